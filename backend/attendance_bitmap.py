@@ -0,0 +1,450 @@
+"""
+Monthly Attendance Bitmap Store
+Compact read model of student attendance: one document per (tenant, student, year, month).
+
+Each attendance session of the month is a single 64-bit integer holding a 2-bit code
+per day (day 1 in bits 0-1 ... day 31 in bits 60-61):
+
+    0 = not marked, 1 = present, 2 = absent, 3 = late
+
+Statuses outside these three (half_day, leave, holiday, ...) are stored verbatim in
+`other` under "<day>:<session>" with code 0 in the bitmap. Writes are atomic `$bit`
+and/or updates, so concurrent marks for different days never clobber each other.
+
+The source of truth stays in `attendance` / `student_attendance`; every write path
+there feeds this store through attendance_rollup.record_attendance_changes, and the
+backfill job rebuilds it from both collections. A slot written by both collections
+holds the latest mark; clearing it in one collection falls back to the other's.
+"""
+
+import asyncio
+import calendar
+import logging
+from datetime import datetime
+from typing import Any, Dict, Iterable, Optional
+
+from bson.int64 import Int64
+from fastapi import Depends, HTTPException, Query
+from pymongo import UpdateOne
+
+from job_queue import job_queue
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SESSION = "Morning"
+DAY_BITS = 2
+DAY_MASK = 0b11
+FULL_MASK = (1 << (31 * DAY_BITS)) - 1
+
+STATUS_CODES = {"present": 1, "absent": 2, "late": 3}
+CODE_STATUSES = {code: status for status, code in STATUS_CODES.items()}
+STATUS_ALIASES = {"p": "present", "a": "absent", "l": "late"}
+
+BACKFILL_BATCH_SIZE = 1000
+
+
+# ================================
+# ENCODING
+# ================================
+
+def normalize_status(status: Optional[str]) -> Optional[str]:
+    if not status:
+        return None
+    status = str(status).strip().lower()
+    return STATUS_ALIASES.get(status, status)
+
+
+def normalize_date(value: Any) -> Optional[str]:
+    """YYYY-MM-DD from a date string, ISO datetime string or datetime"""
+    if isinstance(value, datetime):
+        return value.strftime("%Y-%m-%d")
+    if isinstance(value, str) and len(value) >= 10:
+        return value[:10]
+    return None
+
+
+def session_field(session: Optional[str]) -> str:
+    """Session name usable as a MongoDB field name"""
+    name = (session or DEFAULT_SESSION).strip() or DEFAULT_SESSION
+    return name.replace(".", "_").replace("$", "_")
+
+
+def mark_day(mark: dict) -> Optional[tuple]:
+    """(year, month, day) of a mark, None when its date is unusable"""
+    date_str = normalize_date(mark.get("date"))
+    if not date_str:
+        return None
+    try:
+        year, month, day = int(date_str[:4]), int(date_str[5:7]), int(date_str[8:10])
+    except ValueError:
+        return None
+    return (year, month, day) if 1 <= day <= 31 else None
+
+
+def bitmap_id(tenant_id: str, student_id: str, year: int, month: int) -> str:
+    return f"{tenant_id}:{student_id}:{year}-{month:02d}"
+
+
+def decode_day(bits: int, day: int) -> int:
+    return (bits >> ((day - 1) * DAY_BITS)) & DAY_MASK
+
+
+def count_codes(bits: int) -> Dict[str, int]:
+    counts = {status: 0 for status in STATUS_CODES}
+    while bits:
+        code = bits & DAY_MASK
+        if code:
+            counts[CODE_STATUSES[code]] += 1
+        bits >>= DAY_BITS
+    return counts
+
+
+def summarize_bitmap_doc(doc: dict) -> Dict[str, int]:
+    """Status counts of one month document across all sessions"""
+    totals = {status: 0 for status in STATUS_CODES}
+    for bits in (doc.get("sessions") or {}).values():
+        for status, count in count_codes(int(bits)).items():
+            totals[status] += count
+    for status in (doc.get("other") or {}).values():
+        totals[status] = totals.get(status, 0) + 1
+    totals["total"] = sum(totals.values())
+    return totals
+
+
+def attendance_rate(counts: Dict[str, int]) -> float:
+    total = counts.get("total", 0)
+    return round((counts.get("present", 0) / total * 100) if total > 0 else 0, 2)
+
+
+# ================================
+# WRITER
+# ================================
+
+async def record_attendance_marks(db, tenant_id: str, marks: Iterable[dict]) -> int:
+    """
+    Apply attendance marks to the bitmap store.
+
+    Each mark is {person_id, date, status, attendance_session?, class_id?}; a
+    status of None clears the day. Marks for the same student-month are merged
+    into one update and all updates go out in one unordered bulk_write.
+    Returns the number of month documents touched.
+    """
+    # doc id -> {"meta": ..., "slots": {(day, session): status}}
+    pending: Dict[str, dict] = {}
+    for mark in marks:
+        person_id = mark.get("person_id")
+        slot = mark_day(mark)
+        if not person_id or not slot:
+            continue
+        year, month, day = slot
+
+        doc_id = bitmap_id(tenant_id, person_id, year, month)
+        entry = pending.setdefault(doc_id, {
+            "meta": {"tenant_id": tenant_id, "student_id": person_id, "year": year, "month": month},
+            "class_id": None,
+            "slots": {}
+        })
+        if mark.get("class_id"):
+            entry["class_id"] = mark["class_id"]
+        entry["slots"][(day, session_field(mark.get("attendance_session")))] = normalize_status(mark.get("status"))
+
+    if not pending:
+        return 0
+
+    operations = []
+    now = datetime.utcnow()
+    for doc_id, entry in pending.items():
+        clear_masks: Dict[str, int] = {}
+        set_bits: Dict[str, int] = {}
+        set_fields: Dict[str, Any] = {"updated_at": now}
+        unset_fields: Dict[str, str] = {}
+
+        for (day, session), status in entry["slots"].items():
+            shift = (day - 1) * DAY_BITS
+            clear_masks[session] = clear_masks.get(session, 0) | (DAY_MASK << shift)
+            code = STATUS_CODES.get(status, 0)
+            set_bits[session] = set_bits.get(session, 0) | (code << shift)
+            other_key = f"other.{day:02d}:{session}"
+            if status and code == 0:
+                set_fields[other_key] = status
+            else:
+                unset_fields[other_key] = ""
+
+        if entry["class_id"]:
+            set_fields["class_id"] = entry["class_id"]
+
+        update = {
+            "$bit": {
+                f"sessions.{session}": {
+                    "and": Int64(FULL_MASK & ~mask),
+                    "or": Int64(set_bits[session])
+                }
+                for session, mask in clear_masks.items()
+            },
+            "$set": set_fields,
+            "$setOnInsert": entry["meta"]
+        }
+        if unset_fields:
+            update["$unset"] = unset_fields
+        operations.append(UpdateOne({"_id": doc_id}, update, upsert=True))
+
+    await db.attendance_bitmaps.bulk_write(operations, ordered=False)
+    return len(operations)
+
+
+# ================================
+# READERS
+# ================================
+
+async def get_month_grid(db, tenant_id: str, student_id: str, year: int, month: int) -> dict:
+    """Day-by-day statuses of a student for one month"""
+    doc = await db.attendance_bitmaps.find_one({"_id": bitmap_id(tenant_id, student_id, year, month)}) or {}
+    days_in_month = calendar.monthrange(year, month)[1]
+    sessions = {name: int(bits) for name, bits in (doc.get("sessions") or {}).items()}
+    other = doc.get("other") or {}
+
+    days = []
+    for day in range(1, days_in_month + 1):
+        statuses = {}
+        for name, bits in sessions.items():
+            code = decode_day(bits, day)
+            if code:
+                statuses[name] = CODE_STATUSES[code]
+        for key, status in other.items():
+            other_day, _, name = key.partition(":")
+            if int(other_day) == day:
+                statuses[name] = status
+        days.append({"day": day, "date": f"{year}-{month:02d}-{day:02d}", "sessions": statuses})
+
+    counts = summarize_bitmap_doc(doc)
+    return {
+        "student_id": student_id,
+        "year": year,
+        "month": month,
+        "days": days,
+        "summary": {**counts, "attendance_rate": attendance_rate(counts)}
+    }
+
+
+async def get_year_summary(db, tenant_id: str, student_id: str, year: int) -> dict:
+    """Monthly and yearly attendance percentages of a student (at most 12 documents)"""
+    docs = await db.attendance_bitmaps.find(
+        {"tenant_id": tenant_id, "student_id": student_id, "year": year},
+        {"month": 1, "sessions": 1, "other": 1}
+    ).to_list(12)
+
+    months = []
+    totals: Dict[str, int] = {}
+    for doc in sorted(docs, key=lambda d: d["month"]):
+        counts = summarize_bitmap_doc(doc)
+        months.append({"month": doc["month"], **counts, "attendance_rate": attendance_rate(counts)})
+        for status, count in counts.items():
+            totals[status] = totals.get(status, 0) + count
+
+    totals.setdefault("total", 0)
+    return {
+        "student_id": student_id,
+        "year": year,
+        "months": months,
+        "summary": {**totals, "attendance_rate": attendance_rate(totals)}
+    }
+
+
+async def get_class_heatmap(
+    db,
+    tenant_id: str,
+    class_id: str,
+    year: int,
+    month: int,
+    session: Optional[str] = None
+) -> dict:
+    """Per-day present/absent/late counts of a class for one month"""
+    docs = await db.attendance_bitmaps.find(
+        {"tenant_id": tenant_id, "class_id": class_id, "year": year, "month": month},
+        {"sessions": 1, "other": 1}
+    ).to_list(None)
+
+    days_in_month = calendar.monthrange(year, month)[1]
+    grid = [{status: 0 for status in STATUS_CODES} for _ in range(days_in_month)]
+    other_counts = [0] * days_in_month
+    wanted = session_field(session) if session else None
+
+    for doc in docs:
+        for name, bits in (doc.get("sessions") or {}).items():
+            if wanted and name != wanted:
+                continue
+            bits = int(bits)
+            for day in range(1, days_in_month + 1):
+                code = decode_day(bits, day)
+                if code:
+                    grid[day - 1][CODE_STATUSES[code]] += 1
+        for key in (doc.get("other") or {}):
+            other_day, _, name = key.partition(":")
+            if (not wanted or name == wanted) and int(other_day) <= days_in_month:
+                other_counts[int(other_day) - 1] += 1
+
+    days = []
+    for index, counts in enumerate(grid):
+        total = sum(counts.values()) + other_counts[index]
+        days.append({
+            "day": index + 1,
+            **counts,
+            "other": other_counts[index],
+            "total": total,
+            "attendance_rate": round((counts["present"] / total * 100) if total else 0, 2)
+        })
+    return {"class_id": class_id, "year": year, "month": month, "students": len(docs), "days": days}
+
+
+# ================================
+# BACKFILL
+# ================================
+
+async def backfill_attendance_bitmaps(job_id: str, db, tenant_id: str, year: Optional[int] = None) -> dict:
+    """
+    Rebuild the bitmap store of a tenant from `attendance` and `student_attendance`.
+
+    The month documents are computed in memory and written with one `$set` each;
+    nothing is deleted first, so live `$bit` writes to months outside the rebuild
+    survive and the readers keep their data while the job runs. Months left
+    without any source record are removed at the end.
+    """
+    sources = [
+        (db.attendance, {"tenant_id": tenant_id, "type": "student"}),
+        (db.student_attendance, {"tenant_id": tenant_id}),
+    ]
+    projection = {"_id": 0, "person_id": 1, "date": 1, "status": 1, "attendance_session": 1, "class_id": 1, "created_at": 1}
+
+    job = job_queue.get_job(job_id)
+    if job:
+        job.total = sum([await collection.count_documents(query) for collection, query in sources])
+
+    # doc id -> month document being rebuilt
+    months: Dict[str, dict] = {}
+    processed = 0
+    for collection, query in sources:
+        # Oldest first so the latest write of a day wins, as it did in the source collection
+        async for record in collection.find(query, projection).sort("created_at", 1):
+            processed += 1
+            if processed % BACKFILL_BATCH_SIZE == 0:
+                job_queue.update_progress(job_id, processed)
+                await asyncio.sleep(0)
+            slot = mark_day(record)
+            if not record.get("person_id") or not slot or (year and slot[0] != year):
+                continue
+            record_year, month, day = slot
+            doc = months.setdefault(bitmap_id(tenant_id, record["person_id"], record_year, month), {
+                "tenant_id": tenant_id, "student_id": record["person_id"], "year": record_year,
+                "month": month, "class_id": None, "sessions": {}, "other": {}
+            })
+            if record.get("class_id"):
+                doc["class_id"] = record["class_id"]
+            session = session_field(record.get("attendance_session"))
+            status = normalize_status(record.get("status"))
+            shift = (day - 1) * DAY_BITS
+            code = STATUS_CODES.get(status, 0)
+            bits = doc["sessions"].get(session, 0) & ~(DAY_MASK << shift)
+            doc["sessions"][session] = bits | (code << shift)
+            other_key = f"{day:02d}:{session}"
+            if status and code == 0:
+                doc["other"][other_key] = status
+            else:
+                doc["other"].pop(other_key, None)
+    job_queue.update_progress(job_id, processed)
+
+    now = datetime.utcnow()
+    operations = []
+    for doc_id, doc in months.items():
+        doc["sessions"] = {session: Int64(bits) for session, bits in doc["sessions"].items()}
+        if not doc["class_id"]:
+            doc.pop("class_id")
+        operations.append(UpdateOne({"_id": doc_id}, {"$set": {**doc, "updated_at": now}}, upsert=True))
+    for i in range(0, len(operations), BACKFILL_BATCH_SIZE):
+        await db.attendance_bitmaps.bulk_write(operations[i:i + BACKFILL_BATCH_SIZE], ordered=False)
+
+    stale_filter = {"tenant_id": tenant_id}
+    if year:
+        stale_filter["year"] = year
+    stale_ids = [
+        doc["_id"] async for doc in db.attendance_bitmaps.find(stale_filter, {"_id": 1})
+        if doc["_id"] not in months
+    ]
+    for i in range(0, len(stale_ids), BACKFILL_BATCH_SIZE):
+        await db.attendance_bitmaps.delete_many({"_id": {"$in": stale_ids[i:i + BACKFILL_BATCH_SIZE]}})
+
+    return {
+        "message": f"Rebuilt attendance bitmaps from {processed} records",
+        "records": processed,
+        "month_documents_written": len(operations)
+    }
+
+
+# ================================
+# ROUTES
+# ================================
+
+def setup_attendance_bitmap_routes(api_router, db, get_current_user):
+    """Setup attendance bitmap read model routes"""
+
+    async def _check_student_access(current_user, student_id: str):
+        if current_user.role in ["super_admin", "admin", "principal", "teacher"]:
+            return
+        if current_user.role in ["student", "parent"]:
+            from student_utils import resolve_student_identity
+            student = await resolve_student_identity(db, current_user)
+            if student and student.get("id") == student_id:
+                return
+        raise HTTPException(status_code=403, detail="Not authorized")
+
+    @api_router.get("/attendance/bitmap/students/{student_id}/month")
+    async def get_student_attendance_month_grid(
+        student_id: str,
+        year: int = Query(..., ge=2000, le=2100),
+        month: int = Query(..., ge=1, le=12),
+        current_user=Depends(get_current_user)
+    ):
+        """Month grid of a student's attendance from the bitmap store"""
+        await _check_student_access(current_user, student_id)
+        return await get_month_grid(db, current_user.tenant_id, student_id, year, month)
+
+    @api_router.get("/attendance/bitmap/students/{student_id}/year")
+    async def get_student_attendance_year_summary(
+        student_id: str,
+        year: int = Query(..., ge=2000, le=2100),
+        current_user=Depends(get_current_user)
+    ):
+        """Monthly and yearly attendance percentages of a student"""
+        await _check_student_access(current_user, student_id)
+        return await get_year_summary(db, current_user.tenant_id, student_id, year)
+
+    @api_router.get("/attendance/bitmap/classes/{class_id}/heatmap")
+    async def get_class_attendance_heatmap(
+        class_id: str,
+        year: int = Query(..., ge=2000, le=2100),
+        month: int = Query(..., ge=1, le=12),
+        session: Optional[str] = None,
+        current_user=Depends(get_current_user)
+    ):
+        """Per-day attendance counts of a class for a month"""
+        if current_user.role not in ["super_admin", "admin", "principal", "teacher"]:
+            raise HTTPException(status_code=403, detail="Not authorized")
+        return await get_class_heatmap(db, current_user.tenant_id, class_id, year, month, session)
+
+    @api_router.post("/attendance/bitmap/backfill")
+    async def start_attendance_bitmap_backfill(
+        year: Optional[int] = None,
+        current_user=Depends(get_current_user)
+    ):
+        """Rebuild the bitmap store from the attendance collections (background job)"""
+        if current_user.role not in ["super_admin", "admin"]:
+            raise HTTPException(status_code=403, detail="Not authorized")
+
+        job = job_queue.create_job(job_type="attendance_bitmap_backfill", tenant_id=current_user.tenant_id)
+        asyncio.create_task(job_queue.run_job(
+            job.id, backfill_attendance_bitmaps, db, current_user.tenant_id, year
+        ))
+        return {
+            "job_id": job.id,
+            "message": "Attendance bitmap backfill started",
+            "status_url": f"/api/jobs/{job.id}"
+        }
@@ -0,0 +1,659 @@
+"""
+Attendance Feature Pipeline
+Per-student rolling attendance metrics behind /attendance/ai-insights.
+
+One `attendance_features` document per (tenant, student) holds, for 7/30/90-day
+windows ending on `as_of`:
+- present / absent / late / marked day counts and attendance, absence and late rates
+- the longest consecutive-absence streak inside the window
+plus the current absence streak, absences per weekday (90 days) and the late trend
+(late rate of the last 30 days minus the 30 days before).
+
+Features are computed from the monthly bitmap store (attendance_bitmap), merging
+sessions into one status per day (present > late > absent). The computation is
+vectorized over a students x 90-days matrix, so the same code refreshes the few
+students touched by an attendance write and a whole institution in the nightly
+run. Unmarked days (weekends, holidays) neither break nor extend streaks.
+
+Attendance writers only flag the touched students in `attendance_feature_queue`;
+a background loop refreshes them in batches, so writes never wait for the
+feature computation. Until a tenant's bitmaps have been backfilled and its
+features computed once (`attendance_feature_status`), insights are answered by
+the original scan of `student_attendance` while a background job prepares them.
+"""
+
+import asyncio
+import logging
+from datetime import date, datetime, timedelta
+from typing import Dict, Iterable, List, Optional
+
+import numpy as np
+from fastapi import Depends, HTTPException
+from pymongo import UpdateOne
+
+from pymongo.errors import DuplicateKeyError
+
+from attendance_bitmap import DAY_BITS, DAY_MASK, backfill_attendance_bitmaps
+from job_queue import job_queue
+from pagination import get_pagination_params, create_paginated_response
+
+logger = logging.getLogger(__name__)
+
+WINDOW_DAYS = 90
+WINDOWS = [7, 30, 90]
+PERIOD_WINDOWS = {"week": 7, "month": 30, "quarter": 90}
+REFRESH_CHUNK_SIZE = 2000
+FEATURE_RUN_HOUR_UTC = 21  # 03:00 Asia/Dhaka, after the overdue engine
+QUEUE_DRAIN_SECONDS = 30
+PREPARE_LEASE_SECONDS = 3600
+LEGACY_RECORD_LIMIT = 5000
+
+WEEKDAYS = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday"]
+
+# Bitmap code (0 none, 1 present, 2 absent, 3 late) -> day priority when merging
+# sessions, and back. Priorities: 0 none, 1 absent, 2 late, 3 present.
+CODE_PRIORITY = np.array([0, 3, 1, 2], dtype=np.int8)
+ABSENT, LATE, PRESENT = 1, 2, 3
+
+DAY_SHIFTS = np.arange(31, dtype=np.int64) * DAY_BITS
+
+
+# ================================
+# VECTORIZED COMPUTATION
+# ================================
+
+def window_months(as_of: date) -> List[tuple]:
+    """(year, month) pairs overlapping the 90-day window ending on as_of"""
+    start = as_of - timedelta(days=WINDOW_DAYS - 1)
+    months = []
+    year, month = start.year, start.month
+    while (year, month) <= (as_of.year, as_of.month):
+        months.append((year, month))
+        year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+    return months
+
+
+def build_day_matrix(docs: List[dict], student_index: Dict[str, int], as_of: date) -> np.ndarray:
+    """students x 90 matrix of merged day priorities from bitmap documents"""
+    start = as_of - timedelta(days=WINDOW_DAYS - 1)
+    matrix = np.zeros((len(student_index), WINDOW_DAYS), dtype=np.int8)
+
+    bits, rows, offsets = [], [], []
+    for doc in docs:
+        row = student_index.get(doc["student_id"])
+        if row is None:
+            continue
+        offset = (date(doc["year"], doc["month"], 1) - start).days
+        for value in (doc.get("sessions") or {}).values():
+            bits.append(int(value))
+            rows.append(row)
+            offsets.append(offset)
+    if not bits:
+        return matrix
+
+    codes = (np.array(bits, dtype=np.int64)[:, None] >> DAY_SHIFTS) & DAY_MASK
+    priorities = CODE_PRIORITY[codes]
+    columns = np.array(offsets, dtype=np.int64)[:, None] + np.arange(31)
+    rows = np.broadcast_to(np.array(rows)[:, None], columns.shape)
+    valid = (columns >= 0) & (columns < WINDOW_DAYS) & (priorities > 0)
+    np.maximum.at(matrix, (rows[valid], columns[valid]), priorities[valid])
+    return matrix
+
+
+def absence_runs(matrix: np.ndarray) -> np.ndarray:
+    """
+    Length of the absence streak ending on each day. Present/late days reset the
+    streak; unmarked days carry it over unchanged.
+    """
+    absent = (matrix == ABSENT).astype(np.int32)
+    cumulative = np.cumsum(absent, axis=1)
+    resets = np.where((matrix > 0) & (matrix != ABSENT), cumulative, 0)
+    return cumulative - np.maximum.accumulate(resets, axis=1)
+
+
+def _rate(part: np.ndarray, whole: np.ndarray) -> np.ndarray:
+    return np.round(np.divide(part * 100.0, whole, out=np.zeros(part.shape), where=whole > 0), 2)
+
+
+def compute_features(matrix: np.ndarray, as_of: date) -> Dict[str, np.ndarray]:
+    """Feature columns (one value per student row) from a day matrix"""
+    features: Dict[str, np.ndarray] = {}
+    for window in WINDOWS:
+        recent = matrix[:, -window:]
+        marked = (recent > 0).sum(axis=1)
+        present = (recent == PRESENT).sum(axis=1)
+        absent = (recent == ABSENT).sum(axis=1)
+        late = (recent == LATE).sum(axis=1)
+        features[f"total_days_{window}"] = marked
+        features[f"present_{window}"] = present
+        features[f"absences_{window}"] = absent
+        features[f"late_arrivals_{window}"] = late
+        features[f"attendance_rate_{window}"] = _rate(present, marked)
+        features[f"absence_rate_{window}"] = _rate(absent, marked)
+        features[f"late_rate_{window}"] = _rate(late, marked)
+        features[f"max_absence_streak_{window}"] = absence_runs(recent).max(axis=1)
+
+    features["current_absence_streak"] = absence_runs(matrix)[:, -1]
+
+    previous = matrix[:, -60:-30]
+    previous_late_rate = _rate((previous == LATE).sum(axis=1), (previous > 0).sum(axis=1))
+    features["late_trend"] = np.round(features["late_rate_30"] - previous_late_rate, 2)
+
+    start = as_of - timedelta(days=WINDOW_DAYS - 1)
+    weekday_onehot = np.eye(7, dtype=np.int32)[(start.weekday() + np.arange(WINDOW_DAYS)) % 7]
+    features["weekday_absences"] = (matrix == ABSENT).astype(np.int32) @ weekday_onehot
+    return features
+
+
+def feature_documents(
+    tenant_id: str,
+    student_ids: List[str],
+    students: Dict[str, dict],
+    class_ids: Dict[str, str],
+    features: Dict[str, np.ndarray],
+    as_of: date
+) -> List[dict]:
+    now = datetime.utcnow()
+    documents = []
+    for row, student_id in enumerate(student_ids):
+        student = students.get(student_id) or {}
+        weekday_absences = features["weekday_absences"][row].tolist()
+        late_trend = float(features["late_trend"][row])
+        doc = {
+            "_id": f"{tenant_id}:{student_id}",
+            "tenant_id": tenant_id,
+            "student_id": student_id,
+            "person_name": student.get("name") or student.get("full_name") or "Unknown",
+            "class_id": student.get("class_id") or class_ids.get(student_id),
+            "as_of": as_of.isoformat(),
+            "current_absence_streak": int(features["current_absence_streak"][row]),
+            "weekday_absences": dict(zip(WEEKDAYS, weekday_absences)),
+            "most_absent_weekday": WEEKDAYS[int(np.argmax(weekday_absences))] if max(weekday_absences) > 1 else None,
+            "late_trend": late_trend,
+            "late_trend_direction": "rising" if late_trend > 5 else "falling" if late_trend < -5 else "stable",
+            "updated_at": now
+        }
+        for key, column in features.items():
+            if key[-1].isdigit():
+                doc[key] = column[row].item()
+        documents.append(doc)
+    return documents
+
+
+# ================================
+# REFRESH
+# ================================
+
+def _today() -> date:
+    return datetime.utcnow().date()
+
+
+def _month_filter(as_of: date) -> dict:
+    return {"$or": [{"year": year, "month": month} for year, month in window_months(as_of)]}
+
+
+async def refresh_student_features(
+    db,
+    tenant_id: str,
+    student_ids: Iterable[str],
+    as_of: Optional[date] = None
+) -> int:
+    """Recompute and store the features of the given students"""
+    student_ids = list(dict.fromkeys(s for s in student_ids if s))
+    if not student_ids:
+        return 0
+    as_of = as_of or _today()
+
+    docs, students = await asyncio.gather(
+        db.attendance_bitmaps.find(
+            {"tenant_id": tenant_id, "student_id": {"$in": student_ids}, **_month_filter(as_of)},
+            {"_id": 0, "student_id": 1, "year": 1, "month": 1, "class_id": 1, "sessions": 1}
+        ).to_list(None),
+        db.students.find(
+            {"tenant_id": tenant_id, "id": {"$in": student_ids}},
+            {"_id": 0, "id": 1, "name": 1, "full_name": 1, "class_id": 1}
+        ).to_list(None)
+    )
+
+    student_index = {student_id: row for row, student_id in enumerate(student_ids)}
+    matrix = build_day_matrix(docs, student_index, as_of)
+    features = compute_features(matrix, as_of)
+    class_ids = {doc["student_id"]: doc.get("class_id") for doc in docs if doc.get("class_id")}
+    documents = feature_documents(
+        tenant_id, student_ids, {s["id"]: s for s in students}, class_ids, features, as_of
+    )
+
+    await db.attendance_features.bulk_write(
+        [UpdateOne({"_id": doc["_id"]}, {"$set": doc}, upsert=True) for doc in documents],
+        ordered=False
+    )
+    return len(documents)
+
+
+async def record_attendance_feature_changes(db, tenant_id: str, marks: Iterable[dict]) -> int:
+    """Read-model writer: queue the students in a set of marks for a feature refresh"""
+    student_ids = list(dict.fromkeys(mark.get("person_id") for mark in marks if mark.get("person_id")))
+    if not student_ids:
+        return 0
+    now = datetime.utcnow()
+    await db.attendance_feature_queue.bulk_write([
+        UpdateOne(
+            {"_id": f"{tenant_id}:{student_id}"},
+            {"$set": {"tenant_id": tenant_id, "student_id": student_id, "queued_at": now}},
+            upsert=True
+        ) for student_id in student_ids
+    ], ordered=False)
+    return len(student_ids)
+
+
+async def drain_feature_queue(db, limit: int = REFRESH_CHUNK_SIZE) -> int:
+    """Refresh the features of queued students; returns the number refreshed"""
+    started = datetime.utcnow()
+    queued = await db.attendance_feature_queue.find(
+        {"queued_at": {"$lte": started}}, {"tenant_id": 1, "student_id": 1}
+    ).sort("queued_at", 1).limit(limit).to_list(limit)
+
+    by_tenant: Dict[str, List[str]] = {}
+    for entry in queued:
+        by_tenant.setdefault(entry["tenant_id"], []).append(entry["student_id"])
+
+    refreshed = 0
+    for tenant_id, student_ids in by_tenant.items():
+        refreshed += await refresh_student_features(db, tenant_id, student_ids)
+
+    # Students marked again while refreshing keep a newer queued_at and stay queued
+    if queued:
+        await db.attendance_feature_queue.delete_many({
+            "_id": {"$in": [entry["_id"] for entry in queued]},
+            "queued_at": {"$lte": started}
+        })
+    return refreshed
+
+
+async def feature_queue_loop(db):
+    """Background loop that refreshes the students queued by attendance writes"""
+    while True:
+        try:
+            while await drain_feature_queue(db) >= REFRESH_CHUNK_SIZE:
+                await asyncio.sleep(0)
+        except Exception as e:
+            logger.error(f"Attendance feature queue refresh failed: {e}")
+        await asyncio.sleep(QUEUE_DRAIN_SECONDS)
+
+
+async def refresh_tenant_features(db, tenant_id: str, job_id: Optional[str] = None) -> dict:
+    """Recompute the features of every student with attendance in the last 90 days"""
+    as_of = _today()
+    student_ids = await db.attendance_bitmaps.distinct(
+        "student_id", {"tenant_id": tenant_id, **_month_filter(as_of)}
+    )
+    if job_id:
+        job = job_queue.get_job(job_id)
+        if job:
+            job.total = len(student_ids)
+
+    refreshed = 0
+    for i in range(0, len(student_ids), REFRESH_CHUNK_SIZE):
+        refreshed += await refresh_student_features(db, tenant_id, student_ids[i:i + REFRESH_CHUNK_SIZE], as_of)
+        if job_id:
+            job_queue.update_progress(job_id, refreshed)
+
+    # Students with no attendance left in the window
+    removed = await db.attendance_features.delete_many(
+        {"tenant_id": tenant_id, "as_of": {"$lt": as_of.isoformat()}}
+    )
+    return {
+        "message": f"Refreshed attendance features for {refreshed} students",
+        "as_of": as_of.isoformat(),
+        "students": refreshed,
+        "removed": removed.deleted_count
+    }
+
+
+async def _claim_nightly_refresh(db, run_date: str) -> bool:
+    """Make sure only one worker process runs the nightly refresh for a given date"""
+    result = await db.scheduler_locks.update_one(
+        {"_id": "attendance_features", "run_date": {"$ne": run_date}},
+        {"$set": {"run_date": run_date, "claimed_at": datetime.utcnow()}}
+    )
+    if result.modified_count:
+        return True
+    try:
+        await db.scheduler_locks.insert_one({"_id": "attendance_features", "run_date": run_date, "claimed_at": datetime.utcnow()})
+        return True
+    except Exception:
+        return False
+
+
+async def feature_scheduler_loop(db):
+    """Background loop that moves every tenant's windows forward once per night"""
+    while True:
+        now = datetime.utcnow()
+        next_run = now.replace(hour=FEATURE_RUN_HOUR_UTC, minute=0, second=0, microsecond=0)
+        if next_run <= now:
+            next_run += timedelta(days=1)
+        await asyncio.sleep((next_run - now).total_seconds())
+
+        try:
+            if not await _claim_nightly_refresh(db, next_run.strftime("%Y-%m-%d")):
+                continue
+            for tenant_id in await db.attendance_bitmaps.distinct("tenant_id"):
+                try:
+                    await refresh_tenant_features(db, tenant_id)
+                except Exception as e:
+                    logger.error(f"Attendance feature refresh failed for tenant {tenant_id}: {e}")
+        except Exception as e:
+            logger.error(f"Nightly attendance feature refresh failed: {e}")
+
+
+def start_feature_scheduler(db):
+    """Start the nightly feature refresh and the write queue refresh (call once from application startup)"""
+    asyncio.create_task(feature_queue_loop(db))
+    return asyncio.create_task(feature_scheduler_loop(db))
+
+
+# ================================
+# FIRST-USE PREPARATION
+# ================================
+
+async def features_ready(db, tenant_id: str) -> bool:
+    return bool(await db.attendance_feature_status.find_one({"_id": tenant_id, "ready": True}, {"_id": 1}))
+
+
+async def _claim_prepare_lease(db, tenant_id: str) -> bool:
+    """Only one worker process prepares a tenant's features at a time"""
+    now = datetime.utcnow()
+    lock_id = f"attendance_features_prepare:{tenant_id}"
+    lease = {"expires_at": now + timedelta(seconds=PREPARE_LEASE_SECONDS)}
+    result = await db.scheduler_locks.update_one(
+        {"_id": lock_id, "expires_at": {"$lt": now}},
+        {"$set": lease}
+    )
+    if result.matched_count:
+        return True
+    try:
+        await db.scheduler_locks.insert_one({"_id": lock_id, **lease})
+        return True
+    except DuplicateKeyError:
+        return False
+
+
+async def prepare_tenant_features(job_id: str, db, tenant_id: str) -> dict:
+    """Backfill the bitmaps of a tenant, compute its features and mark them ready"""
+    bitmaps = await backfill_attendance_bitmaps(job_id, db, tenant_id)
+    features = await refresh_tenant_features(db, tenant_id, job_id)
+    await db.attendance_feature_status.update_one(
+        {"_id": tenant_id},
+        {"$set": {"ready": True, "ready_at": datetime.utcnow()}},
+        upsert=True
+    )
+    await db.scheduler_locks.delete_one({"_id": f"attendance_features_prepare:{tenant_id}"})
+    return {**features, "bitmap_records": bitmaps["records"]}
+
+
+async def start_feature_preparation(db, tenant_id: str) -> Optional[str]:
+    """Start the first-use preparation job unless another worker is already on it"""
+    if not await _claim_prepare_lease(db, tenant_id):
+        return None
+    job = job_queue.create_job(job_type="attendance_features_prepare", tenant_id=tenant_id)
+    asyncio.create_task(job_queue.run_job(job.id, prepare_tenant_features, db, tenant_id))
+    return job.id
+
+
+# ================================
+# INSIGHTS
+# ================================
+
+def at_risk_query(window: int) -> dict:
+    return {
+        f"total_days_{window}": {"$gt": 0},
+        "$or": [
+            {f"max_absence_streak_{window}": {"$gte": 3}},
+            {f"absence_rate_{window}": {"$gt": 15}}
+        ]
+    }
+
+
+def chronic_query(window: int) -> dict:
+    return {f"total_days_{window}": {"$gt": 0}, f"absence_rate_{window}": {"$gt": 20}}
+
+
+def insight_item(doc: dict, window: int) -> dict:
+    """Feature document in the shape of the insight lists"""
+    return {
+        "person_id": doc["student_id"],
+        "person_name": doc.get("person_name", "Unknown"),
+        "class_id": doc.get("class_id"),
+        "total_days": doc.get(f"total_days_{window}", 0),
+        "absences": doc.get(f"absences_{window}", 0),
+        "late_arrivals": doc.get(f"late_arrivals_{window}", 0),
+        "absence_streak": doc.get(f"max_absence_streak_{window}", 0),
+        "current_streak": doc.get("current_absence_streak", 0),
+        "absence_rate": doc.get(f"absence_rate_{window}", 0),
+        "late_rate": doc.get(f"late_rate_{window}", 0),
+        "attendance_rate": doc.get(f"attendance_rate_{window}", 0),
+        "most_absent_weekday": doc.get("most_absent_weekday"),
+        "late_trend": doc.get("late_trend", 0),
+        "late_trend_direction": doc.get("late_trend_direction", "stable")
+    }
+
+
+def _recommendations(chronic_total: int, at_risk_total: int) -> List[dict]:
+    recommendations = []
+    if chronic_total:
+        recommendations.append({
+            "type": "intervention",
+            "message_bn": f"{chronic_total} জন শিক্ষার্থীর দীর্ঘমেয়াদী অনুপস্থিতি রয়েছে (>২০%)। অভিভাবক সভা বিবেচনা করুন।",
+            "message": f"{chronic_total} students have chronic absenteeism (>20%). Consider parent meetings.",
+            "priority": "high"
+        })
+    if at_risk_total:
+        recommendations.append({
+            "type": "monitoring",
+            "message_bn": f"{at_risk_total} জন শিক্ষার্থী ঝুঁকিতে রয়েছে। নিবিড় পর্যবেক্ষণ প্রয়োজন।",
+            "message": f"{at_risk_total} students are at risk. Enable closer monitoring.",
+            "priority": "medium"
+        })
+    return recommendations
+
+
+async def scan_attendance_insights(db, tenant_id: str, period: str, class_id: Optional[str] = None) -> dict:
+    """Insights computed directly from `student_attendance` (used until the features are ready)"""
+    today = datetime.utcnow()
+    start_date = (today - timedelta(days=PERIOD_WINDOWS.get(period, 90))).strftime("%Y-%m-%d")
+    end_date = today.strftime("%Y-%m-%d")
+
+    filter_criteria = {"tenant_id": tenant_id, "date": {"$gte": start_date, "$lte": end_date}}
+    if class_id:
+        filter_criteria["class_id"] = class_id
+
+    records = await db.student_attendance.find(
+        filter_criteria, {"_id": 0, "person_id": 1, "person_name": 1, "status": 1}
+    ).to_list(LEGACY_RECORD_LIMIT)
+
+    person_patterns = {}
+    for record in records:
+        person_id = record.get("person_id")
+        stats = person_patterns.setdefault(person_id, {
+            "person_id": person_id,
+            "person_name": record.get("person_name", "Unknown"),
+            "total_days": 0,
+            "absences": 0,
+            "late_arrivals": 0,
+            "absence_streak": 0,
+            "current_streak": 0
+        })
+        stats["total_days"] += 1
+        status = record.get("status")
+        if status == "absent":
+            stats["absences"] += 1
+            stats["current_streak"] += 1
+        else:
+            if status == "late":
+                stats["late_arrivals"] += 1
+            stats["current_streak"] = 0
+        stats["absence_streak"] = max(stats["absence_streak"], stats["current_streak"])
+
+    at_risk_students = []
+    chronic_absentees = []
+    for stats in person_patterns.values():
+        absence_rate = stats["absences"] / stats["total_days"]
+        late_rate = stats["late_arrivals"] / stats["total_days"]
+        if absence_rate > 0.20:
+            chronic_absentees.append({
+                **stats,
+                "absence_rate": round(absence_rate * 100, 2),
+                "risk_level": "high" if absence_rate > 0.30 else "medium"
+            })
+        if stats["absence_streak"] >= 3 or absence_rate > 0.15:
+            at_risk_students.append({
+                **stats,
+                "absence_rate": round(absence_rate * 100, 2),
+                "late_rate": round(late_rate * 100, 2),
+                "risk_reason": "Consecutive absences" if stats["absence_streak"] >= 3 else "High absence rate"
+            })
+
+    present = sum(1 for r in records if r.get("status") == "present")
+    return {
+        "period": period,
+        "date_range": {"start": start_date, "end": end_date},
+        "overall_stats": {
+            "total_records": len(records),
+            "unique_students": len(person_patterns),
+            "overall_attendance_rate": round(present / len(records) * 100 if records else 0, 2),
+            "at_risk_count": len(at_risk_students),
+            "chronic_absentee_count": len(chronic_absentees)
+        },
+        "alerts": {
+            "at_risk_students": sorted(at_risk_students, key=lambda x: x["absence_rate"], reverse=True)[:10],
+            "chronic_absentees": sorted(chronic_absentees, key=lambda x: x["absence_rate"], reverse=True)[:10]
+        },
+        "recommendations": _recommendations(len(chronic_absentees), len(at_risk_students)),
+        "features_as_of": None
+    }
+
+
+async def get_attendance_insights(db, tenant_id: str, period: str, class_id: Optional[str] = None) -> dict:
+    """
+    Institution (or class) insights from the precomputed features. Before the
+    tenant's features are ready, starts their preparation in the background and
+    answers from the direct scan.
+    """
+    if not await features_ready(db, tenant_id):
+        await start_feature_preparation(db, tenant_id)
+        return await scan_attendance_insights(db, tenant_id, period, class_id)
+
+    window = PERIOD_WINDOWS.get(period, 90)
+    base = {"tenant_id": tenant_id}
+    if class_id:
+        base["class_id"] = class_id
+
+    projection = {"_id": 0}
+    overall, at_risk, at_risk_total, chronic, chronic_total = await asyncio.gather(
+        db.attendance_features.aggregate([
+            {"$match": {**base, f"total_days_{window}": {"$gt": 0}}},
+            {"$group": {
+                "_id": None,
+                "students": {"$sum": 1},
+                "marked": {"$sum": f"$total_days_{window}"},
+                "present": {"$sum": f"$present_{window}"},
+                "as_of": {"$max": "$as_of"}
+            }}
+        ]).to_list(1),
+        db.attendance_features.find({**base, **at_risk_query(window)}, projection)
+            .sort(f"absence_rate_{window}", -1).limit(10).to_list(10),
+        db.attendance_features.count_documents({**base, **at_risk_query(window)}),
+        db.attendance_features.find({**base, **chronic_query(window)}, projection)
+            .sort(f"absence_rate_{window}", -1).limit(10).to_list(10),
+        db.attendance_features.count_documents({**base, **chronic_query(window)})
+    )
+    overall = overall[0] if overall else {"students": 0, "marked": 0, "present": 0, "as_of": None}
+
+    at_risk_students = []
+    for doc in at_risk:
+        item = insight_item(doc, window)
+        item["risk_reason"] = "Consecutive absences" if item["absence_streak"] >= 3 else "High absence rate"
+        at_risk_students.append(item)
+    chronic_absentees = []
+    for doc in chronic:
+        item = insight_item(doc, window)
+        item["risk_level"] = "high" if item["absence_rate"] > 30 else "medium"
+        chronic_absentees.append(item)
+
+    as_of = overall.get("as_of") or _today().isoformat()
+    return {
+        "period": period,
+        "date_range": {
+            "start": (date.fromisoformat(as_of) - timedelta(days=window - 1)).isoformat(),
+            "end": as_of
+        },
+        "overall_stats": {
+            "total_records": overall["marked"],
+            "unique_students": overall["students"],
+            "overall_attendance_rate": round(
+                overall["present"] / overall["marked"] * 100 if overall["marked"] else 0, 2
+            ),
+            "at_risk_count": at_risk_total,
+            "chronic_absentee_count": chronic_total
+        },
+        "alerts": {
+            "at_risk_students": at_risk_students,
+            "chronic_absentees": chronic_absentees
+        },
+        "recommendations": _recommendations(chronic_total, at_risk_total),
+        "features_as_of": as_of
+    }
+
+
+# ================================
+# ROUTES
+# ================================
+
+def setup_attendance_feature_routes(api_router, db, get_current_user):
+    """Setup attendance feature routes (paged at-risk list, refresh job)"""
+
+    @api_router.get("/attendance/ai-insights/at-risk")
+    async def get_at_risk_students(
+        period: str = "month",
+        class_id: Optional[str] = None,
+        page: int = 1,
+        limit: int = 50,
+        current_user=Depends(get_current_user)
+    ):
+        """Paged at-risk students, highest absence rate first"""
+        if current_user.role not in ["super_admin", "admin", "principal", "teacher"]:
+            raise HTTPException(status_code=403, detail="Not authorized")
+
+        window = PERIOD_WINDOWS.get(period, 90)
+        params = get_pagination_params(page, limit)
+        query = {"tenant_id": current_user.tenant_id, **at_risk_query(window)}
+        if class_id:
+            query["class_id"] = class_id
+
+        total, docs = await asyncio.gather(
+            db.attendance_features.count_documents(query),
+            db.attendance_features.find(query, {"_id": 0}).sort(
+                f"absence_rate_{window}", -1
+            ).skip(params.skip).limit(params.effective_limit).to_list(params.effective_limit)
+        )
+        return create_paginated_response(
+            [insight_item(doc, window) for doc in docs], total, params.page, params.effective_limit
+        )
+
+    @api_router.post("/attendance/ai-insights/refresh")
+    async def trigger_attendance_feature_refresh(current_user=Depends(get_current_user)):
+        """Recompute the attendance features of the current tenant (background job)"""
+        if current_user.role not in ["super_admin", "admin"]:
+            raise HTTPException(status_code=403, detail="Not authorized")
+
+        job = job_queue.create_job(job_type="attendance_features", tenant_id=current_user.tenant_id)
+
+        async def refresh_task(job_id: str, tenant_id: str):
+            return await refresh_tenant_features(db, tenant_id, job_id)
+
+        asyncio.create_task(job_queue.run_job(job.id, refresh_task, current_user.tenant_id))
+        return {
+            "job_id": job.id,
+            "message": "Attendance feature refresh started",
+            "status_url": f"/api/jobs/{job.id}"
+        }
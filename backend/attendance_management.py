@@ -13,13 +13,23 @@ Features:
 """
 
 import asyncio
+import io
 import logging
 import os
+import time
 import uuid
 from datetime import datetime, timedelta
+from functools import lru_cache
 from typing import List, Optional, Dict
 from pydantic import BaseModel
 from fastapi import APIRouter, Depends, HTTPException
+from fastapi.responses import StreamingResponse
+from pymongo import InsertOne, ReturnDocument, UpdateOne
+from pymongo.errors import BulkWriteError
+
+from attendance_features import get_attendance_insights
+from attendance_rollup import attendance_report_scope, record_attendance_changes
+from cache import bump_cache_version, cache, CacheTTL, get_cache_version
 
 logger = logging.getLogger(__name__)
 
@@ -77,6 +87,163 @@ class BulkManualAttendance(BaseModel):
 # ATTENDANCE RULE ENGINE
 # ================================
 
+DEFAULT_ATTENDANCE_RULE = {
+    "late_threshold_minutes": 15,
+    "absent_threshold_minutes": 60,
+    "half_day_checkout_time": "13:00",
+    "school_start_time": "09:00",
+    "school_end_time": "15:00",
+    "excluded_days": ["friday"]
+}
+
+@lru_cache(maxsize=4096)
+def _minute_of_day(value: Optional[str]) -> Optional[int]:
+    """Minute of day of "HH:MM" or an ISO datetime string; None if unparseable"""
+    if not value or not isinstance(value, str):
+        return None
+    time_part = value.split("T")[-1][:5] if "T" in value else value[:5]
+    parts = time_part.split(":")
+    if len(parts) != 2 or not all(p.isdigit() for p in parts):
+        return None
+    hours, minutes = int(parts[0]), int(parts[1])
+    if hours > 23 or minutes > 59:
+        return None
+    return hours * 60 + minutes
+
+@lru_cache(maxsize=1024)
+def _day_name(date_str: str) -> str:
+    return datetime.strptime(date_str, "%Y-%m-%d").strftime("%A").lower()
+
+class CompiledAttendanceRule:
+    """An attendance rule reduced to minute-of-day thresholds"""
+
+    __slots__ = (
+        "start_minute", "late_minute", "absent_minute", "half_day_minute",
+        "excluded_days", "late_reason", "absent_reason", "half_day_reason"
+    )
+
+    def __init__(self, rule: dict):
+        late_minutes = rule.get("late_threshold_minutes", 15)
+        absent_minutes = rule.get("absent_threshold_minutes", 60)
+        half_day_time = rule.get("half_day_checkout_time", "13:00")
+
+        self.start_minute = _minute_of_day(rule.get("school_start_time", "09:00"))
+        if self.start_minute is not None:
+            self.late_minute = self.start_minute + late_minutes
+            self.absent_minute = self.start_minute + absent_minutes
+        else:
+            self.late_minute = self.absent_minute = None
+        self.half_day_minute = _minute_of_day(half_day_time)
+        self.excluded_days = frozenset(d.lower() for d in rule.get("excluded_days") or [])
+        self.late_reason = f"Checked in after {late_minutes} minutes"
+        self.absent_reason = f"Checked in after {absent_minutes} minutes"
+        self.half_day_reason = f"Left before {half_day_time}"
+
+    def classify(self, check_in_time: Optional[str], check_out_time: Optional[str], day_name: str) -> dict:
+        if day_name in self.excluded_days:
+            return {"status": "holiday", "reason": f"{day_name.capitalize()} is a holiday"}
+
+        if not check_in_time:
+            return {"status": "absent", "reason": "No check-in recorded"}
+
+        check_in = _minute_of_day(check_in_time)
+        if check_in is None or self.start_minute is None:
+            return {"status": "present", "reason": "Time parse issue - default present"}
+
+        if check_in > self.absent_minute:
+            return {"status": "absent", "reason": self.absent_reason}
+        elif check_in > self.late_minute:
+            return {"status": "late", "reason": self.late_reason}
+
+        if check_out_time and self.half_day_minute is not None:
+            check_out = _minute_of_day(check_out_time)
+            if check_out is not None and check_out < self.half_day_minute:
+                return {"status": "half_day", "reason": self.half_day_reason}
+
+        return {"status": "present", "reason": "On time"}
+
+class CompiledRuleSet:
+    """
+    All active rules of a tenant, indexed the way rules are resolved:
+    class rule first, then shift rule, then the general rule, then the default.
+    """
+
+    def __init__(self, rules: List[dict]):
+        self.by_class: Dict[str, CompiledAttendanceRule] = {}
+        self.by_shift: Dict[str, CompiledAttendanceRule] = {}
+        self.general: Optional[CompiledAttendanceRule] = None
+        # First match wins, as with find_one in natural order
+        for rule in rules:
+            compiled = CompiledAttendanceRule(rule)
+            if rule.get("class_id"):
+                self.by_class.setdefault(rule["class_id"], compiled)
+            if rule.get("shift"):
+                self.by_shift.setdefault(rule["shift"], compiled)
+            if rule.get("rule_type") == "general" and self.general is None:
+                self.general = compiled
+        self.default = CompiledAttendanceRule(DEFAULT_ATTENDANCE_RULE)
+
+    def select(self, class_id: Optional[str] = None, shift: Optional[str] = None) -> CompiledAttendanceRule:
+        return (
+            (class_id and self.by_class.get(class_id))
+            or (shift and self.by_shift.get(shift))
+            or self.general
+            or self.default
+        )
+
+    def classify(
+        self,
+        check_in_time: Optional[str],
+        check_out_time: Optional[str],
+        date_str: str,
+        class_id: Optional[str] = None,
+        shift: Optional[str] = None
+    ) -> dict:
+        try:
+            return self.select(class_id, shift).classify(check_in_time, check_out_time, _day_name(date_str))
+        except Exception as e:
+            logger.error(f"Error calculating attendance status: {e}")
+            return {"status": "present", "reason": "Default status"}
+
+def attendance_rules_scope(tenant_id: str) -> str:
+    """Cache scope (and key prefix) of a tenant's compiled attendance rules"""
+    return f"attendance_rules:{tenant_id}"
+
+async def get_compiled_attendance_rules(db, tenant_id: str) -> CompiledRuleSet:
+    """Compiled rule set of a tenant, cached under the tenant's shared rules version
+    so a rule edit in one worker is seen by the others on their next read"""
+    scope = attendance_rules_scope(tenant_id)
+    cache_key = f"{scope}:v{await get_cache_version(db, scope)}"
+    rule_set = await cache.get(cache_key)
+    if rule_set is not None:
+        return rule_set
+
+    rules = await db.attendance_rules.find(
+        {"tenant_id": tenant_id, "is_active": True}, {"_id": 0}
+    ).to_list(None)
+    rule_set = CompiledRuleSet(rules)
+    await cache.set(cache_key, rule_set, CacheTTL.ATTENDANCE_RULES)
+    return rule_set
+
+async def invalidate_attendance_rules(db, tenant_id: str):
+    """Drop the compiled rule set in every worker after an attendance rule is created, edited or deleted"""
+    await bump_cache_version(db, attendance_rules_scope(tenant_id))
+    await cache.clear_pattern(f"{attendance_rules_scope(tenant_id)}:")
+
+async def classify_attendance_batch(db, tenant_id: str, items: List[dict]) -> List[dict]:
+    """
+    Classify many (check_in, check_out, date[, class_id, shift]) records at once.
+    Rules are resolved from the compiled cache; no per-record queries.
+    """
+    rule_set = await get_compiled_attendance_rules(db, tenant_id)
+    return [
+        rule_set.classify(
+            item.get("check_in"), item.get("check_out"), item.get("date"),
+            item.get("class_id"), item.get("shift")
+        )
+        for item in items
+    ]
+
 async def calculate_attendance_status(
     db,
     tenant_id: str,
@@ -87,84 +254,53 @@ async def calculate_attendance_status(
     shift: Optional[str] = None
 ) -> dict:
     """Calculate attendance status based on rules"""
-    try:
-        filter_criteria = {"tenant_id": tenant_id, "is_active": True}
-        rule = None
-        
-        if class_id:
-            filter_criteria["class_id"] = class_id
-            rule = await db.attendance_rules.find_one(filter_criteria)
-            if not rule:
-                del filter_criteria["class_id"]
-        
-        if shift and not rule:
-            filter_criteria["shift"] = shift
-            rule = await db.attendance_rules.find_one(filter_criteria)
-            if not rule:
-                del filter_criteria["shift"]
-        
-        if not rule:
-            filter_criteria["rule_type"] = "general"
-            rule = await db.attendance_rules.find_one(filter_criteria)
-        
-        if not rule:
-            rule = {
-                "late_threshold_minutes": 15,
-                "absent_threshold_minutes": 60,
-                "half_day_checkout_time": "13:00",
-                "school_start_time": "09:00",
-                "school_end_time": "15:00",
-                "excluded_days": ["friday"]
-            }
-        
-        date_obj = datetime.strptime(date_str, "%Y-%m-%d")
-        day_name = date_obj.strftime("%A").lower()
-        
-        if day_name in [d.lower() for d in rule.get("excluded_days", [])]:
-            return {"status": "holiday", "reason": f"{day_name.capitalize()} is a holiday"}
-        
-        if not check_in_time:
-            return {"status": "absent", "reason": "No check-in recorded"}
-        
-        try:
-            school_start = datetime.strptime(rule["school_start_time"], "%H:%M")
-            check_in_str = check_in_time.split("T")[-1][:5] if "T" in check_in_time else check_in_time[:5]
-            check_in = datetime.strptime(check_in_str, "%H:%M")
-        except:
-            return {"status": "present", "reason": "Time parse issue - default present"}
-        
-        late_minutes = rule["late_threshold_minutes"]
-        absent_minutes = rule["absent_threshold_minutes"]
-        
-        late_threshold = school_start + timedelta(minutes=late_minutes)
-        absent_threshold = school_start + timedelta(minutes=absent_minutes)
-        
-        if check_in > absent_threshold:
-            return {"status": "absent", "reason": f"Checked in after {absent_minutes} minutes"}
-        elif check_in > late_threshold:
-            return {"status": "late", "reason": f"Checked in after {late_minutes} minutes"}
-        
-        if check_out_time:
-            try:
-                half_day_time = datetime.strptime(rule["half_day_checkout_time"], "%H:%M")
-                check_out_str = check_out_time.split("T")[-1][:5] if "T" in check_out_time else check_out_time[:5]
-                check_out = datetime.strptime(check_out_str, "%H:%M")
-                
-                if check_out < half_day_time:
-                    return {"status": "half_day", "reason": f"Left before {rule['half_day_checkout_time']}"}
-            except:
-                pass
-        
-        return {"status": "present", "reason": "On time"}
-        
-    except Exception as e:
-        logger.error(f"Error calculating attendance status: {e}")
-        return {"status": "present", "reason": "Default status"}
+    rule_set = await get_compiled_attendance_rules(db, tenant_id)
+    return rule_set.classify(check_in_time, check_out_time, date_str, class_id, shift)
 
 # ================================
 # PARENT NOTIFICATION
 # ================================
 
+async def _deliver_attendance_message(db, tenant_id: str, student: dict, message: str, status: str, sms_enabled: bool):
+    """Send one attendance message to a student's parent by SMS and in-app notification"""
+    parent_phone = student.get("guardian_phone") or student.get("parent_phone")
+    
+    if sms_enabled and parent_phone:
+        try:
+            from twilio.rest import Client
+            account_sid = os.getenv("TWILIO_ACCOUNT_SID")
+            auth_token = os.getenv("TWILIO_AUTH_TOKEN")
+            from_number = os.getenv("TWILIO_PHONE_NUMBER")
+            
+            if account_sid and auth_token and from_number:
+                client = Client(account_sid, auth_token)
+                client.messages.create(
+                    body=message,
+                    from_=from_number,
+                    to=parent_phone
+                )
+                logger.info(f"Attendance SMS sent to {parent_phone}")
+        except Exception as sms_error:
+            logger.error(f"Failed to send SMS: {sms_error}")
+    
+    await db.notifications.insert_one({
+        "id": str(uuid.uuid4()),
+        "tenant_id": tenant_id,
+        "type": "attendance_alert",
+        "title": "উপস্থিতি সতর্কতা / Attendance Alert",
+        "message": message,
+        "recipient_type": "parent",
+        "recipient_id": student.get("parent_id"),
+        "related_student_id": student.get("id"),
+        "status": status,
+        "read": False,
+        "created_at": datetime.utcnow().isoformat()
+    })
+
+async def _attendance_sms_enabled(db, tenant_id: str) -> bool:
+    settings = await db.notification_settings.find_one({"tenant_id": tenant_id})
+    return settings.get("attendance_sms_enabled", True) if settings else True
+
 async def send_attendance_notification(db, tenant_id: str, student_id: str, status: str, date: str):
     """Send SMS/notification to parent about student attendance"""
     try:
@@ -172,7 +308,6 @@ async def send_attendance_notification(db, tenant_id: str, student_id: str, stat
         if not student:
             return
         
-        parent_phone = student.get("guardian_phone") or student.get("parent_phone")
         student_name = student.get("full_name", student.get("first_name", "Your child"))
         
         if status == "absent":
@@ -182,43 +317,52 @@ async def send_attendance_notification(db, tenant_id: str, student_id: str, stat
         else:
             return
         
-        settings = await db.notification_settings.find_one({"tenant_id": tenant_id})
-        sms_enabled = settings.get("attendance_sms_enabled", True) if settings else True
+        sms_enabled = await _attendance_sms_enabled(db, tenant_id)
+        await _deliver_attendance_message(db, tenant_id, student, message, status, sms_enabled)
         
-        if sms_enabled and parent_phone:
-            try:
-                from twilio.rest import Client
-                account_sid = os.getenv("TWILIO_ACCOUNT_SID")
-                auth_token = os.getenv("TWILIO_AUTH_TOKEN")
-                from_number = os.getenv("TWILIO_PHONE_NUMBER")
-                
-                if account_sid and auth_token and from_number:
-                    client = Client(account_sid, auth_token)
-                    client.messages.create(
-                        body=message,
-                        from_=from_number,
-                        to=parent_phone
-                    )
-                    logger.info(f"Attendance SMS sent to {parent_phone}")
-            except Exception as sms_error:
-                logger.error(f"Failed to send SMS: {sms_error}")
+    except Exception as e:
+        logger.error(f"Failed to send attendance notification: {e}")
+
+async def send_attendance_digest_notifications(db, tenant_id: str, events_by_student: Dict[str, List[tuple]]):
+    """
+    Send one message per student summarising several (date, status) events,
+    e.g. after a device backlog sync. Single events use the regular wording.
+    """
+    try:
+        if not events_by_student:
+            return
         
-        await db.notifications.insert_one({
-            "id": str(uuid.uuid4()),
-            "tenant_id": tenant_id,
-            "type": "attendance_alert",
-            "title": "উপস্থিতি সতর্কতা / Attendance Alert",
-            "message": message,
-            "recipient_type": "parent",
-            "recipient_id": student.get("parent_id"),
-            "related_student_id": student_id,
-            "status": status,
-            "read": False,
-            "created_at": datetime.utcnow().isoformat()
-        })
+        students = await db.students.find(
+            {"tenant_id": tenant_id, "id": {"$in": list(events_by_student)}},
+            {"_id": 0}
+        ).to_list(None)
+        sms_enabled = await _attendance_sms_enabled(db, tenant_id)
         
+        for student in students:
+            events = sorted(events_by_student.get(student["id"], []))
+            if not events:
+                continue
+            if len(events) == 1:
+                date, status = events[0]
+                await send_attendance_notification(db, tenant_id, student["id"], status, date)
+                continue
+            
+            student_name = student.get("full_name", student.get("first_name", "Your child"))
+            absent_dates = [d for d, st in events if st == "absent"]
+            late_dates = [d for d, st in events if st == "late"]
+            parts = []
+            if absent_dates:
+                parts.append(f"{len(absent_dates)} দিন অনুপস্থিত ({', '.join(absent_dates)})")
+            if late_dates:
+                parts.append(f"{len(late_dates)} দিন দেরিতে এসেছে ({', '.join(late_dates)})")
+            message = f"প্রিয় অভিভাবক, আপনার সন্তান {student_name} " + " এবং ".join(parts) + "। - School ERP"
+            
+            await _deliver_attendance_message(
+                db, tenant_id, student, message,
+                "absent" if absent_dates else "late", sms_enabled
+            )
     except Exception as e:
-        logger.error(f"Failed to send attendance notification: {e}")
+        logger.error(f"Failed to send attendance digest notifications: {e}")
 
 # ================================
 # HELPER FUNCTIONS
@@ -237,6 +381,551 @@ def sanitize_mongo_data(data):
         return [sanitize_mongo_data(item) for item in data]
     return data
 
+# ================================
+# BATCH ATTENDANCE WRITER
+# ================================
+
+def attendance_key(record: dict) -> tuple:
+    """Identity of an attendance record within a tenant"""
+    return (record["person_id"], record["date"], record.get("attendance_session") or "Morning")
+
+def session_match(sessions: List[str]) -> dict:
+    """Query on attendance_session matching the sessions the way attendance_key reads
+    them: legacy records without a session belong to "Morning"."""
+    sessions = list(sessions)
+    if "Morning" in sessions:
+        sessions.append(None)
+    return {"$in": sessions}
+
+async def write_student_attendance_batch(
+    db,
+    tenant_id: str,
+    records: List[dict],
+    source: str,
+    recorded_by: str,
+    recorded_by_name: str
+) -> List[dict]:
+    """
+    Upsert a batch of student attendance records in a fixed number of round trips:
+    one `$in` query for student names, one for existing records, one unordered
+    bulk_write. Records are keyed by (tenant, person, date, session); the record
+    id and created_at are kept when a record is re-saved.
+
+    Returns one outcome per distinct key: created, updated or failed.
+    """
+    # Last write wins for duplicate keys within the same submission
+    by_key: Dict[tuple, dict] = {}
+    for record in records:
+        by_key[attendance_key(record)] = record
+    if not by_key:
+        return []
+
+    person_ids = list({key[0] for key in by_key})
+    dates = list({key[1] for key in by_key})
+    sessions = list({key[2] for key in by_key})
+
+    students, existing = await asyncio.gather(
+        db.students.find(
+            {"tenant_id": tenant_id, "id": {"$in": person_ids}},
+            {"_id": 0, "id": 1, "name": 1, "full_name": 1, "class_id": 1, "section_id": 1}
+        ).to_list(None),
+        db.student_attendance.find(
+            {
+                "tenant_id": tenant_id,
+                "person_id": {"$in": person_ids},
+                "date": {"$in": dates},
+                "attendance_session": session_match(sessions)
+            },
+            {"_id": 0, "id": 1, "person_id": 1, "date": 1, "attendance_session": 1, "status": 1, "class_id": 1}
+        ).to_list(None)
+    )
+    students_by_id = {s["id"]: s for s in students}
+    existing_by_key = {attendance_key(r): r for r in existing}
+
+    now = datetime.utcnow().isoformat()
+    operations = []
+    outcomes = []
+    changes = []
+    for key, record in by_key.items():
+        person_id, date, session = key
+        student = students_by_id.get(person_id) or {}
+        current = existing_by_key.get(key)
+        record_id = (current or {}).get("id") or str(uuid.uuid4())
+
+        attendance_doc = {
+            "tenant_id": tenant_id,
+            "person_id": person_id,
+            "person_type": "student",
+            "person_name": student.get("name") or student.get("full_name", ""),
+            "date": date,
+            "status": record["status"],
+            "class_id": record.get("class_id") or student.get("class_id"),
+            "section_id": record.get("section_id") or student.get("section_id"),
+            "source": source,
+            "attendance_session": session,
+            "recorded_by": recorded_by,
+            "recorded_by_name": recorded_by_name,
+            "updated_at": now
+        }
+        for field in ("check_in", "check_out", "remarks", "reason"):
+            if field in record:
+                attendance_doc[field] = record[field]
+        if current and not current.get("id"):
+            attendance_doc["id"] = record_id
+
+        operations.append(UpdateOne(
+            {"person_id": person_id, "date": date, "attendance_session": session_match([session]), "tenant_id": tenant_id},
+            {
+                "$set": attendance_doc,
+                "$setOnInsert": {"id": record_id, "created_at": now}
+            },
+            upsert=True
+        ))
+        outcomes.append({
+            "person_id": person_id,
+            "date": date,
+            "attendance_session": session,
+            "record_id": record_id,
+            "status": record["status"],
+            "outcome": "updated" if current else "created"
+        })
+        changes.append({
+            "person_id": person_id,
+            "date": date,
+            "attendance_session": session,
+            "status": record["status"],
+            "class_id": attendance_doc["class_id"],
+            "previous_status": (current or {}).get("status"),
+            "previous_class_id": (current or {}).get("class_id")
+        })
+
+    try:
+        await db.student_attendance.bulk_write(operations, ordered=False)
+    except BulkWriteError as e:
+        for error in e.details.get("writeErrors", []):
+            outcome = outcomes[error["index"]]
+            outcome["outcome"] = "failed"
+            outcome["error"] = error.get("errmsg", "write failed")
+        logger.error(f"Attendance batch had {len(e.details.get('writeErrors', []))} failed writes")
+
+    await record_attendance_changes(db, tenant_id, (
+        change for change, outcome in zip(changes, outcomes) if outcome["outcome"] != "failed"
+    ))
+    return outcomes
+
+# ================================
+# OFFLINE SYNC ENGINE
+# ================================
+
+SYNC_CHUNK_SIZE = 1000
+
+async def sync_offline_attendance_batch(
+    db,
+    tenant_id: str,
+    device_id: str,
+    records: List[dict],
+    synced_by: Optional[str] = None
+) -> dict:
+    """
+    Sync a device backlog of attendance records.
+
+    Records are grouped by date and processed in chunks: existing rows are
+    resolved with one `$in` query per chunk, statuses come from the compiled
+    rule set, and each chunk is written with one unordered bulk_write. Records
+    are keyed by (person, date, session) like write_student_attendance_batch. An
+    earlier check-in than the stored one replaces it and reclassifies the status
+    (conflict); anything else for an existing key is a duplicate. Late/absent parent
+    notifications are coalesced into one message per student.
+    """
+    started = time.perf_counter()
+    synced_count = duplicate_count = conflict_count = invalid_count = failed_count = 0
+    rule_set = await get_compiled_attendance_rules(db, tenant_id)
+    events_by_student: Dict[str, List[tuple]] = {}
+    synced_marks: List[dict] = []
+    
+    # date -> attendance_key -> merged record (earliest check-in wins, like sequential processing)
+    by_date: Dict[str, Dict[tuple, dict]] = {}
+    for record in records:
+        person_id, date = record.get("person_id"), record.get("date")
+        if not person_id or not date:
+            invalid_count += 1
+            continue
+        people = by_date.setdefault(date, {})
+        key = attendance_key(record)
+        current = people.get(key)
+        if current is None:
+            people[key] = dict(record)
+        elif (record.get("check_in") or "23:59") < (current.get("check_in") or "23:59"):
+            current["check_in"] = record.get("check_in")
+            conflict_count += 1
+        else:
+            duplicate_count += 1
+    
+    chunk_count = 0
+    for date, people in by_date.items():
+        keys = list(people)
+        for i in range(0, len(keys), SYNC_CHUNK_SIZE):
+            chunk = keys[i:i + SYNC_CHUNK_SIZE]
+            chunk_count += 1
+            synced_at = datetime.utcnow().isoformat()
+            
+            existing_rows = await db.student_attendance.find(
+                {
+                    "tenant_id": tenant_id,
+                    "date": date,
+                    "person_id": {"$in": list({key[0] for key in chunk})},
+                    "attendance_session": session_match({key[2] for key in chunk})
+                },
+                {"_id": 0, "id": 1, "person_id": 1, "date": 1, "attendance_session": 1, "check_in": 1,
+                 "check_out": 1, "status": 1, "class_id": 1}
+            ).to_list(None)
+            existing_by_key = {}
+            for row in existing_rows:
+                existing_by_key.setdefault(attendance_key(row), row)
+            
+            operations = []
+            # (kind, mark for the read models or None)
+            pending_events = []
+            for key in chunk:
+                person_id, _, session = key
+                record = people[key]
+                existing = existing_by_key.get(key)
+                
+                if existing:
+                    new_checkin = record.get("check_in") or "23:59"
+                    if new_checkin < (existing.get("check_in") or "23:59"):
+                        # An earlier check-in can change the status (e.g. late -> present)
+                        class_id = existing.get("class_id") or record.get("class_id")
+                        status_result = rule_set.classify(
+                            new_checkin,
+                            existing.get("check_out") or record.get("check_out"),
+                            date,
+                            class_id
+                        )
+                        operations.append(UpdateOne(
+                            {"id": existing.get("id"), "tenant_id": tenant_id},
+                            {"$set": {
+                                "check_in": new_checkin,
+                                "status": status_result["status"],
+                                "status_reason": status_result["reason"],
+                                "source": "biometric_sync",
+                                "device_id": device_id,
+                                "synced_at": synced_at
+                            }}
+                        ))
+                        pending_events.append(("conflict", {
+                            "person_id": person_id,
+                            "date": date,
+                            "status": status_result["status"],
+                            "attendance_session": session,
+                            "class_id": class_id,
+                            "previous_status": existing.get("status"),
+                            "previous_class_id": existing.get("class_id")
+                        }))
+                    else:
+                        duplicate_count += 1
+                    continue
+                
+                status_result = rule_set.classify(
+                    record.get("check_in"),
+                    record.get("check_out"),
+                    date,
+                    record.get("class_id")
+                )
+                operations.append(InsertOne({
+                    "id": str(uuid.uuid4()),
+                    "tenant_id": tenant_id,
+                    **record,
+                    "attendance_session": session,
+                    "status": status_result["status"],
+                    "status_reason": status_result["reason"],
+                    "source": "biometric_sync",
+                    "device_id": device_id,
+                    "synced_at": synced_at
+                }))
+                pending_events.append(("synced", {
+                    "person_id": person_id,
+                    "date": date,
+                    "status": status_result["status"],
+                    "attendance_session": session,
+                    "class_id": record.get("class_id")
+                }))
+            
+            if not operations:
+                continue
+            
+            failed_indexes = set()
+            try:
+                await db.student_attendance.bulk_write(operations, ordered=False)
+            except BulkWriteError as e:
+                failed_indexes = {err["index"] for err in e.details.get("writeErrors", [])}
+                logger.error(f"Offline sync chunk for {date} had {len(failed_indexes)} failed writes")
+            
+            for index, (kind, mark) in enumerate(pending_events):
+                if index in failed_indexes:
+                    failed_count += 1
+                    continue
+                synced_marks.append(mark)
+                if kind == "conflict":
+                    conflict_count += 1
+                else:
+                    synced_count += 1
+                    if mark["status"] in ["absent", "late"]:
+                        events_by_student.setdefault(mark["person_id"], []).append((date, mark["status"]))
+    
+    await record_attendance_changes(db, tenant_id, synced_marks)
+    if events_by_student:
+        asyncio.create_task(send_attendance_digest_notifications(db, tenant_id, events_by_student))
+    
+    duration = time.perf_counter() - started
+    summary = {
+        "records_received": len(records),
+        "records_synced": synced_count,
+        "duplicates_skipped": duplicate_count,
+        "conflicts_resolved": conflict_count,
+        "invalid_skipped": invalid_count,
+        "failed": failed_count,
+        "dates": len(by_date),
+        "chunks": chunk_count,
+        "duration_ms": round(duration * 1000, 1),
+        "records_per_second": round(len(records) / duration, 1) if duration > 0 else None,
+        "students_notified": len(events_by_student)
+    }
+    
+    await db.sync_logs.insert_one({
+        "id": str(uuid.uuid4()),
+        "tenant_id": tenant_id,
+        "device_id": device_id,
+        "sync_type": "offline_attendance",
+        **summary,
+        "synced_by": synced_by,
+        "synced_at": datetime.utcnow().isoformat()
+    })
+    
+    return summary
+
+# ================================
+# ATTENDANCE REPORT AGGREGATION
+# ================================
+
+STATUS_COLUMNS = ["present", "absent", "late", "half_day"]
+
+def month_date_range(year: int, month: int) -> tuple:
+    """[start, end) date strings of a month"""
+    start_date = f"{year}-{month:02d}-01"
+    if month == 12:
+        end_date = f"{year + 1}-01-01"
+    else:
+        end_date = f"{year}-{month + 1:02d}-01"
+    return start_date, end_date
+
+def _current_month_start() -> str:
+    return datetime.utcnow().strftime("%Y-%m-01")
+
+def _status_count(status: str, default_status: Optional[str] = None) -> dict:
+    field = {"$ifNull": ["$status", default_status]} if default_status else "$status"
+    return {"$sum": {"$cond": [{"$eq": [field, status]}, 1, 0]}}
+
+def _attendance_rate(present: int, total: int) -> float:
+    return round((present / total * 100) if total > 0 else 0, 2)
+
+async def _report_cache_prefix(db, tenant_id: str) -> str:
+    """Key prefix of the cached closed-month reports; record_attendance_changes
+    bumps the version on any write dated in a closed month"""
+    version = await get_cache_version(db, attendance_report_scope(tenant_id))
+    return f"{attendance_report_scope(tenant_id)}:v{version}"
+
+async def aggregate_monthly_attendance(
+    db,
+    tenant_id: str,
+    month: int,
+    year: int,
+    person_type: str = "student",
+    class_id: Optional[str] = None,
+    semester_id: Optional[str] = None,
+    marhala_id: Optional[str] = None,
+    department_id: Optional[str] = None
+) -> dict:
+    """Per-person monthly attendance tallies computed with one $group pipeline"""
+    start_date, end_date = month_date_range(year, month)
+    
+    # Student reports of closed months are cached until a write lands in a closed month
+    cache_key = None
+    if person_type == "student" and start_date < _current_month_start():
+        cache_key = (
+            f"{await _report_cache_prefix(db, tenant_id)}:monthly:{start_date}:"
+            f"{class_id}:{semester_id}:{marhala_id}:{department_id}"
+        )
+        cached_report = await cache.get(cache_key)
+        if cached_report is not None:
+            return cached_report
+    
+    collection = db.student_attendance if person_type == "student" else db.attendance
+    
+    filter_criteria = {
+        "tenant_id": tenant_id,
+        "date": {"$gte": start_date, "$lt": end_date}
+    }
+    
+    # Semester-centric filtering (Madrasha hierarchy)
+    if semester_id:
+        filter_criteria["semester_id"] = semester_id
+    elif department_id:
+        filter_criteria["department_id"] = department_id
+    elif marhala_id:
+        filter_criteria["marhala_id"] = marhala_id
+    elif class_id:
+        filter_criteria["class_id"] = class_id
+    if class_id and person_type == "student":
+        filter_criteria["class_id"] = class_id
+    
+    pipeline = [
+        {"$match": filter_criteria},
+        {"$group": {
+            "_id": {"$ifNull": ["$person_id", "$employee_id"]},
+            "person_name": {"$first": {"$ifNull": ["$person_name", {"$ifNull": ["$employee_name", "Unknown"]}]}},
+            "total_days": {"$sum": 1},
+            **{status: _status_count(status, default_status="absent") for status in STATUS_COLUMNS}
+        }},
+        {"$sort": {"person_name": 1}}
+    ]
+    
+    person_details = []
+    total_records = 0
+    async for row in collection.aggregate(pipeline):
+        row["person_id"] = row.pop("_id")
+        row["attendance_rate"] = _attendance_rate(row["present"], row["total_days"])
+        total_records += row["total_days"]
+        person_details.append(row)
+    
+    report = {
+        "summary": {"total_records": total_records, "unique_persons": len(person_details)},
+        "person_details": person_details
+    }
+    if cache_key:
+        await cache.set(cache_key, report, CacheTTL.CLOSED_PERIOD_REPORT)
+    return report
+
+async def aggregate_class_wise_attendance(db, tenant_id: str, start_date: str, end_date: str) -> List[dict]:
+    """Per-class attendance tallies over [start_date, end_date) with one $group pipeline"""
+    cache_key = None
+    if end_date <= _current_month_start():
+        cache_key = f"{await _report_cache_prefix(db, tenant_id)}:class_wise:{start_date}:{end_date}"
+        cached_report = await cache.get(cache_key)
+        if cached_report is not None:
+            return cached_report
+    
+    classes = await db.classes.find(
+        {"tenant_id": tenant_id}, {"_id": 0, "id": 1, "name": 1, "class_name": 1}
+    ).to_list(None)
+    class_ids = [cls.get("id") for cls in classes]
+    
+    pipeline = [
+        {"$match": {
+            "tenant_id": tenant_id,
+            "date": {"$gte": start_date, "$lt": end_date},
+            "class_id": {"$in": class_ids}
+        }},
+        {"$group": {
+            "_id": "$class_id",
+            "total_students": {"$sum": 1},
+            **{status: _status_count(status) for status in STATUS_COLUMNS}
+        }}
+    ]
+    totals = {row["_id"]: row async for row in db.student_attendance.aggregate(pipeline)}
+    
+    class_stats = []
+    for cls in classes:
+        row = totals.get(cls.get("id"))
+        if not row:
+            continue
+        class_stats.append({
+            "class_id": cls.get("id"),
+            "class_name": cls.get("name", cls.get("class_name", "Unknown")),
+            "total_students": row["total_students"],
+            "present": row["present"],
+            "absent": row["absent"],
+            "late": row["late"],
+            "half_day": row["half_day"],
+            "attendance_rate": _attendance_rate(row["present"], row["total_students"])
+        })
+    
+    if cache_key:
+        await cache.set(cache_key, class_stats, CacheTTL.CLOSED_PERIOD_REPORT)
+    return class_stats
+
+async def export_attendance_report(
+    db,
+    tenant_id: str,
+    format: str,
+    title: str,
+    filename: str,
+    headers: List[str],
+    rows: List[list],
+    summary: dict,
+    generated_by: str = "Administrator",
+    filter_text: str = ""
+):
+    """Render an aggregated report as an Excel or PDF download"""
+    if format == "excel":
+        import openpyxl
+        from openpyxl.styles import Alignment, Font, PatternFill
+        
+        wb = openpyxl.Workbook()
+        ws = wb.active
+        ws.title = "Attendance"
+        header_fill = PatternFill(start_color="10B981", end_color="10B981", fill_type="solid")
+        header_font = Font(bold=True, color="FFFFFF", size=11)
+        
+        ws.append([title])
+        ws.append([f"{key}: {value}" for key, value in summary.items()])
+        ws.append(headers)
+        for cell in ws[3]:
+            cell.fill = header_fill
+            cell.font = header_font
+            cell.alignment = Alignment(horizontal="center", vertical="center")
+        for row in rows:
+            ws.append(row)
+        for col_idx, header in enumerate(headers, 1):
+            ws.column_dimensions[openpyxl.utils.get_column_letter(col_idx)].width = max(12, len(header) + 4)
+        
+        output = io.BytesIO()
+        wb.save(output)
+        output.seek(0)
+        return StreamingResponse(
+            output,
+            media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+            headers={"Content-Disposition": f"attachment; filename={filename}.xlsx"}
+        )
+    
+    if format == "pdf":
+        from weasyprint_pdf import generate_attendance_report_pdf
+        
+        institution = await db.institutions.find_one(
+            {"tenant_id": tenant_id, "is_active": True},
+            {"school_name": 1, "name": 1, "address": 1, "phone": 1, "email": 1}
+        ) or {}
+        phone, email = institution.get("phone"), institution.get("email")
+        output = await asyncio.to_thread(
+            generate_attendance_report_pdf,
+            report_title=title,
+            attendance_data=rows,
+            summary_data=summary,
+            headers=headers,
+            school_name=institution.get("school_name") or institution.get("name") or "ইন্টারনেট মাদ্রাসা",
+            school_address=institution.get("address") or "",
+            school_contact=f"Phone: {phone} | Email: {email}" if phone or email else "",
+            generated_by=generated_by,
+            filter_text=filter_text
+        )
+        return StreamingResponse(
+            output,
+            media_type="application/pdf",
+            headers={"Content-Disposition": f"attachment; filename={filename}.pdf"}
+        )
+    
+    raise HTTPException(status_code=400, detail="Unsupported format. Use json, excel or pdf")
+
 # ================================
 # ROUTE SETUP FUNCTION
 # ================================
@@ -307,6 +996,7 @@ def setup_attendance_routes(api_router, db, get_current_user, User):
             }
             
             await db.attendance_rules.insert_one(rule_doc)
+            await invalidate_attendance_rules(db, current_user.tenant_id)
             
             await db.audit_logs.insert_one({
                 "id": str(uuid.uuid4()),
@@ -350,6 +1040,7 @@ def setup_attendance_routes(api_router, db, get_current_user, User):
             if result.modified_count == 0:
                 raise HTTPException(status_code=404, detail="Rule not found")
             
+            await invalidate_attendance_rules(db, current_user.tenant_id)
             return {"message": "Attendance rule updated successfully"}
         except HTTPException:
             raise
@@ -375,6 +1066,7 @@ def setup_attendance_routes(api_router, db, get_current_user, User):
             if result.deleted_count == 0:
                 raise HTTPException(status_code=404, detail="Rule not found")
             
+            await invalidate_attendance_rules(db, current_user.tenant_id)
             return {"message": "Attendance rule deleted successfully"}
         except HTTPException:
             raise
@@ -382,6 +1074,20 @@ def setup_attendance_routes(api_router, db, get_current_user, User):
             logger.error(f"Failed to delete attendance rule: {e}")
             raise HTTPException(status_code=500, detail="Failed to delete attendance rule")
 
+    @api_router.post("/attendance-rules/evaluate")
+    async def evaluate_attendance_rules(
+        items: List[Dict],
+        current_user: User = Depends(get_current_user)
+    ):
+        """Classify a batch of {check_in, check_out, date, class_id, shift} records with the active rules"""
+        if current_user.role not in ["super_admin", "admin", "principal", "teacher"]:
+            raise HTTPException(status_code=403, detail="Not authorized")
+        if len(items) > 10000:
+            raise HTTPException(status_code=400, detail="Maximum 10000 records per request")
+        
+        results = await classify_attendance_batch(db, current_user.tenant_id, items)
+        return {"results": results, "total": len(results)}
+
     # ================================
     # STUDENT ATTENDANCE
     # ================================
@@ -449,71 +1155,50 @@ def setup_attendance_routes(api_router, db, get_current_user, User):
             raise HTTPException(status_code=403, detail="Not authorized to take manual attendance")
         
         try:
-            saved_count = 0
             today = datetime.utcnow().strftime("%Y-%m-%d")
             
-            for record in attendance_data:
-                if record.date < today and current_user.role not in ["super_admin", "admin"]:
-                    continue
-                
-                record_id = str(uuid.uuid4())
-                
-                student = await db.students.find_one({"id": record.person_id, "tenant_id": current_user.tenant_id})
-                
-                attendance_doc = {
-                    "id": record_id,
-                    "tenant_id": current_user.tenant_id,
-                    "person_id": record.person_id,
-                    "person_type": "student",
-                    "person_name": student.get("full_name", "") if student else "",
-                    "date": record.date,
-                    "status": record.status,
-                    "check_in": record.check_in,
-                    "check_out": record.check_out,
-                    "class_id": record.class_id or (student.get("class_id") if student else None),
-                    "section_id": record.section_id or (student.get("section_id") if student else None),
-                    "source": "manual",
-                    "recorded_by": current_user.id,
-                    "recorded_by_name": current_user.full_name or current_user.email,
-                    "remarks": record.remarks,
-                    "reason": record.reason,
-                    "attendance_session": record.attendance_session,
-                    "created_at": datetime.utcnow().isoformat()
-                }
-                
-                await db.student_attendance.update_one(
-                    {
-                        "person_id": record.person_id,
-                        "date": record.date,
-                        "attendance_session": record.attendance_session,
-                        "tenant_id": current_user.tenant_id
-                    },
-                    {"$set": attendance_doc},
-                    upsert=True
-                )
-                
-                await db.attendance_audit_logs.insert_one({
+            records = [
+                record.dict() for record in attendance_data
+                if record.date >= today or current_user.role in ["super_admin", "admin"]
+            ]
+            skipped_count = len(attendance_data) - len(records)
+            
+            outcomes = await write_student_attendance_batch(
+                db, current_user.tenant_id, records,
+                source="manual",
+                recorded_by=current_user.id,
+                recorded_by_name=current_user.full_name or current_user.email
+            )
+            saved = [o for o in outcomes if o["outcome"] != "failed"]
+            
+            if saved:
+                timestamp = datetime.utcnow().isoformat()
+                await db.attendance_audit_logs.insert_many([{
                     "id": str(uuid.uuid4()),
                     "tenant_id": current_user.tenant_id,
                     "action": "MANUAL_ATTENDANCE",
-                    "record_id": record_id,
-                    "person_id": record.person_id,
-                    "date": record.date,
-                    "status": record.status,
+                    "record_id": o["record_id"],
+                    "person_id": o["person_id"],
+                    "date": o["date"],
+                    "status": o["status"],
                     "user_id": current_user.id,
                     "user_email": current_user.email,
                     "user_role": current_user.role,
-                    "timestamp": datetime.utcnow().isoformat()
-                })
-                
-                saved_count += 1
-                
-                if record.status in ["absent", "late"]:
+                    "timestamp": timestamp
+                } for o in saved])
+            
+            for o in saved:
+                if o["status"] in ["absent", "late"]:
                     asyncio.create_task(send_attendance_notification(
-                        db, current_user.tenant_id, record.person_id, record.status, record.date
+                        db, current_user.tenant_id, o["person_id"], o["status"], o["date"]
                     ))
             
-            return {"message": f"Manual attendance saved for {saved_count} students", "saved_count": saved_count}
+            return {
+                "message": f"Manual attendance saved for {len(saved)} students",
+                "saved_count": len(saved),
+                "skipped_count": skipped_count,
+                "results": outcomes
+            }
         except Exception as e:
             logger.error(f"Failed to save manual attendance: {e}")
             raise HTTPException(status_code=500, detail="Failed to save manual attendance")
@@ -528,42 +1213,28 @@ def setup_attendance_routes(api_router, db, get_current_user, User):
             raise HTTPException(status_code=403, detail="Not authorized")
         
         try:
-            saved_count = 0
-            
-            for record in data.records:
-                record.date = data.date
-                record.class_id = data.class_id
-                if data.section_id:
-                    record.section_id = data.section_id
-                
-                record_id = str(uuid.uuid4())
-                student = await db.students.find_one({"id": record.person_id, "tenant_id": current_user.tenant_id})
-                
-                attendance_doc = {
-                    "id": record_id,
-                    "tenant_id": current_user.tenant_id,
-                    "person_id": record.person_id,
-                    "person_type": "student",
-                    "person_name": student.get("full_name", "") if student else "",
-                    "date": record.date,
-                    "status": record.status,
-                    "class_id": record.class_id,
-                    "section_id": record.section_id,
-                    "source": "manual_bulk",
-                    "attendance_session": data.attendance_session,
-                    "recorded_by": current_user.id,
-                    "recorded_by_name": current_user.full_name or current_user.email,
-                    "created_at": datetime.utcnow().isoformat()
-                }
-                
-                await db.student_attendance.update_one(
-                    {"person_id": record.person_id, "date": record.date, "attendance_session": data.attendance_session, "tenant_id": current_user.tenant_id},
-                    {"$set": attendance_doc},
-                    upsert=True
-                )
-                saved_count += 1
+            records = [{
+                "person_id": record.person_id,
+                "date": data.date,
+                "status": record.status,
+                "class_id": data.class_id,
+                "section_id": data.section_id or record.section_id,
+                "attendance_session": data.attendance_session
+            } for record in data.records]
+            
+            outcomes = await write_student_attendance_batch(
+                db, current_user.tenant_id, records,
+                source="manual_bulk",
+                recorded_by=current_user.id,
+                recorded_by_name=current_user.full_name or current_user.email
+            )
+            saved_count = sum(1 for o in outcomes if o["outcome"] != "failed")
             
-            return {"message": f"Bulk attendance saved for {saved_count} students", "saved_count": saved_count}
+            return {
+                "message": f"Bulk attendance saved for {saved_count} students",
+                "saved_count": saved_count,
+                "results": outcomes
+            }
         except Exception as e:
             logger.error(f"Failed to save bulk attendance: {e}")
             raise HTTPException(status_code=500, detail="Failed to save bulk attendance")
@@ -612,6 +1283,9 @@ def setup_attendance_routes(api_router, db, get_current_user, User):
                     "edit_reason": edit_request.edit_reason
                 }}
             )
+            await record_attendance_changes(db, current_user.tenant_id, [{
+                **record, "status": edit_request.new_status, "previous_status": old_status
+            }])
             
             await db.attendance_audit_logs.insert_one({
                 "id": str(uuid.uuid4()),
@@ -717,66 +1391,39 @@ def setup_attendance_routes(api_router, db, get_current_user, User):
     ):
         """Get monthly attendance summary report with semester filtering"""
         try:
-            start_date = f"{year}-{month:02d}-01"
-            if month == 12:
-                end_date = f"{year + 1}-01-01"
-            else:
-                end_date = f"{year}-{month + 1:02d}-01"
-            
-            collection = db.student_attendance if person_type == "student" else db.attendance
-            
-            filter_criteria = {
-                "tenant_id": current_user.tenant_id,
-                "date": {"$gte": start_date, "$lt": end_date}
-            }
-            
-            # Semester-centric filtering (Madrasha hierarchy)
-            if semester_id:
-                filter_criteria["semester_id"] = semester_id
-            elif department_id:
-                filter_criteria["department_id"] = department_id
-            elif marhala_id:
-                filter_criteria["marhala_id"] = marhala_id
-            elif class_id:
-                filter_criteria["class_id"] = class_id
-            if class_id and person_type == "student":
-                filter_criteria["class_id"] = class_id
-            
-            records = await collection.find(filter_criteria).to_list(5000)
-            
-            person_stats = {}
-            for record in records:
-                person_id = record.get("person_id") or record.get("employee_id")
-                if person_id not in person_stats:
-                    person_stats[person_id] = {
-                        "person_id": person_id,
-                        "person_name": record.get("person_name", record.get("employee_name", "Unknown")),
-                        "total_days": 0,
-                        "present": 0,
-                        "absent": 0,
-                        "late": 0,
-                        "half_day": 0
-                    }
-                
-                person_stats[person_id]["total_days"] += 1
-                status = record.get("status", "absent")
-                if status in person_stats[person_id]:
-                    person_stats[person_id][status] += 1
+            report = await aggregate_monthly_attendance(
+                db, current_user.tenant_id, month, year, person_type,
+                class_id=class_id, semester_id=semester_id,
+                marhala_id=marhala_id, department_id=department_id
+            )
             
-            for stats in person_stats.values():
-                if stats["total_days"] > 0:
-                    stats["attendance_rate"] = round((stats["present"] / stats["total_days"]) * 100, 2)
-                else:
-                    stats["attendance_rate"] = 0
+            if format != "json":
+                rows = [
+                    [p["person_name"], p["total_days"], p["present"], p["absent"],
+                     p["late"], p["half_day"], f"{p['attendance_rate']}%"]
+                    for p in report["person_details"]
+                ]
+                return await export_attendance_report(
+                    db, current_user.tenant_id, format,
+                    title=f"Monthly Attendance Report - {month:02d}/{year}",
+                    filename=f"attendance_{person_type}_{year}_{month:02d}",
+                    headers=["Name", "Days", "Present", "Absent", "Late", "Half Day", "Rate"],
+                    rows=rows,
+                    summary={"Total Records": report["summary"]["total_records"],
+                             "Persons": report["summary"]["unique_persons"]},
+                    generated_by=current_user.full_name or current_user.email,
+                    filter_text=f"{person_type.title()} | {month:02d}/{year}"
+                )
             
             return {
                 "month": month,
                 "year": year,
                 "person_type": person_type,
                 "generated_at": datetime.utcnow().isoformat(),
-                "summary": {"total_records": len(records), "unique_persons": len(person_stats)},
-                "person_details": list(person_stats.values())
+                **report
             }
+        except HTTPException:
+            raise
         except Exception as e:
             logger.error(f"Failed to generate monthly report: {e}")
             raise HTTPException(status_code=500, detail="Failed to generate report")
@@ -786,51 +1433,49 @@ def setup_attendance_routes(api_router, db, get_current_user, User):
         date: Optional[str] = None,
         month: Optional[int] = None,
         year: Optional[int] = None,
+        format: str = "json",
         current_user: User = Depends(get_current_user)
     ):
         """Get class-wise attendance summary"""
         try:
             if date:
-                date_filter = {"date": date}
+                start_date = date
+                end_date = (datetime.strptime(date, "%Y-%m-%d") + timedelta(days=1)).strftime("%Y-%m-%d")
+                period = date
             elif month and year:
-                start_date = f"{year}-{month:02d}-01"
-                if month == 12:
-                    end_date = f"{year + 1}-01-01"
-                else:
-                    end_date = f"{year}-{month + 1:02d}-01"
-                date_filter = {"date": {"$gte": start_date, "$lt": end_date}}
+                start_date, end_date = month_date_range(year, month)
+                period = f"{month:02d}/{year}"
             else:
-                date_filter = {"date": datetime.utcnow().strftime("%Y-%m-%d")}
-            
-            classes = await db.classes.find({"tenant_id": current_user.tenant_id}).to_list(50)
-            
-            class_stats = []
-            for cls in classes:
-                class_id = cls.get("id")
-                class_name = cls.get("name", cls.get("class_name", "Unknown"))
-                
-                filter_criteria = {"tenant_id": current_user.tenant_id, "class_id": class_id, **date_filter}
-                records = await db.student_attendance.find(filter_criteria).to_list(1000)
-                
-                if records:
-                    present = len([r for r in records if r.get("status") == "present"])
-                    total = len(records)
-                    
-                    class_stats.append({
-                        "class_id": class_id,
-                        "class_name": class_name,
-                        "total_students": total,
-                        "present": present,
-                        "absent": len([r for r in records if r.get("status") == "absent"]),
-                        "late": len([r for r in records if r.get("status") == "late"]),
-                        "attendance_rate": round((present / total * 100) if total > 0 else 0, 2)
-                    })
+                start_date = datetime.utcnow().strftime("%Y-%m-%d")
+                end_date = (datetime.utcnow() + timedelta(days=1)).strftime("%Y-%m-%d")
+                period = start_date
+            
+            class_stats = await aggregate_class_wise_attendance(db, current_user.tenant_id, start_date, end_date)
+            
+            if format != "json":
+                rows = [
+                    [c["class_name"], c["total_students"], c["present"], c["absent"],
+                     c["late"], f"{c['attendance_rate']}%"]
+                    for c in class_stats
+                ]
+                return await export_attendance_report(
+                    db, current_user.tenant_id, format,
+                    title=f"Class-wise Attendance Report - {period}",
+                    filename=f"attendance_class_wise_{start_date}",
+                    headers=["Class", "Records", "Present", "Absent", "Late", "Rate"],
+                    rows=rows,
+                    summary={"Classes": len(class_stats)},
+                    generated_by=current_user.full_name or current_user.email,
+                    filter_text=period
+                )
             
             return {
                 "generated_at": datetime.utcnow().isoformat(),
                 "class_summary": class_stats,
                 "total_classes": len(class_stats)
             }
+        except HTTPException:
+            raise
         except Exception as e:
             logger.error(f"Failed to generate class-wise report: {e}")
             raise HTTPException(status_code=500, detail="Failed to generate report")
@@ -847,81 +1492,19 @@ def setup_attendance_routes(api_router, db, get_current_user, User):
     ):
         """Sync offline attendance records from biometric devices"""
         try:
-            synced_count = 0
-            duplicate_count = 0
-            conflict_count = 0
-            
-            for record in records:
-                existing = await db.student_attendance.find_one({
-                    "person_id": record.get("person_id"),
-                    "date": record.get("date"),
-                    "tenant_id": current_user.tenant_id
-                })
-                
-                if existing:
-                    existing_checkin = existing.get("check_in", "23:59")
-                    new_checkin = record.get("check_in", "23:59")
-                    
-                    if new_checkin < existing_checkin:
-                        await db.student_attendance.update_one(
-                            {"id": existing.get("id")},
-                            {"$set": {
-                                "check_in": new_checkin,
-                                "source": "biometric_sync",
-                                "device_id": device_id,
-                                "synced_at": datetime.utcnow().isoformat()
-                            }}
-                        )
-                        conflict_count += 1
-                    else:
-                        duplicate_count += 1
-                else:
-                    status_result = await calculate_attendance_status(
-                        db,
-                        current_user.tenant_id,
-                        record.get("check_in"),
-                        record.get("check_out"),
-                        record.get("date"),
-                        record.get("class_id")
-                    )
-                    
-                    record_doc = {
-                        "id": str(uuid.uuid4()),
-                        "tenant_id": current_user.tenant_id,
-                        **record,
-                        "status": status_result["status"],
-                        "status_reason": status_result["reason"],
-                        "source": "biometric_sync",
-                        "device_id": device_id,
-                        "synced_at": datetime.utcnow().isoformat()
-                    }
-                    
-                    await db.student_attendance.insert_one(record_doc)
-                    synced_count += 1
-                    
-                    if status_result["status"] in ["absent", "late"]:
-                        asyncio.create_task(send_attendance_notification(
-                            db, current_user.tenant_id, record.get("person_id"),
-                            status_result["status"], record.get("date")
-                        ))
-            
-            await db.sync_logs.insert_one({
-                "id": str(uuid.uuid4()),
-                "tenant_id": current_user.tenant_id,
-                "device_id": device_id,
-                "sync_type": "offline_attendance",
-                "records_synced": synced_count,
-                "duplicates_skipped": duplicate_count,
-                "conflicts_resolved": conflict_count,
-                "synced_by": current_user.id,
-                "synced_at": datetime.utcnow().isoformat()
-            })
+            summary = await sync_offline_attendance_batch(
+                db, current_user.tenant_id, device_id, records, synced_by=current_user.id
+            )
             
             return {
                 "message": "Offline sync completed",
-                "synced": synced_count,
-                "duplicates": duplicate_count,
-                "conflicts_resolved": conflict_count
+                "synced": summary["records_synced"],
+                "duplicates": summary["duplicates_skipped"],
+                "conflicts_resolved": summary["conflicts_resolved"],
+                "invalid": summary["invalid_skipped"],
+                "failed": summary["failed"],
+                "duration_ms": summary["duration_ms"],
+                "records_per_second": summary["records_per_second"]
             }
         except Exception as e:
             logger.error(f"Failed to sync offline attendance: {e}")
@@ -937,114 +1520,9 @@ def setup_attendance_routes(api_router, db, get_current_user, User):
         class_id: Optional[str] = None,
         current_user: User = Depends(get_current_user)
     ):
-        """Get AI-assisted attendance insights and analytics"""
+        """Get AI-assisted attendance insights from the precomputed attendance features"""
         try:
-            today = datetime.utcnow()
-            if period == "week":
-                start_date = (today - timedelta(days=7)).strftime("%Y-%m-%d")
-            elif period == "month":
-                start_date = (today - timedelta(days=30)).strftime("%Y-%m-%d")
-            else:
-                start_date = (today - timedelta(days=90)).strftime("%Y-%m-%d")
-            
-            end_date = today.strftime("%Y-%m-%d")
-            
-            filter_criteria = {
-                "tenant_id": current_user.tenant_id,
-                "date": {"$gte": start_date, "$lte": end_date}
-            }
-            if class_id:
-                filter_criteria["class_id"] = class_id
-            
-            records = await db.student_attendance.find(filter_criteria).to_list(5000)
-            
-            person_patterns = {}
-            for record in records:
-                person_id = record.get("person_id")
-                if person_id not in person_patterns:
-                    person_patterns[person_id] = {
-                        "person_id": person_id,
-                        "person_name": record.get("person_name", "Unknown"),
-                        "total_days": 0,
-                        "absences": 0,
-                        "late_arrivals": 0,
-                        "absence_streak": 0,
-                        "current_streak": 0
-                    }
-                
-                person_patterns[person_id]["total_days"] += 1
-                status = record.get("status")
-                if status == "absent":
-                    person_patterns[person_id]["absences"] += 1
-                    person_patterns[person_id]["current_streak"] += 1
-                elif status == "late":
-                    person_patterns[person_id]["late_arrivals"] += 1
-                    person_patterns[person_id]["current_streak"] = 0
-                else:
-                    person_patterns[person_id]["current_streak"] = 0
-                
-                person_patterns[person_id]["absence_streak"] = max(
-                    person_patterns[person_id]["absence_streak"],
-                    person_patterns[person_id]["current_streak"]
-                )
-            
-            at_risk_students = []
-            chronic_absentees = []
-            
-            for stats in person_patterns.values():
-                if stats["total_days"] > 0:
-                    absence_rate = stats["absences"] / stats["total_days"]
-                    late_rate = stats["late_arrivals"] / stats["total_days"]
-                    
-                    if absence_rate > 0.20:
-                        chronic_absentees.append({
-                            **stats,
-                            "absence_rate": round(absence_rate * 100, 2),
-                            "risk_level": "high" if absence_rate > 0.30 else "medium"
-                        })
-                    
-                    if stats["absence_streak"] >= 3 or absence_rate > 0.15:
-                        at_risk_students.append({
-                            **stats,
-                            "absence_rate": round(absence_rate * 100, 2),
-                            "late_rate": round(late_rate * 100, 2),
-                            "risk_reason": "Consecutive absences" if stats["absence_streak"] >= 3 else "High absence rate"
-                        })
-            
-            insights = {
-                "period": period,
-                "date_range": {"start": start_date, "end": end_date},
-                "overall_stats": {
-                    "total_records": len(records),
-                    "unique_students": len(person_patterns),
-                    "overall_attendance_rate": round(
-                        len([r for r in records if r.get("status") == "present"]) / len(records) * 100 if records else 0, 2
-                    )
-                },
-                "alerts": {
-                    "at_risk_students": sorted(at_risk_students, key=lambda x: x["absence_rate"], reverse=True)[:10],
-                    "chronic_absentees": sorted(chronic_absentees, key=lambda x: x["absence_rate"], reverse=True)[:10]
-                },
-                "recommendations": []
-            }
-            
-            if chronic_absentees:
-                insights["recommendations"].append({
-                    "type": "intervention",
-                    "message_bn": f"{len(chronic_absentees)} জন শিক্ষার্থীর দীর্ঘমেয়াদী অনুপস্থিতি রয়েছে (>২০%)। অভিভাবক সভা বিবেচনা করুন।",
-                    "message": f"{len(chronic_absentees)} students have chronic absenteeism (>20%). Consider parent meetings.",
-                    "priority": "high"
-                })
-            
-            if at_risk_students:
-                insights["recommendations"].append({
-                    "type": "monitoring",
-                    "message_bn": f"{len(at_risk_students)} জন শিক্ষার্থী ঝুঁকিতে রয়েছে। নিবিড় পর্যবেক্ষণ প্রয়োজন।",
-                    "message": f"{len(at_risk_students)} students are at risk. Enable closer monitoring.",
-                    "priority": "medium"
-                })
-            
-            return insights
+            return await get_attendance_insights(db, current_user.tenant_id, period, class_id)
         except Exception as e:
             logger.error(f"Failed to generate AI insights: {e}")
             raise HTTPException(status_code=500, detail="Failed to generate insights")
@@ -1091,14 +1569,20 @@ def setup_attendance_routes(api_router, db, get_current_user, User):
             if not edit_request:
                 raise HTTPException(status_code=404, detail="Request not found")
             
-            await db.student_attendance.update_one(
+            record = await db.student_attendance.find_one_and_update(
                 {"id": edit_request["record_id"]},
                 {"$set": {
                     "status": edit_request["new_status"],
                     "approved_by": current_user.id,
                     "approved_at": datetime.utcnow().isoformat()
-                }}
+                }},
+                projection={"_id": 0, "person_id": 1, "date": 1, "status": 1, "attendance_session": 1, "class_id": 1},
+                return_document=ReturnDocument.BEFORE
             )
+            if record:
+                await record_attendance_changes(db, current_user.tenant_id, [{
+                    **record, "status": edit_request["new_status"], "previous_status": record.get("status")
+                }])
             
             await db.attendance_edit_requests.update_one(
                 {"id": request_id},
@@ -0,0 +1,438 @@
+"""
+Daily Attendance Rollups
+Per-tenant, per-class, per-day student attendance read by the dashboards.
+
+One document per (tenant, date, class) holds the status of every marked
+(student, session) slot under marks.<student>.<session>. Writers `$set` the slot
+a mark lands in and `$unset` the slot it leaves, so a mark written twice (or by
+both `attendance` and `student_attendance`) is counted once and counts never
+drift; dashboards read today's attendance with a single indexed find and count
+the slots instead of scanning the attendance collections.
+
+Status counts count (student, session) slots, so a student marked in two sessions
+counts twice; not_marked is derived from the number of distinct students with a
+mark, not from the status totals.
+
+The slots cover both `attendance` (type "student") and `student_attendance`.
+Dashboards used to count `attendance` only, so schools that mark attendance
+through the batch writer now see those marks on the dashboards too. Tenants with
+attendance from before the rollups get a one-time rebuild, started by the first
+dashboard read and recorded in `attendance_rollup_status`.
+
+record_attendance_changes is the single hook every attendance writer calls; it
+feeds the daily rollups and the monthly bitmap store (attendance_bitmap), queues
+the touched students for a feature refresh (attendance_features) and, for marks
+in a closed month, invalidates the cached closed-month reports in every worker.
+"""
+
+import asyncio
+import logging
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Optional
+
+from fastapi import Depends, HTTPException
+from pymongo import ReplaceOne, UpdateOne
+from pymongo.errors import DuplicateKeyError
+
+from attendance_bitmap import normalize_date, normalize_status, record_attendance_marks, session_field
+from attendance_features import record_attendance_feature_changes
+from cache import bump_cache_version, cache
+from job_queue import job_queue
+
+logger = logging.getLogger(__name__)
+
+ROLLUP_STATUSES = ["present", "absent", "late", "half_day", "leave", "other"]
+UNASSIGNED_CLASS = "unassigned"
+REBUILD_LEASE_SECONDS = 3600
+REBUILD_WRITE_BATCH = 1000
+
+# Tenants whose one-time rebuild is known to be done (saves a lookup per dashboard read)
+_rebuilt_tenants = set()
+
+
+def rollup_status(status: Optional[str]) -> Optional[str]:
+    status = normalize_status(status)
+    if not status:
+        return None
+    status = status.replace("-", "_").replace(" ", "_")
+    return status if status in ROLLUP_STATUSES else "other"
+
+
+def rollup_id(tenant_id: str, date: str, class_id: Optional[str]) -> str:
+    return f"{tenant_id}:{date}:{class_id or UNASSIGNED_CLASS}"
+
+
+def empty_counts() -> Dict[str, int]:
+    return {status: 0 for status in ROLLUP_STATUSES}
+
+
+def student_field(person_id: str) -> str:
+    """Student id usable as a MongoDB field name"""
+    return str(person_id).replace(".", "_").replace("$", "_")
+
+
+def count_slots(marks: Optional[dict]) -> Dict[str, int]:
+    """Status counts and distinct marked students of a rollup's marks"""
+    counts = empty_counts()
+    marked = 0
+    for sessions in (marks or {}).values():
+        statuses = [rollup_status(status) for status in (sessions or {}).values()]
+        statuses = [status for status in statuses if status]
+        for status in statuses:
+            counts[status] += 1
+        if statuses:
+            marked += 1
+    counts["total"] = sum(counts[status] for status in ROLLUP_STATUSES)
+    counts["marked"] = marked
+    return counts
+
+
+# ================================
+# WRITERS
+# ================================
+
+async def record_attendance_rollups(db, tenant_id: str, marks: Iterable[dict]) -> int:
+    """
+    Apply attendance changes to the daily rollups.
+
+    Each mark is {person_id, date, class_id, status, attendance_session?,
+    previous_class_id?}; status None clears the slot. A mark that moves the
+    student to another class clears the slot in previous_class_id. Changes are
+    merged per (date, class), later marks winning, and written with one unordered
+    bulk_write.
+    Returns the number of rollup documents touched.
+    """
+    # doc id -> {"meta": ..., "slots": {field: status or None}}
+    pending: Dict[str, dict] = {}
+
+    def put(date: str, class_id: Optional[str], field: str, status: Optional[str]):
+        doc_id = rollup_id(tenant_id, date, class_id)
+        entry = pending.setdefault(doc_id, {
+            "meta": {"tenant_id": tenant_id, "date": date, "class_id": class_id or UNASSIGNED_CLASS},
+            "slots": {}
+        })
+        entry["slots"][field] = status
+
+    for mark in marks:
+        date = normalize_date(mark.get("date"))
+        person_id = mark.get("person_id")
+        if not date or not person_id:
+            continue
+        field = f"marks.{student_field(person_id)}.{session_field(mark.get('attendance_session'))}"
+        class_id = mark.get("class_id") or UNASSIGNED_CLASS
+        previous_class_id = mark.get("previous_class_id") or class_id
+        if previous_class_id != class_id:
+            put(date, previous_class_id, field, None)
+        put(date, class_id, field, rollup_status(mark.get("status")))
+
+    now = datetime.utcnow()
+    operations = []
+    for doc_id, entry in pending.items():
+        set_fields = {field: status for field, status in entry["slots"].items() if status}
+        unset_fields = {field: "" for field, status in entry["slots"].items() if not status}
+        update = {"$set": {**set_fields, "updated_at": now}, "$setOnInsert": entry["meta"]}
+        if unset_fields:
+            update["$unset"] = unset_fields
+        operations.append(UpdateOne({"_id": doc_id}, update, upsert=True))
+
+    if operations:
+        await db.attendance_rollups.bulk_write(operations, ordered=False)
+    return len(operations)
+
+
+def attendance_report_scope(tenant_id: str) -> str:
+    """Cache scope (and key prefix) of a tenant's closed-month attendance reports"""
+    return f"attendance_report:{tenant_id}"
+
+
+async def invalidate_attendance_reports(db, tenant_id: str, dates=None):
+    """
+    Drop the cached closed-month student reports of a tenant in every worker.
+    Only writes dated before the current month can affect them; pass dates=None
+    when the dates are unknown.
+    """
+    month_start = datetime.utcnow().strftime("%Y-%m-01")
+    if dates is None or any(d and d < month_start for d in dates):
+        await bump_cache_version(db, attendance_report_scope(tenant_id))
+        await cache.clear_pattern(f"{attendance_report_scope(tenant_id)}:")
+
+
+async def invalidate_reports_for_marks(db, tenant_id: str, marks: List[dict]):
+    await invalidate_attendance_reports(db, tenant_id, [normalize_date(m.get("date")) for m in marks])
+
+
+# Student attendance collections feeding the read models, with their student filter
+ATTENDANCE_SOURCES = {
+    "attendance": {"type": "student"},
+    "student_attendance": {},
+}
+
+
+async def keep_marks_of_other_sources(db, tenant_id: str, marks: List[dict], source: str) -> List[dict]:
+    """
+    Cleared marks (status None) whose slot another attendance collection still
+    holds take that collection's status instead, so clearing a mark in `source`
+    only clears the slots that `source` owns in the read models.
+    """
+    cleared = [mark for mark in marks if not mark.get("status") and mark.get("person_id")]
+    if not cleared:
+        return marks
+    dates = {normalize_date(mark.get("date")) for mark in cleared} - {None}
+    if not dates:
+        return marks
+    person_ids = list({mark["person_id"] for mark in cleared})
+    held = {}
+    for name, student_filter in ATTENDANCE_SOURCES.items():
+        if name == source:
+            continue
+        async for row in db[name].find(
+            {
+                "tenant_id": tenant_id, **student_filter, "person_id": {"$in": person_ids},
+                "date": {"$gte": min(dates), "$lte": f"{max(dates)}T23:59:59"}
+            },
+            {"_id": 0, "person_id": 1, "date": 1, "attendance_session": 1, "status": 1, "class_id": 1}
+        ):
+            date = normalize_date(row.get("date"))
+            if date in dates and row.get("status"):
+                held[(row["person_id"], date, session_field(row.get("attendance_session")))] = row
+
+    kept = []
+    for mark in marks:
+        row = None
+        if not mark.get("status") and mark.get("person_id"):
+            row = held.get((mark["person_id"], normalize_date(mark.get("date")), session_field(mark.get("attendance_session"))))
+        kept.append({**mark, "status": row["status"], "class_id": row.get("class_id")} if row else mark)
+    return kept
+
+
+async def record_attendance_changes(db, tenant_id: str, marks: Iterable[dict], source: Optional[str] = None):
+    """
+    Feed written student attendance into the read models (daily rollups and monthly
+    bitmaps), queue the per-student attendance feature refresh and invalidate the
+    closed-month reports the marks fall in. Marks are {person_id, date, status, attendance_session?,
+    class_id?, previous_status?, previous_class_id?}; status None clears a mark.
+    Writers that clear marks pass the collection they cleared them in as `source`,
+    so slots still held by the other collection keep its mark.
+    Read-model failures are logged and never fail the write that triggered them.
+    """
+    marks = list(marks)
+    if not marks:
+        return
+    if source:
+        try:
+            marks = await keep_marks_of_other_sources(db, tenant_id, marks, source)
+        except Exception as e:
+            logger.error(f"keep_marks_of_other_sources failed for {tenant_id}: {e}")
+    for writer in (
+        record_attendance_rollups, record_attendance_marks, record_attendance_feature_changes,
+        invalidate_reports_for_marks
+    ):
+        try:
+            await writer(db, tenant_id, marks)
+        except Exception as e:
+            logger.error(f"{writer.__name__} failed for {tenant_id}: {e}")
+
+
+# ================================
+# READERS
+# ================================
+
+async def get_attendance_rollup(
+    db,
+    tenant_id: str,
+    date: str,
+    class_ids: Optional[List[str]] = None,
+    enrolled: Optional[int] = None
+) -> dict:
+    """
+    Attendance counts of one day, overall and per class. Status counts and `total`
+    count (student, session) slots; `marked` counts distinct students. `enrolled`
+    (the number of students the caller is looking at) turns into a not_marked count.
+    `rebuilding` is True while the tenant's one-time rebuild is still running.
+    """
+    rebuilding = not await ensure_attendance_rollups(db, tenant_id)
+    query = {"tenant_id": tenant_id, "date": date}
+    if class_ids is not None:
+        query["class_id"] = {"$in": list(class_ids)}
+    docs = await db.attendance_rollups.find(
+        query, {"_id": 0, "class_id": 1, "marks": 1}
+    ).to_list(None)
+
+    totals = {**empty_counts(), "total": 0, "marked": 0}
+    classes = {}
+    for doc in docs:
+        counts = count_slots(doc.get("marks"))
+        for key in totals:
+            totals[key] += counts[key]
+        classes[doc["class_id"]] = counts
+
+    if enrolled is not None:
+        totals["not_marked"] = max(enrolled - totals["marked"], 0)
+    return {"date": date, **totals, "classes": classes, "rebuilding": rebuilding}
+
+
+# ================================
+# REBUILD
+# ================================
+
+async def rebuild_attendance_rollups(
+    job_id: str,
+    db,
+    tenant_id: str,
+    start_date: Optional[str] = None,
+    end_date: Optional[str] = None
+) -> dict:
+    """
+    Recount the rollups of a tenant from `attendance` and `student_attendance`.
+
+    Every (student, date, session) slot is counted once; when both collections hold
+    it, `student_attendance` wins, and within a collection the latest write wins.
+    Rollups are overwritten one document at a time (never deleted first), so the
+    dashboards keep their numbers while the rebuild runs. A full rebuild records
+    the tenant as rebuilt.
+    """
+    date_filter = {}
+    if start_date:
+        date_filter["$gte"] = start_date
+    if end_date:
+        date_filter["$lte"] = f"{end_date}T23:59:59"
+
+    sources = [
+        (db.attendance, {"tenant_id": tenant_id, "type": "student"}),
+        (db.student_attendance, {"tenant_id": tenant_id}),
+    ]
+    projection = {"_id": 0, "person_id": 1, "date": 1, "class_id": 1, "status": 1, "attendance_session": 1}
+    # doc id -> {"meta": ..., "marks": {student: {session: status}}}
+    rollups: Dict[str, dict] = {}
+    # (date, student, session) -> doc id holding the slot, so a later write in another
+    # class moves the slot instead of counting it twice
+    slots: Dict[tuple, str] = {}
+    for index, (collection, query) in enumerate(sources):
+        if date_filter:
+            query["date"] = date_filter
+        async for record in collection.find(query, projection).sort("created_at", 1):
+            date = normalize_date(record.get("date"))
+            status = rollup_status(record.get("status"))
+            if not date or not status or not record.get("person_id"):
+                continue
+            student = student_field(record["person_id"])
+            session = session_field(record.get("attendance_session"))
+            doc_id = rollup_id(tenant_id, date, record.get("class_id"))
+            previous_id = slots.get((date, student, session))
+            if previous_id and previous_id != doc_id:
+                rollups[previous_id]["marks"][student].pop(session, None)
+            slots[(date, student, session)] = doc_id
+            doc = rollups.setdefault(doc_id, {
+                "meta": {"tenant_id": tenant_id, "date": date, "class_id": record.get("class_id") or UNASSIGNED_CLASS},
+                "marks": {}
+            })
+            doc["marks"].setdefault(student, {})[session] = status
+        job_queue.update_progress(job_id, index + 1)
+
+    now = datetime.utcnow()
+    operations = []
+    for doc_id, doc in rollups.items():
+        marks = {student: sessions for student, sessions in doc["marks"].items() if sessions}
+        operations.append(ReplaceOne(
+            {"_id": doc_id}, {**doc["meta"], "marks": marks, "updated_at": now}, upsert=True
+        ))
+    for i in range(0, len(operations), REBUILD_WRITE_BATCH):
+        await db.attendance_rollups.bulk_write(operations[i:i + REBUILD_WRITE_BATCH], ordered=False)
+
+    # Days and classes without any attendance left in the source collections
+    stale_filter = {"tenant_id": tenant_id}
+    if date_filter:
+        stale_filter["date"] = {key: value[:10] for key, value in date_filter.items()}
+    stale_ids = [
+        doc["_id"] async for doc in db.attendance_rollups.find(stale_filter, {"_id": 1})
+        if doc["_id"] not in rollups
+    ]
+    for i in range(0, len(stale_ids), REBUILD_WRITE_BATCH):
+        await db.attendance_rollups.delete_many({"_id": {"$in": stale_ids[i:i + REBUILD_WRITE_BATCH]}})
+
+    if not date_filter:
+        await db.attendance_rollup_status.update_one(
+            {"_id": tenant_id}, {"$set": {"rebuilt": True, "rebuilt_at": now}}, upsert=True
+        )
+        _rebuilt_tenants.add(tenant_id)
+    await db.scheduler_locks.delete_one({"_id": f"attendance_rollup_rebuild:{tenant_id}"})
+
+    return {"message": f"Rebuilt {len(rollups)} daily attendance rollups", "rollups": len(rollups)}
+
+
+async def _claim_rebuild_lease(db, tenant_id: str) -> bool:
+    """Only one worker process rebuilds a tenant's rollups at a time"""
+    now = datetime.utcnow()
+    lock_id = f"attendance_rollup_rebuild:{tenant_id}"
+    lease = {"expires_at": now + timedelta(seconds=REBUILD_LEASE_SECONDS)}
+    result = await db.scheduler_locks.update_one(
+        {"_id": lock_id, "expires_at": {"$lt": now}},
+        {"$set": lease}
+    )
+    if result.matched_count:
+        return True
+    try:
+        await db.scheduler_locks.insert_one({"_id": lock_id, **lease})
+        return True
+    except DuplicateKeyError:
+        return False
+
+
+async def ensure_attendance_rollups(db, tenant_id: str) -> bool:
+    """
+    True once the tenant's rollups have been rebuilt from the attendance collections.
+    Otherwise start the one-time rebuild (unless another worker is already on it)
+    and return False; writes keep feeding the rollups meanwhile.
+    """
+    if tenant_id in _rebuilt_tenants:
+        return True
+    if await db.attendance_rollup_status.find_one({"_id": tenant_id, "rebuilt": True}, {"_id": 1}):
+        _rebuilt_tenants.add(tenant_id)
+        return True
+    if await _claim_rebuild_lease(db, tenant_id):
+        job = job_queue.create_job(job_type="attendance_rollup_rebuild", tenant_id=tenant_id, total=2)
+        asyncio.create_task(job_queue.run_job(job.id, rebuild_attendance_rollups, db, tenant_id))
+    return False
+
+# ================================
+# ROUTES
+# ================================
+
+def setup_attendance_rollup_routes(api_router, db, get_current_user):
+    """Setup daily attendance rollup routes"""
+
+    @api_router.get("/attendance/rollups/daily")
+    async def get_daily_attendance_rollup(
+        date: Optional[str] = None,
+        class_id: Optional[str] = None,
+        current_user=Depends(get_current_user)
+    ):
+        """Attendance counts of a day (default today), overall and per class"""
+        if current_user.role not in ["super_admin", "admin", "principal", "teacher"]:
+            raise HTTPException(status_code=403, detail="Not authorized")
+        date = date or datetime.now().strftime("%Y-%m-%d")
+        return await get_attendance_rollup(
+            db, current_user.tenant_id, date, [class_id] if class_id else None
+        )
+
+    @api_router.post("/attendance/rollups/rebuild")
+    async def start_attendance_rollup_rebuild(
+        start_date: Optional[str] = None,
+        end_date: Optional[str] = None,
+        current_user=Depends(get_current_user)
+    ):
+        """Recount the daily rollups from the attendance collections (background job)"""
+        if current_user.role not in ["super_admin", "admin"]:
+            raise HTTPException(status_code=403, detail="Not authorized")
+        if not await _claim_rebuild_lease(db, current_user.tenant_id):
+            raise HTTPException(status_code=409, detail="An attendance rollup rebuild is already running")
+
+        job = job_queue.create_job(job_type="attendance_rollup_rebuild", tenant_id=current_user.tenant_id, total=2)
+        asyncio.create_task(job_queue.run_job(
+            job.id, rebuild_attendance_rollups, db, current_user.tenant_id, start_date, end_date
+        ))
+        return {
+            "job_id": job.id,
+            "message": "Attendance rollup rebuild started",
+            "status_url": f"/api/jobs/{job.id}"
+        }
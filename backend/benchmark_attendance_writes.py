@@ -0,0 +1,107 @@
+"""
+Benchmark: class attendance submission, per-student writes vs. batch writer.
+
+Compares the old path (find_one + update_one per student) with
+write_student_attendance_batch for 60- and 500-student classes, both on first
+save (inserts) and on re-save (updates).
+
+Runs against MONGO_URL in a throwaway database (BENCHMARK_DB_NAME, default
+attendance_benchmark) which is dropped afterwards:
+
+    python benchmark_attendance_writes.py
+"""
+
+import asyncio
+import os
+import time
+import uuid
+from datetime import datetime
+
+import motor.motor_asyncio
+from dotenv import load_dotenv
+
+from attendance_management import write_student_attendance_batch
+
+load_dotenv()
+
+TENANT_ID = "benchmark"
+CLASS_SIZES = [60, 500]
+RUNS = 5
+
+
+async def legacy_write(db, records):
+    """The previous implementation: 2 round trips per student"""
+    for record in records:
+        student = await db.students.find_one({"id": record["person_id"], "tenant_id": TENANT_ID})
+        await db.student_attendance.update_one(
+            {"person_id": record["person_id"], "date": record["date"],
+             "attendance_session": record["attendance_session"], "tenant_id": TENANT_ID},
+            {"$set": {
+                "id": str(uuid.uuid4()),
+                "tenant_id": TENANT_ID,
+                "person_id": record["person_id"],
+                "person_type": "student",
+                "person_name": student.get("name", "") if student else "",
+                "date": record["date"],
+                "status": record["status"],
+                "class_id": record["class_id"],
+                "source": "manual_bulk",
+                "attendance_session": record["attendance_session"],
+                "created_at": datetime.utcnow().isoformat()
+            }},
+            upsert=True
+        )
+
+
+async def batch_write(db, records):
+    await write_student_attendance_batch(db, TENANT_ID, records, "manual_bulk", "benchmark", "Benchmark")
+
+
+async def time_runs(db, writer, records, fresh: bool) -> float:
+    """Median milliseconds per submission"""
+    timings = []
+    for _ in range(RUNS):
+        if fresh:
+            await db.student_attendance.delete_many({})
+        start = time.perf_counter()
+        await writer(db, records)
+        timings.append((time.perf_counter() - start) * 1000)
+    timings.sort()
+    return timings[len(timings) // 2]
+
+
+async def main():
+    client = motor.motor_asyncio.AsyncIOMotorClient(os.environ.get("MONGO_URL", "mongodb://localhost:27017"))
+    db_name = os.environ.get("BENCHMARK_DB_NAME", "attendance_benchmark")
+    db = client[db_name]
+
+    try:
+        await db.student_attendance.create_index(
+            [("tenant_id", 1), ("person_id", 1), ("date", 1), ("attendance_session", 1)]
+        )
+        print(f"{'students':>8} {'mode':>8} {'legacy ms':>10} {'batch ms':>10} {'speedup':>8}")
+        for size in CLASS_SIZES:
+            await db.students.delete_many({})
+            await db.students.insert_many([
+                {"id": f"s{i}", "tenant_id": TENANT_ID, "name": f"Student {i}", "class_id": "c1"}
+                for i in range(size)
+            ])
+            records = [{
+                "person_id": f"s{i}", "date": "2026-01-15", "status": "present" if i % 7 else "absent",
+                "class_id": "c1", "attendance_session": "Morning"
+            } for i in range(size)]
+
+            for mode, fresh in (("insert", True), ("update", False)):
+                legacy = await time_runs(db, legacy_write, records, fresh)
+                await db.student_attendance.delete_many({})
+                if not fresh:
+                    await batch_write(db, records)
+                batch = await time_runs(db, batch_write, records, fresh)
+                print(f"{size:>8} {mode:>8} {legacy:>10.1f} {batch:>10.1f} {legacy / batch:>7.1f}x")
+    finally:
+        await client.drop_database(db_name)
+        client.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,112 @@
+"""
+Benchmark: end-of-year promotion of 20k students.
+
+Seeds 12 classes x 2 sections of students with published 10-subject results
+and class fee configurations, then times the promotion preview (rule
+evaluation + storing the decisions) and the apply job (student moves, fee
+assignment with ledger charges, history snapshots).
+
+Runs against MONGO_URL in a throwaway database (BENCHMARK_DB_NAME, default
+promotion_benchmark) which is dropped afterwards:
+
+    python benchmark_promotion.py [students]
+"""
+
+import asyncio
+import os
+import random
+import sys
+import time
+from types import SimpleNamespace
+
+import motor.motor_asyncio
+from dotenv import load_dotenv
+
+from db_indexes import create_performance_indexes
+from promotion_engine import PromotionPreviewRequest, apply_promotion, build_promotion_preview
+
+load_dotenv()
+
+TENANT_ID = "benchmark"
+SCHOOL_ID = "benchmark-school"
+CLASSES = 12
+SUBJECTS = ["Bangla", "English", "Math", "Science", "Arabic", "Quran", "Hadith", "Fiqh", "History", "ICT"]
+
+
+async def seed(db, students: int):
+    random.seed(7)
+    await db.exam_terms.insert_one({
+        "id": "final", "tenant_id": TENANT_ID, "school_id": SCHOOL_ID,
+        "name": "Final Exam", "academic_year": "2025-2026"
+    })
+    await db.classes.insert_many([{
+        "id": f"class-{c}", "tenant_id": TENANT_ID, "school_id": SCHOOL_ID, "name": f"Class {c}",
+        "standard": f"Class {c}", "internal_standard": c, "order_index": c, "is_active": True
+    } for c in range(1, CLASSES + 1)])
+    await db.sections.insert_many([{
+        "id": f"class-{c}-{name}", "tenant_id": TENANT_ID, "class_id": f"class-{c}", "name": name
+    } for c in range(1, CLASSES + 1) for name in ("A", "B")])
+    await db.fee_configurations.insert_many([{
+        "id": f"fee-{c}-{fee_type}", "tenant_id": TENANT_ID, "school_id": SCHOOL_ID,
+        "apply_to_classes": f"class-{c}", "fee_type": fee_type, "amount": amount, "is_active": True
+    } for c in range(1, CLASSES + 1) for fee_type, amount in (("Tuition Fees", 800 + 50 * c), ("Exam Fees", 300))])
+    await db.promotion_rules.insert_one({
+        "tenant_id": TENANT_ID, "school_id": SCHOOL_ID, "is_active": True, "mandatory_subjects": ["Quran"]
+    })
+
+    batch_students, batch_results = [], []
+    for i in range(students):
+        c = i % CLASSES + 1
+        section = "A" if i % 2 else "B"
+        batch_students.append({
+            "id": f"s{i}", "tenant_id": TENANT_ID, "school_id": SCHOOL_ID, "name": f"Student {i}",
+            "admission_no": str(10000 + i), "class_id": f"class-{c}", "section_id": f"class-{c}-{section}",
+            "roll_no": str(i // CLASSES + 1), "is_active": True
+        })
+        if i % 97:
+            marks = [max(0, min(100, int(random.gauss(62, 18)))) for _ in SUBJECTS]
+            batch_results.append({
+                "id": f"r{i}", "tenant_id": TENANT_ID, "school_id": SCHOOL_ID, "exam_term_id": "final",
+                "status": "published", "student_id": f"s{i}", "class_id": f"class-{c}",
+                "subjects": [{"subject_name": s, "obtained_marks": m, "max_marks": 100, "passing_marks": 33}
+                             for s, m in zip(SUBJECTS, marks)],
+                "total_marks": sum(marks), "percentage": round(sum(marks) / len(SUBJECTS), 2)
+            })
+        if len(batch_students) == 5000 or i == students - 1:
+            await db.students.insert_many(batch_students)
+            if batch_results:
+                await db.student_results.insert_many(batch_results)
+            batch_students, batch_results = [], []
+
+
+async def main():
+    students = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    client = motor.motor_asyncio.AsyncIOMotorClient(os.environ.get("MONGO_URL", "mongodb://localhost:27017"))
+    db_name = os.environ.get("BENCHMARK_DB_NAME", "promotion_benchmark")
+    db = client[db_name]
+    user = SimpleNamespace(tenant_id=TENANT_ID, school_id=SCHOOL_ID, id="benchmark", role="admin")
+
+    try:
+        await create_performance_indexes(db)
+        await seed(db, students)
+
+        start = time.perf_counter()
+        run = await build_promotion_preview(db, user, PromotionPreviewRequest(exam_term_id="final"))
+        preview_ms = (time.perf_counter() - start) * 1000
+
+        start = time.perf_counter()
+        outcome = await apply_promotion(None, db, TENANT_ID, run["id"])
+        apply_ms = (time.perf_counter() - start) * 1000
+
+        print(f"students: {students}")
+        print(f"decisions: {run['summary']}")
+        print(f"preview: {preview_ms:>9.0f} ms ({students / preview_ms * 1000:,.0f} students/s)")
+        print(f"apply:   {apply_ms:>9.0f} ms ({students / apply_ms * 1000:,.0f} students/s, "
+              f"{outcome['fees_assigned']} fees assigned)")
+    finally:
+        await client.drop_database(db_name)
+        client.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,430 @@
+"""
+Biometric Punch Ingestion (PostgreSQL)
+Application-lifetime asyncpg pool and a micro-batching writer for device punches.
+
+Punches submitted within a few milliseconds of each other are written together:
+- one `INSERT ... SELECT FROM unnest(...) RETURNING` for all new punch rows; a punch
+  already stored for the same (tenant, device, person, timestamp) is reported as a
+  duplicate, so devices and connectors can safely resend
+- one `UPDATE device_registry ... FROM unnest(...)` with the punch count per device
+- one lookup of earlier punches on the same day as each punch, for first-punch
+  detection
+all on a single pooled connection and transaction. Each caller awaits the result
+for its own punch, so the /biometric/punch response is unchanged. First punches
+are classified with the tenant's compiled attendance rules (attendance_management).
+
+The writer is the only write path into attendance_punches; reads, partitioning and
+retention live in punch_store. asyncpg is imported lazily, as before, so the rest of
+the API runs without it.
+"""
+
+import asyncio
+import json
+import logging
+import math
+import os
+import time
+from datetime import datetime, timezone
+from typing import Awaitable, Callable, Dict, List, Optional
+
+from attendance_management import CompiledRuleSet
+
+logger = logging.getLogger(__name__)
+
+PUNCH_BATCH_MAX_SIZE = int(os.environ.get("BIOMETRIC_BATCH_MAX_SIZE", "500"))
+PUNCH_BATCH_MAX_DELAY = float(os.environ.get("BIOMETRIC_BATCH_DELAY_MS", "5")) / 1000
+PG_POOL_MIN_SIZE = int(os.environ.get("PG_POOL_MIN_SIZE", "1"))
+PG_POOL_MAX_SIZE = int(os.environ.get("PG_POOL_MAX_SIZE", "10"))
+
+PUNCH_COLUMNS = [
+    "person_id", "person_type", "tenant_id", "school_id", "device_id", "device_name",
+    "punch_time", "punch_method", "punch_type", "verification_score", "status", "source_payload"
+]
+# A punch is stored once per (tenant, device, person, timestamp)
+DEDUPE_COLUMNS = ["tenant_id", "device_id", "person_id", "punch_time"]
+# Advisory lock shared by every write transaction and taken exclusively by schema
+# changes of attendance_punches (punch_store.partition_punch_table), so writers in
+# all processes wait for a table swap instead of writing into the table being replaced
+PUNCH_SCHEMA_LOCK = 7_305_216_001
+
+
+# ================================
+# CONNECTION POOL
+# ================================
+
+_pool = None
+_pool_lock = asyncio.Lock()
+
+
+async def get_pg_pool():
+    """Shared asyncpg pool, created on first use"""
+    global _pool
+    if _pool is not None:
+        return _pool
+    async with _pool_lock:
+        if _pool is None:
+            import asyncpg
+
+            database_url = os.environ.get("DATABASE_URL")
+            if not database_url:
+                raise RuntimeError("DATABASE_URL is not configured")
+            _pool = await asyncpg.create_pool(
+                database_url,
+                min_size=PG_POOL_MIN_SIZE,
+                max_size=PG_POOL_MAX_SIZE,
+                command_timeout=30
+            )
+            logger.info(f"PostgreSQL pool created (min={PG_POOL_MIN_SIZE}, max={PG_POOL_MAX_SIZE})")
+    return _pool
+
+
+async def close_pg_pool():
+    global _pool
+    if _pool is not None:
+        await _pool.close()
+        _pool = None
+
+
+# ================================
+# PUNCH RECORDS
+# ================================
+
+def parse_punch_time(value) -> datetime:
+    if isinstance(value, datetime):
+        return value
+    return datetime.fromisoformat(str(value).replace("Z", "+00:00"))
+
+
+REQUIRED_PUNCH_FIELDS = ["person_id", "device_id", "punch_time"]
+OPTIONAL_TEXT_FIELDS = ["person_type", "device_name", "punch_method", "punch_type", "status"]
+MAX_PUNCH_BATCH = 1000
+
+
+def _is_identifier(value) -> bool:
+    return isinstance(value, (str, int)) and not isinstance(value, bool) and bool(str(value).strip())
+
+
+def punch_error(punch_data: dict) -> Optional[str]:
+    """Why a device payload cannot be stored, or None"""
+    if not isinstance(punch_data, dict):
+        return "Punch must be an object"
+    for field in REQUIRED_PUNCH_FIELDS:
+        if punch_data.get(field) is None:
+            return f"Missing required field: {field}"
+    for field in ("person_id", "device_id"):
+        if not _is_identifier(punch_data[field]):
+            return f"Invalid {field}"
+    if not isinstance(punch_data["punch_time"], (str, datetime)):
+        return "Invalid punch_time"
+    try:
+        parse_punch_time(punch_data["punch_time"])
+    except (TypeError, ValueError):
+        return "Invalid punch_time"
+    for field in OPTIONAL_TEXT_FIELDS:
+        if punch_data.get(field) is not None and not isinstance(punch_data[field], str):
+            return f"Invalid {field}"
+    score = punch_data.get("verification_score")
+    if score is not None:
+        try:
+            if isinstance(score, bool) or not math.isfinite(float(score)):
+                return "Invalid verification_score"
+        except (TypeError, ValueError):
+            return "Invalid verification_score"
+    if punch_data.get("source_payload") is not None and not isinstance(punch_data["source_payload"], dict):
+        return "Invalid source_payload"
+    return None
+
+
+def is_punch_data_error(error: Exception) -> bool:
+    """True when the database refused a punch for its values (retrying cannot help)"""
+    if isinstance(error, (TypeError, ValueError)):
+        return True
+    try:
+        import asyncpg
+    except ImportError:
+        return False
+    return isinstance(error, (asyncpg.exceptions.DataError, asyncpg.exceptions.IntegrityConstraintViolationError))
+
+
+def build_punch_record(punch_data: dict, tenant_id: str, school_id: Optional[str]) -> dict:
+    """Punch row from a device payload (required fields are checked by the caller)"""
+    return {
+        "person_id": str(punch_data["person_id"]).strip(),
+        "person_type": punch_data.get("person_type") or "student",
+        "tenant_id": tenant_id,
+        "school_id": school_id,
+        "device_id": str(punch_data["device_id"]).strip(),
+        "device_name": punch_data.get("device_name") or "Unknown Device",
+        "punch_time": parse_punch_time(punch_data["punch_time"]),
+        "punch_method": punch_data.get("punch_method") or "fingerprint",
+        "punch_type": punch_data.get("punch_type") or "IN",
+        "verification_score": punch_data.get("verification_score") or 0,
+        "status": punch_data.get("status") or "verified",
+        "source_payload": punch_data.get("source_payload") or punch_data
+    }
+
+
+def _coerce(value, pg_type: str):
+    """Python value for a column of the given PostgreSQL type"""
+    if value is None:
+        return None
+    if pg_type.startswith("timestamp"):
+        if pg_type == "timestamp with time zone":
+            return value if value.tzinfo else value.replace(tzinfo=timezone.utc)
+        return value.astimezone(timezone.utc).replace(tzinfo=None) if value.tzinfo else value
+    if pg_type in ("json", "jsonb"):
+        return value if isinstance(value, str) else json.dumps(value, default=str)
+    if pg_type in ("integer", "smallint", "bigint"):
+        return int(round(float(value)))
+    if pg_type in ("double precision", "real") or pg_type.startswith("numeric"):
+        return float(value)
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, (dict, list)):
+        return json.dumps(value, default=str)
+    return str(value)
+
+
+# Rule classification of a first punch -> arrival type reported to the device
+ARRIVAL_TYPES = {"present": "on_time", "late": "late", "absent": "very_late", "holiday": "holiday"}
+
+
+def day_start(value: datetime) -> datetime:
+    return value.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def attendance_status(record: dict, earlier_punches_today: int, rules: CompiledRuleSet) -> dict:
+    """Status reported back to the device for a punch"""
+    if earlier_punches_today == 0:
+        punch_time = record["punch_time"]
+        classified = rules.classify(
+            punch_time.strftime("%H:%M"), None, punch_time.strftime("%Y-%m-%d"), record.get("class_id")
+        )
+        return {"status": "present", "type": ARRIVAL_TYPES.get(classified["status"], "on_time")}
+    if record["punch_type"] == "OUT":
+        return {"status": "checked_out", "type": "normal"}
+    return {"status": "checked_in", "type": "return"}
+
+
+# ================================
+# MICRO-BATCH WRITER
+# ================================
+
+class PunchBatchWriter:
+    """Buffers punches for a few milliseconds and writes them in one round of statements"""
+
+    def __init__(self, max_batch: int = PUNCH_BATCH_MAX_SIZE, max_delay: float = PUNCH_BATCH_MAX_DELAY):
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+        self._insert_sql: Optional[str] = None
+        self._column_types: Dict[str, str] = {}
+        self.stats = {"punches": 0, "duplicates": 0, "batches": 0, "failed_batches": 0, "largest_batch": 0}
+        self._listeners: List[Callable[[List[dict], List[dict]], None]] = []
+        self._rules_loader: Optional[Callable[[str], Awaitable[CompiledRuleSet]]] = None
+
+    def set_rules_loader(self, loader: Callable[[str], Awaitable[CompiledRuleSet]]):
+        """loader(tenant_id) returns the compiled attendance rules used to classify first punches"""
+        self._rules_loader = loader
+
+    async def _rules(self, tenant_ids) -> Dict[str, CompiledRuleSet]:
+        tenant_ids = list(dict.fromkeys(tenant_ids))
+        if self._rules_loader is None:
+            return {tenant_id: CompiledRuleSet([]) for tenant_id in tenant_ids}
+        rule_sets = await asyncio.gather(*(self._rules_loader(tenant_id) for tenant_id in tenant_ids))
+        return dict(zip(tenant_ids, rule_sets))
+
+    def add_listener(self, listener: Callable[[List[dict], List[dict]], None]):
+        """Call listener(records, results) after every stored batch; it must not block"""
+        if listener not in self._listeners:
+            self._listeners.append(listener)
+
+    async def submit(self, record: dict) -> dict:
+        """Queue a punch and wait for {duplicate, punch_id, processed_at, attendance_status}"""
+        if self._task is None or self._task.done():
+            self._queue = asyncio.Queue()
+            self._task = asyncio.create_task(self._run())
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((record, future))
+        return await future
+
+    async def submit_many(self, records: List[dict], return_exceptions: bool = False) -> List:
+        """submit() every record; with return_exceptions a failed punch yields its exception"""
+        return await asyncio.gather(*(self.submit(record) for record in records), return_exceptions=return_exceptions)
+
+    async def _run(self):
+        stopping = False
+        while not stopping:
+            item = await self._queue.get()
+            if item is None:
+                break
+            batch = [item]
+            deadline = time.monotonic() + self.max_delay
+            while len(batch) < self.max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = await asyncio.wait_for(self._queue.get(), remaining)
+                except asyncio.TimeoutError:
+                    break
+                if item is None:
+                    stopping = True
+                    break
+                batch.append(item)
+
+            try:
+                results = await self.write([record for record, _ in batch])
+                for (_, future), result in zip(batch, results):
+                    if not future.done():
+                        future.set_result(result)
+            except Exception as e:
+                self.stats["failed_batches"] += 1
+                logger.error(f"Punch batch of {len(batch)} failed: {e}")
+                await self._write_each(batch, e)
+
+    async def _write_each(self, batch: List[tuple], error: Exception):
+        """Retry a failed batch punch by punch, so one bad punch fails only its own caller"""
+        if len(batch) == 1:
+            _, future = batch[0]
+            if not future.done():
+                future.set_exception(error)
+            return
+        for record, future in batch:
+            try:
+                result = (await self.write([record]))[0]
+                if not future.done():
+                    future.set_result(result)
+            except Exception as e:
+                logger.error(f"Punch of {record.get('person_id')} on {record.get('device_id')} failed: {e}")
+                if not future.done():
+                    future.set_exception(e)
+
+    async def _prepare(self, conn):
+        """Build the batch INSERT with array types taken from the table definition"""
+        rows = await conn.fetch(
+            """SELECT a.attname, format_type(a.atttypid, a.atttypmod) AS type
+               FROM pg_attribute a
+               WHERE a.attrelid = 'attendance_punches'::regclass AND a.attnum > 0 AND NOT a.attisdropped"""
+        )
+        types = {row["attname"]: row["type"] for row in rows}
+        self._column_types = {column: types.get(column, "text") for column in PUNCH_COLUMNS}
+        arrays = ", ".join(
+            f"${i}::{self._column_types[column]}[]" for i, column in enumerate(PUNCH_COLUMNS, start=1)
+        )
+        # NOT EXISTS skips punches already stored; the unique dedupe index created with
+        # the schema (punch_store.ensure_punch_indexes) also covers two workers
+        # inserting the same punch at once
+        self._insert_sql = (
+            f"INSERT INTO attendance_punches ({', '.join(PUNCH_COLUMNS)}) "
+            f"SELECT v.* FROM unnest({arrays}) AS v({', '.join(PUNCH_COLUMNS)}) "
+            f"WHERE NOT EXISTS (SELECT 1 FROM attendance_punches p "
+            f"WHERE p.tenant_id = v.tenant_id AND p.device_id = v.device_id "
+            f"AND p.person_id = v.person_id AND p.punch_time = v.punch_time) "
+            f"ON CONFLICT DO NOTHING "
+            f"RETURNING punch_id, processed_at, {', '.join(DEDUPE_COLUMNS)}"
+        )
+
+    def _dedupe_key(self, record: dict) -> tuple:
+        return tuple(_coerce(record[column], self._column_types[column]) for column in DEDUPE_COLUMNS)
+
+    async def write(self, records: List[dict], count_devices: bool = True) -> List[dict]:
+        """
+        Store punches right away (no batching delay) and return one result per record.
+        count_devices=False leaves device_registry alone, for imports of old punches.
+        """
+        pool = await get_pg_pool()
+        async with pool.acquire() as conn:
+            if self._insert_sql is None:
+                await self._prepare(conn)
+
+            # Repeats inside the batch are duplicates of the first occurrence
+            keys = [self._dedupe_key(record) for record in records]
+            unique: Dict[tuple, dict] = {}
+            for key, record in zip(keys, records):
+                unique.setdefault(key, record)
+            batch = list(unique.values())
+
+            # Punches stored before this batch on the same day as each punch, per person.
+            # The day is the punch's own calendar day, in the punch's time zone
+            time_type = self._column_types["punch_time"]
+            people = list({
+                (r["tenant_id"], r["person_id"], _coerce(day_start(r["punch_time"]), time_type)) for r in batch
+            })
+
+            async with conn.transaction():
+                await conn.execute("SELECT pg_advisory_xact_lock_shared($1)", PUNCH_SCHEMA_LOCK)
+                earlier_rows = await conn.fetch(
+                    f"""SELECT v.tenant_id, v.person_id, v.day, count(*) AS punches
+                       FROM attendance_punches p
+                       JOIN unnest($1::text[], $2::text[], $3::{time_type}[]) AS v(tenant_id, person_id, day)
+                         ON p.tenant_id = v.tenant_id AND p.person_id = v.person_id
+                       WHERE p.punch_time >= v.day AND p.punch_time < v.day + interval '1 day'
+                       GROUP BY v.tenant_id, v.person_id, v.day""",
+                    [tenant for tenant, _, _ in people],
+                    [person for _, person, _ in people],
+                    [day for _, _, day in people]
+                )
+                columns = [
+                    [_coerce(record[column], self._column_types[column]) for record in batch]
+                    for column in PUNCH_COLUMNS
+                ]
+                inserted = await conn.fetch(self._insert_sql, *columns)
+                inserted_by_key = {tuple(row[column] for column in DEDUPE_COLUMNS): row for row in inserted}
+
+                device_counts: Dict[tuple, int] = {}
+                for row in inserted:
+                    device_key = (row["device_id"], row["tenant_id"])
+                    device_counts[device_key] = device_counts.get(device_key, 0) + 1
+                if device_counts and count_devices:
+                    await conn.execute(
+                        """UPDATE device_registry AS d SET
+                           last_seen = NOW(), connection_status = 'online',
+                           daily_punches = COALESCE(d.daily_punches, 0) + v.punches
+                           FROM unnest($1::text[], $2::text[], $3::int[]) AS v(device_id, tenant_id, punches)
+                           WHERE d.device_id = v.device_id AND d.tenant_id = v.tenant_id""",
+                        [device for device, _ in device_counts],
+                        [tenant for _, tenant in device_counts],
+                        list(device_counts.values())
+                    )
+
+        self.stats["punches"] += len(inserted)
+        self.stats["duplicates"] += len(records) - len(inserted)
+        self.stats["batches"] += 1
+        self.stats["largest_batch"] = max(self.stats["largest_batch"], len(records))
+
+        earlier = {(row["tenant_id"], row["person_id"], row["day"]): row["punches"] for row in earlier_rows}
+        rules = await self._rules(record["tenant_id"] for record in batch)
+        results = []
+        for key, record in zip(keys, records):
+            row = inserted_by_key.pop(key, None)
+            if row is None:
+                results.append({"duplicate": True, "punch_id": None, "processed_at": None, "attendance_status": None})
+                continue
+            person = (record["tenant_id"], record["person_id"], _coerce(day_start(record["punch_time"]), time_type))
+            results.append({
+                "duplicate": False,
+                "punch_id": row["punch_id"],
+                "processed_at": row["processed_at"],
+                "attendance_status": attendance_status(record, earlier.get(person, 0), rules[record["tenant_id"]])
+            })
+            earlier[person] = earlier.get(person, 0) + 1
+
+        for listener in self._listeners:
+            try:
+                listener(records, results)
+            except Exception as e:
+                logger.error(f"Punch listener failed: {e}")
+        return results
+
+    async def close(self):
+        """Flush whatever is queued and stop the writer"""
+        if self._task is None or self._task.done():
+            return
+        await self._queue.put(None)
+        await self._task
+        self._task = None
+
+
+punch_writer = PunchBatchWriter()
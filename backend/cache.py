@@ -2,10 +2,16 @@
 In-Memory Caching Layer for Performance Optimization
 Simple TTL-based cache for dashboard stats, metadata, and dropdowns
 (Redis-ready: can be swapped to Redis when needed)
+
+The cache lives in one worker process, so clearing a key only clears it in the
+worker that handled the write. Long-lived entries that any worker may need to
+invalidate put a shared version (get_cache_version, stored in MongoDB) in their
+key; bump_cache_version makes every worker miss on its next read.
 """
 
 import time
 import asyncio
+from datetime import datetime
 from typing import Any, Optional, Callable
 from functools import wraps
 import logging
@@ -73,6 +79,23 @@ class CacheTTL:
     CLASS_SECTION_LIST = 1800    # 30 minutes
     USER_CONTEXT = 300           # 5 minutes
     TENANT_INFO = 3600           # 1 hour
+    ATTENDANCE_RULES = 600       # 10 minutes (keyed by the tenant's rules version)
+    GRADING_SCHEME = 1800        # 30 minutes (keyed by the tenant's grading version)
+    MARKSHEET = 3600             # 1 hour (keyed by results version)
+    CLOSED_PERIOD_REPORT = 86400 # 24 hours (keyed by the tenant's attendance report version)
+
+async def get_cache_version(db, scope: str) -> int:
+    """Shared version of a cache scope (0 until first bumped)"""
+    doc = await db.cache_versions.find_one({"_id": scope}, {"version": 1})
+    return doc.get("version", 0) if doc else 0
+
+async def bump_cache_version(db, scope: str):
+    """Invalidate a cache scope in every worker"""
+    await db.cache_versions.update_one(
+        {"_id": scope},
+        {"$inc": {"version": 1}, "$set": {"updated_at": datetime.utcnow()}},
+        upsert=True
+    )
 
 def cached(key_prefix: str, ttl: int = 300):
     """Decorator for caching async function results"""
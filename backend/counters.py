@@ -0,0 +1,363 @@
+"""
+Per-Tenant Sequential Number Allocator
+Issues receipt numbers, admission numbers, employee ids and certificate serials per tenant/year
+from an atomic `counters` collection (findOneAndUpdate + $inc).
+
+Each worker reserves a block of numbers in a single round trip and hands them out
+from memory. Numbers are gap-tolerant: if a worker restarts, the unused tail of
+its block is simply skipped, but a number is never issued twice.
+"""
+
+import asyncio
+import logging
+import re
+from datetime import datetime
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+from cache import cache, CacheTTL
+
+logger = logging.getLogger(__name__)
+
+
+class Sequence:
+    """Known sequence names (also the keys of `institution.number_formats`)"""
+    RECEIPT = "receipt"
+    ADMISSION = "admission"
+    EMPLOYEE = "employee"
+    COURSE_CERTIFICATE = "course_certificate"
+    BONAFIDE_CERTIFICATE = "bonafide_certificate"
+
+
+# Formatting templates (str.format syntax). Available fields:
+#   {seq} {year} {yy} {month} {date} {tenant} {school_code}
+DEFAULT_TEMPLATES = {
+    Sequence.RECEIPT: "RCP{year}{seq:06d}",
+    Sequence.ADMISSION: "{school_code}{yy}{seq:04d}",
+    Sequence.EMPLOYEE: "EMP-{year}-{seq:04d}",
+    Sequence.COURSE_CERTIFICATE: "CC{year}{seq:04d}",
+    Sequence.BONAFIDE_CERTIFICATE: "BF{year}{seq:04d}",
+}
+
+# Numbers reserved per round trip. Receipts are high-volume so they are
+# pre-allocated in blocks; admission numbers, employee ids and certificate serials
+# are printed on permanent documents, so they stay dense (one number per round trip).
+BLOCK_SIZES = {
+    Sequence.RECEIPT: 10,
+    Sequence.ADMISSION: 1,
+    Sequence.EMPLOYEE: 1,
+    Sequence.COURSE_CERTIFICATE: 1,
+    Sequence.BONAFIDE_CERTIFICATE: 1,
+}
+
+_SEQ_FIELD = re.compile(r"\{seq[^}]*\}")
+
+_TEMPLATE_SAMPLE = {
+    "seq": 1, "year": 2000, "yy": "00", "month": "01",
+    "date": "20000101", "tenant": "TENANT", "school_code": "SCH",
+}
+
+
+def validate_number_template(template: str) -> bool:
+    """Check that a template formats cleanly and contains a {seq} field"""
+    if "{seq" not in template:
+        return False
+    try:
+        template.format(**_TEMPLATE_SAMPLE)
+        return True
+    except (KeyError, ValueError, IndexError):
+        return False
+
+
+def format_sequence_number(template: str, seq: int, year: int, **context) -> str:
+    """Render a sequence value through a template"""
+    now = datetime.utcnow()
+    values = {
+        "seq": seq,
+        "year": year,
+        "yy": str(year)[-2:],
+        "month": now.strftime("%m"),
+        "date": now.strftime("%Y%m%d"),
+        "tenant": "",
+        "school_code": "STU",
+    }
+    values.update({k: v for k, v in context.items() if v is not None})
+    return template.format(**values)
+
+
+def sequence_affixes(template: str, year: int, **context) -> Tuple[str, str]:
+    """Formatted text before and after the {seq} field of a template"""
+    match = _SEQ_FIELD.search(template)
+    if not match:
+        return format_sequence_number(template, 0, year, **context), ""
+    return (
+        format_sequence_number(template[:match.start()], 0, year, **context),
+        format_sequence_number(template[match.end():], 0, year, **context),
+    )
+
+
+class SequenceAllocator:
+    """Hands out sequence numbers from per-worker blocks reserved in MongoDB"""
+
+    def __init__(self, block_sizes: Optional[Dict[str, int]] = None):
+        self.block_sizes = dict(BLOCK_SIZES)
+        if block_sizes:
+            self.block_sizes.update(block_sizes)
+        # counter key -> [next value, last reserved value]
+        self._blocks: Dict[str, list] = {}
+        self._locks: Dict[str, asyncio.Lock] = {}
+        self._seeded: set = set()
+
+    @staticmethod
+    def counter_key(tenant_id: str, sequence: str, year: int) -> str:
+        return f"{tenant_id}:{sequence}:{year}"
+
+    async def next_value(
+        self,
+        db,
+        tenant_id: str,
+        sequence: str,
+        year: Optional[int] = None,
+        seed: Optional[Callable[[], Awaitable[int]]] = None
+    ) -> int:
+        """
+        Return the next value of (tenant, sequence, year).
+
+        `seed` is awaited once, when the counter does not exist yet, and should
+        return the highest number already in use so the sequence continues from
+        legacy data instead of colliding with it.
+        """
+        year = year or datetime.utcnow().year
+        key = self.counter_key(tenant_id, sequence, year)
+        lock = self._locks.setdefault(key, asyncio.Lock())
+
+        async with lock:
+            block = self._blocks.get(key)
+            if not block or block[0] > block[1]:
+                await self._ensure_seeded(db, key, tenant_id, sequence, year, seed)
+                start, end = await self._reserve_block(
+                    db, key, tenant_id, sequence, year, self.block_sizes.get(sequence, 1)
+                )
+                block = [start, end]
+                self._blocks[key] = block
+
+            value = block[0]
+            block[0] += 1
+            return value
+
+    async def peek(
+        self,
+        db,
+        tenant_id: str,
+        sequence: str,
+        year: Optional[int] = None,
+        seed: Optional[Callable[[], Awaitable[int]]] = None
+    ) -> int:
+        """Best-effort preview of the next value without consuming it"""
+        year = year or datetime.utcnow().year
+        key = self.counter_key(tenant_id, sequence, year)
+        block = self._blocks.get(key)
+        if block and block[0] <= block[1]:
+            return block[0]
+        await self.ensure_seeded(db, tenant_id, sequence, year, seed)
+        return await self.issued_value(db, tenant_id, sequence, year) + 1
+
+    async def ensure_seeded(
+        self,
+        db,
+        tenant_id: str,
+        sequence: str,
+        year: int,
+        seed: Optional[Callable[[], Awaitable[int]]] = None
+    ):
+        """Seed a new counter from legacy data without reserving any number"""
+        key = self.counter_key(tenant_id, sequence, year)
+        if seed is None or key in self._seeded:
+            return
+        async with self._locks.setdefault(key, asyncio.Lock()):
+            await self._ensure_seeded(db, key, tenant_id, sequence, year, seed)
+
+    async def issued_value(self, db, tenant_id: str, sequence: str, year: int) -> int:
+        """Highest value reserved so far across all workers (0 for a new counter)"""
+        doc = await db.counters.find_one({"_id": self.counter_key(tenant_id, sequence, year)}, {"value": 1})
+        return int(doc.get("value", 0)) if doc else 0
+
+    async def _ensure_seeded(self, db, key, tenant_id, sequence, year, seed):
+        if key not in self._seeded:
+            await self._seed_counter(db, key, tenant_id, sequence, year, seed)
+            self._seeded.add(key)
+
+    async def _seed_counter(self, db, key, tenant_id, sequence, year, seed):
+        if seed is None:
+            return
+        if await db.counters.find_one({"_id": key}, {"_id": 1}):
+            return
+        start = int(await seed() or 0)
+        try:
+            await db.counters.update_one(
+                {"_id": key},
+                {
+                    "$max": {"value": start},
+                    "$setOnInsert": {"tenant_id": tenant_id, "sequence": sequence, "year": year},
+                },
+                upsert=True
+            )
+            logger.info(f"Seeded counter {key} at {start}")
+        except DuplicateKeyError:
+            # Another worker created the counter concurrently; $max again to be safe
+            await db.counters.update_one({"_id": key}, {"$max": {"value": start}})
+
+    async def _reserve_block(self, db, key, tenant_id, sequence, year, size) -> Tuple[int, int]:
+        update = {
+            "$inc": {"value": size},
+            "$set": {"updated_at": datetime.utcnow()},
+            "$setOnInsert": {"tenant_id": tenant_id, "sequence": sequence, "year": year},
+        }
+        for attempt in range(2):
+            try:
+                doc = await db.counters.find_one_and_update(
+                    {"_id": key},
+                    update,
+                    upsert=True,
+                    return_document=ReturnDocument.AFTER
+                )
+                end = int(doc["value"])
+                return end - size + 1, end
+            except DuplicateKeyError:
+                # Concurrent upsert of a brand-new counter: retry as a plain update
+                if attempt:
+                    raise
+        raise RuntimeError(f"Could not reserve block for counter {key}")
+
+    def reset(self):
+        """Drop in-memory blocks (the unused tail of each block becomes a gap)"""
+        self._blocks.clear()
+        self._seeded.clear()
+
+
+# Global allocator instance (one per worker process)
+sequence_allocator = SequenceAllocator()
+
+
+async def get_number_templates(db, tenant_id: str) -> Dict[str, str]:
+    """Get the institution's numbering templates merged over the defaults"""
+    cache_key = f"number_formats:{tenant_id}"
+    templates = await cache.get(cache_key)
+    if templates is not None:
+        return templates
+
+    institution = await db.institutions.find_one(
+        {"tenant_id": tenant_id, "is_active": True},
+        {"number_formats": 1}
+    )
+    templates = dict(DEFAULT_TEMPLATES)
+    for name, template in ((institution or {}).get("number_formats") or {}).items():
+        if template and validate_number_template(template):
+            templates[name] = template
+        else:
+            logger.warning(f"Ignoring invalid {name} number template for {tenant_id}: {template!r}")
+
+    await cache.set(cache_key, templates, CacheTTL.INSTITUTION_METADATA)
+    return templates
+
+
+async def invalidate_number_templates(tenant_id: str):
+    """Drop cached numbering templates after institution settings change"""
+    await cache.delete(f"number_formats:{tenant_id}")
+
+
+async def _template_for(db, tenant_id: str, sequence: str) -> str:
+    templates = await get_number_templates(db, tenant_id)
+    return templates.get(sequence) or DEFAULT_TEMPLATES.get(sequence) or "{seq}"
+
+
+async def number_prefix(db, tenant_id: str, sequence: str, year: Optional[int] = None, **context: Any) -> str:
+    """Formatted text in front of the sequence value, honouring the institution's template"""
+    year = year or datetime.utcnow().year
+    template = await _template_for(db, tenant_id, sequence)
+    return sequence_affixes(template, year, tenant=tenant_id.upper(), **context)[0]
+
+
+async def allocate_number(
+    db,
+    tenant_id: str,
+    sequence: str,
+    year: Optional[int] = None,
+    seed: Optional[Callable[[], Awaitable[int]]] = None,
+    **context: Any
+) -> str:
+    """Allocate and format the next number of a sequence for a tenant"""
+    year = year or datetime.utcnow().year
+    template = await _template_for(db, tenant_id, sequence)
+    seq = await sequence_allocator.next_value(db, tenant_id, sequence, year, seed=seed)
+    return format_sequence_number(template, seq, year, tenant=tenant_id.upper(), **context)
+
+
+async def preview_number(
+    db,
+    tenant_id: str,
+    sequence: str,
+    year: Optional[int] = None,
+    seed: Optional[Callable[[], Awaitable[int]]] = None,
+    **context: Any
+) -> str:
+    """Format the next number of a sequence without consuming it"""
+    year = year or datetime.utcnow().year
+    template = await _template_for(db, tenant_id, sequence)
+    seq = await sequence_allocator.peek(db, tenant_id, sequence, year, seed=seed)
+    return format_sequence_number(template, seq, year, tenant=tenant_id.upper(), **context)
+
+
+async def claim_number(
+    db,
+    tenant_id: str,
+    sequence: str,
+    requested: Optional[str] = None,
+    year: Optional[int] = None,
+    seed: Optional[Callable[[], Awaitable[int]]] = None,
+    in_use: Optional[Callable[[str], Awaitable[bool]]] = None,
+    **context: Any
+) -> str:
+    """
+    Number to save on a new record.
+
+    A blank request, or one that falls in the not-yet-issued range of the sequence
+    (e.g. a previewed number pre-filled by a form), is replaced by a freshly
+    allocated number. So is an issued number that `in_use` reports as taken (a
+    preview that another create allocated in the meantime), so two forms opened
+    with the same preview both save. Any other value (a legacy or hand-typed
+    number) is kept as entered.
+    """
+    year = year or datetime.utcnow().year
+    requested = str(requested or "").strip()
+    if requested:
+        template = await _template_for(db, tenant_id, sequence)
+        prefix, suffix = sequence_affixes(template, year, tenant=tenant_id.upper(), **context)
+        upper = requested.upper()
+        if not (upper.startswith(prefix.upper()) and upper.endswith(suffix.upper())):
+            return requested
+        body = requested[len(prefix):len(requested) - len(suffix)]
+        if not body.isdigit():
+            return requested
+        await sequence_allocator.ensure_seeded(db, tenant_id, sequence, year, seed)
+        if int(body) <= await sequence_allocator.issued_value(db, tenant_id, sequence, year):
+            if in_use is None or not await in_use(requested):
+                return requested
+    return await allocate_number(db, tenant_id, sequence, year=year, seed=seed, **context)
+
+
+def max_numeric_suffix(values, prefix: str) -> int:
+    """Highest integer that follows `prefix` in a list of legacy identifiers"""
+    max_num = 0
+    prefix = prefix.upper()
+    for value in values:
+        value = str(value or "").upper()
+        if not value.startswith(prefix):
+            continue
+        try:
+            max_num = max(max_num, int(value[len(prefix):]))
+        except ValueError:
+            continue
+    return max_num
@@ -107,6 +107,69 @@ async def create_performance_indexes(db):
         )
         indexes_created.append("attendance: tenant_year_month")
 
+        # Staff day records (reports, payroll, punch reconciler upserts)
+        await attendance.create_index(
+            [("tenant_id", 1), ("type", 1), ("employee_id", 1), ("date", 1)],
+            name="idx_attendance_tenant_type_employee_date",
+            background=True
+        )
+        indexes_created.append("attendance: tenant_type_employee_date")
+
+        # ==================== STUDENT ATTENDANCE ====================
+
+        # Upsert key of the batch attendance writer
+        await db.student_attendance.create_index(
+            [("tenant_id", 1), ("person_id", 1), ("date", 1), ("attendance_session", 1)],
+            name="idx_student_attendance_key",
+            background=True
+        )
+        # Daily class view and date-range reports
+        await db.student_attendance.create_index(
+            [("tenant_id", 1), ("date", 1), ("class_id", 1)],
+            name="idx_student_attendance_tenant_date_class",
+            background=True
+        )
+        indexes_created.append("student_attendance: key, tenant_date_class")
+
+        # ==================== ATTENDANCE BITMAPS ====================
+
+        # _id is tenant:student:YYYY-MM; these serve yearly summaries and class heatmaps
+        await db.attendance_bitmaps.create_index(
+            [("tenant_id", 1), ("student_id", 1), ("year", 1)],
+            name="idx_attendance_bitmaps_tenant_student_year",
+            background=True
+        )
+        await db.attendance_bitmaps.create_index(
+            [("tenant_id", 1), ("class_id", 1), ("year", 1), ("month", 1)],
+            name="idx_attendance_bitmaps_tenant_class_month",
+            background=True
+        )
+        indexes_created.append("attendance_bitmaps: tenant_student_year, tenant_class_month")
+
+        # ==================== ATTENDANCE ROLLUPS ====================
+
+        # Dashboards: one day of a tenant, optionally restricted to some classes
+        await db.attendance_rollups.create_index(
+            [("tenant_id", 1), ("date", 1), ("class_id", 1)],
+            name="idx_attendance_rollups_tenant_date_class",
+            background=True
+        )
+        indexes_created.append("attendance_rollups: tenant_date_class")
+
+        # ==================== ATTENDANCE FEATURES ====================
+
+        # _id is tenant:student; at-risk lists sort by the absence rate of the requested window
+        await db.attendance_features.create_index([("tenant_id", 1), ("absence_rate_7", -1)], name="idx_features_tenant_absence_7", background=True)
+        await db.attendance_features.create_index([("tenant_id", 1), ("absence_rate_30", -1)], name="idx_features_tenant_absence_30", background=True)
+        await db.attendance_features.create_index([("tenant_id", 1), ("absence_rate_90", -1)], name="idx_features_tenant_absence_90", background=True)
+        await db.attendance_features.create_index([("tenant_id", 1), ("class_id", 1), ("absence_rate_30", -1)], name="idx_features_tenant_class_absence_30", background=True)
+        await db.attendance_features.create_index([("tenant_id", 1), ("as_of", 1)], name="idx_features_tenant_as_of", background=True)
+        indexes_created.append("attendance_features: tenant_absence_7/30/90, tenant_class_absence_30, tenant_as_of")
+
+        # Students queued by attendance writes, drained oldest first by the refresh loop
+        await db.attendance_feature_queue.create_index([("queued_at", 1)], name="idx_feature_queue_queued_at", background=True)
+        indexes_created.append("attendance_feature_queue: queued_at")
+
         # ==================== RESULTS COLLECTION ====================
         results = db.results
         
@@ -126,6 +189,59 @@ async def create_performance_indexes(db):
         )
         indexes_created.append("results: student_year")
 
+        # Result ranking (published results of an exam term) and merit lists
+        await db.student_results.create_index(
+            [("tenant_id", 1), ("school_id", 1), ("exam_term_id", 1), ("status", 1)],
+            name="idx_student_results_tenant_term_status",
+            background=True
+        )
+        await db.student_results.create_index(
+            [("tenant_id", 1), ("school_id", 1), ("exam_term_id", 1), ("merit_rank", 1)],
+            name="idx_student_results_tenant_term_merit",
+            background=True
+        )
+
+        # Result entry upserts (one result per student per exam term)
+        await db.student_results.create_index(
+            [("tenant_id", 1), ("school_id", 1), ("exam_term_id", 1), ("student_id", 1)],
+            name="idx_student_results_tenant_term_student",
+            background=True
+        )
+        indexes_created.append("student_results: tenant_term_status, tenant_term_merit, tenant_term_student")
+
+        # Results version per exam term (marksheet cache keys) and analytics snapshots
+        await db.result_versions.create_index(
+            [("tenant_id", 1), ("school_id", 1), ("exam_term_id", 1)],
+            name="idx_result_versions_tenant_term",
+            unique=True,
+            background=True
+        )
+        await db.result_analytics.create_index(
+            [("tenant_id", 1), ("school_id", 1), ("exam_term_id", 1)],
+            name="idx_result_analytics_tenant_term",
+            unique=True,
+            background=True
+        )
+        indexes_created.append("result_versions: tenant_term, result_analytics: tenant_term")
+
+        # Promotion runs and their per-student decisions / history snapshots
+        await db.promotion_runs.create_index(
+            [("tenant_id", 1), ("school_id", 1), ("status", 1), ("created_at", -1)],
+            name="idx_promotion_runs_tenant_status",
+            background=True
+        )
+        await db.student_promotions.create_index(
+            [("tenant_id", 1), ("promotion_id", 1), ("applied", 1)],
+            name="idx_student_promotions_run_applied",
+            background=True
+        )
+        await db.student_promotions.create_index(
+            [("tenant_id", 1), ("student_id", 1), ("created_at", -1)],
+            name="idx_student_promotions_student",
+            background=True
+        )
+        indexes_created.append("promotion_runs: tenant_status, student_promotions: run_applied, student")
+
         # ==================== USERS COLLECTION ====================
         users = db.users
         
@@ -146,6 +262,15 @@ async def create_performance_indexes(db):
         )
         indexes_created.append("users: tenant_username (unique)")
 
+        # ==================== STAFF COLLECTION ====================
+        # Duplicate email checks during staff import
+        await db.staff.create_index(
+            [("tenant_id", 1), ("email", 1), ("is_active", 1)],
+            name="idx_staff_tenant_email_active",
+            background=True
+        )
+        indexes_created.append("staff: tenant_email_active")
+
         # ==================== CLASSES COLLECTION ====================
         classes = db.classes
         
@@ -194,6 +319,95 @@ async def create_performance_indexes(db):
         )
         indexes_created.append("fees: tenant_duedate_status")
 
+        # ==================== STUDENT FEES / OVERDUE ENGINE ====================
+        
+        # Overdue engine range scan: fees whose due date has passed
+        await db.student_fees.create_index(
+            [("tenant_id", 1), ("is_active", 1), ("due_at", 1)],
+            name="idx_student_fees_tenant_active_due_at",
+            background=True
+        )
+        await db.student_fees.create_index(
+            [("tenant_id", 1), ("student_id", 1)],
+            name="idx_student_fees_tenant_student",
+            background=True
+        )
+        await db.fee_ledgers.create_index(
+            [("tenant_id", 1), ("student_id", 1)],
+            name="idx_fee_ledgers_tenant_student",
+            background=True
+        )
+        await db.fee_defaulters.create_index(
+            [("tenant_id", 1), ("snapshot_id", 1), ("overdue_amount", -1)],
+            name="idx_fee_defaulters_snapshot_amount",
+            background=True
+        )
+        indexes_created.append("student_fees: tenant_active_due_at, tenant_student; fee_ledgers: tenant_student; fee_defaulters: snapshot")
+
+        # ==================== STUDENT LEDGER ====================
+        
+        # Statements: range scan per student by entry date
+        await db.student_ledger_entries.create_index(
+            [("tenant_id", 1), ("student_id", 1), ("entry_date", 1)],
+            name="idx_ledger_tenant_student_date",
+            background=True
+        )
+        # Idempotent writers: one entry per source record
+        await db.student_ledger_entries.create_index(
+            [("tenant_id", 1), ("source", 1), ("source_id", 1)],
+            name="idx_ledger_tenant_source_unique",
+            unique=True,
+            background=True
+        )
+        await db.student_ledger_entries.create_index(
+            [("tenant_id", 1), ("student_id", 1), ("period_year", 1), ("entry_type", 1)],
+            name="idx_ledger_tenant_student_period",
+            background=True
+        )
+        indexes_created.append("student_ledger_entries: tenant_student_date, source (unique), period")
+
+        # ==================== SSLCOMMERZ ====================
+
+        # IPN dedupe: a repeated delivery of the same notification is a no-op
+        await db.sslcommerz_ipn.create_index(
+            [("tran_id", 1), ("val_id", 1)],
+            name="idx_ipn_tran_val_unique",
+            unique=True,
+            background=True
+        )
+        await db.sslcommerz_ipn.create_index(
+            [("status", 1)],
+            name="idx_ipn_status",
+            background=True
+        )
+        await db.payment_transactions.create_index(
+            [("tran_id", 1)],
+            name="idx_payment_tran_id",
+            background=True
+        )
+        indexes_created.append("sslcommerz_ipn: tran_val (unique), status; payment_transactions: tran_id")
+
+        # ==================== FEE RECEIPTS ====================
+
+        await db.payments.create_index(
+            [("tenant_id", 1), ("receipt_no", 1)],
+            name="idx_payments_tenant_receipt",
+            background=True
+        )
+        # Bulk "receipts for a date" ZIP
+        await db.payments.create_index(
+            [("tenant_id", 1), ("payment_date", 1)],
+            name="idx_payments_tenant_date",
+            background=True
+        )
+        # Artifacts are keyed by content hash (_id); this finds stale revisions
+        await db.fee_receipt_artifacts.create_index(
+            [("tenant_id", 1), ("receipt_no", 1)],
+            name="idx_receipt_artifacts_tenant_receipt",
+            background=True
+        )
+        indexes_created.append("payments: tenant_receipt, tenant_date; fee_receipt_artifacts: tenant_receipt")
+
         # ==================== MADRASHA ACADEMIC ====================
         
         # Marhalas
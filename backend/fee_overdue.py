@@ -0,0 +1,454 @@
+"""
+Fee Overdue & Defaulter Engine
+Nightly batch job that moves pending fees into overdue once their due date passes.
+
+Per tenant it:
+- finds fees whose `due_at` has passed with one indexed range query
+- moves pending_amount into overdue_amount with a single bulk_write
+- refreshes the per-student fee_ledgers rollups for the affected students
+- stores a defaulter list snapshot (student, class, amount, days overdue)
+  that reports and overdue notifications read instead of recomputing
+- imports the fee history of students whose ledger is not initialized yet, so
+  ledger balances never depend on someone opening the student's fee pages
+"""
+
+import asyncio
+import calendar
+import logging
+import uuid
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional
+
+from fastapi import Depends, HTTPException
+from pymongo import UpdateOne
+
+from job_queue import job_queue
+from pagination import get_pagination_params, create_paginated_response
+from student_ledger import initialize_student_ledgers
+
+logger = logging.getLogger(__name__)
+
+OVERDUE_BATCH_SIZE = 1000
+OVERDUE_RUN_HOUR_UTC = 18  # 00:00 Bangladesh time
+
+
+# ================================
+# DUE DATE NORMALIZATION
+# ================================
+
+def resolve_due_at(fee: Dict[str, Any]) -> Optional[datetime]:
+    """
+    Turn a student_fee's `due_date` into a concrete datetime.
+
+    `due_date` is stored either as a date/ISO string or, for fees generated
+    from a fee configuration, as a day of the month (e.g. 10). Day-of-month
+    values are resolved against the month the fee was generated in.
+    """
+    due_date = fee.get("due_date")
+    if due_date is None or due_date == "":
+        return None
+    if isinstance(due_date, datetime):
+        return due_date
+    if isinstance(due_date, str):
+        try:
+            parsed = datetime.fromisoformat(due_date.replace('Z', '+00:00'))
+            return parsed.replace(tzinfo=None)
+        except ValueError:
+            return None
+    if isinstance(due_date, (int, float)):
+        day = int(due_date)
+        if day < 1 or day > 31:
+            return None
+        base = fee.get("created_at") if isinstance(fee.get("created_at"), datetime) else datetime.utcnow()
+        last_day = calendar.monthrange(base.year, base.month)[1]
+        return datetime(base.year, base.month, min(day, last_day))
+    return None
+
+
+async def backfill_due_at(db, tenant_id: str) -> int:
+    """Materialize `due_at` on fees that only have the legacy `due_date` field"""
+    cursor = db.student_fees.find(
+        {
+            "tenant_id": tenant_id,
+            "due_at": {"$exists": False},
+            "due_date": {"$nin": [None, ""]}
+        },
+        {"_id": 1, "due_date": 1, "created_at": 1}
+    )
+    operations = []
+    updated = 0
+    async for fee in cursor:
+        operations.append(UpdateOne({"_id": fee["_id"]}, {"$set": {"due_at": resolve_due_at(fee)}}))
+        if len(operations) >= OVERDUE_BATCH_SIZE:
+            result = await db.student_fees.bulk_write(operations, ordered=False)
+            updated += result.modified_count
+            operations = []
+    if operations:
+        result = await db.student_fees.bulk_write(operations, ordered=False)
+        updated += result.modified_count
+    return updated
+
+
+def split_unpaid_amount(
+    amount: float,
+    paid_amount: float,
+    due_at: Optional[datetime],
+    was_overdue: bool,
+    as_of: datetime
+) -> Dict[str, Any]:
+    """
+    Pending/overdue split and status of a fee whose amount or due date changed.
+
+    The unpaid remainder stays overdue only if the fee had already been moved to
+    overdue and its (new) due date has still passed; otherwise it is pending again
+    and the nightly run moves it once the due date passes.
+    """
+    unpaid = max(0, (amount or 0) - (paid_amount or 0))
+    if not unpaid:
+        return {"pending_amount": 0, "overdue_amount": 0, "status": "paid"}
+    if was_overdue and due_at is not None and due_at < as_of:
+        return {"pending_amount": 0, "overdue_amount": unpaid, "status": "overdue"}
+    return {
+        "pending_amount": unpaid,
+        "overdue_amount": 0,
+        "status": "partial" if paid_amount else "pending"
+    }
+
+
+# ================================
+# OVERDUE TRANSITION
+# ================================
+
+async def mark_overdue_fees(db, tenant_id: str, as_of: datetime) -> Dict[str, Any]:
+    """Move pending amounts into overdue for every fee whose due date has passed"""
+    cursor = db.student_fees.find(
+        {
+            "tenant_id": tenant_id,
+            "is_active": True,
+            "due_at": {"$lt": as_of},
+            "pending_amount": {"$gt": 0}
+        },
+        {"_id": 1, "student_id": 1, "pending_amount": 1}
+    )
+
+    operations = []
+    affected_students = set()
+    transitioned = 0
+    async for fee in cursor:
+        pending = fee.get("pending_amount", 0) or 0
+        # Guard on the pending amount read so a concurrent payment is never overwritten
+        operations.append(UpdateOne(
+            {"_id": fee["_id"], "pending_amount": pending},
+            {
+                "$inc": {"overdue_amount": pending},
+                "$set": {"pending_amount": 0, "status": "overdue", "overdue_since": as_of, "updated_at": datetime.utcnow()}
+            }
+        ))
+        affected_students.add(fee["student_id"])
+        if len(operations) >= OVERDUE_BATCH_SIZE:
+            result = await db.student_fees.bulk_write(operations, ordered=False)
+            transitioned += result.modified_count
+            operations = []
+    if operations:
+        result = await db.student_fees.bulk_write(operations, ordered=False)
+        transitioned += result.modified_count
+
+    return {"transitioned": transitioned, "student_ids": list(affected_students)}
+
+
+async def refresh_fee_ledgers(db, tenant_id: str, student_ids: List[str]) -> int:
+    """Recompute the pending/overdue split on fee_ledgers for the given students"""
+    if not student_ids:
+        return 0
+
+    refreshed = 0
+    now = datetime.utcnow()
+    for i in range(0, len(student_ids), OVERDUE_BATCH_SIZE):
+        chunk = student_ids[i:i + OVERDUE_BATCH_SIZE]
+        totals = await db.student_fees.aggregate([
+            {"$match": {"tenant_id": tenant_id, "is_active": True, "student_id": {"$in": chunk}}},
+            {"$group": {
+                "_id": "$student_id",
+                "pending_amount": {"$sum": "$pending_amount"},
+                "overdue_amount": {"$sum": "$overdue_amount"}
+            }}
+        ]).to_list(None)
+
+        operations = [
+            UpdateOne(
+                {"tenant_id": tenant_id, "student_id": row["_id"], "is_active": True},
+                {
+                    # Totals and balance are owned by the student ledger; only the
+                    # pending/overdue split is refreshed here
+                    "$set": {
+                        "pending_amount": row["pending_amount"],
+                        "overdue_amount": row["overdue_amount"],
+                        "updated_at": now
+                    },
+                    "$setOnInsert": {"id": str(uuid.uuid4()), "created_at": now}
+                },
+                upsert=True
+            )
+            for row in totals
+        ]
+        if operations:
+            result = await db.fee_ledgers.bulk_write(operations, ordered=False)
+            refreshed += result.modified_count + result.upserted_count
+    return refreshed
+
+
+# ================================
+# DEFAULTER SNAPSHOT
+# ================================
+
+async def build_defaulter_snapshot(db, tenant_id: str, as_of: datetime) -> Dict[str, Any]:
+    """Store the current defaulter list and point the tenant's snapshot pointer at it"""
+    rows = await db.student_fees.aggregate([
+        {"$match": {"tenant_id": tenant_id, "is_active": True, "overdue_amount": {"$gt": 0}}},
+        {"$group": {
+            "_id": "$student_id",
+            "student_name": {"$first": "$student_name"},
+            "admission_no": {"$first": "$admission_no"},
+            "class_id": {"$first": "$class_id"},
+            "section_id": {"$first": "$section_id"},
+            "overdue_amount": {"$sum": "$overdue_amount"},
+            "fee_types": {"$addToSet": "$fee_type"},
+            "oldest_due_at": {"$min": "$due_at"}
+        }},
+        {"$sort": {"overdue_amount": -1}}
+    ]).to_list(None)
+
+    class_ids = list({r["class_id"] for r in rows if r.get("class_id")})
+    class_names = {}
+    if class_ids:
+        classes = await db.classes.find(
+            {"tenant_id": tenant_id, "id": {"$in": class_ids}},
+            {"_id": 0, "id": 1, "name": 1}
+        ).to_list(None)
+        class_names = {c["id"]: c.get("name", "") for c in classes}
+
+    snapshot_id = str(uuid.uuid4())
+    defaulters = []
+    for row in rows:
+        oldest_due_at = row.get("oldest_due_at")
+        days_overdue = (as_of - oldest_due_at).days if isinstance(oldest_due_at, datetime) else 0
+        defaulters.append({
+            "snapshot_id": snapshot_id,
+            "tenant_id": tenant_id,
+            "student_id": row["_id"],
+            "student_name": row.get("student_name"),
+            "admission_no": row.get("admission_no"),
+            "class_id": row.get("class_id"),
+            "class_name": class_names.get(row.get("class_id"), ""),
+            "section_id": row.get("section_id"),
+            "overdue_amount": row["overdue_amount"],
+            "fee_types": row.get("fee_types", []),
+            "days_overdue": max(0, days_overdue),
+            "as_of": as_of
+        })
+
+    for i in range(0, len(defaulters), OVERDUE_BATCH_SIZE):
+        await db.fee_defaulters.insert_many(defaulters[i:i + OVERDUE_BATCH_SIZE], ordered=False)
+
+    previous = await db.fee_defaulter_snapshots.find_one_and_update(
+        {"tenant_id": tenant_id},
+        {"$set": {
+            "tenant_id": tenant_id,
+            "snapshot_id": snapshot_id,
+            "as_of": as_of,
+            "generated_at": datetime.utcnow(),
+            "defaulter_count": len(defaulters),
+            "total_overdue": sum(d["overdue_amount"] for d in defaulters)
+        }},
+        upsert=True
+    )
+    # Readers follow the pointer, so the old rows can go once it has moved
+    if previous and previous.get("snapshot_id"):
+        await db.fee_defaulters.delete_many({"tenant_id": tenant_id, "snapshot_id": previous["snapshot_id"]})
+
+    return {"snapshot_id": snapshot_id, "defaulters": defaulters}
+
+
+async def get_current_defaulter_snapshot(db, tenant_id: str) -> Optional[Dict[str, Any]]:
+    """Metadata of the latest defaulter snapshot for a tenant"""
+    return await db.fee_defaulter_snapshots.find_one({"tenant_id": tenant_id}, {"_id": 0})
+
+
+async def notify_new_defaulters(db, tenant_id: str, defaulters: List[Dict[str, Any]], student_ids: List[str]):
+    """Send one overdue notification per student whose fees turned overdue in this run"""
+    from notification_service import get_notification_service
+
+    newly_overdue = set(student_ids)
+    targets = [d for d in defaulters if d["student_id"] in newly_overdue]
+    if not targets:
+        return 0
+
+    students = await db.students.find(
+        {"tenant_id": tenant_id, "id": {"$in": [d["student_id"] for d in targets]}},
+        {"_id": 0, "id": 1, "school_id": 1, "parent_email": 1, "guardian_email": 1, "parent_user_id": 1}
+    ).to_list(None)
+    students_by_id = {s["id"]: s for s in students}
+
+    notification_svc = get_notification_service(db)
+    sent = 0
+    for defaulter in targets:
+        student = students_by_id.get(defaulter["student_id"], {})
+        try:
+            await notification_svc.notify_fee_overdue(
+                tenant_id=tenant_id,
+                school_id=student.get("school_id"),
+                student_name=defaulter.get("student_name") or "",
+                amount=f"{defaulter['overdue_amount']:,.2f}",
+                parent_email=student.get("parent_email") or student.get("guardian_email"),
+                parent_user_id=student.get("parent_user_id")
+            )
+            sent += 1
+        except Exception as e:
+            logger.warning(f"Overdue notification failed for {defaulter['student_id']}: {e}")
+    return sent
+
+
+# ================================
+# ENGINE
+# ================================
+
+async def run_overdue_engine(db, tenant_id: str, as_of: Optional[datetime] = None, notify: bool = True) -> Dict[str, Any]:
+    """Run the full overdue pipeline for one tenant"""
+    as_of = as_of or datetime.utcnow()
+    started = datetime.utcnow()
+
+    backfilled = await backfill_due_at(db, tenant_id)
+    ledgers_initialized = await initialize_student_ledgers(db, tenant_id)
+    transition = await mark_overdue_fees(db, tenant_id, as_of)
+    ledgers = await refresh_fee_ledgers(db, tenant_id, transition["student_ids"])
+    snapshot = await build_defaulter_snapshot(db, tenant_id, as_of)
+
+    notified = 0
+    if notify:
+        notified = await notify_new_defaulters(db, tenant_id, snapshot["defaulters"], transition["student_ids"])
+
+    summary = {
+        "tenant_id": tenant_id,
+        "as_of": as_of,
+        "due_dates_backfilled": backfilled,
+        "ledgers_initialized": ledgers_initialized,
+        "fees_transitioned": transition["transitioned"],
+        "ledgers_refreshed": ledgers,
+        "defaulter_count": len(snapshot["defaulters"]),
+        "snapshot_id": snapshot["snapshot_id"],
+        "notifications_sent": notified,
+        "duration_ms": int((datetime.utcnow() - started).total_seconds() * 1000)
+    }
+    logger.info(f"Overdue engine finished for {tenant_id}: {summary}")
+    return summary
+
+
+async def run_overdue_engine_all_tenants(db, as_of: Optional[datetime] = None) -> List[Dict[str, Any]]:
+    """Run the overdue pipeline for every tenant that has fees"""
+    tenant_ids = await db.student_fees.distinct("tenant_id", {"is_active": True})
+    summaries = []
+    for tenant_id in tenant_ids:
+        try:
+            summaries.append(await run_overdue_engine(db, tenant_id, as_of=as_of))
+        except Exception as e:
+            logger.error(f"Overdue engine failed for tenant {tenant_id}: {e}")
+    return summaries
+
+
+async def _claim_nightly_run(db, run_date: str) -> bool:
+    """Make sure only one worker process runs the nightly job for a given date"""
+    result = await db.scheduler_locks.update_one(
+        {"_id": "fee_overdue_engine", "run_date": {"$ne": run_date}},
+        {"$set": {"run_date": run_date, "claimed_at": datetime.utcnow()}}
+    )
+    if result.modified_count:
+        return True
+    try:
+        await db.scheduler_locks.insert_one({"_id": "fee_overdue_engine", "run_date": run_date, "claimed_at": datetime.utcnow()})
+        return True
+    except Exception:
+        return False
+
+
+async def overdue_scheduler_loop(db):
+    """Background loop that runs the overdue engine once per night"""
+    while True:
+        now = datetime.utcnow()
+        next_run = now.replace(hour=OVERDUE_RUN_HOUR_UTC, minute=0, second=0, microsecond=0)
+        if next_run <= now:
+            next_run += timedelta(days=1)
+        await asyncio.sleep((next_run - now).total_seconds())
+
+        try:
+            if await _claim_nightly_run(db, next_run.strftime("%Y-%m-%d")):
+                await run_overdue_engine_all_tenants(db)
+        except Exception as e:
+            logger.error(f"Nightly overdue run failed: {e}")
+
+
+def start_overdue_scheduler(db):
+    """Start the nightly overdue job (call once from application startup)"""
+    return asyncio.create_task(overdue_scheduler_loop(db))
+
+
+# ================================
+# ROUTES
+# ================================
+
+def setup_fee_overdue_routes(router, db, get_current_user):
+
+    @router.post("/fees/overdue/run")
+    async def trigger_overdue_run(current_user=Depends(get_current_user)):
+        """Run the overdue engine for the current tenant as a background job"""
+        if current_user.role not in ["super_admin", "admin", "accountant"]:
+            raise HTTPException(status_code=403, detail="Not authorized")
+
+        job = job_queue.create_job(job_type="fee_overdue", tenant_id=current_user.tenant_id)
+
+        async def overdue_task(job_id: str, tenant_id: str):
+            summary = await run_overdue_engine(db, tenant_id)
+            summary["as_of"] = summary["as_of"].isoformat()
+            return summary
+
+        asyncio.create_task(job_queue.run_job(job.id, overdue_task, current_user.tenant_id))
+        return {
+            "job_id": job.id,
+            "message": "Overdue calculation started",
+            "status_url": f"/api/jobs/{job.id}"
+        }
+
+    @router.get("/fees/defaulters")
+    async def get_fee_defaulters(
+        class_id: Optional[str] = None,
+        min_days_overdue: int = 0,
+        page: int = 1,
+        limit: int = 50,
+        current_user=Depends(get_current_user)
+    ):
+        """Read the latest defaulter snapshot (computed by the overdue engine)"""
+        if current_user.role not in ["super_admin", "admin", "accountant", "principal"]:
+            raise HTTPException(status_code=403, detail="Not authorized")
+
+        snapshot = await get_current_defaulter_snapshot(db, current_user.tenant_id)
+        if not snapshot:
+            response = create_paginated_response([], 0, page, limit)
+            response["snapshot"] = None
+            return response
+
+        params = get_pagination_params(page, limit)
+        query = {"tenant_id": current_user.tenant_id, "snapshot_id": snapshot["snapshot_id"]}
+        if class_id:
+            query["class_id"] = class_id
+        if min_days_overdue > 0:
+            query["days_overdue"] = {"$gte": min_days_overdue}
+
+        total = await db.fee_defaulters.count_documents(query)
+        items = await db.fee_defaulters.find(query, {"_id": 0}).sort(
+            "overdue_amount", -1
+        ).skip(params.skip).limit(params.effective_limit).to_list(params.effective_limit)
+
+        response = create_paginated_response(items, total, params.page, params.effective_limit)
+        response["snapshot"] = snapshot
+        return response
+
+    logger.info("Fee Overdue Routes Registered")
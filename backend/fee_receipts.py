@@ -0,0 +1,430 @@
+"""
+Fee Receipt PDF Rendering and Artifact Cache
+Receipts are rendered once through a template whose styles are compiled at import
+time, and stored in `fee_receipt_artifacts` keyed by a content hash of the payment
+fields printed on the receipt plus the institution branding version.
+
+- A download whose ETag still matches is answered with 304 without loading the PDF
+- Editing the payment, the student's printed details (name, admission number,
+  class and section names) or the institution branding changes the key, so
+  stale artifacts are never served and are replaced on the next download
+- Bulk "all receipts for a date" ZIPs are built as background jobs
+"""
+
+import asyncio
+import hashlib
+import io
+import json
+import logging
+import os
+import tempfile
+import zipfile
+from datetime import datetime, timedelta
+from typing import Any, Dict, Optional
+
+from bson import Binary
+from fastapi import Depends, HTTPException, Query, Request
+from fastapi.responses import FileResponse, Response
+from pymongo.errors import DuplicateKeyError
+from reportlab.lib import colors
+from reportlab.lib.enums import TA_CENTER
+from reportlab.lib.pagesizes import A4
+from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+from reportlab.lib.units import inch
+from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer
+
+from cache import cache, CacheTTL
+from job_queue import job_queue, JobStatus
+
+logger = logging.getLogger(__name__)
+
+# Bump when the layout below changes so every cached artifact is re-rendered
+RECEIPT_TEMPLATE_VERSION = 1
+
+# Payment fields printed on the receipt; any change to them yields a new artifact
+RECEIPT_PAYMENT_FIELDS = (
+    "receipt_no", "student_id", "student_name", "admission_no", "fee_type", "amount",
+    "payment_mode", "transaction_id", "remarks", "payment_date"
+)
+BRANDING_FIELDS = ("school_name", "name", "address", "phone", "email", "currency", "logo_url")
+
+CURRENCY_SYMBOLS = {'BDT': 'Tk ', 'USD': '$', 'EUR': 'EUR ', 'GBP': 'GBP ', 'INR': 'Rs '}
+DEFAULT_SCHOOL_NAME = "ইন্টারনেট মাদ্রাসা"
+
+
+# ==================== PRECOMPILED TEMPLATE ====================
+
+_styles = getSampleStyleSheet()
+TITLE_STYLE = ParagraphStyle('Title', parent=_styles['Title'], fontSize=18, textColor=colors.HexColor('#1e40af'), alignment=TA_CENTER)
+HEADER_STYLE = ParagraphStyle('Header', parent=_styles['Normal'], fontSize=12, textColor=colors.HexColor('#374151'), alignment=TA_CENTER)
+NORMAL_STYLE = ParagraphStyle('Normal', parent=_styles['Normal'], fontSize=10)
+RECEIPT_TITLE_STYLE = ParagraphStyle('ReceiptTitle', parent=_styles['Title'], fontSize=16, textColor=colors.HexColor('#059669'), alignment=TA_CENTER)
+RECEIPT_NO_STYLE = ParagraphStyle('ReceiptNo', parent=_styles['Normal'], fontSize=11, alignment=TA_CENTER, textColor=colors.HexColor('#6b7280'))
+FOOTER_STYLE = ParagraphStyle('Footer', parent=_styles['Normal'], fontSize=8, alignment=TA_CENTER, textColor=colors.HexColor('#9ca3af'))
+
+DETAILS_TABLE_STYLE = TableStyle([
+    ('FONTNAME', (0, 0), (0, -1), 'Helvetica-Bold'),
+    ('FONTNAME', (2, 0), (2, -1), 'Helvetica-Bold'),
+    ('FONTSIZE', (0, 0), (-1, -1), 10),
+    ('TEXTCOLOR', (0, 0), (0, -1), colors.HexColor('#374151')),
+    ('TEXTCOLOR', (2, 0), (2, -1), colors.HexColor('#374151')),
+    ('BOTTOMPADDING', (0, 0), (-1, -1), 8),
+])
+PAYMENT_TABLE_STYLE = TableStyle([
+    ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#059669')),
+    ('TEXTCOLOR', (0, 0), (-1, 0), colors.white),
+    ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+    ('FONTSIZE', (0, 0), (-1, -1), 10),
+    ('ALIGN', (1, 0), (1, -1), 'RIGHT'),
+    ('GRID', (0, 0), (-1, -2), 0.5, colors.HexColor('#e5e7eb')),
+    ('BACKGROUND', (0, -1), (-1, -1), colors.HexColor('#ecfdf5')),
+    ('FONTNAME', (0, -1), (-1, -1), 'Helvetica-Bold'),
+    ('TEXTCOLOR', (0, -1), (-1, -1), colors.HexColor('#059669')),
+    ('BOTTOMPADDING', (0, 0), (-1, -1), 10),
+    ('TOPPADDING', (0, 0), (-1, -1), 10),
+])
+FOOTER_TABLE_STYLE = TableStyle([
+    ('ALIGN', (1, 0), (1, -1), 'CENTER'),
+    ('FONTSIZE', (0, 0), (-1, -1), 9),
+    ('TEXTCOLOR', (0, 0), (-1, -1), colors.HexColor('#6b7280')),
+])
+FOOTER_ROWS = [["", "Authorized Signature"], ["", "_____________________"]]
+
+
+def render_receipt_pdf(ctx: Dict[str, Any]) -> bytes:
+    """Render a receipt from a prepared context (pure CPU work, safe to run in a thread)"""
+    buffer = io.BytesIO()
+    doc = SimpleDocTemplate(buffer, pagesize=A4, topMargin=0.5*inch, bottomMargin=0.5*inch)
+    currency = ctx["currency"]
+    amount = ctx["amount"]
+
+    elements = [Paragraph(ctx["school_name"], TITLE_STYLE)]
+    if ctx["school_address"]:
+        elements.append(Paragraph(ctx["school_address"], HEADER_STYLE))
+    if ctx["school_phone"] or ctx["school_email"]:
+        contact_info = f"Phone: {ctx['school_phone']}" if ctx["school_phone"] else ""
+        if ctx["school_email"]:
+            contact_info += f" | Email: {ctx['school_email']}" if contact_info else f"Email: {ctx['school_email']}"
+        elements.append(Paragraph(contact_info, HEADER_STYLE))
+
+    elements.append(Spacer(1, 0.3*inch))
+    elements.append(Paragraph("PAYMENT RECEIPT", RECEIPT_TITLE_STYLE))
+    elements.append(Paragraph(f"Receipt No: {ctx['receipt_no']}", RECEIPT_NO_STYLE))
+    elements.append(Spacer(1, 0.2*inch))
+
+    payment_date = ctx["payment_date"]
+    details_table = Table([
+        ["Student Name:", ctx["student_name"], "Date:", payment_date.strftime("%d-%m-%Y")],
+        ["Admission No:", ctx["admission_no"], "Time:", payment_date.strftime("%I:%M %p")],
+        ["Class:", f"{ctx['class_name']} - Section {ctx['section_name']}", "Payment Mode:", ctx["payment_mode"]],
+    ], colWidths=[1.5*inch, 2.5*inch, 1.3*inch, 2*inch])
+    details_table.setStyle(DETAILS_TABLE_STYLE)
+    elements.append(details_table)
+    elements.append(Spacer(1, 0.3*inch))
+
+    payment_data = [
+        ["Description", "Amount"],
+        [ctx["fee_type"], f"{currency}{amount:,.2f}"],
+    ]
+    if ctx["transaction_id"]:
+        payment_data.append(["Transaction ID", ctx["transaction_id"]])
+    payment_data.append(["", ""])
+    payment_data.append(["Total Amount Paid", f"{currency}{amount:,.2f}"])
+
+    payment_table = Table(payment_data, colWidths=[4.5*inch, 2.5*inch])
+    payment_table.setStyle(PAYMENT_TABLE_STYLE)
+    elements.append(payment_table)
+    elements.append(Spacer(1, 0.3*inch))
+
+    if ctx["remarks"]:
+        elements.append(Paragraph(f"<b>Remarks:</b> {ctx['remarks']}", NORMAL_STYLE))
+        elements.append(Spacer(1, 0.2*inch))
+
+    elements.append(Spacer(1, 0.5*inch))
+    footer_table = Table(FOOTER_ROWS, colWidths=[4.5*inch, 2.5*inch])
+    footer_table.setStyle(FOOTER_TABLE_STYLE)
+    elements.append(footer_table)
+
+    elements.append(Spacer(1, 0.3*inch))
+    elements.append(Paragraph("This is a computer-generated receipt and does not require a physical signature.", FOOTER_STYLE))
+    elements.append(Paragraph(f"Generated on {datetime.utcnow().strftime('%d-%m-%Y %I:%M %p')}", FOOTER_STYLE))
+
+    doc.build(elements)
+    return buffer.getvalue()
+
+
+# ==================== CACHE KEYS ====================
+
+def _digest(values: Dict[str, Any]) -> str:
+    return hashlib.sha256(json.dumps(values, sort_keys=True, default=str).encode()).hexdigest()
+
+
+async def get_receipt_branding(db, tenant_id: str) -> Dict[str, Any]:
+    """Institution branding printed on receipts, with its content version"""
+    cache_key = f"receipt_branding:{tenant_id}"
+    branding = await cache.get(cache_key)
+    if branding is not None:
+        return branding
+
+    institution = await db.institutions.find_one(
+        {"tenant_id": tenant_id, "is_active": True},
+        {field: 1 for field in BRANDING_FIELDS}
+    ) or {}
+    branding = {field: institution.get(field) for field in BRANDING_FIELDS}
+    branding["version"] = _digest(branding)[:16]
+
+    await cache.set(cache_key, branding, CacheTTL.INSTITUTION_METADATA)
+    return branding
+
+
+async def invalidate_receipt_branding(tenant_id: str):
+    """Drop cached branding after institution settings change"""
+    await cache.delete(f"receipt_branding:{tenant_id}")
+
+
+def receipt_artifact_key(payment: Dict[str, Any], branding_version: str, student: Dict[str, Any]) -> str:
+    """Content address of a rendered receipt"""
+    fields = {field: payment.get(field) for field in RECEIPT_PAYMENT_FIELDS}
+    fields["_student"] = student
+    fields["_branding"] = branding_version
+    fields["_template"] = RECEIPT_TEMPLATE_VERSION
+    return _digest(fields)
+
+
+def _parse_payment_date(value) -> datetime:
+    if isinstance(value, datetime):
+        return value
+    if isinstance(value, str):
+        try:
+            return datetime.fromisoformat(value.replace('Z', '+00:00'))
+        except ValueError:
+            pass
+    return datetime.utcnow()
+
+
+# ==================== ARTIFACT STORE ====================
+
+async def get_receipt_student(db, tenant_id: str, payment: Dict[str, Any]) -> Dict[str, Any]:
+    """Student details printed on the receipt (current names of the class and section)"""
+    student = await db.students.find_one(
+        {"id": payment["student_id"], "tenant_id": tenant_id},
+        {"_id": 0, "name": 1, "admission_no": 1, "class_id": 1, "section_id": 1}
+    )
+
+    class_name = "N/A"
+    section_name = "N/A"
+    if student:
+        class_doc, section_doc = await asyncio.gather(
+            db.classes.find_one({"id": student.get("class_id")}, {"name": 1}),
+            db.sections.find_one({"id": student.get("section_id")}, {"name": 1})
+        )
+        class_name = class_doc.get("name", "N/A") if class_doc else "N/A"
+        section_name = section_doc.get("name", "N/A") if section_doc else "N/A"
+
+    return {
+        "student_name": student.get("name", "N/A") if student else payment.get("student_name", "N/A"),
+        "admission_no": student.get("admission_no", "N/A") if student else payment.get("admission_no", "N/A"),
+        "class_name": class_name,
+        "section_name": section_name,
+    }
+
+
+def _build_receipt_context(payment: Dict[str, Any], branding: Dict[str, Any], student: Dict[str, Any]) -> Dict[str, Any]:
+    currency_code = branding.get("currency") or "BDT"
+    return {
+        "receipt_no": payment["receipt_no"],
+        "school_name": branding.get("school_name") or branding.get("name") or DEFAULT_SCHOOL_NAME,
+        "school_address": branding.get("address") or "",
+        "school_phone": branding.get("phone") or "",
+        "school_email": branding.get("email") or "",
+        "currency": CURRENCY_SYMBOLS.get(currency_code, currency_code + ' '),
+        **student,
+        "payment_date": _parse_payment_date(payment.get("payment_date")),
+        "payment_mode": payment.get("payment_mode", "Cash"),
+        "fee_type": payment.get("fee_type", "Fee Payment"),
+        "amount": payment.get("amount", 0),
+        "transaction_id": payment.get("transaction_id"),
+        "remarks": payment.get("remarks"),
+    }
+
+
+async def get_receipt_pdf(
+    db,
+    tenant_id: str,
+    payment: Dict[str, Any],
+    branding: Optional[Dict[str, Any]] = None,
+    student: Optional[Dict[str, Any]] = None
+) -> bytes:
+    """Return the receipt PDF for a payment, rendering and storing it on a cache miss"""
+    branding = branding or await get_receipt_branding(db, tenant_id)
+    student = student or await get_receipt_student(db, tenant_id, payment)
+    key = receipt_artifact_key(payment, branding["version"], student)
+
+    artifact = await db.fee_receipt_artifacts.find_one({"_id": key}, {"pdf": 1})
+    if artifact:
+        return bytes(artifact["pdf"])
+
+    ctx = _build_receipt_context(payment, branding, student)
+    pdf = await asyncio.to_thread(render_receipt_pdf, ctx)
+
+    try:
+        await db.fee_receipt_artifacts.insert_one({
+            "_id": key,
+            "tenant_id": tenant_id,
+            "receipt_no": payment["receipt_no"],
+            "branding_version": branding["version"],
+            "pdf": Binary(pdf),
+            "size": len(pdf),
+            "created_at": datetime.utcnow()
+        })
+    except DuplicateKeyError:
+        # Rendered concurrently by another request; either copy is valid
+        pass
+
+    # Drop artifacts of older revisions of this receipt
+    await db.fee_receipt_artifacts.delete_many({
+        "tenant_id": tenant_id,
+        "receipt_no": payment["receipt_no"],
+        "_id": {"$ne": key}
+    })
+    return pdf
+
+
+def _etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    candidates = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+    return "*" in candidates or etag in candidates
+
+
+# ==================== BULK ZIP ====================
+
+async def build_receipts_zip_task(job_id: str, db, tenant_id: str, date_str: str):
+    """Background job: ZIP every receipt issued on a date"""
+    day = datetime.strptime(date_str, "%Y-%m-%d")
+    payments = await db.payments.find({
+        "tenant_id": tenant_id,
+        "receipt_no": {"$exists": True, "$ne": None},
+        "payment_date": {"$gte": day, "$lt": day + timedelta(days=1)}
+    }, {"_id": 0}).sort("receipt_no", 1).to_list(None)
+
+    job = job_queue.get_job(job_id)
+    if job:
+        job.total = len(payments)
+
+    branding = await get_receipt_branding(db, tenant_id)
+    output_dir = tempfile.mkdtemp(prefix="fee_receipts_")
+    filename = f"receipts_{date_str}.zip"
+    zip_path = os.path.join(output_dir, filename)
+
+    generated_count = 0
+    with zipfile.ZipFile(zip_path, 'w', zipfile.ZIP_DEFLATED) as zipf:
+        for i, payment in enumerate(payments):
+            job_queue.update_progress(job_id, i + 1)
+            try:
+                pdf = await get_receipt_pdf(db, tenant_id, payment, branding)
+                zipf.writestr(f"Receipt-{payment['receipt_no']}.pdf", pdf)
+                generated_count += 1
+            except Exception as e:
+                logger.error(f"Failed to add receipt {payment.get('receipt_no')} to ZIP: {e}")
+
+    return {
+        "message": f"Bundled {generated_count} receipts for {date_str}",
+        "count": generated_count,
+        "zip_path": zip_path,
+        "filename": filename
+    }
+
+
+# ==================== ROUTES ====================
+
+def setup_fee_receipt_routes(api_router, db, get_current_user):
+    """Setup fee receipt PDF routes"""
+
+    @api_router.get("/fees/receipt/{receipt_no}/pdf")
+    async def generate_fee_receipt_pdf(
+        receipt_no: str,
+        request: Request,
+        current_user=Depends(get_current_user)
+    ):
+        """Download the PDF receipt for a payment (cached, ETag-aware)"""
+        try:
+            payment = await db.payments.find_one({
+                "receipt_no": receipt_no,
+                "tenant_id": current_user.tenant_id
+            }, {"_id": 0})
+
+            if not payment:
+                raise HTTPException(status_code=404, detail="Receipt not found")
+
+            branding = await get_receipt_branding(db, current_user.tenant_id)
+            student = await get_receipt_student(db, current_user.tenant_id, payment)
+            etag = f'"{receipt_artifact_key(payment, branding["version"], student)}"'
+            headers = {
+                "ETag": etag,
+                "Cache-Control": "private, no-cache",
+                "Content-Disposition": f"attachment; filename=Receipt-{receipt_no}.pdf"
+            }
+
+            if _etag_matches(request.headers.get("if-none-match"), etag):
+                return Response(status_code=304, headers={"ETag": etag, "Cache-Control": headers["Cache-Control"]})
+
+            pdf = await get_receipt_pdf(db, current_user.tenant_id, payment, branding, student)
+            return Response(content=pdf, media_type="application/pdf", headers=headers)
+
+        except HTTPException:
+            raise
+        except Exception as e:
+            logger.error(f"Failed to generate receipt PDF: {str(e)}")
+            raise HTTPException(status_code=500, detail="Failed to generate receipt")
+
+    @api_router.post("/fees/receipts/bulk-zip")
+    async def start_bulk_receipts_zip(
+        date: str = Query(..., description="Payment date (YYYY-MM-DD)"),
+        current_user=Depends(get_current_user)
+    ):
+        """Start a background job bundling all receipts issued on a date"""
+        if current_user.role not in ["super_admin", "admin", "accountant"]:
+            raise HTTPException(status_code=403, detail="Not authorized")
+
+        try:
+            datetime.strptime(date, "%Y-%m-%d")
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid date format. Use YYYY-MM-DD")
+
+        job = job_queue.create_job(job_type="fee_receipts_zip", tenant_id=current_user.tenant_id)
+        asyncio.create_task(job_queue.run_job(
+            job.id, build_receipts_zip_task, db, current_user.tenant_id, date
+        ))
+
+        return {
+            "job_id": job.id,
+            "message": f"Started bundling receipts for {date}",
+            "status_url": f"/api/jobs/{job.id}"
+        }
+
+    @api_router.get("/fees/receipts/bulk-download")
+    async def download_bulk_receipts_zip(
+        job_id: str,
+        current_user=Depends(get_current_user)
+    ):
+        """Download a completed receipts ZIP"""
+        job = job_queue.get_job(job_id)
+        if not job or job.job_type != "fee_receipts_zip":
+            raise HTTPException(status_code=404, detail="Job not found")
+
+        if job.tenant_id != current_user.tenant_id:
+            raise HTTPException(status_code=403, detail="Not authorized")
+
+        if job.status != JobStatus.COMPLETED:
+            raise HTTPException(status_code=400, detail=f"Job not completed. Current status: {job.status}")
+
+        zip_path = (job.result or {}).get("zip_path")
+        if not zip_path or not os.path.exists(zip_path):
+            raise HTTPException(status_code=404, detail="Generated file not found. Please regenerate.")
+
+        return FileResponse(
+            path=zip_path,
+            media_type="application/zip",
+            filename=job.result.get("filename", "receipts.zip")
+        )
@@ -0,0 +1,133 @@
+"""
+Compiled Grading Schemes
+Percentage -> grade / GPA lookup without a database round trip per mark.
+
+The institution's grading scheme is resolved once and compiled into boundary
+arrays sorted by lower bound:
+1. the default result-config grading scheme (/result-config/grading-schemes)
+2. else the default grading scale (/grading-scales)
+3. else the built-in 10-point scale
+
+Compiled schemes are cached per tenant/school under a shared per-tenant version
+(cache_versions) that is bumped whenever a grading scheme or grading scale is
+created, edited or deleted, so every worker drops its copy. A compiled scheme offers
+a synchronous O(log n) `lookup` (bisect) for single marks and a NumPy `grade_array`
+for grading a whole class at once; both give identical results.
+"""
+
+import logging
+from bisect import bisect_right
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+from cache import bump_cache_version, cache, CacheTTL, get_cache_version
+
+logger = logging.getLogger(__name__)
+
+# Used when the institution has neither a grading scheme nor a grading scale
+DEFAULT_GRADE_BANDS = [
+    {"grade": "A+", "min_percentage": 90, "max_percentage": 100, "gpa": 10.0, "remarks": "Excellent"},
+    {"grade": "A", "min_percentage": 80, "max_percentage": 89.99, "gpa": 9.0, "remarks": "Very Good"},
+    {"grade": "B+", "min_percentage": 70, "max_percentage": 79.99, "gpa": 8.0, "remarks": "Good"},
+    {"grade": "B", "min_percentage": 60, "max_percentage": 69.99, "gpa": 7.0, "remarks": "Above Average"},
+    {"grade": "C+", "min_percentage": 50, "max_percentage": 59.99, "gpa": 6.0, "remarks": "Average"},
+    {"grade": "C", "min_percentage": 40, "max_percentage": 49.99, "gpa": 5.0, "remarks": "Below Average"},
+    {"grade": "D", "min_percentage": 33, "max_percentage": 39.99, "gpa": 4.0, "remarks": "Pass"},
+    {"grade": "F", "min_percentage": 0, "max_percentage": 32.99, "gpa": 0.0, "remarks": "Fail"},
+]
+FAIL_GRADE = {"grade": "F", "gpa": 0.0, "remarks": "Fail"}
+
+
+def bands_from_grading_scale(scale: dict) -> List[dict]:
+    """Grading scale boundaries in grading scheme band form"""
+    return [{
+        "grade": b.get("grade", ""),
+        "min_percentage": b.get("min_marks", 0),
+        "max_percentage": b.get("max_marks", 0),
+        "gpa": b.get("grade_point", 0.0),
+        "remarks": b.get("description") or "",
+    } for b in scale.get("grade_boundaries") or []]
+
+
+class CompiledGradingScheme:
+    """Grade bands as boundary arrays sorted by lower bound"""
+
+    def __init__(self, bands: List[dict], source: str = "default"):
+        bands = sorted(bands or DEFAULT_GRADE_BANDS, key=lambda b: float(b["min_percentage"]))
+        self.source = source
+        self.lower = [float(b["min_percentage"]) for b in bands]
+        # Bands are inclusive of max_percentage. Close the rounding gap between
+        # adjacent bands (80-89 / 90-100, or 89.99 / 90) so 89.5 is not a fail;
+        # real gaps in a scheme still grade as F
+        upper = [float(b["max_percentage"]) for b in bands]
+        for i in range(len(bands) - 1):
+            if self.lower[i + 1] - upper[i] <= 1:
+                upper[i] = float(np.nextafter(self.lower[i + 1], -np.inf))
+        self.upper = upper
+        self.bands = [
+            {"grade": b["grade"], "gpa": float(b.get("gpa") or 0.0), "remarks": b.get("remarks") or ""}
+            for b in bands
+        ] + [FAIL_GRADE]
+
+        self._lower = np.array(self.lower)
+        self._upper = np.array(self.upper)
+        self._grades = np.array([b["grade"] for b in self.bands], dtype=object)
+        self._gpas = np.array([b["gpa"] for b in self.bands])
+
+    def index(self, percentage: float) -> int:
+        i = bisect_right(self.lower, percentage) - 1
+        if i < 0 or not percentage <= self.upper[i]:  # NaN (no marks) is a fail
+            return len(self.bands) - 1
+        return i
+
+    def lookup(self, percentage: float) -> dict:
+        """{"grade", "gpa", "remarks"} for one percentage"""
+        return dict(self.bands[self.index(percentage)])
+
+    def grade_array(self, percentages) -> Tuple[np.ndarray, np.ndarray]:
+        """(grades, gpas) for an array of percentages"""
+        percentages = np.asarray(percentages, dtype=np.float64)
+        index = np.searchsorted(self._lower, percentages, side="right") - 1
+        outside = (index < 0) | ~(percentages <= self._upper[np.clip(index, 0, None)])
+        index = np.where(outside, len(self.bands) - 1, index)
+        return self._grades[index], self._gpas[index]
+
+
+async def load_grading_scheme(db, tenant_id: str, school_id: Optional[str]) -> CompiledGradingScheme:
+    scope = {"tenant_id": tenant_id, "school_id": school_id, "is_default": True, "is_active": True}
+    scheme = await db.grading_schemes.find_one(scope, {"_id": 0, "id": 1, "grade_bands": 1})
+    if scheme and scheme.get("grade_bands"):
+        return CompiledGradingScheme(scheme["grade_bands"], f"grading_scheme:{scheme.get('id')}")
+
+    scale = await db.grading_scales.find_one(scope, {"_id": 0, "id": 1, "grade_boundaries": 1})
+    bands = bands_from_grading_scale(scale) if scale else []
+    if bands:
+        return CompiledGradingScheme(bands, f"grading_scale:{scale.get('id')}")
+
+    return CompiledGradingScheme(DEFAULT_GRADE_BANDS)
+
+
+def grading_scheme_scope(tenant_id: str) -> str:
+    """Cache scope (and key prefix) of a tenant's compiled grading schemes"""
+    return f"grading_scheme:{tenant_id}"
+
+
+async def get_compiled_grading_scheme(db, tenant_id: str, school_id: Optional[str]) -> CompiledGradingScheme:
+    """Compiled grading scheme of an institution, cached under the tenant's shared
+    grading version so a scheme or scale edit in one worker reaches the others"""
+    scope = grading_scheme_scope(tenant_id)
+    cache_key = f"{scope}:v{await get_cache_version(db, scope)}:{school_id}"
+    compiled = await cache.get(cache_key)
+    if compiled is not None:
+        return compiled
+
+    compiled = await load_grading_scheme(db, tenant_id, school_id)
+    await cache.set(cache_key, compiled, CacheTTL.GRADING_SCHEME)
+    return compiled
+
+
+async def invalidate_grading_scheme(db, tenant_id: str):
+    """Drop the compiled schemes of a tenant in every worker after a grading scheme or scale changes"""
+    await bump_cache_version(db, grading_scheme_scope(tenant_id))
+    await cache.clear_pattern(f"{grading_scheme_scope(tenant_id)}:")
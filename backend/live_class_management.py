@@ -6,6 +6,8 @@ from bson import ObjectId
 import logging
 import pytz
 
+from attendance_rollup import record_attendance_changes
+
 logger = logging.getLogger(__name__)
 
 # Bangladesh timezone for live class time comparison
@@ -638,7 +640,7 @@ def setup_live_class_routes(app, db, get_current_user, get_current_tenant):
                 
                 # ALWAYS upsert to main attendance collection for admin/student dashboard visibility
                 # Use attendance_session in query to allow multiple sessions per day
-                upsert_result = await db.student_attendance.update_one(
+                previous = await db.student_attendance.find_one_and_update(
                     {
                         "tenant_id": tenant_id,
                         "person_id": student_id,
@@ -671,10 +673,20 @@ def setup_live_class_routes(app, db, get_current_user, get_current_tenant):
                             "created_at": datetime.utcnow()
                         }
                     },
+                    projection={"_id": 0, "status": 1, "class_id": 1},
                     upsert=True
                 )
 
-                logger.info(f"Main attendance upserted: person_id={student_id}, type=student, date={today}, matched={upsert_result.matched_count}, modified={upsert_result.modified_count}, upserted_id={upsert_result.upserted_id}")
+                logger.info(f"Main attendance upserted: person_id={student_id}, type=student, date={today}, existing={previous is not None}")
+                await record_attendance_changes(db, tenant_id, [{
+                    "person_id": student_id,
+                    "date": today,
+                    "status": "present",
+                    "attendance_session": matched_session_name,
+                    "class_id": student_class_id,
+                    "previous_status": (previous or {}).get("status"),
+                    "previous_class_id": (previous or {}).get("class_id")
+                }])
             
             return {
                 "message": "Joined successfully",
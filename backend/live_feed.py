@@ -0,0 +1,411 @@
+"""
+Live Biometric Attendance Feed
+In-process pub/sub hub pushing punches and running counters to dashboards over
+SSE (/biometric/live/stream) or WebSocket (/biometric/live/ws).
+
+The punch writer notifies the hub after every stored batch. Per tenant the hub keeps
+today's state - counters (punches, present, late, not yet arrived), the latest
+punches and a short ring buffer of numbered events - built once from the punch
+store and then moved forward by the published punches.
+
+Browsers cannot set headers on EventSource/WebSocket, so both accept ?token=; the
+dashboard first asks /biometric/live/token for a token valid a couple of minutes,
+which keeps long-lived JWTs out of URLs and access logs.
+
+Protocol: every event carries (epoch, seq), the epoch being the day. A client
+sends back the last pair it saw (SSE Last-Event-ID "epoch:seq", WebSocket query
+params); if those events are still buffered it only receives what it missed,
+otherwise it gets a fresh snapshot followed by deltas. A client too slow to keep
+up with its queue is disconnected and resumes the same way.
+
+The hub lives in one worker process: with several workers, punches ingested by
+another worker reach this worker's dashboards after its next snapshot.
+"""
+
+import asyncio
+import json
+import logging
+from collections import deque
+from datetime import datetime, timedelta
+from typing import Deque, Dict, List, Optional, Set, Tuple
+
+from fastapi import Depends, HTTPException, Request, WebSocket, WebSocketDisconnect
+from fastapi.responses import StreamingResponse
+
+from attendance_management import get_compiled_attendance_rules
+from biometric_ingest import attendance_status, punch_writer
+from punch_store import punch_person_names, query_punches
+
+logger = logging.getLogger(__name__)
+
+EVENT_BUFFER_SIZE = 1000
+LATEST_PUNCHES = 50
+SUBSCRIBER_QUEUE_SIZE = 500
+HEARTBEAT_SECONDS = 15
+LATE_TYPES = ("late", "very_late")
+
+
+def _today() -> str:
+    return datetime.now().strftime("%Y-%m-%d")
+
+
+class TenantFeed:
+    """Today's live state of one tenant"""
+
+    def __init__(self, tenant_id: str, epoch: str, expected: int):
+        self.tenant_id = tenant_id
+        self.epoch = epoch
+        self.seq = 0
+        self.events: Deque[dict] = deque(maxlen=EVENT_BUFFER_SIZE)
+        self.latest: Deque[dict] = deque(maxlen=LATEST_PUNCHES)
+        self.subscribers: Set[asyncio.Queue] = set()
+        self.punch_ids: Set[int] = set()
+        self.first_punch: Dict[str, str] = {}  # person_id -> on_time / late / very_late
+        self.names: Dict[str, str] = {}
+        self.expected = expected
+        self.punches = 0
+        self.late = 0
+        self.present_by_type: Dict[str, int] = {"staff": 0, "student": 0}
+
+    def counters(self) -> dict:
+        present = len(self.first_punch)
+        return {
+            "punches": self.punches,
+            "present": present,
+            "late": self.late,
+            "staff_present": self.present_by_type["staff"],
+            "student_present": self.present_by_type["student"],
+            "expected": self.expected,
+            "not_yet_arrived": max(self.expected - present, 0)
+        }
+
+    def apply(self, punch: dict, first_type: Optional[str]) -> bool:
+        """Count a stored punch; False if it was already counted"""
+        if punch["punch_id"] in self.punch_ids:
+            return False
+        self.punch_ids.add(punch["punch_id"])
+        self.punches += 1
+        if first_type and punch["person_id"] not in self.first_punch:
+            self.first_punch[punch["person_id"]] = first_type
+            self.late += first_type in LATE_TYPES
+            if punch["person_type"] in self.present_by_type:
+                self.present_by_type[punch["person_type"]] += 1
+        self.latest.appendleft(punch)
+        return True
+
+    def snapshot(self) -> dict:
+        return {
+            "type": "snapshot",
+            "epoch": self.epoch,
+            "seq": self.seq,
+            "counters": self.counters(),
+            "latest_punches": list(self.latest),
+            "generated_at": datetime.utcnow().isoformat()
+        }
+
+    def events_after(self, epoch: Optional[str], seq: Optional[int]) -> Optional[List[dict]]:
+        """Buffered events after (epoch, seq), or None when the client needs a snapshot"""
+        if epoch != self.epoch or seq is None or seq > self.seq:
+            return None
+        if seq == self.seq:
+            return []
+        if not self.events or self.events[0]["seq"] > seq + 1:
+            return None
+        return [event for event in self.events if event["seq"] > seq]
+
+
+class LiveAttendanceHub:
+    """Fan-out of stored punches to per-tenant live subscribers"""
+
+    def __init__(self):
+        self.db = None
+        self.feeds: Dict[str, TenantFeed] = {}
+        self._loading: Dict[str, asyncio.Lock] = {}
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+        self.stats = {"published": 0, "dropped_subscribers": 0}
+
+    def attach(self, db):
+        self.db = db
+        punch_writer.add_listener(self.publish)
+
+    # ---- publishing (called by the punch writer) ----
+
+    def publish(self, records: List[dict], results: List[dict]):
+        """Queue a stored batch; never blocks the writer"""
+        today = datetime.now().date()
+        fresh = [
+            (record, result) for record, result in zip(records, results)
+            if not result["duplicate"] and record["punch_time"].date() == today
+        ]
+        if not fresh:
+            return
+        if self._task is None or self._task.done():
+            self._queue = asyncio.Queue()
+            self._task = asyncio.create_task(self._run())
+        self._queue.put_nowait(fresh)
+
+    async def _run(self):
+        while True:
+            batch = await self._queue.get()
+            try:
+                await self._dispatch(batch)
+            except Exception as e:
+                logger.error(f"Live feed dispatch failed: {e}")
+
+    async def _dispatch(self, batch: List[Tuple[dict, dict]]):
+        by_tenant: Dict[str, List[Tuple[dict, dict]]] = {}
+        for record, result in batch:
+            by_tenant.setdefault(record["tenant_id"], []).append((record, result))
+
+        for tenant_id, items in by_tenant.items():
+            feed = await self.get_feed(tenant_id)
+            punches = [self._punch_view(record, result["punch_id"]) for record, result in items]
+            await self._resolve_names(feed, punches)
+            for punch, (_, result) in zip(punches, items):
+                status = result.get("attendance_status") or {}
+                first_type = status.get("type") if status.get("status") == "present" else None
+                if not feed.apply(punch, first_type):
+                    continue
+                feed.seq += 1
+                event = {
+                    "type": "punch",
+                    "epoch": feed.epoch,
+                    "seq": feed.seq,
+                    "punch": punch,
+                    "attendance_status": status,
+                    "counters": feed.counters()
+                }
+                feed.events.append(event)
+                self._fan_out(feed, event)
+                self.stats["published"] += 1
+
+    def _fan_out(self, feed: TenantFeed, event: dict):
+        for queue in list(feed.subscribers):
+            try:
+                queue.put_nowait(event)
+            except asyncio.QueueFull:
+                # Slow client: cut it off, it resumes from the last seq it received
+                feed.subscribers.discard(queue)
+                while not queue.empty():
+                    queue.get_nowait()
+                queue.put_nowait(None)
+                self.stats["dropped_subscribers"] += 1
+
+    # ---- tenant state ----
+
+    @staticmethod
+    def _punch_view(record: dict, punch_id) -> dict:
+        return {
+            "punch_id": punch_id,
+            "person_id": record["person_id"],
+            "person_type": record.get("person_type"),
+            "device_id": record.get("device_id"),
+            "device_name": record.get("device_name"),
+            "punch_time": record["punch_time"].strftime("%Y-%m-%d %H:%M:%S"),
+            "punch_type": record.get("punch_type"),
+            "punch_method": record.get("punch_method")
+        }
+
+    async def _resolve_names(self, feed: TenantFeed, punches: List[dict]):
+        missing = [p for p in punches if p["person_id"] not in feed.names]
+        if missing:
+            feed.names.update(await punch_person_names(self.db, feed.tenant_id, missing))
+        for punch in punches:
+            punch["person_name"] = feed.names.setdefault(punch["person_id"], punch["person_id"])
+
+    async def _expected_people(self, tenant_id: str) -> int:
+        staff, students = await asyncio.gather(
+            self.db.staff.count_documents({"tenant_id": tenant_id, "is_active": True}),
+            self.db.students.count_documents(
+                {"tenant_id": tenant_id, "$or": [{"is_active": True}, {"is_active": {"$exists": False}}]}
+            )
+        )
+        return staff + students
+
+    async def get_feed(self, tenant_id: str) -> TenantFeed:
+        """Today's feed of a tenant, loaded from the punch store on first use each day"""
+        epoch = _today()
+        feed = self.feeds.get(tenant_id)
+        if feed and feed.epoch == epoch:
+            return feed
+        lock = self._loading.setdefault(tenant_id, asyncio.Lock())
+        async with lock:
+            feed = self.feeds.get(tenant_id)
+            if feed and feed.epoch == epoch:
+                return feed
+            new_feed = TenantFeed(tenant_id, epoch, await self._expected_people(tenant_id))
+            day_start = datetime.strptime(epoch, "%Y-%m-%d")
+            punches = await query_punches(
+                tenant_id, day_start, day_start + timedelta(days=1), limit=None, newest_first=False
+            )
+            rules = await get_compiled_attendance_rules(self.db, tenant_id)
+            views = [self._punch_view(punch, punch["punch_id"]) for punch in punches]
+            await self._resolve_names(new_feed, views[-LATEST_PUNCHES:])
+            for punch, view in zip(punches, views):
+                first_type = None
+                if punch["person_id"] not in new_feed.first_punch:
+                    first_type = attendance_status(punch, 0, rules)["type"]
+                new_feed.apply(view, first_type)
+            if feed:
+                # Day rollover: keep the connected clients, they get the new snapshot
+                new_feed.subscribers = feed.subscribers
+                for queue in list(new_feed.subscribers):
+                    try:
+                        queue.put_nowait(new_feed.snapshot())
+                    except asyncio.QueueFull:
+                        new_feed.subscribers.discard(queue)
+            self.feeds[tenant_id] = new_feed
+            return new_feed
+
+    # ---- subscribing ----
+
+    async def subscribe(self, tenant_id: str, epoch: Optional[str], seq: Optional[int]) -> Tuple[asyncio.Queue, List[dict]]:
+        """Register a subscriber; returns its queue and the events to send first"""
+        feed = await self.get_feed(tenant_id)
+        missed = feed.events_after(epoch, seq)
+        queue: asyncio.Queue = asyncio.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+        feed.subscribers.add(queue)
+        return queue, missed if missed is not None else [feed.snapshot()]
+
+    def unsubscribe(self, tenant_id: str, queue: asyncio.Queue):
+        feed = self.feeds.get(tenant_id)
+        if feed:
+            feed.subscribers.discard(queue)
+
+
+live_hub = LiveAttendanceHub()
+
+
+def _parse_resume(epoch: Optional[str], seq) -> Tuple[Optional[str], Optional[int]]:
+    try:
+        return epoch, int(seq) if seq is not None else None
+    except (TypeError, ValueError):
+        return None, None
+
+
+def _sse(event: dict) -> str:
+    return f"id: {event['epoch']}:{event['seq']}\nevent: {event['type']}\ndata: {json.dumps(event, default=str)}\n\n"
+
+
+# ================================
+# ROUTES
+# ================================
+
+LIVE_FEED_ROLES = ["super_admin", "admin", "principal"]
+STREAM_TOKEN_MINUTES = 2
+
+
+def setup_live_feed_routes(api_router, db, get_current_user, get_user_from_token, create_access_token):
+    """Setup live attendance feed routes (SSE and WebSocket)"""
+    live_hub.attach(db)
+
+    async def stream_user(request: Request, token: Optional[str]):
+        """User of a stream request: ?token= (EventSource) or the Authorization header"""
+        if not token:
+            scheme, _, token = request.headers.get("authorization", "").partition(" ")
+            if scheme.lower() != "bearer" or not token:
+                raise HTTPException(status_code=401, detail="Not authenticated")
+        current_user = await get_user_from_token(token)
+        if current_user.role not in LIVE_FEED_ROLES:
+            raise HTTPException(status_code=403, detail="Not authorized")
+        return current_user
+
+    @api_router.post("/biometric/live/token")
+    async def create_live_stream_token(current_user=Depends(get_current_user)):
+        """Short-lived token for the ?token= parameter of the stream and socket"""
+        if current_user.role not in LIVE_FEED_ROLES:
+            raise HTTPException(status_code=403, detail="Not authorized")
+        token = create_access_token(
+            data={"sub": current_user.id, "tenant_id": current_user.tenant_id, "scope": "live_feed"},
+            expires_delta=timedelta(minutes=STREAM_TOKEN_MINUTES)
+        )
+        return {"token": token, "expires_in": STREAM_TOKEN_MINUTES * 60}
+
+    @api_router.get("/biometric/live/snapshot")
+    async def get_live_snapshot(current_user=Depends(get_current_user)):
+        """Current counters and latest punches (what a new stream starts with)"""
+        if current_user.role not in LIVE_FEED_ROLES:
+            raise HTTPException(status_code=403, detail="Not authorized")
+        feed = await live_hub.get_feed(current_user.tenant_id)
+        return feed.snapshot()
+
+    @api_router.get("/biometric/live/stream")
+    async def stream_live_attendance(
+        request: Request,
+        epoch: Optional[str] = None,
+        seq: Optional[int] = None,
+        token: Optional[str] = None
+    ):
+        """Server-sent events: snapshot (or missed events), then punch deltas"""
+        current_user = await stream_user(request, token)
+
+        last_event_id = request.headers.get("last-event-id")
+        if last_event_id and ":" in last_event_id:
+            epoch, seq = last_event_id.rsplit(":", 1)
+        epoch, seq = _parse_resume(epoch, seq)
+        tenant_id = current_user.tenant_id
+        queue, initial = await live_hub.subscribe(tenant_id, epoch, seq)
+
+        async def events():
+            try:
+                yield "retry: 3000\n\n"
+                for event in initial:
+                    yield _sse(event)
+                while True:
+                    try:
+                        event = await asyncio.wait_for(queue.get(), HEARTBEAT_SECONDS)
+                    except asyncio.TimeoutError:
+                        if await request.is_disconnected():
+                            break
+                        yield ": keepalive\n\n"
+                        continue
+                    if event is None:
+                        break
+                    yield _sse(event)
+            finally:
+                live_hub.unsubscribe(tenant_id, queue)
+
+        return StreamingResponse(
+            events(),
+            media_type="text/event-stream",
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+        )
+
+    @api_router.websocket("/biometric/live/ws")
+    async def live_attendance_socket(
+        websocket: WebSocket,
+        token: str,
+        epoch: Optional[str] = None,
+        seq: Optional[int] = None
+    ):
+        """WebSocket variant of the stream; browsers pass the JWT as ?token="""
+        try:
+            current_user = await get_user_from_token(token)
+        except HTTPException:
+            await websocket.close(code=4401)
+            return
+        if current_user.role not in LIVE_FEED_ROLES:
+            await websocket.close(code=4403)
+            return
+
+        await websocket.accept()
+        tenant_id = current_user.tenant_id
+        queue, initial = await live_hub.subscribe(tenant_id, *_parse_resume(epoch, seq))
+        try:
+            for event in initial:
+                await websocket.send_text(json.dumps(event, default=str))
+            while True:
+                try:
+                    event = await asyncio.wait_for(queue.get(), HEARTBEAT_SECONDS)
+                except asyncio.TimeoutError:
+                    await websocket.send_text(json.dumps({"type": "heartbeat"}))
+                    continue
+                if event is None:
+                    await websocket.close(code=4408)
+                    break
+                await websocket.send_text(json.dumps(event, default=str))
+        except WebSocketDisconnect:
+            pass
+        finally:
+            live_hub.unsubscribe(tenant_id, queue)
@@ -0,0 +1,293 @@
+"""
+Consolidated Marksheet Pivot
+Student x subject marks matrix for an exam term, built from student_results.
+
+- One aggregation unwinds the results into (student, subject, obtained, max) rows
+- The rows are pivoted into NumPy matrices; totals, percentages, subject and
+  overall grades, GPA and positions are computed column-wise in one pass
+  (positions follow the institution's rank mode and tie-breaks)
+- Sheets are cached per (exam term, class, results version). Every write that
+  changes the results of a term bumps its version, so a cached sheet is never
+  served after marks change and nothing has to be invalidated explicitly
+- Excel is written with a write-only workbook row by row and PDF as a landscape
+  long table, so large sheets are not held twice in memory
+"""
+
+import logging
+from datetime import datetime, timezone
+from typing import List, Optional
+
+import numpy as np
+from pymongo import ReturnDocument
+
+from cache import cache, CacheTTL
+from grading import get_compiled_grading_scheme
+from result_ranking import get_rank_settings
+
+logger = logging.getLogger(__name__)
+
+
+# ================================
+# RESULTS VERSION
+# ================================
+
+async def get_results_version(db, tenant_id: str, school_id: Optional[str], exam_term_id: str) -> int:
+    doc = await db.result_versions.find_one(
+        {"tenant_id": tenant_id, "school_id": school_id, "exam_term_id": exam_term_id},
+        {"_id": 0, "version": 1}
+    )
+    return doc["version"] if doc else 0
+
+
+async def bump_results_version(db, tenant_id: str, school_id: Optional[str], exam_term_id: str) -> int:
+    """Mark the results of an exam term as changed (call after every result write)"""
+    try:
+        doc = await db.result_versions.find_one_and_update(
+            {"tenant_id": tenant_id, "school_id": school_id, "exam_term_id": exam_term_id},
+            {"$inc": {"version": 1}, "$set": {"updated_at": datetime.utcnow()}},
+            upsert=True,
+            return_document=ReturnDocument.AFTER
+        )
+        return doc["version"]
+    except Exception as e:
+        logger.error(f"Failed to bump results version for exam term {exam_term_id}: {e}")
+        return 0
+
+
+# ================================
+# PIVOT
+# ================================
+
+def _positions(keys: List[np.ndarray], mode: str) -> np.ndarray:
+    """Competition ranks (best first) for rows ordered by descending keys"""
+    count = len(keys[0])
+    if not count:
+        return np.zeros(0, dtype=np.int64)
+    order = np.lexsort([-k for k in reversed(keys)])
+    ordered = np.stack([k[order] for k in keys])
+    new_group = np.ones(count, dtype=bool)
+    new_group[1:] = np.any(ordered[:, 1:] != ordered[:, :-1], axis=0)
+    if mode == "dense":
+        sorted_ranks = np.cumsum(new_group)
+    else:
+        sorted_ranks = np.maximum.accumulate(np.where(new_group, np.arange(1, count + 1), 0))
+    positions = np.empty(count, dtype=np.int64)
+    positions[order] = sorted_ranks
+    return positions
+
+
+async def build_marksheet(
+    db,
+    tenant_id: str,
+    school_id: Optional[str],
+    exam_term_id: str,
+    class_id: Optional[str] = None,
+    include_unpublished: bool = False,
+) -> dict:
+    """Pivoted marksheet of an exam term (optionally one class), cached by results version"""
+    version = await get_results_version(db, tenant_id, school_id, exam_term_id)
+    cache_key = (
+        f"marksheet:{tenant_id}:{school_id}:{exam_term_id}:{class_id or 'all'}:"
+        f"{int(include_unpublished)}:{version}"
+    )
+    sheet = await cache.get(cache_key)
+    if sheet is not None:
+        return sheet
+
+    exam_term = await db.exam_terms.find_one(
+        {"id": exam_term_id, "tenant_id": tenant_id, "school_id": school_id},
+        {"_id": 0, "name": 1, "academic_year": 1, "passing_percentage": 1}
+    ) or {}
+    passing_percentage = float(exam_term.get("passing_percentage") or 33.0)
+
+    match = {"tenant_id": tenant_id, "school_id": school_id, "exam_term_id": exam_term_id}
+    if not include_unpublished:
+        match["status"] = "published"
+    if class_id:
+        match["class_id"] = class_id
+
+    rows = await db.student_results.aggregate([
+        {"$match": match},
+        {"$unwind": "$subjects"},
+        {"$project": {
+            "_id": 0,
+            "student_id": 1, "student_name": 1, "admission_no": 1,
+            "class_name": 1, "section_name": 1,
+            "subject": {"$ifNull": ["$subjects.subject_name", "$subjects.subject_id"]},
+            "obtained": "$subjects.obtained_marks",
+            "max": "$subjects.max_marks",
+        }},
+    ]).to_list(None)
+
+    grading = await get_compiled_grading_scheme(db, tenant_id, school_id)
+    mode, tie_breaks = await get_rank_settings(db, tenant_id, school_id)
+
+    # Pivot: students in order of first appearance, subjects alphabetically
+    student_index, students = {}, []
+    for row in rows:
+        if row["student_id"] not in student_index:
+            student_index[row["student_id"]] = len(students)
+            students.append({
+                "student_id": row["student_id"],
+                "name": row.get("student_name", ""),
+                "admission_no": row.get("admission_no", ""),
+                "class_name": row.get("class_name", ""),
+                "section_name": row.get("section_name", ""),
+            })
+    subjects = sorted({str(row["subject"]) for row in rows if row.get("subject")})
+    subject_index = {name: i for i, name in enumerate(subjects)}
+
+    obtained = np.full((len(students), len(subjects)), np.nan)
+    maximum = np.full((len(students), len(subjects)), np.nan)
+    for row in rows:
+        column = subject_index.get(str(row.get("subject")))
+        if column is None:
+            continue
+        r = student_index[row["student_id"]]
+        obtained[r, column] = float(row.get("obtained") or 0)
+        maximum[r, column] = float(row.get("max") or 0) or np.nan
+
+    totals = np.nansum(obtained, axis=1)
+    max_totals = np.nansum(maximum, axis=1)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        percentages = np.where(max_totals > 0, np.round(totals / max_totals * 100, 2), 0.0)
+        subject_percentages = obtained / maximum * 100
+    grades, gpas = grading.grade_array(percentages)
+    subject_grades, _ = grading.grade_array(np.nan_to_num(subject_percentages, nan=-1.0))
+    taken = ~np.isnan(obtained)
+
+    keys = [percentages] + [{"total_marks": totals, "gpa": gpas}[field] for field in tie_breaks]
+    positions = _positions(keys, mode)
+
+    for i, student in enumerate(students):
+        student["marks"] = [None if not taken[i, j] else float(obtained[i, j]) for j in range(len(subjects))]
+        student["subject_grades"] = [subject_grades[i, j] if taken[i, j] else None for j in range(len(subjects))]
+        student["total_marks"] = float(totals[i])
+        student["total_max_marks"] = float(max_totals[i])
+        student["percentage"] = float(percentages[i])
+        student["grade"] = grades[i]
+        student["gpa"] = float(gpas[i])
+        student["position"] = int(positions[i])
+    students.sort(key=lambda s: (s["position"], s["name"]))
+
+    subject_averages = np.nanmean(obtained, axis=0) if len(students) else np.zeros(len(subjects))
+    sheet = {
+        "exam_term_id": exam_term_id,
+        "exam_term_name": exam_term.get("name", ""),
+        "academic_year": exam_term.get("academic_year", ""),
+        "class_id": class_id,
+        "results_version": version,
+        "rank_mode": mode,
+        "subjects": subjects,
+        "subject_averages": [round(float(v), 2) if not np.isnan(v) else None for v in subject_averages],
+        "students": students,
+        "summary": {
+            "total_students": len(students),
+            "average_percentage": round(float(percentages.mean()), 2) if len(students) else 0,
+            "highest_percentage": float(percentages.max()) if len(students) else 0,
+            "pass_count": int(np.sum(percentages >= passing_percentage)),
+        },
+        "generated_at": datetime.now(timezone.utc).strftime("%Y-%m-%d %H:%M:%S"),
+    }
+    await cache.set(cache_key, sheet, CacheTTL.MARKSHEET)
+    return sheet
+
+
+# ================================
+# EXPORT
+# ================================
+
+def _header(sheet: dict) -> List[str]:
+    return ["Pos", "Name", "Adm. No", "Class", "Section", *sheet["subjects"], "Total", "%", "Grade", "GPA"]
+
+
+def _row(student: dict) -> list:
+    return [
+        student["position"], student["name"], student["admission_no"],
+        student["class_name"], student["section_name"],
+        *["-" if m is None else (int(m) if float(m).is_integer() else m) for m in student["marks"]],
+        student["total_marks"], student["percentage"], student["grade"], student["gpa"],
+    ]
+
+
+def write_marksheet_excel(sheet: dict, title: str, file_path: str):
+    """Write the sheet with a write-only (streaming) workbook"""
+    from openpyxl import Workbook
+    from openpyxl.cell import WriteOnlyCell
+    from openpyxl.styles import Font, PatternFill
+
+    workbook = Workbook(write_only=True)
+    worksheet = workbook.create_sheet("Consolidated Marksheet")
+    worksheet.freeze_panes = "C4"
+
+    title_cell = WriteOnlyCell(worksheet, value=title)
+    title_cell.font = Font(bold=True, size=14)
+    worksheet.append([title_cell])
+    worksheet.append([f"Generated: {sheet['generated_at']} UTC", f"Students: {sheet['summary']['total_students']}"])
+
+    header_font = Font(bold=True, color="FFFFFF")
+    header_fill = PatternFill("solid", fgColor="1E3A8A")
+    header = []
+    for value in _header(sheet):
+        cell = WriteOnlyCell(worksheet, value=value)
+        cell.font = header_font
+        cell.fill = header_fill
+        header.append(cell)
+    worksheet.append(header)
+
+    for student in sheet["students"]:
+        worksheet.append(_row(student))
+    worksheet.append(["", "Subject average", "", "", "", *[
+        "-" if v is None else v for v in sheet["subject_averages"]
+    ]])
+    workbook.save(file_path)
+
+
+def write_marksheet_pdf(sheet: dict, title: str, school_name: str, file_path: str):
+    """Landscape marksheet; the table splits across pages with a repeated header"""
+    from reportlab.lib import colors
+    from reportlab.lib.pagesizes import A4, landscape
+    from reportlab.lib.styles import ParagraphStyle
+    from reportlab.platypus import LongTable, Paragraph, SimpleDocTemplate, Spacer, TableStyle
+
+    from bengali_text_helper import register_bengali_fonts
+
+    register_bengali_fonts()
+    doc = SimpleDocTemplate(file_path, pagesize=landscape(A4), leftMargin=24, rightMargin=24, topMargin=30, bottomMargin=30)
+    heading = ParagraphStyle("MarksheetHeading", fontName="BN-Bold", fontSize=13, leading=17)
+    body = ParagraphStyle("MarksheetBody", fontName="BN", fontSize=8, leading=10)
+
+    summary = sheet["summary"]
+    story = [
+        Paragraph(school_name, heading),
+        Paragraph(title, body),
+        Paragraph(
+            f"Students: {summary['total_students']} | Average: {summary['average_percentage']}% | "
+            f"Passed: {summary['pass_count']} | Generated: {sheet['generated_at']} UTC", body
+        ),
+        Spacer(1, 8),
+    ]
+
+    data = [_header(sheet)] + [
+        [Paragraph(str(v), body) if i == 1 else v for i, v in enumerate(_row(student))]
+        for student in sheet["students"]
+    ]
+    subject_count = len(sheet["subjects"])
+    name_width = 120
+    fixed = [26, name_width, 55, 45, 45]
+    remaining = doc.width - sum(fixed)
+    column = remaining / (subject_count + 4) if subject_count + 4 else remaining
+    table = LongTable(data, colWidths=fixed + [column] * (subject_count + 4), repeatRows=1)
+    table.setStyle(TableStyle([
+        ("FONTNAME", (0, 0), (-1, -1), "BN"),
+        ("FONTNAME", (0, 0), (-1, 0), "BN-Bold"),
+        ("FONTSIZE", (0, 0), (-1, -1), 7),
+        ("BACKGROUND", (0, 0), (-1, 0), colors.HexColor("#1e3a8a")),
+        ("TEXTCOLOR", (0, 0), (-1, 0), colors.white),
+        ("ROWBACKGROUNDS", (0, 1), (-1, -1), [colors.white, colors.HexColor("#f3f4f6")]),
+        ("GRID", (0, 0), (-1, -1), 0.25, colors.HexColor("#d1d5db")),
+        ("ALIGN", (5, 1), (-1, -1), "CENTER"),
+        ("VALIGN", (0, 0), (-1, -1), "MIDDLE"),
+    ]))
+    story.append(table)
+    doc.build(story)
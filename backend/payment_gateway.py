@@ -2,14 +2,17 @@ import logging
 from typing import Optional, List, Dict, Any
 from datetime import datetime
 import uuid
-import uuid
-import requests
 from fastapi import APIRouter, Depends, HTTPException, Request, Form, Body
 from fastapi.responses import RedirectResponse
 from pydantic import BaseModel
 from bson import ObjectId
 
 from student_utils import resolve_student_identity, get_student_fee_structure
+from counters import Sequence, allocate_number
+from student_ledger import record_monthly_payment
+from sslcommerz_client import (
+    gateway_client, gateway_base_url, GatewayUnavailableError, ipn_queue, verify_ipn_signature
+)
 
 logger = logging.getLogger(__name__)
 
@@ -32,15 +35,9 @@ class SSLCommerzService:
         self.store_id = settings.get('store_id')
         self.store_passwd = settings.get('store_passwd')
         self.is_sandbox = settings.get('is_sandbox', True)
-        
-        if self.is_sandbox:
-            self.base_url = "https://sandbox.sslcommerz.com"
-        else:
-            self.base_url = "https://securepay.sslcommerz.com"
+        self.base_url = gateway_base_url(self.is_sandbox)
             
-    def initiate_session(self, data: Dict[str, Any]) -> str:
-        api_url = f"{self.base_url}/gwprocess/v4/api.php"
-        
+    async def initiate_session(self, data: Dict[str, Any]) -> str:
         post_data = {
             'store_id': self.store_id,
             'store_passwd': self.store_passwd,
@@ -62,11 +59,12 @@ class SSLCommerzService:
             'product_category': "Service",
             'product_profile': "general"
         }
+        if data.get('ipn_url'):
+            post_data['ipn_url'] = data['ipn_url']
         
         try:
             logger.info(f"Initiating SSLCommerz Session: {post_data['tran_id']} - {post_data['total_amount']}")
-            response = requests.post(api_url, data=post_data)
-            response_data = response.json()
+            response_data = await gateway_client.initiate_session(self.base_url, post_data)
             
             if response_data.get('status') == 'SUCCESS':
                 return response_data.get('GatewayPageURL')
@@ -78,27 +76,139 @@ class SSLCommerzService:
             logger.error(f"SSLCommerz Connection Error: {e}")
             raise
 
-    def validate_transaction(self, val_id: str) -> Dict[str, Any]:
-        api_url = f"{self.base_url}/validator/api/validationserverAPI.php"
-        
-        params = {
-            'val_id': val_id,
-            'store_id': self.store_id,
-            'store_passwd': self.store_passwd,
-            'format': 'json'
-        }
-        
+    async def validate_transaction(self, val_id: str) -> Dict[str, Any]:
         try:
-            response = requests.get(api_url, params=params)
-            return response.json()
+            return await gateway_client.validate_transaction(
+                self.base_url, val_id, self.store_id, self.store_passwd
+            )
+        except GatewayUnavailableError:
+            raise
         except Exception as e:
             logger.error(f"Validation Error: {e}")
             return {"status": "FAILED"}
 
+
+async def settle_student_transaction(db, tran_id: str, val_id: str) -> str:
+    """
+    Validate a student fee transaction and post it to monthly_payments.
+
+    Shared by the browser success callback and the IPN worker, so it must be
+    idempotent: only the caller that flips the transaction to "success" writes
+    the monthly payments. Returns "success", "already_processed", "failed" or
+    "not_found". Raises GatewayUnavailableError when validation cannot be reached.
+    """
+    transaction = await db.payment_transactions.find_one({"tran_id": tran_id})
+    if not transaction:
+        return "not_found"
+    if transaction.get('status') == 'success':
+        return "already_processed"
+        
+    tenant_id = transaction['tenant_id']
+    
+    # Get Settings
+    settings = await db.payment_settings.find_one({"tenant_id": tenant_id})
+    service = SSLCommerzService(settings or {})
+    
+    validation = await service.validate_transaction(val_id)
+    
+    if validation.get('status') not in ('VALID', 'VALIDATED'):
+        await db.payment_transactions.update_one(
+            {"_id": transaction['_id'], "status": {"$ne": "success"}},
+            {"$set": {"status": "failed", "validation_response": validation}}
+        )
+        return "failed"
+
+    # 1. Update Transaction (atomic claim: the first settler wins)
+    claimed = await db.payment_transactions.find_one_and_update(
+        {"_id": transaction['_id'], "status": {"$ne": "success"}},
+        {"$set": {
+            "status": "success", 
+            "val_id": val_id, 
+            "validated_at": datetime.utcnow(),
+            "payment_details": validation
+        }}
+    )
+    if not claimed:
+        return "already_processed"
+    
+    # 2. Assign Payments to monthly_payments collection
+    # "এডমিন প্যানেলের ফি আদায়ে সেই ছাত্রের পেমেন্ট হিস্টোরী তে এড হবে"
+    
+    student_id = transaction['student_id']
+    months = transaction['months'] # e.g. ['January', 'February']
+    year = transaction['year']
+    amount_per_month = transaction['amount'] / len(months)
+    
+    # Create/Update monthly payment records
+    for month in months:
+        payment_record = {
+            "tenant_id": tenant_id,
+            "student_id": student_id,
+            "month": month,
+            "year": year,
+            "amount": amount_per_month,
+            "status": "paid", # Mark as paid
+            "payment_date": datetime.utcnow(),
+            "payment_method": "sslcommerz",
+            "tran_id": tran_id,
+            "collected_by": "online",
+            "receipt_no": await allocate_number(db, tenant_id, Sequence.RECEIPT)
+        }
+        
+        # Update if a pending/partial record exists, otherwise create it
+        await db.monthly_payments.update_one(
+            {
+                "tenant_id": tenant_id,
+                "student_id": student_id,
+                "month": month,
+                "year": year
+            },
+            {"$set": payment_record},
+            upsert=True
+        )
+        
+        await record_monthly_payment(db, payment_record)
+    
+    return "success"
+
+
+async def verify_student_ipn(db, form: Dict[str, Any]) -> bool:
+    """Check the IPN's verify_sign against the store password of the transaction's tenant"""
+    transaction = await db.payment_transactions.find_one(
+        {"tran_id": form.get('tran_id')}, {"_id": 0, "tenant_id": 1}
+    )
+    if not transaction:
+        return False
+    settings = await db.payment_settings.find_one(
+        {"tenant_id": transaction['tenant_id']}, {"_id": 0, "store_passwd": 1}
+    )
+    return verify_ipn_signature(form, (settings or {}).get('store_passwd'))
+
+
+async def handle_student_fee_ipn(db, form: Dict[str, Any]) -> str:
+    """IPN queue handler for student fee transactions"""
+    tran_id = form.get('tran_id')
+    val_id = form.get('val_id')
+    if not tran_id:
+        return "invalid"
+    if not val_id or form.get('status') not in ('VALID', 'VALIDATED'):
+        # Nothing to validate with the gateway: only a signed notification may
+        # fail a pending transaction
+        if not await verify_student_ipn(db, form):
+            return "invalid_signature"
+        await db.payment_transactions.update_one(
+            {"tran_id": tran_id, "status": "pending"},
+            {"$set": {"status": "failed", "failed_at": datetime.utcnow(), "ipn_status": form.get('status')}}
+        )
+        return "failed"
+    return await settle_student_transaction(db, tran_id, val_id)
+
 # --- Routes Setup ---
 
 def setup_payment_gateway_routes(router, db, get_current_user):
     
+    ipn_queue.register_handler("student_fee", handle_student_fee_ipn)
+    
     @router.post("/setup/payment-gateway")
     async def save_payment_gateway_settings(
         settings: PaymentGatewaySettings,
@@ -209,12 +319,13 @@ def setup_payment_gateway_routes(router, db, get_current_user):
                 'success_url': f"{base_url}/api/public/payment/success",
                 'fail_url': f"{base_url}/api/public/payment/fail",
                 'cancel_url': f"{base_url}/api/public/payment/cancel",
+                'ipn_url': f"{base_url}/api/public/payment/ipn",
                 'cus_name': student.get('name', 'Student'),
                 'cus_email': student.get('email', 'no-email@example.com'),
                 'cus_phone': student.get('phone') or student.get('parent_phone', '01700000000')
             }
             
-            gateway_url = service.initiate_session(session_data)
+            gateway_url = await service.initiate_session(session_data)
             
             return {"gateway_url": gateway_url}
             
@@ -236,84 +347,37 @@ def setup_payment_gateway_routes(router, db, get_current_user):
              # Basic handling
              return RedirectResponse(url="/student/payment/fail?reason=invalid_callback")
              
-        # Find Transaction
-        transaction = await db.payment_transactions.find_one({"tran_id": tran_id})
-        if not transaction:
-             return RedirectResponse(url="/student/payment/fail?reason=tran_not_found")
-             
-        tenant_id = transaction['tenant_id']
-        
-        # Get Settings
-        settings = await db.payment_settings.find_one({"tenant_id": tenant_id})
-        service = SSLCommerzService(settings)
+        try:
+            outcome = await settle_student_transaction(db, tran_id, val_id)
+        except GatewayUnavailableError:
+            # The IPN worker settles the transaction once the gateway is reachable again
+            return RedirectResponse(url="/student/payment/fail?reason=gateway_unavailable", status_code=303)
         
-        validation = service.validate_transaction(val_id)
+        if outcome == "not_found":
+             return RedirectResponse(url="/student/payment/fail?reason=tran_not_found")
         
-        if validation.get('status') == 'VALID' or validation.get('status') == 'VALIDATED':
-            # 1. Update Transaction
-            await db.payment_transactions.update_one(
-                {"_id": transaction['_id']},
-                {"$set": {
-                    "status": "success", 
-                    "val_id": val_id, 
-                    "validated_at": datetime.utcnow(),
-                    "payment_details": validation
-                }}
-            )
-            
-            # 2. Assign Payments to monthly_payments collection
-            # "এডমিন প্যানেলের ফি আদায়ে সেই ছাত্রের পেমেন্ট হিস্টোরী তে এড হবে"
-            
-            student_id = transaction['student_id']
-            months = transaction['months'] # e.g. ['January', 'February']
-            year = transaction['year']
-            amount_per_month = transaction['amount'] / len(months)
-            
-            # Create/Update monthly payment records
-            for month in months:
-                existing = await db.monthly_payments.find_one({
-                    "tenant_id": tenant_id,
-                    "student_id": student_id,
-                    "month": month,
-                    "year": year
-                })
-                
-                payment_record = {
-                    "tenant_id": tenant_id,
-                    "student_id": student_id,
-                    "month": month,
-                    "year": year,
-                    "amount": amount_per_month,
-                    "status": "paid", # Mark as paid
-                    "payment_date": datetime.utcnow(),
-                    "payment_method": "sslcommerz",
-                    "tran_id": tran_id,
-                    "collected_by": "online",
-                    "receipt_no": f"RCP-{uuid.uuid4().hex[:8].upper()}"
-                }
-                
-                if existing:
-                    # Update if exists? Usually we shouldn't double pay.
-                    # But if it was pending or partial... let's just update
-                    await db.monthly_payments.update_one(
-                        {"_id": existing['_id']},
-                        {"$set": payment_record}
-                    )
-                else:
-                    await db.monthly_payments.insert_one(payment_record)
-            
+        if outcome in ("success", "already_processed"):
             # Redirect to Frontend Success
             # Need to know frontend URL. Assuming relative path works or standard port.
             # Check Origin? 
             # Using standard path /student/payment/success
             return RedirectResponse(url="/student/payment/success?tran_id=" + tran_id, status_code=303)
             
-        else:
-            await db.payment_transactions.update_one(
-                {"_id": transaction['_id']},
-                {"$set": {"status": "failed", "validation_response": validation}}
-            )
-            return RedirectResponse(url="/student/payment/fail", status_code=303)
+        return RedirectResponse(url="/student/payment/fail", status_code=303)
+
+    @router.post("/public/payment/ipn")
+    async def payment_ipn(request: Request):
+        """SSLCommerz server-to-server notification; queued and processed once per tran_id/val_id"""
+        form_data = dict(await request.form())
+        if not form_data.get('tran_id'):
+            raise HTTPException(status_code=400, detail="Missing tran_id")
+        # Unauthenticated endpoint: reject anything not signed with the store password
+        if not await verify_student_ipn(db, form_data):
+            logger.warning(f"Rejected IPN with invalid signature for {form_data.get('tran_id')}")
+            raise HTTPException(status_code=400, detail="Invalid signature")
+        
+        queued = await ipn_queue.enqueue(db, "student_fee", form_data)
+        return {"status": "received", "duplicate": not queued}
 
     @router.post("/public/payment/fail")
     async def payment_fail(request: Request):
@@ -221,6 +221,17 @@ async def calculate_attendance_summary(db, tenant_id: str, employee_id: str, yea
         "date": {"$gte": start_date, "$lte": end_date}
     }).to_list(100)
     
+    # Days reconciled from biometric punches fill the days without a manual record
+    recorded_dates = {record.get("date") for record in attendance_records}
+    punch_days = await db.attendance.find({
+        "tenant_id": tenant_id,
+        "type": "staff",
+        "employee_id": employee_id,
+        "date": {"$gte": start_date, "$lte": end_date},
+        "source": "biometric"
+    }, {"_id": 0, "date": 1, "status": 1}).to_list(100)
+    attendance_records += [day for day in punch_days if day["date"] not in recorded_dates]
+    
     summary = {
         "total_working_days": 0,
         "present_days": 0,
@@ -0,0 +1,697 @@
+"""
+Student Promotion Engine
+End-of-year promotion of whole classes from the published results of a final
+exam term, using the institution's promotion rules (/result-config/promotion-rules).
+
+Preview (dry run)
+- One read of the active students of the selected classes and one read of their
+  published results; the rules are evaluated per student in memory:
+  overall percentage, mandatory subjects, grace marks (spent on the smallest
+  shortfalls first, up to max_grace_marks per student), min_subjects_to_pass and
+  compartment subjects
+- Each student gets a decision: promote, compartment (promoted with failed
+  subjects to clear), detain, graduate (promoted out of the last class) or
+  no_result (no published result; stays in the class)
+- Destination class follows the class order (order_index, then standard); the
+  section keeps its name where the next class has one; roll numbers are
+  reassigned per destination section by merit
+- The preview is stored as a promotion run; its per-student decisions
+  (`student_promotions`) become the history snapshots once applied
+
+Apply
+- Runs as a job_queue job over the unapplied decisions, 1000 at a time: one
+  bulk_write of student class/section/roll changes, one insert_many of the
+  destination class's fees (plus their ledger charges) and one bulk_write
+  marking the decisions applied
+- Every step is idempotent, so an interrupted or failed run is resumed by
+  applying it again; it continues with the decisions not yet applied, and fees
+  the run inserted before the interruption get their missing ledger charges
+- A run is claimed by switching its status to "applying" in one
+  find_one_and_update, so two requests (or two workers) never apply it at once.
+  The applying job touches updated_at after every chunk; a run left "applying"
+  for APPLY_STALE_MINUTES (its worker died) can be claimed again
+"""
+
+import asyncio
+import logging
+import re
+import uuid
+from collections import Counter, defaultdict
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+from fastapi import Depends, HTTPException, Query
+from pydantic import BaseModel
+from pymongo import UpdateOne
+
+from cache import invalidate_tenant_cache
+from fee_overdue import resolve_due_at
+from job_queue import job_queue
+from marksheet import get_results_version
+from pagination import get_pagination_params, create_paginated_response
+from result_ingest import subject_key
+from student_ledger import LedgerSource, record_student_fee_charges
+
+logger = logging.getLogger(__name__)
+
+DECISIONS = ("promote", "compartment", "detain", "graduate", "no_result")
+OVERRIDE_DECISIONS = ("promote", "detain", "graduate")
+MOVING_DECISIONS = ("promote", "compartment")
+APPLY_CHUNK_SIZE = 1000
+APPLY_STALE_MINUTES = 10
+# Classes outside the regular progression (Hifz, Nazera, ...) are only
+# promoted through an explicit class_map entry
+NON_PROGRESSING_CATEGORIES = ("Special",)
+
+DEFAULT_PROMOTION_RULES = {
+    "min_overall_percentage": 33.0,
+    "min_subjects_to_pass": 0,
+    "mandatory_subjects": [],
+    "grace_marks_allowed": True,
+    "max_grace_marks": 5.0,
+    "allow_compartment": True,
+    "max_compartment_subjects": 2,
+}
+
+STUDENT_PROJECTION = {
+    "_id": 0, "id": 1, "name": 1, "admission_no": 1, "student_identifier": 1,
+    "class_id": 1, "section_id": 1, "roll_no": 1,
+}
+
+
+class PromotionPreviewRequest(BaseModel):
+    exam_term_id: str
+    class_ids: List[str] = []  # default: every class with a promotion path
+    class_map: Dict[str, Optional[str]] = {}  # from class -> next class (None: graduate)
+    overrides: Dict[str, str] = {}  # student_id -> promote / detain / graduate
+    to_academic_year: Optional[str] = None
+
+
+# ================================
+# RULES
+# ================================
+
+def normalize_promotion_rules(rules: Optional[dict]) -> dict:
+    rules = rules or {}
+    return {field: default if rules.get(field) is None else rules[field]
+            for field, default in DEFAULT_PROMOTION_RULES.items()}
+
+
+def evaluate_result(result: dict, rules: dict, mandatory: set) -> dict:
+    """Promotion decision for one published result (before class progression)"""
+    failing = []
+    subjects = result.get("subjects") or []
+    for subject in subjects:
+        obtained = float(subject.get("obtained_marks") or 0)
+        passing = float(subject.get("passing_marks") or 0)
+        if obtained < passing:
+            name = subject.get("subject_name") or subject.get("subject_id") or ""
+            keys = {subject_key(name), subject.get("subject_id") or ""}
+            failing.append((passing - obtained, name, keys))
+
+    grace_left = float(rules["max_grace_marks"]) if rules["grace_marks_allowed"] else 0.0
+    grace: Dict[str, float] = {}
+    failed = []
+    for shortfall, name, keys in sorted(failing, key=lambda f: f[0]):
+        if shortfall <= grace_left:
+            grace_left -= shortfall
+            grace[name] = round(shortfall, 2)
+        else:
+            failed.append((name, keys))
+
+    percentage = float(result.get("percentage") or 0)
+    failed_names = [name for name, _ in failed]
+    evaluation = {"percentage": percentage, "grade": result.get("grade"), "total_marks": float(result.get("total_marks") or 0),
+                  "failed_subjects": failed_names, "compartment_subjects": [], "grace_marks": grace}
+
+    if percentage < float(rules["min_overall_percentage"]):
+        return {**evaluation, "decision": "detain",
+                "reasons": [f"Overall {percentage:g}% is below {float(rules['min_overall_percentage']):g}%"]}
+    failed_mandatory = [name for name, keys in failed if keys & mandatory]
+    if failed_mandatory:
+        return {**evaluation, "decision": "detain",
+                "reasons": [f"Failed mandatory subject(s): {', '.join(failed_mandatory)}"]}
+    if not failed:
+        return {**evaluation, "decision": "promote", "reasons": ["Passed with grace marks"] if grace else []}
+    passed = len(subjects) - len(failed)
+    if rules["min_subjects_to_pass"] and passed >= int(rules["min_subjects_to_pass"]):
+        return {**evaluation, "decision": "promote",
+                "reasons": [f"Passed {passed} of {len(subjects)} subjects"]}
+    if rules["allow_compartment"] and len(failed) <= int(rules["max_compartment_subjects"]):
+        return {**evaluation, "decision": "compartment", "compartment_subjects": failed_names,
+                "reasons": [f"Compartment in {', '.join(failed_names)}"]}
+    return {**evaluation, "decision": "detain", "reasons": [f"Failed {len(failed)} subject(s)"]}
+
+
+# ================================
+# CLASS PROGRESSION
+# ================================
+
+def _standard_number(cls: dict) -> int:
+    if cls.get("internal_standard") is not None:
+        return int(cls["internal_standard"])
+    match = re.search(r"\d+", str(cls.get("standard") or cls.get("name") or ""))
+    return int(match.group()) if match else 0
+
+
+def default_progression(classes: List[dict]) -> Dict[str, Optional[str]]:
+    """class_id -> next class_id in class order; the last class graduates (None)"""
+    ordered = sorted(
+        (c for c in classes if c.get("category") not in NON_PROGRESSING_CATEGORIES),
+        key=lambda c: (c.get("order_index") or 0, _standard_number(c), c.get("name") or "")
+    )
+    return {
+        cls["id"]: ordered[i + 1]["id"] if i + 1 < len(ordered) else None
+        for i, cls in enumerate(ordered)
+    }
+
+
+def next_academic_year(year: str) -> str:
+    """'2025-2026' -> '2026-2027', '2025-26' -> '2026-27', '2025' -> '2026'"""
+    return re.sub(r"\d+", lambda m: str(int(m.group()) + 1).zfill(len(m.group())), year or "")
+
+
+def _section_for(sections: List[dict], name: str) -> Optional[dict]:
+    """Section of the destination class with the same name, else its first section"""
+    wanted = str(name or "").strip().lower()
+    for section in sections:
+        if str(section.get("name") or "").strip().lower() == wanted:
+            return section
+    return sections[0] if sections else None
+
+
+def assign_rolls(decisions: List[dict]):
+    """Roll numbers per destination section: best result first, no result last"""
+    groups: Dict[tuple, List[dict]] = defaultdict(list)
+    for decision in decisions:
+        if decision["decision"] != "graduate":
+            groups[(decision["to_class_id"], decision["to_section_id"])].append(decision)
+    for members in groups.values():
+        members.sort(key=lambda d: (
+            d["percentage"] is None, -(d["percentage"] or 0), -(d["total_marks"] or 0), d["student_name"] or ""
+        ))
+        for roll, decision in enumerate(members, 1):
+            decision["to_roll_no"] = str(roll)
+
+
+# ================================
+# PREVIEW
+# ================================
+
+async def build_promotion_preview(db, current_user, request: PromotionPreviewRequest) -> dict:
+    """Evaluate the rules for every student of the selected classes and store the run"""
+    tenant_id, school_id = current_user.tenant_id, current_user.school_id
+
+    blocking = await db.promotion_runs.find_one(
+        {"tenant_id": tenant_id, "school_id": school_id, "status": {"$in": ["applying", "failed"]}},
+        {"_id": 0, "id": 1}
+    )
+    if blocking:
+        raise HTTPException(
+            status_code=409,
+            detail=f"Promotion run {blocking['id']} is partially applied; apply it again to finish it first"
+        )
+
+    exam_term = await db.exam_terms.find_one(
+        {"id": request.exam_term_id, "tenant_id": tenant_id, "school_id": school_id},
+        {"_id": 0, "id": 1, "name": 1, "academic_year": 1}
+    )
+    if not exam_term:
+        raise HTTPException(status_code=404, detail="Exam term not found")
+
+    for decision in request.overrides.values():
+        if decision not in OVERRIDE_DECISIONS:
+            raise HTTPException(status_code=400, detail=f"Override must be one of {', '.join(OVERRIDE_DECISIONS)}")
+
+    rules = normalize_promotion_rules(await db.promotion_rules.find_one(
+        {"tenant_id": tenant_id, "school_id": school_id, "is_active": True}, {"_id": 0}
+    ))
+    mandatory = {subject_key(s) for s in rules["mandatory_subjects"]} | set(rules["mandatory_subjects"])
+
+    classes = {c["id"]: c async for c in db.classes.find(
+        {"tenant_id": tenant_id, "is_active": True},
+        {"_id": 0, "id": 1, "name": 1, "display_name": 1, "standard": 1, "internal_standard": 1, "order_index": 1, "category": 1}
+    )}
+    progression = default_progression(list(classes.values()))
+    for from_id, to_id in request.class_map.items():
+        if from_id not in classes or (to_id and to_id not in classes):
+            raise HTTPException(status_code=400, detail="class_map refers to an unknown class")
+        progression[from_id] = to_id or None
+
+    class_ids = request.class_ids or list(progression)
+    unknown = [c for c in class_ids if c not in progression]
+    if unknown:
+        names = ", ".join(classes[c]["name"] if c in classes else c for c in unknown)
+        raise HTTPException(status_code=400, detail=f"No promotion path for {names}; add it to class_map")
+
+    involved = set(class_ids) | {progression[c] for c in class_ids if progression[c]}
+    sections_by_class: Dict[str, List[dict]] = defaultdict(list)
+    section_names: Dict[str, str] = {}
+    async for section in db.sections.find(
+        {"tenant_id": tenant_id, "class_id": {"$in": list(involved)}, "is_active": {"$ne": False}},
+        {"_id": 0, "id": 1, "class_id": 1, "name": 1}
+    ):
+        sections_by_class[section["class_id"]].append(section)
+        section_names[section["id"]] = section.get("name", "")
+    for sections in sections_by_class.values():
+        sections.sort(key=lambda s: str(s.get("name") or ""))
+
+    results = {r["student_id"]: r async for r in db.student_results.find(
+        {"tenant_id": tenant_id, "school_id": school_id, "exam_term_id": request.exam_term_id,
+         "status": "published", "class_id": {"$in": class_ids}},
+        {"_id": 0, "student_id": 1, "percentage": 1, "total_marks": 1, "grade": 1, "subjects": 1}
+    )}
+    students = await db.students.find(
+        {"tenant_id": tenant_id, "class_id": {"$in": class_ids}, "is_active": True}, STUDENT_PROJECTION
+    ).to_list(None)
+
+    run_id = str(uuid.uuid4())
+    academic_year = exam_term.get("academic_year") or ""
+    to_academic_year = request.to_academic_year or next_academic_year(academic_year)
+    now = datetime.utcnow()
+
+    def class_name(class_id: Optional[str]) -> str:
+        return (classes.get(class_id) or {}).get("name", "") if class_id else ""
+
+    decisions = []
+    for student in students:
+        from_class = student.get("class_id")
+        next_class = progression.get(from_class)
+        result = results.get(student["id"])
+        if result:
+            evaluation = evaluate_result(result, rules, mandatory)
+        else:
+            evaluation = {"decision": "no_result", "reasons": ["No published result"], "percentage": None,
+                          "grade": None, "total_marks": None, "failed_subjects": [], "compartment_subjects": [],
+                          "grace_marks": {}}
+
+        override = request.overrides.get(student["id"])
+        if override:
+            evaluation["decision"] = override
+            evaluation["reasons"] = evaluation["reasons"] + [f"Overridden: {override}"]
+        if evaluation["decision"] in MOVING_DECISIONS and next_class is None:
+            if evaluation["decision"] == "compartment":
+                evaluation["decision"] = "detain"
+                evaluation["reasons"] = evaluation["reasons"] + ["Compartment subjects must be cleared before graduating"]
+            else:
+                evaluation["decision"] = "graduate"
+
+        if evaluation["decision"] in MOVING_DECISIONS:
+            section = _section_for(sections_by_class.get(next_class, []), section_names.get(student.get("section_id")))
+            to_class, to_section = next_class, (section or {}).get("id", "")
+        elif evaluation["decision"] == "graduate":
+            to_class, to_section = None, None
+        else:
+            to_class, to_section = from_class, student.get("section_id")
+
+        decisions.append({
+            "id": str(uuid.uuid4()),
+            "tenant_id": tenant_id,
+            "school_id": school_id,
+            "promotion_id": run_id,
+            "student_id": student["id"],
+            "student_name": student.get("name", ""),
+            "admission_no": student.get("admission_no", ""),
+            **evaluation,
+            "from_class_id": from_class,
+            "from_class_name": class_name(from_class),
+            "from_section_id": student.get("section_id"),
+            "from_section_name": section_names.get(student.get("section_id"), ""),
+            "from_roll_no": student.get("roll_no"),
+            "to_class_id": to_class,
+            "to_class_name": class_name(to_class),
+            "to_section_id": to_section,
+            "to_section_name": section_names.get(to_section, "") if to_section else "",
+            "to_roll_no": None,
+            "academic_year": academic_year,
+            "to_academic_year": to_academic_year,
+            "applied": False,
+            "created_at": now,
+        })
+    assign_rolls(decisions)
+
+    summary = Counter({decision: 0 for decision in DECISIONS})
+    per_class: Dict[str, Counter] = defaultdict(Counter)
+    for decision in decisions:
+        summary[decision["decision"]] += 1
+        per_class[decision["from_class_id"]][decision["decision"]] += 1
+    run = {
+        "id": run_id,
+        "tenant_id": tenant_id,
+        "school_id": school_id,
+        "exam_term_id": request.exam_term_id,
+        "exam_term_name": exam_term.get("name", ""),
+        "academic_year": academic_year,
+        "to_academic_year": to_academic_year,
+        "class_ids": class_ids,
+        "class_map": {c: progression[c] for c in class_ids},
+        "overrides": request.overrides,
+        "rules": rules,
+        "results_version": await get_results_version(db, tenant_id, school_id, request.exam_term_id),
+        "status": "preview",
+        "total_students": len(decisions),
+        "summary": dict(summary),
+        "classes": [{
+            "class_id": c,
+            "class_name": class_name(c),
+            "to_class_id": progression[c],
+            "to_class_name": class_name(progression[c]) if progression[c] else "Graduate",
+            "total": sum(per_class[c].values()),
+            **{decision: per_class[c][decision] for decision in DECISIONS},
+        } for c in class_ids],
+        "applied_count": 0,
+        "created_by": current_user.id,
+        "created_at": now,
+        "updated_at": now,
+    }
+
+    # A new preview replaces the unapplied ones
+    stale_runs = [r["id"] async for r in db.promotion_runs.find(
+        {"tenant_id": tenant_id, "school_id": school_id, "status": {"$in": ["preview", "stale"]}}, {"_id": 0, "id": 1}
+    )]
+    if stale_runs:
+        await db.student_promotions.delete_many({"tenant_id": tenant_id, "promotion_id": {"$in": stale_runs}})
+        await db.promotion_runs.delete_many({"tenant_id": tenant_id, "id": {"$in": stale_runs}})
+
+    for start in range(0, len(decisions), APPLY_CHUNK_SIZE):
+        await db.student_promotions.insert_many(decisions[start:start + APPLY_CHUNK_SIZE], ordered=False)
+    await db.promotion_runs.insert_one(run)
+    run.pop("_id", None)
+    logger.info(f"Promotion preview {run_id} for exam term {request.exam_term_id}: {dict(summary)}")
+    return run
+
+
+# ================================
+# APPLY
+# ================================
+
+async def load_class_fee_configs(db, tenant_id: str) -> Dict[str, List[dict]]:
+    """Active class-specific fee configurations by class id"""
+    configs: Dict[str, List[dict]] = defaultdict(list)
+    async for config in db.fee_configurations.find(
+        {"tenant_id": tenant_id, "is_active": True, "apply_to_classes": {"$ne": "all"}},
+        {"_id": 0, "id": 1, "school_id": 1, "fee_type": 1, "amount": 1, "due_date": 1, "apply_to_classes": 1}
+    ):
+        configs[config["apply_to_classes"]].append(config)
+    return configs
+
+
+async def apply_promotion_chunk(db, tenant_id: str, chunk: List[dict], fee_configs: Dict[str, List[dict]]) -> int:
+    """Apply one chunk of decisions; safe to repeat. Returns the number of fees assigned"""
+    now = datetime.utcnow()
+    students = {s["id"]: s async for s in db.students.find(
+        {"tenant_id": tenant_id, "id": {"$in": [d["student_id"] for d in chunk]}},
+        {**STUDENT_PROJECTION, "monthly_fee_config_id": 1}
+    )}
+    config_classes = {c["id"]: class_id for class_id, configs in fee_configs.items() for c in configs}
+
+    student_ops = []
+    for decision in chunk:
+        student = students.get(decision["student_id"])
+        if not student:
+            continue
+        key = {"id": decision["student_id"], "tenant_id": tenant_id}
+        if decision["decision"] == "graduate":
+            student_ops.append(UpdateOne(key, {"$set": {
+                "is_active": False,
+                "status": "graduated",
+                "graduated_at": now,
+                "graduation_year": decision["academic_year"],
+                "last_promotion_id": decision["promotion_id"],
+                "updated_at": now,
+            }}))
+            continue
+        update = {"$set": {
+            "class_id": decision["to_class_id"],
+            "section_id": decision["to_section_id"] or "",
+            "roll_no": decision["to_roll_no"],
+            "last_promotion_id": decision["promotion_id"],
+            "updated_at": now,
+        }}
+        if decision["decision"] == "compartment":
+            update["$set"]["compartment_subjects"] = decision["compartment_subjects"]
+        else:
+            update["$unset"] = {"compartment_subjects": ""}
+        # A per-student fee configuration of the old class no longer applies
+        if decision["to_class_id"] != decision["from_class_id"] and \
+                config_classes.get(student.get("monthly_fee_config_id")) == decision["from_class_id"]:
+            update["$set"]["monthly_fee_config_id"] = None
+        student_ops.append(UpdateOne(key, update))
+    if student_ops:
+        await db.students.bulk_write(student_ops, ordered=False)
+
+    # Fees of the destination class for students moving up
+    moving = [d for d in chunk if d["decision"] in MOVING_DECISIONS and d["student_id"] in students
+              and fee_configs.get(d["to_class_id"])]
+    new_fees = []
+    resumed_fees = []
+    if moving:
+        config_ids = list({c["id"] for d in moving for c in fee_configs[d["to_class_id"]]})
+        existing_fees = await db.student_fees.find(
+            {"tenant_id": tenant_id, "student_id": {"$in": [d["student_id"] for d in moving]},
+             "fee_config_id": {"$in": config_ids}, "is_active": True},
+            {"_id": 0, "id": 1, "tenant_id": 1, "student_id": 1, "fee_config_id": 1, "fee_type": 1,
+             "amount": 1, "promotion_id": 1, "created_at": 1}
+        ).to_list(None)
+        assigned = {(f["student_id"], f["fee_config_id"]) for f in existing_fees}
+
+        # Fees this run inserted before an interruption may still lack their ledger charge
+        run_fees = {f["id"]: f for f in existing_fees if f.get("promotion_id") == chunk[0]["promotion_id"]}
+        if run_fees:
+            charged = {e["source_id"] async for e in db.student_ledger_entries.find(
+                {"tenant_id": tenant_id, "source": LedgerSource.STUDENT_FEE, "source_id": {"$in": list(run_fees)}},
+                {"_id": 0, "source_id": 1}
+            )}
+            resumed_fees = list(run_fees.values())
+            uncharged = [fee for fee_id, fee in run_fees.items() if fee_id not in charged]
+            if uncharged:
+                await record_student_fee_charges(db, uncharged)
+
+        for decision in moving:
+            student = students[decision["student_id"]]
+            for config in fee_configs[decision["to_class_id"]]:
+                if (student["id"], config["id"]) in assigned:
+                    continue
+                new_fees.append({
+                    "id": str(uuid.uuid4()),
+                    "tenant_id": tenant_id,
+                    "school_id": config.get("school_id") or decision["school_id"],
+                    "student_id": student["id"],
+                    "student_name": student.get("name", ""),
+                    "admission_no": student.get("admission_no", ""),
+                    "student_identifier": student.get("student_identifier"),
+                    "class_id": decision["to_class_id"],
+                    "section_id": decision["to_section_id"],
+                    "fee_config_id": config["id"],
+                    "fee_type": config.get("fee_type", ""),
+                    "amount": config.get("amount", 0),
+                    "paid_amount": 0.0,
+                    "pending_amount": config.get("amount", 0),
+                    "overdue_amount": 0.0,
+                    "due_date": config.get("due_date"),
+                    "status": "pending",
+                    "is_active": True,
+                    "promotion_id": decision["promotion_id"],
+                    "created_at": now,
+                    "updated_at": now,
+                })
+                new_fees[-1]["due_at"] = resolve_due_at(new_fees[-1])
+        if new_fees:
+            await db.student_fees.insert_many(new_fees, ordered=False)
+            await record_student_fee_charges(db, new_fees)
+
+    fees_per_student = Counter(f["student_id"] for f in new_fees + resumed_fees)
+    await db.student_promotions.bulk_write([UpdateOne(
+        {"id": decision["id"], "tenant_id": tenant_id},
+        {"$set": {
+            "applied": True,
+            "applied_at": now,
+            "student_found": decision["student_id"] in students,
+            "fees_assigned": fees_per_student.get(decision["student_id"], 0),
+        }}
+    ) for decision in chunk], ordered=False)
+    return len(new_fees) + len(resumed_fees)
+
+
+async def apply_promotion(job_id: Optional[str], db, tenant_id: str, run_id: str) -> dict:
+    """Apply (or resume applying) a promotion run"""
+    run = await db.promotion_runs.find_one({"id": run_id, "tenant_id": tenant_id}, {"_id": 0})
+    base = {"tenant_id": tenant_id, "promotion_id": run_id, "applied": False}
+    pending = await db.student_promotions.count_documents(base)
+    if job_id:
+        job = job_queue.get_job(job_id)
+        if job:
+            job.total = pending
+
+    fee_configs = await load_class_fee_configs(db, tenant_id)
+    processed = fees = 0
+    try:
+        while True:
+            chunk = await db.student_promotions.find(base, {"_id": 0}).limit(APPLY_CHUNK_SIZE).to_list(APPLY_CHUNK_SIZE)
+            if not chunk:
+                break
+            chunk_fees = await apply_promotion_chunk(db, tenant_id, chunk, fee_configs)
+            fees += chunk_fees
+            processed += len(chunk)
+            await db.promotion_runs.update_one(
+                {"id": run_id, "tenant_id": tenant_id},
+                {"$inc": {"applied_count": len(chunk), "fees_assigned": chunk_fees},
+                 "$set": {"updated_at": datetime.utcnow()}}
+            )
+            if job_id:
+                job_queue.update_progress(job_id, processed)
+    except Exception as e:
+        await db.promotion_runs.update_one(
+            {"id": run_id, "tenant_id": tenant_id},
+            {"$set": {"status": "failed", "error": str(e), "updated_at": datetime.utcnow()}}
+        )
+        logger.error(f"Promotion run {run_id} failed after {processed} students: {e}")
+        raise
+
+    now = datetime.utcnow()
+    await db.promotion_runs.update_one(
+        {"id": run_id, "tenant_id": tenant_id},
+        {"$set": {"status": "applied", "applied_at": now, "updated_at": now, "error": None}}
+    )
+    # Previews built before these moves describe classes that no longer exist as they were
+    await db.promotion_runs.update_many(
+        {"tenant_id": tenant_id, "school_id": run["school_id"], "status": "preview"},
+        {"$set": {"status": "stale", "updated_at": now}}
+    )
+    await invalidate_tenant_cache(tenant_id)
+    logger.info(f"Applied promotion run {run_id}: {processed} students, {fees} fees assigned")
+    return {"promotion_id": run_id, "applied": processed, "fees_assigned": fees}
+
+
+# ================================
+# API ROUTES
+# ================================
+
+def setup_promotion_routes(api_router, db, get_current_user):
+    """Setup student promotion routes"""
+
+    def require_admin(current_user):
+        if current_user.role not in ["super_admin", "admin", "principal"]:
+            raise HTTPException(status_code=403, detail="Not authorized")
+
+    @api_router.post("/promotions/preview")
+    async def preview_promotion(
+        request: PromotionPreviewRequest,
+        current_user=Depends(get_current_user)
+    ):
+        """Dry run: evaluate the promotion rules for whole classes without changing any student"""
+        try:
+            require_admin(current_user)
+            return await build_promotion_preview(db, current_user, request)
+        except HTTPException:
+            raise
+        except Exception as e:
+            logger.error(f"Error building promotion preview: {e}")
+            raise HTTPException(status_code=500, detail="Failed to build promotion preview")
+
+    @api_router.get("/promotions")
+    async def list_promotions(current_user=Depends(get_current_user)):
+        """Promotion runs of the institution, newest first"""
+        require_admin(current_user)
+        return await db.promotion_runs.find(
+            {"tenant_id": current_user.tenant_id, "school_id": current_user.school_id},
+            {"_id": 0, "classes": 0, "overrides": 0}
+        ).sort("created_at", -1).to_list(50)
+
+    @api_router.get("/promotions/students/{student_id}/history")
+    async def get_student_promotion_history(
+        student_id: str,
+        current_user=Depends(get_current_user)
+    ):
+        """Applied promotion snapshots of one student"""
+        if current_user.role not in ["super_admin", "admin", "principal", "teacher"]:
+            raise HTTPException(status_code=403, detail="Not authorized")
+        return await db.student_promotions.find(
+            {"tenant_id": current_user.tenant_id, "student_id": student_id, "applied": True},
+            {"_id": 0}
+        ).sort("created_at", -1).to_list(100)
+
+    @api_router.get("/promotions/{run_id}")
+    async def get_promotion(run_id: str, current_user=Depends(get_current_user)):
+        require_admin(current_user)
+        run = await db.promotion_runs.find_one({"id": run_id, "tenant_id": current_user.tenant_id}, {"_id": 0})
+        if not run:
+            raise HTTPException(status_code=404, detail="Promotion run not found")
+        return run
+
+    @api_router.get("/promotions/{run_id}/students")
+    async def get_promotion_students(
+        run_id: str,
+        decision: Optional[str] = None,
+        class_id: Optional[str] = None,
+        page: int = Query(1, ge=1),
+        limit: int = Query(50, ge=1, le=500),
+        current_user=Depends(get_current_user)
+    ):
+        """Per-student decisions of a run"""
+        require_admin(current_user)
+        query = {"tenant_id": current_user.tenant_id, "promotion_id": run_id}
+        if decision:
+            query["decision"] = decision
+        if class_id:
+            query["from_class_id"] = class_id
+        params = get_pagination_params(page, limit)
+        total = await db.student_promotions.count_documents(query)
+        items = await db.student_promotions.find(query, {"_id": 0}).sort(
+            [("from_class_id", 1), ("student_name", 1)]
+        ).skip(params.skip).limit(params.effective_limit).to_list(params.effective_limit)
+        return create_paginated_response(items, total, params.page, params.effective_limit)
+
+    @api_router.post("/promotions/{run_id}/apply")
+    async def apply_promotion_run(run_id: str, current_user=Depends(get_current_user)):
+        """Apply a previewed run in the background; applying a failed or interrupted run resumes it"""
+        try:
+            require_admin(current_user)
+            run = await db.promotion_runs.find_one({"id": run_id, "tenant_id": current_user.tenant_id}, {"_id": 0})
+            if not run:
+                raise HTTPException(status_code=404, detail="Promotion run not found")
+
+            if run["status"] == "applied":
+                raise HTTPException(status_code=400, detail="Promotion run is already applied")
+            if run["status"] == "stale":
+                raise HTTPException(status_code=409, detail="Another promotion was applied since this preview; preview again")
+            if run["status"] == "preview":
+                version = await get_results_version(db, run["tenant_id"], run["school_id"], run["exam_term_id"])
+                if version != run.get("results_version"):
+                    raise HTTPException(status_code=409, detail="Results changed since the preview; preview again")
+
+            now = datetime.utcnow()
+            claimed = await db.promotion_runs.find_one_and_update(
+                {"id": run_id, "tenant_id": current_user.tenant_id, "$or": [
+                    {"status": {"$in": ["preview", "failed"]}},
+                    {"status": "applying", "updated_at": {"$lt": now - timedelta(minutes=APPLY_STALE_MINUTES)}},
+                ]},
+                {"$set": {"status": "applying", "applied_by": current_user.id, "updated_at": now}}
+            )
+            if not claimed:
+                current = await db.promotion_runs.find_one(
+                    {"id": run_id, "tenant_id": current_user.tenant_id}, {"_id": 0, "status": 1, "job_id": 1}
+                ) or {}
+                if current.get("status") == "applying":
+                    return {
+                        "job_id": current.get("job_id"),
+                        "message": "Promotion is already being applied",
+                        "status_url": f"/api/jobs/{current.get('job_id')}"
+                    }
+                raise HTTPException(status_code=409, detail="Promotion run changed; reload it and try again")
+
+            job = job_queue.create_job("student_promotion", current_user.tenant_id, total=run.get("total_students", 0))
+            await db.promotion_runs.update_one(
+                {"id": run_id, "tenant_id": current_user.tenant_id}, {"$set": {"job_id": job.id}}
+            )
+            asyncio.create_task(job_queue.run_job(job.id, apply_promotion, db, current_user.tenant_id, run_id))
+            return {
+                "job_id": job.id,
+                "message": "Promotion is being applied in the background",
+                "status_url": f"/api/jobs/{job.id}"
+            }
+        except HTTPException:
+            raise
+        except Exception as e:
+            logger.error(f"Error applying promotion run {run_id}: {e}")
+            raise HTTPException(status_code=500, detail="Failed to apply promotion")
@@ -0,0 +1,533 @@
+"""
+Punch-to-Attendance Reconciler
+Turns raw biometric punches (punch_store) into day-level attendance records.
+
+A background loop reads punches ingested since a watermark on processed_at, in
+(processed_at, punch_id) order, and recomputes every affected (person, day) from
+the punch store, so re-reading a punch is harmless:
+- punches are paired into IN/OUT sessions per person; repeated INs within
+  DUPLICATE_PUNCH_SECONDS are one punch, extra OUTs move the check-out
+- a session belongs to the day of its IN, so an OUT up to MAX_SHIFT_HOURS later
+  closes a night shift on the previous day; an IN without an OUT is a missing
+  check-out and is not penalised as a half day
+- statuses come from the compiled attendance rules (class rule, shift rule, general)
+
+Staff days are upserted into `attendance` (type "staff"), student days into
+`student_attendance` (feeding the attendance read models) under the batch writer's
+key (person, date, attendance_session "Morning"), so marking a student by hand
+replaces the biometric record instead of adding a second one. Records entered by
+hand or by other sources are never overwritten: existing biometric records are
+updated only while they are still biometric, and new ones are insert-only. Each cycle re-reads the last
+RECONCILE_OVERLAP_SECONDS of punches to pick up transactions that committed late.
+A date range can be re-processed on demand as a background job.
+"""
+
+import asyncio
+import logging
+import os
+import socket
+import uuid
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from fastapi import Depends, HTTPException
+from pymongo import DeleteOne, UpdateOne
+
+from attendance_bitmap import DEFAULT_SESSION
+from attendance_management import get_compiled_attendance_rules
+from attendance_rollup import record_attendance_changes
+from biometric_ingest import get_pg_pool
+from job_queue import job_queue
+from punch_store import PUNCH_TABLE
+
+logger = logging.getLogger(__name__)
+
+RECONCILE_INTERVAL_SECONDS = float(os.environ.get("PUNCH_RECONCILE_INTERVAL", "15"))
+RECONCILE_OVERLAP_SECONDS = 120
+RECONCILE_PAGE_SIZE = 2000
+RECONCILE_PERSON_CHUNK = 500
+DUPLICATE_PUNCH_SECONDS = 120
+MAX_SHIFT_HOURS = 16
+LEASE_SECONDS = 60
+RECONCILED_SOURCE = "biometric"
+
+STATE_ID = "punch_reconciler"
+_holder = f"{socket.gethostname()}:{os.getpid()}"
+
+
+def punch_direction(punch_type: Optional[str]) -> Optional[str]:
+    """IN / OUT for pairing; break punches do not open or close a session"""
+    punch_type = (punch_type or "IN").upper()
+    if punch_type.startswith("BREAK"):
+        return None
+    return "OUT" if punch_type.endswith("OUT") else "IN"
+
+
+# ================================
+# PAIRING
+# ================================
+
+def pair_sessions(punches: List[dict]) -> List[dict]:
+    """
+    IN/OUT sessions of one person from their punches in time order.
+    Each session is {in, out}; either side may be None.
+    """
+    sessions: List[dict] = []
+    duplicate_window = timedelta(seconds=DUPLICATE_PUNCH_SECONDS)
+    max_shift = timedelta(hours=MAX_SHIFT_HOURS)
+
+    for punch in punches:
+        direction = punch_direction(punch.get("punch_type"))
+        at = punch["punch_time"]
+        last = sessions[-1] if sessions else None
+        if direction == "IN":
+            if last and last["out"] is None and last["in"] and at - last["in"] <= duplicate_window:
+                continue  # repeated IN
+            sessions.append({"in": at, "out": None})
+        elif direction == "OUT":
+            start = last and (last["in"] or last["out"])
+            if last and start and at - start <= max_shift and (last["out"] is None or at > last["out"]):
+                # Closes the open session, or a later OUT replaces the check-out
+                last["out"] = at
+            else:
+                sessions.append({"in": None, "out": at})
+    return sessions
+
+
+def summarize_days(sessions: List[dict]) -> Dict[str, dict]:
+    """Day summaries keyed YYYY-MM-DD; a session counts on the day of its IN"""
+    days: Dict[str, dict] = {}
+    for session in sessions:
+        day = (session["in"] or session["out"]).strftime("%Y-%m-%d")
+        summary = days.setdefault(day, {
+            "first_in": None, "last_out": None, "sessions": 0, "worked_minutes": 0, "missing_out": False
+        })
+        summary["sessions"] += 1
+        if session["in"] and (summary["first_in"] is None or session["in"] < summary["first_in"]):
+            summary["first_in"] = session["in"]
+        if session["out"] and (summary["last_out"] is None or session["out"] > summary["last_out"]):
+            summary["last_out"] = session["out"]
+        if session["in"] and session["out"]:
+            summary["worked_minutes"] += int((session["out"] - session["in"]).total_seconds() // 60)
+        elif session["in"]:
+            summary["missing_out"] = True
+    return days
+
+
+def _hhmm(value: Optional[datetime]) -> Optional[str]:
+    return value.strftime("%H:%M") if value else None
+
+
+# ================================
+# DAY RECORDS
+# ================================
+
+async def _fetch_person_punches(conn, tenant_id: str, person_ids: List[str], start: datetime, end: datetime) -> Dict[str, List[dict]]:
+    rows = await conn.fetch(
+        f"""SELECT person_id, punch_time, punch_type, device_id
+            FROM {PUNCH_TABLE}
+            WHERE tenant_id = $1 AND person_id = ANY($2::text[])
+              AND punch_time >= $3 AND punch_time < $4
+            ORDER BY person_id, punch_time""",
+        tenant_id, person_ids, start, end
+    )
+    by_person: Dict[str, List[dict]] = {}
+    for row in rows:
+        by_person.setdefault(row["person_id"], []).append(dict(row))
+    return by_person
+
+
+async def _resolve_people(db, tenant_id: str, person_type: str, person_ids: List[str]) -> Dict[str, dict]:
+    """Device person id -> staff or student document (projected)"""
+    if person_type == "staff":
+        docs = await db.staff.find(
+            {"tenant_id": tenant_id, "employee_id": {"$in": person_ids}},
+            {"_id": 0, "employee_id": 1, "name": 1, "full_name": 1, "department": 1, "shift": 1}
+        ).to_list(None)
+        return {doc["employee_id"]: doc for doc in docs}
+
+    docs = await db.students.find(
+        {"tenant_id": tenant_id, "$or": [{"id": {"$in": person_ids}}, {"admission_no": {"$in": person_ids}}]},
+        {"_id": 0, "id": 1, "admission_no": 1, "name": 1, "class_id": 1, "section_id": 1, "shift": 1}
+    ).to_list(None)
+    people = {}
+    for doc in docs:
+        for key in (doc.get("admission_no"), doc.get("id")):
+            if key in person_ids:
+                people[key] = doc
+    return people
+
+
+def _day_fields(summary: dict, status: dict, device_id: Optional[str]) -> dict:
+    return {
+        "status": status["status"],
+        "status_reason": status["reason"],
+        "check_in": _hhmm(summary["first_in"]),
+        "check_out": _hhmm(summary["last_out"]),
+        "worked_minutes": summary["worked_minutes"],
+        "punch_sessions": summary["sessions"],
+        "missing_check_out": summary["missing_out"],
+        "device_id": device_id
+    }
+
+
+async def reconcile_person_days(
+    db,
+    conn,
+    tenant_id: str,
+    person_type: str,
+    days_by_person: Dict[str, Iterable[str]],
+    remove_stale: bool = False
+) -> dict:
+    """
+    Recompute the attendance of the given (person, day) pairs from the punch store
+    and write the records that changed. remove_stale drops reconciled records of
+    those days that no longer have punches (used when re-processing a range).
+    """
+    stats = {"written": 0, "unchanged": 0, "skipped_manual": 0, "unmatched": 0, "removed": 0}
+    person_ids = list(days_by_person)
+    all_days = sorted({day for days in days_by_person.values() for day in days})
+    if not person_ids or not all_days:
+        return stats
+
+    # One day either side: night shifts that started the day before, or end the day after
+    window_start = datetime.strptime(all_days[0], "%Y-%m-%d") - timedelta(days=1)
+    window_end = datetime.strptime(all_days[-1], "%Y-%m-%d") + timedelta(days=2)
+    punches_by_person = await _fetch_person_punches(conn, tenant_id, person_ids, window_start, window_end)
+    people = await _resolve_people(db, tenant_id, person_type, person_ids)
+    rule_set = await get_compiled_attendance_rules(db, tenant_id)
+
+    is_staff = person_type == "staff"
+    collection = db.attendance if is_staff else db.student_attendance
+    key_field = "employee_id" if is_staff else "person_id"
+    record_ids = {pid: (pid if is_staff else people[pid]["id"]) for pid in person_ids if pid in people}
+    stats["unmatched"] = len(person_ids) - len(record_ids)
+    if not record_ids:
+        return stats
+
+    query = {"tenant_id": tenant_id, key_field: {"$in": list(record_ids.values())}, "date": {"$in": all_days}}
+    if is_staff:
+        query["type"] = "staff"
+    else:
+        # Other sessions are separate records; None matches biometric days stored without a session
+        query["attendance_session"] = {"$in": [DEFAULT_SESSION, None]}
+    existing: Dict[Tuple[str, str], dict] = {}
+    for doc in await collection.find(query, {"_id": 0}).to_list(None):
+        current = existing.get((doc[key_field], doc["date"]))
+        # Any record from another source (manual, device sync) makes the day off-limits
+        if current is None or current.get("source") == RECONCILED_SOURCE:
+            existing[(doc[key_field], doc["date"])] = doc
+
+    now = datetime.utcnow()
+    operations = []
+    marks = []
+    # A student may punch under the admission number and be referenced by id
+    by_record: Dict[str, List[str]] = {}
+    for person_id, record_id in record_ids.items():
+        by_record.setdefault(record_id, []).append(person_id)
+
+    for record_id, aliases in by_record.items():
+        person = people[aliases[0]]
+        punches = sorted(
+            (punch for alias in aliases for punch in punches_by_person.get(alias, [])),
+            key=lambda punch: punch["punch_time"]
+        )
+        summaries = summarize_days(pair_sessions(punches))
+        devices = {punch["punch_time"].strftime("%Y-%m-%d"): punch["device_id"] for punch in punches}
+
+        for day in {day for alias in aliases for day in days_by_person[alias]}:
+            current = existing.get((record_id, day))
+            if current and current.get("source") != RECONCILED_SOURCE:
+                stats["skipped_manual"] += 1
+                continue
+            summary = summaries.get(day)
+            if current:
+                # Only while the record is still biometric: a manual mark since the read wins
+                key = {"tenant_id": tenant_id, "id": current["id"], "source": RECONCILED_SOURCE}
+            else:
+                key = {"tenant_id": tenant_id, key_field: record_id, "date": day}
+                key.update({"type": "staff"} if is_staff else {"attendance_session": DEFAULT_SESSION})
+
+            if summary is None:
+                if current and remove_stale:
+                    operations.append(DeleteOne(key))
+                    stats["removed"] += 1
+                    if not is_staff:
+                        marks.append({"person_id": record_id, "date": day, "status": None,
+                                      "attendance_session": DEFAULT_SESSION,
+                                      "class_id": current.get("class_id"), "previous_status": current.get("status")})
+                continue
+
+            status = rule_set.classify(
+                _hhmm(summary["first_in"]),
+                None if summary["missing_out"] else _hhmm(summary["last_out"]),
+                day,
+                person.get("class_id"),
+                person.get("shift")
+            )
+            fields = _day_fields(summary, status, devices.get(day))
+            if current and all(current.get(name) == value for name, value in fields.items()):
+                stats["unchanged"] += 1
+                continue
+
+            if is_staff:
+                fields.update({
+                    "staff_name": person.get("full_name") or person.get("name", record_id),
+                    "department": person.get("department", "Unknown Department")
+                })
+            else:
+                fields.update({"person_type": "student", "class_id": person.get("class_id"),
+                               "section_id": person.get("section_id"), "attendance_session": DEFAULT_SESSION})
+            if current:
+                operations.append(UpdateOne(key, {"$set": {**fields, "updated_at": now}}))
+            else:
+                # Insert-only: a record written by hand in the meantime is left alone
+                operations.append(UpdateOne(
+                    key,
+                    {"$setOnInsert": {
+                        **fields, "source": RECONCILED_SOURCE, "id": str(uuid.uuid4()),
+                        "created_at": now, "updated_at": now,
+                        **({"person_id": record_id} if is_staff else {})
+                    }},
+                    upsert=True
+                ))
+            stats["written"] += 1
+            if not is_staff:
+                marks.append({
+                    "person_id": record_id,
+                    "date": day,
+                    "attendance_session": DEFAULT_SESSION,
+                    "status": status["status"],
+                    "class_id": person.get("class_id"),
+                    "previous_status": current.get("status") if current else None,
+                    "previous_class_id": current.get("class_id") if current else None
+                })
+
+    if operations:
+        await collection.bulk_write(operations, ordered=False)
+    if marks:
+        await record_attendance_changes(db, tenant_id, marks, source="student_attendance")
+    return stats
+
+
+def _merge_stats(total: dict, stats: dict):
+    for key, value in stats.items():
+        total[key] = total.get(key, 0) + value
+
+
+async def reconcile_keys(db, conn, keys: Iterable[Tuple[str, str, str, str]], remove_stale: bool = False) -> dict:
+    """Reconcile (tenant_id, person_type, person_id, day) keys, grouped per tenant and person type"""
+    grouped: Dict[Tuple[str, str], Dict[str, set]] = {}
+    for tenant_id, person_type, person_id, day in keys:
+        if person_type not in ("staff", "student"):
+            continue
+        grouped.setdefault((tenant_id, person_type), {}).setdefault(person_id, set()).add(day)
+
+    totals: dict = {}
+    for (tenant_id, person_type), days_by_person in grouped.items():
+        person_ids = list(days_by_person)
+        for i in range(0, len(person_ids), RECONCILE_PERSON_CHUNK):
+            chunk = {pid: days_by_person[pid] for pid in person_ids[i:i + RECONCILE_PERSON_CHUNK]}
+            stats = await reconcile_person_days(db, conn, tenant_id, person_type, chunk, remove_stale)
+            _merge_stats(totals, stats)
+    return totals
+
+
+# ================================
+# CONTINUOUS RECONCILIATION
+# ================================
+
+async def _get_state(db) -> dict:
+    return await db.punch_reconciler_state.find_one({"_id": STATE_ID}) or {}
+
+
+async def _claim_lease(db) -> bool:
+    """Only one worker process reconciles at a time; the lease is renewed every cycle"""
+    now = datetime.utcnow()
+    lease = {"holder": _holder, "expires_at": now + timedelta(seconds=LEASE_SECONDS)}
+    result = await db.scheduler_locks.update_one(
+        {"_id": STATE_ID, "$or": [{"holder": _holder}, {"expires_at": {"$lt": now}}]},
+        {"$set": lease}
+    )
+    if result.matched_count:
+        return True
+    try:
+        await db.scheduler_locks.insert_one({"_id": STATE_ID, **lease})
+        return True
+    except Exception:
+        return False
+
+
+async def _pending_lag(conn, watermark: datetime) -> dict:
+    row = await conn.fetchrow(
+        f"""SELECT count(*) AS pending,
+                   EXTRACT(EPOCH FROM (LOCALTIMESTAMP - min(processed_at))) AS lag
+            FROM {PUNCH_TABLE} WHERE processed_at > $1""",
+        watermark
+    )
+    return {"pending_punches": row["pending"], "lag_seconds": round(float(row["lag"] or 0), 1)}
+
+
+async def reconcile_new_punches(db) -> dict:
+    """One reconciliation cycle: everything ingested since the watermark"""
+    state = await _get_state(db)
+    watermark = state.get("watermark") or datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+    cursor = (watermark - timedelta(seconds=RECONCILE_OVERLAP_SECONDS), 0)
+
+    pool = await get_pg_pool()
+    async with pool.acquire() as conn:
+        lag = await _pending_lag(conn, watermark)
+        punches = 0
+        totals: dict = {}
+        while True:
+            rows = await conn.fetch(
+                f"""SELECT punch_id, processed_at, tenant_id, person_type, person_id, punch_time
+                    FROM {PUNCH_TABLE}
+                    WHERE (processed_at, punch_id) > ($1, $2)
+                    ORDER BY processed_at, punch_id
+                    LIMIT {RECONCILE_PAGE_SIZE}""",
+                *cursor
+            )
+            if not rows:
+                break
+            keys = set()
+            for row in rows:
+                day = row["punch_time"].date()
+                for offset in (0, 1):  # the punch may close a night shift of the day before
+                    keys.add((row["tenant_id"], row["person_type"], row["person_id"],
+                              (day - timedelta(days=offset)).strftime("%Y-%m-%d")))
+            _merge_stats(totals, await reconcile_keys(db, conn, keys))
+            punches += len(rows)
+            cursor = (rows[-1]["processed_at"], rows[-1]["punch_id"])
+            watermark = max(watermark, cursor[0])
+            if len(rows) < RECONCILE_PAGE_SIZE:
+                break
+
+    await db.punch_reconciler_state.update_one(
+        {"_id": STATE_ID},
+        {"$set": {
+            "watermark": watermark,
+            "last_cycle_at": datetime.utcnow(),
+            "last_cycle_punches": punches,
+            "last_cycle_stats": totals,
+            **lag
+        }},
+        upsert=True
+    )
+    return {"punches": punches, **totals, **lag}
+
+
+async def reconciler_loop(db):
+    """Reconcile new punches every RECONCILE_INTERVAL_SECONDS"""
+    if not os.environ.get("DATABASE_URL"):
+        logger.info("DATABASE_URL not configured, punch reconciler disabled")
+        return
+    while True:
+        try:
+            if await _claim_lease(db):
+                result = await reconcile_new_punches(db)
+                if result["punches"]:
+                    logger.info(f"Punch reconciler: {result}")
+        except Exception as e:
+            logger.error(f"Punch reconciliation cycle failed: {e}")
+        await asyncio.sleep(RECONCILE_INTERVAL_SECONDS)
+
+
+def start_punch_reconciler(db):
+    """Start the continuous punch reconciler (call once from application startup)"""
+    return asyncio.create_task(reconciler_loop(db))
+
+
+# ================================
+# RE-PROCESSING
+# ================================
+
+async def reprocess_punch_range(job_id: str, db, tenant_id: str, start_date: str, end_date: str) -> dict:
+    """Recompute the tenant's reconciled attendance for [start_date, end_date], day by day"""
+    start = datetime.strptime(start_date, "%Y-%m-%d")
+    end = datetime.strptime(end_date, "%Y-%m-%d")
+    days = [(start + timedelta(days=i)).strftime("%Y-%m-%d") for i in range((end - start).days + 1)]
+
+    job = job_queue.get_job(job_id)
+    if job:
+        job.total = len(days)
+
+    totals: dict = {}
+    pool = await get_pg_pool()
+    async with pool.acquire() as conn:
+        for index, day in enumerate(days):
+            day_start = datetime.strptime(day, "%Y-%m-%d")
+            rows = await conn.fetch(
+                f"""SELECT DISTINCT person_type, person_id FROM {PUNCH_TABLE}
+                    WHERE tenant_id = $1 AND punch_time >= $2 AND punch_time < $3""",
+                tenant_id, day_start, day_start + timedelta(days=1)
+            )
+            keys = {(tenant_id, row["person_type"], row["person_id"], day) for row in rows}
+            # Reconciled records of people who no longer have punches that day
+            for doc in await db.attendance.find(
+                {"tenant_id": tenant_id, "type": "staff", "date": day, "source": RECONCILED_SOURCE},
+                {"_id": 0, "employee_id": 1}
+            ).to_list(None):
+                keys.add((tenant_id, "staff", doc["employee_id"], day))
+            for doc in await db.student_attendance.find(
+                {"tenant_id": tenant_id, "date": day, "source": RECONCILED_SOURCE},
+                {"_id": 0, "person_id": 1}
+            ).to_list(None):
+                keys.add((tenant_id, "student", doc["person_id"], day))
+
+            _merge_stats(totals, await reconcile_keys(db, conn, keys, remove_stale=True))
+            job_queue.update_progress(job_id, index + 1)
+
+    return {"message": f"Re-processed punches of {len(days)} days", "days": len(days), **totals}
+
+
+# ================================
+# ROUTES
+# ================================
+
+def setup_punch_reconciler_routes(api_router, db, get_current_user):
+    """Setup punch reconciler routes (status, range re-processing)"""
+
+    @api_router.get("/biometric/reconciler/status")
+    async def get_reconciler_status(current_user=Depends(get_current_user)):
+        """Watermark, last cycle and current lag of the punch reconciler"""
+        if current_user.role not in ["super_admin", "admin"]:
+            raise HTTPException(status_code=403, detail="Not authorized")
+
+        state = await _get_state(db)
+        state.pop("_id", None)
+        if state.get("watermark"):
+            try:
+                pool = await get_pg_pool()
+                async with pool.acquire() as conn:
+                    state.update(await _pending_lag(conn, state["watermark"]))
+            except Exception as e:
+                logger.error(f"Reconciler lag check failed: {e}")
+        return state
+
+    @api_router.post("/biometric/reconciler/reprocess")
+    async def start_punch_reprocess(
+        start_date: str,
+        end_date: Optional[str] = None,
+        current_user=Depends(get_current_user)
+    ):
+        """Recompute reconciled attendance of a date range from the punches (background job)"""
+        if current_user.role not in ["super_admin", "admin"]:
+            raise HTTPException(status_code=403, detail="Not authorized")
+        end_date = end_date or start_date
+        try:
+            span = (datetime.strptime(end_date, "%Y-%m-%d") - datetime.strptime(start_date, "%Y-%m-%d")).days
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Dates must be YYYY-MM-DD")
+        if span < 0 or span > 366:
+            raise HTTPException(status_code=400, detail="Date range must be between 1 and 367 days")
+
+        job = job_queue.create_job(job_type="punch_reprocess", tenant_id=current_user.tenant_id)
+        asyncio.create_task(job_queue.run_job(
+            job.id, reprocess_punch_range, db, current_user.tenant_id, start_date, end_date
+        ))
+        return {
+            "job_id": job.id,
+            "message": "Punch re-processing started",
+            "status_url": f"/api/jobs/{job.id}"
+        }
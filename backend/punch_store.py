@@ -0,0 +1,575 @@
+"""
+Biometric Punch Store (PostgreSQL)
+Single home and query layer for device punches.
+
+attendance_punches is range-partitioned by month on punch_time
+(attendance_punches_YYYY_MM plus a default partition). Every write goes through
+biometric_ingest.punch_writer and every read through query_punches /
+count_punches / daily_attendance_counts, which filter punch_time with half-open
+range predicates (>= start, < end) so PostgreSQL prunes partitions and uses the
+(tenant_id, ..., punch_time) indexes.
+
+Maintenance at startup converts a plain attendance_punches table into the
+partitioned layout and merges each tenant's legacy MongoDB biometric_punches into
+it (once per tenant, recorded in punch_store_migrations); the migrate route reruns
+the merge on demand. The conversion holds the exclusive PUNCH_SCHEMA_LOCK, so
+writers in every process wait for the swap to commit instead of inserting into the
+table being replaced.
+
+The nightly run creates the partitions of the coming months and detaches partitions
+older than PUNCH_RETENTION_MONTHS into the punch_archive schema. Archived months are
+kept for audits but are no longer part of attendance_punches, so query_punches,
+count_punches and daily_attendance_counts only see the retention window; query an
+archived table directly (punch_archive.attendance_punches_YYYY_MM) or re-attach it.
+"""
+
+import asyncio
+import json
+import logging
+import os
+import re
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional
+
+from fastapi import Depends, HTTPException
+
+from pymongo.errors import DuplicateKeyError
+
+from biometric_ingest import PUNCH_SCHEMA_LOCK, build_punch_record, get_pg_pool, parse_punch_time, punch_writer
+from job_queue import job_queue
+from pagination import get_pagination_params, create_paginated_response
+
+logger = logging.getLogger(__name__)
+
+PUNCH_TABLE = "attendance_punches"
+DEFAULT_PARTITION = "attendance_punches_default"
+ARCHIVE_SCHEMA = "punch_archive"
+PUNCH_RETENTION_MONTHS = int(os.environ.get("PUNCH_RETENTION_MONTHS", "24"))
+PARTITION_MONTHS_AHEAD = 2
+MAINTENANCE_RUN_HOUR_UTC = 20
+MIGRATION_CHUNK_SIZE = 1000
+MIGRATION_LEASE_SECONDS = 3600
+
+PUNCH_INDEXES = {
+    "idx_attendance_punches_tenant_time": "(tenant_id, punch_time)",
+    "idx_attendance_punches_device_time": "(tenant_id, device_id, punch_time)",
+    "idx_attendance_punches_person_time": "(tenant_id, person_id, punch_time)",
+    "idx_attendance_punches_dedupe": "(tenant_id, device_id, person_id, punch_time)",
+    # Watermark scans of the punch reconciler
+    "idx_attendance_punches_processed": "(processed_at, punch_id)",
+}
+UNIQUE_INDEXES = {"idx_attendance_punches_dedupe"}
+
+PUNCH_FIELDS = (
+    "punch_id, person_id, person_type, device_id, device_name, punch_time, "
+    "punch_method, punch_type, verification_score, status, source_payload"
+)
+PARTITION_NAME = re.compile(r"^attendance_punches_(\d{4})_(\d{2})$")
+
+
+def month_start(value: datetime) -> datetime:
+    return value.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+
+
+def add_months(value: datetime, months: int) -> datetime:
+    month = value.month - 1 + months
+    return value.replace(year=value.year + month // 12, month=month % 12 + 1)
+
+
+def partition_name(month: datetime) -> str:
+    return f"{PUNCH_TABLE}_{month.year}_{month.month:02d}"
+
+
+# ================================
+# PARTITIONS
+# ================================
+
+async def is_partitioned(conn) -> bool:
+    return await conn.fetchval(
+        "SELECT EXISTS (SELECT 1 FROM pg_partitioned_table WHERE partrelid = to_regclass($1))",
+        PUNCH_TABLE
+    )
+
+
+async def _create_month_partition(conn, month: datetime) -> bool:
+    """Create the partition of one month; rows already sitting in the default partition move into it"""
+    name = partition_name(month)
+    if await conn.fetchval("SELECT to_regclass($1) IS NOT NULL", name):
+        return False
+    start, end = month, add_months(month, 1)
+    bounds = f"FROM ('{start:%Y-%m-%d}') TO ('{end:%Y-%m-%d}')"
+    async with conn.transaction():
+        if await conn.fetchval("SELECT to_regclass($1) IS NOT NULL", DEFAULT_PARTITION):
+            await conn.execute(f"CREATE TABLE {name} (LIKE {PUNCH_TABLE} INCLUDING DEFAULTS)")
+            await conn.execute(
+                f"WITH moved AS (DELETE FROM {DEFAULT_PARTITION} "
+                f"WHERE punch_time >= $1 AND punch_time < $2 RETURNING *) "
+                f"INSERT INTO {name} SELECT * FROM moved",
+                start, end
+            )
+            await conn.execute(f"ALTER TABLE {PUNCH_TABLE} ATTACH PARTITION {name} FOR VALUES {bounds}")
+        else:
+            await conn.execute(f"CREATE TABLE {name} PARTITION OF {PUNCH_TABLE} FOR VALUES {bounds}")
+    return True
+
+
+async def ensure_punch_partitions(conn, start: Optional[datetime] = None, months_ahead: int = PARTITION_MONTHS_AHEAD) -> List[str]:
+    """Create the monthly partitions from `start` (default this month) up to months_ahead ahead"""
+    if not await is_partitioned(conn):
+        return []
+    created = []
+    now = month_start(datetime.now())
+    month = month_start(start) if start else now
+    last = add_months(now, months_ahead)
+    while month <= last:
+        if await _create_month_partition(conn, month):
+            created.append(partition_name(month))
+        month = add_months(month, 1)
+    await conn.execute(f"CREATE TABLE IF NOT EXISTS {DEFAULT_PARTITION} PARTITION OF {PUNCH_TABLE} DEFAULT")
+    return created
+
+
+async def archive_old_partitions(conn, retention_months: int = PUNCH_RETENTION_MONTHS) -> List[str]:
+    """Detach monthly partitions older than the retention window into the archive schema"""
+    cutoff = add_months(month_start(datetime.now()), -retention_months)
+    rows = await conn.fetch(
+        """SELECT c.relname FROM pg_inherits i
+           JOIN pg_class c ON c.oid = i.inhrelid
+           WHERE i.inhparent = to_regclass($1)""",
+        PUNCH_TABLE
+    )
+    archived = []
+    for row in rows:
+        match = PARTITION_NAME.match(row["relname"])
+        if not match:
+            continue
+        if add_months(datetime(int(match.group(1)), int(match.group(2)), 1), 1) > cutoff:
+            continue
+        async with conn.transaction():
+            await conn.execute(f"CREATE SCHEMA IF NOT EXISTS {ARCHIVE_SCHEMA}")
+            await conn.execute(f"ALTER TABLE {PUNCH_TABLE} DETACH PARTITION {row['relname']}")
+            await conn.execute(f"ALTER TABLE {row['relname']} SET SCHEMA {ARCHIVE_SCHEMA}")
+        archived.append(row["relname"])
+    return archived
+
+
+async def ensure_punch_indexes(conn):
+    """Read-path indexes and the unique dedupe index the writer relies on"""
+    for name, columns in PUNCH_INDEXES.items():
+        if name not in UNIQUE_INDEXES:
+            await conn.execute(f"CREATE INDEX IF NOT EXISTS {name} ON {PUNCH_TABLE} {columns}")
+            continue
+        try:
+            await conn.execute(f"CREATE UNIQUE INDEX IF NOT EXISTS {name} ON {PUNCH_TABLE} {columns}")
+        except Exception as e:
+            # The writer's NOT EXISTS check still skips stored punches without it
+            logger.warning(f"Punch index {name} not created (existing duplicates?): {e}")
+
+
+async def run_punch_maintenance() -> dict:
+    """Partition a plain table, create missing indexes and upcoming partitions, archive expired ones"""
+    pool = await get_pg_pool()
+    async with pool.acquire() as conn:
+        conversion = await partition_punch_table(conn)
+        await ensure_punch_indexes(conn)
+        created = await ensure_punch_partitions(conn)
+        archived = await archive_old_partitions(conn)
+    if conversion["converted"]:
+        logger.info(f"Punch store partitioned ({conversion['rows']} rows moved)")
+    if created or archived:
+        logger.info(f"Punch store maintenance: created {created}, archived {archived}")
+    return {"converted": conversion["converted"], "created": created, "archived": archived}
+
+
+# ================================
+# MIGRATION
+# ================================
+
+async def partition_punch_table(conn) -> dict:
+    """
+    Rebuild a plain attendance_punches table as a monthly partitioned one (no-op when
+    already done). Writers are paused on PUNCH_SCHEMA_LOCK until the swap commits,
+    then insert into the new table by name.
+    """
+    if await is_partitioned(conn) or not await conn.fetchval("SELECT to_regclass($1) IS NOT NULL", PUNCH_TABLE):
+        return {"converted": False, "rows": 0}
+
+    legacy = f"{PUNCH_TABLE}_legacy"
+    async with conn.transaction():
+        await conn.execute("SELECT pg_advisory_xact_lock($1)", PUNCH_SCHEMA_LOCK)
+        # Another worker may have converted the table while this one waited
+        if await is_partitioned(conn):
+            return {"converted": False, "rows": 0}
+        await conn.execute(f"ALTER TABLE {PUNCH_TABLE} RENAME TO {legacy}")
+        for row in await conn.fetch("SELECT indexname FROM pg_indexes WHERE tablename = $1", legacy):
+            await conn.execute(f'ALTER INDEX "{row["indexname"]}" RENAME TO "{row["indexname"]}_legacy"')
+
+        await conn.execute(
+            f"CREATE TABLE {PUNCH_TABLE} (LIKE {legacy} INCLUDING DEFAULTS) PARTITION BY RANGE (punch_time)"
+        )
+        await conn.execute(f"ALTER TABLE {PUNCH_TABLE} ADD PRIMARY KEY (punch_id, punch_time)")
+        sequence = await conn.fetchval("SELECT pg_get_serial_sequence($1, 'punch_id')", legacy)
+        if sequence:
+            await conn.execute(f"ALTER SEQUENCE {sequence} OWNED BY {PUNCH_TABLE}.punch_id")
+        for name, columns in PUNCH_INDEXES.items():
+            unique = "UNIQUE " if name in UNIQUE_INDEXES else ""
+            await conn.execute(f"CREATE {unique}INDEX {name} ON {PUNCH_TABLE} {columns}")
+
+        oldest = await conn.fetchval(f"SELECT min(punch_time) FROM {legacy}")
+        await ensure_punch_partitions(conn, start=oldest)
+
+        status = await conn.execute(
+            f"INSERT INTO {PUNCH_TABLE} SELECT * FROM {legacy} ON CONFLICT DO NOTHING"
+        )
+        await conn.execute(f"DROP TABLE {legacy}")
+
+    return {"converted": True, "rows": int(status.split()[-1])}
+
+
+def legacy_punch_record(doc: dict) -> Optional[dict]:
+    """Punch row for a document of the old Mongo biometric_punches collection"""
+    person_id = doc.get("person_id") or doc.get("staff_id")
+    if not person_id or not doc.get("punch_time"):
+        return None
+    try:
+        punch_time = parse_punch_time(doc["punch_time"])
+    except (TypeError, ValueError):
+        return None
+    payload = {key: value for key, value in doc.items() if key != "_id"}
+    return build_punch_record({
+        "person_id": str(person_id),
+        "person_type": doc.get("person_type") or ("staff" if doc.get("staff_id") else "student"),
+        "device_id": doc.get("device_id") or "unknown",
+        "device_name": doc.get("device_name") or doc.get("device") or "Unknown Device",
+        "punch_time": punch_time,
+        "punch_method": (doc.get("punch_method") or doc.get("verification_method") or "fingerprint").lower(),
+        "punch_type": doc.get("punch_type", "IN"),
+        "verification_score": doc.get("verification_score", 0),
+        "status": str(doc.get("status") or "verified").lower(),
+        "source_payload": payload
+    }, doc["tenant_id"], doc.get("school_id"))
+
+
+async def migrate_punch_store(job_id: Optional[str], db, tenant_id: str) -> dict:
+    """Partition attendance_punches, then copy the tenant's Mongo biometric_punches into it"""
+    pool = await get_pg_pool()
+    async with pool.acquire() as conn:
+        conversion = await partition_punch_table(conn)
+
+    query = {"tenant_id": tenant_id}
+    job = job_queue.get_job(job_id) if job_id else None
+    if job:
+        job.total = await db.biometric_punches.count_documents(query)
+
+    merged = duplicates = skipped = processed = 0
+    chunk: List[dict] = []
+
+    async def flush():
+        nonlocal merged, duplicates
+        results = await punch_writer.write(chunk, count_devices=False)
+        for result in results:
+            if result["duplicate"]:
+                duplicates += 1
+            else:
+                merged += 1
+        chunk.clear()
+
+    async for doc in db.biometric_punches.find(query):
+        processed += 1
+        record = legacy_punch_record(doc)
+        if record is None:
+            skipped += 1
+        else:
+            chunk.append(record)
+        if len(chunk) >= MIGRATION_CHUNK_SIZE:
+            await flush()
+            if job_id:
+                job_queue.update_progress(job_id, processed)
+    if chunk:
+        await flush()
+    if job_id:
+        job_queue.update_progress(job_id, processed)
+
+    await db.punch_store_migrations.update_one(
+        {"_id": tenant_id},
+        {"$set": {"migrated_at": datetime.utcnow(), "merged": merged, "duplicates": duplicates, "skipped": skipped}},
+        upsert=True
+    )
+    return {
+        "message": f"Merged {merged} Mongo punches into the punch store",
+        "table_converted": conversion["converted"],
+        "rows_repartitioned": conversion["rows"],
+        "merged": merged,
+        "duplicates": duplicates,
+        "skipped": skipped
+    }
+
+
+async def _claim_migration_lease(db) -> bool:
+    """Only one worker process merges legacy punches at a time"""
+    now = datetime.utcnow()
+    lease = {"expires_at": now + timedelta(seconds=MIGRATION_LEASE_SECONDS)}
+    result = await db.scheduler_locks.update_one(
+        {"_id": "punch_store_migration", "expires_at": {"$lt": now}},
+        {"$set": lease}
+    )
+    if result.matched_count:
+        return True
+    try:
+        await db.scheduler_locks.insert_one({"_id": "punch_store_migration", **lease})
+        return True
+    except DuplicateKeyError:
+        return False
+
+
+async def migrate_pending_tenants(db) -> List[str]:
+    """Merge the Mongo punches of every tenant not migrated yet; returns the tenants merged"""
+    tenant_ids = await db.biometric_punches.distinct("tenant_id")
+    migrated = set(await db.punch_store_migrations.distinct("_id"))
+    pending = [tenant_id for tenant_id in tenant_ids if tenant_id and tenant_id not in migrated]
+    if not pending or not await _claim_migration_lease(db):
+        return []
+    try:
+        for tenant_id in pending:
+            result = await migrate_punch_store(None, db, tenant_id)
+            logger.info(f"Punch store migration for {tenant_id}: {result['message']}")
+    finally:
+        await db.scheduler_locks.delete_one({"_id": "punch_store_migration"})
+    return pending
+
+
+# ================================
+# QUERIES
+# ================================
+
+def _punch_filters(
+    tenant_id: str,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    device_id: Optional[str] = None,
+    person_id: Optional[str] = None,
+    person_type: Optional[str] = None,
+    punch_type: Optional[str] = None
+):
+    """WHERE clause and arguments; punch_time bounds are half-open [start, end)"""
+    conditions, args = ["tenant_id = $1"], [tenant_id]
+    for clause, value in (
+        ("punch_time >= ${}", start),
+        ("punch_time < ${}", end),
+        ("device_id = ${}", device_id),
+        ("person_id = ${}", person_id),
+        ("person_type = ${}", person_type),
+        ("punch_type = ${}", punch_type),
+    ):
+        if value is not None:
+            args.append(value)
+            conditions.append(clause.format(len(args)))
+    return " AND ".join(conditions), args
+
+
+def _punch_row(row) -> dict:
+    punch = dict(row)
+    payload = punch.get("source_payload")
+    if isinstance(payload, str):
+        try:
+            punch["source_payload"] = json.loads(payload)
+        except ValueError:
+            punch["source_payload"] = {}
+    punch["source_payload"] = punch.get("source_payload") or {}
+    if punch.get("verification_score") is not None:
+        punch["verification_score"] = float(punch["verification_score"])
+    return punch
+
+
+async def query_punches(
+    tenant_id: str,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    device_id: Optional[str] = None,
+    person_id: Optional[str] = None,
+    person_type: Optional[str] = None,
+    punch_type: Optional[str] = None,
+    limit: Optional[int] = 500,
+    offset: int = 0,
+    newest_first: bool = True
+) -> List[dict]:
+    """Punches of a tenant in [start, end), optionally for one device / person / type"""
+    where, args = _punch_filters(tenant_id, start, end, device_id, person_id, person_type, punch_type)
+    sql = f"SELECT {PUNCH_FIELDS} FROM {PUNCH_TABLE} WHERE {where} ORDER BY punch_time {'DESC' if newest_first else 'ASC'}"
+    if limit is not None:
+        args += [limit, offset]
+        sql += f" LIMIT ${len(args) - 1} OFFSET ${len(args)}"
+    pool = await get_pg_pool()
+    async with pool.acquire() as conn:
+        rows = await conn.fetch(sql, *args)
+    return [_punch_row(row) for row in rows]
+
+
+async def count_punches(tenant_id: str, start: Optional[datetime] = None, end: Optional[datetime] = None, **filters) -> int:
+    where, args = _punch_filters(tenant_id, start, end, **filters)
+    pool = await get_pg_pool()
+    async with pool.acquire() as conn:
+        return await conn.fetchval(f"SELECT count(*) FROM {PUNCH_TABLE} WHERE {where}", *args)
+
+
+async def daily_attendance_counts(
+    tenant_id: str,
+    start: datetime,
+    end: datetime,
+    person_type: Optional[str] = None,
+    punch_type: Optional[str] = "IN"
+) -> Dict[str, int]:
+    """Distinct people punching per day in [start, end), keyed YYYY-MM-DD"""
+    where, args = _punch_filters(tenant_id, start, end, person_type=person_type, punch_type=punch_type)
+    pool = await get_pg_pool()
+    async with pool.acquire() as conn:
+        rows = await conn.fetch(
+            f"""SELECT punch_time::date AS day, count(DISTINCT person_id) AS people
+                FROM {PUNCH_TABLE} WHERE {where} GROUP BY day""",
+            *args
+        )
+    return {row["day"].strftime("%Y-%m-%d"): row["people"] for row in rows}
+
+
+async def punch_person_names(db, tenant_id: str, punches: List[dict]) -> Dict[str, str]:
+    """person_id -> display name, from staff employee ids and student admission numbers"""
+    person_ids = list({p["person_id"] for p in punches})
+    if not person_ids:
+        return {}
+    staff, students = await asyncio.gather(
+        db.staff.find(
+            {"tenant_id": tenant_id, "employee_id": {"$in": person_ids}},
+            {"_id": 0, "employee_id": 1, "name": 1}
+        ).to_list(None),
+        db.students.find(
+            {"tenant_id": tenant_id, "$or": [{"admission_no": {"$in": person_ids}}, {"id": {"$in": person_ids}}]},
+            {"_id": 0, "id": 1, "admission_no": 1, "name": 1}
+        ).to_list(None)
+    )
+    names = {}
+    for student in students:
+        for key in (student.get("id"), student.get("admission_no")):
+            if key:
+                names[key] = student.get("name", key)
+    names.update({s["employee_id"]: s.get("name", s["employee_id"]) for s in staff})
+    return names
+
+
+def _parse_day(value: Optional[str], field: str) -> Optional[datetime]:
+    if not value:
+        return None
+    try:
+        parsed = parse_punch_time(value)
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"Invalid {field}")
+    # Same normalisation as the writer: aware times are compared in UTC
+    return parsed.astimezone(timezone.utc).replace(tzinfo=None) if parsed.tzinfo else parsed
+
+
+# ================================
+# SCHEDULER
+# ================================
+
+async def _claim_nightly_run(db, run_date: str) -> bool:
+    """Make sure only one worker process runs the nightly maintenance for a given date"""
+    result = await db.scheduler_locks.update_one(
+        {"_id": "punch_store_maintenance", "run_date": {"$ne": run_date}},
+        {"$set": {"run_date": run_date, "claimed_at": datetime.utcnow()}}
+    )
+    if result.modified_count:
+        return True
+    try:
+        await db.scheduler_locks.insert_one({"_id": "punch_store_maintenance", "run_date": run_date, "claimed_at": datetime.utcnow()})
+        return True
+    except Exception:
+        return False
+
+
+async def punch_maintenance_loop(db):
+    """Partition maintenance and the legacy punch merge at startup, then maintenance once per night"""
+    if not os.environ.get("DATABASE_URL"):
+        logger.info("DATABASE_URL not configured, punch store maintenance disabled")
+        return
+    try:
+        await run_punch_maintenance()
+        await migrate_pending_tenants(db)
+    except Exception as e:
+        logger.error(f"Punch store maintenance failed: {e}")
+
+    while True:
+        now = datetime.utcnow()
+        next_run = now.replace(hour=MAINTENANCE_RUN_HOUR_UTC, minute=0, second=0, microsecond=0)
+        if next_run <= now:
+            next_run += timedelta(days=1)
+        await asyncio.sleep((next_run - now).total_seconds())
+
+        try:
+            if await _claim_nightly_run(db, next_run.strftime("%Y-%m-%d")):
+                await run_punch_maintenance()
+        except Exception as e:
+            logger.error(f"Nightly punch store maintenance failed: {e}")
+
+
+def start_punch_maintenance_scheduler(db):
+    """Start the punch partition maintenance (call once from application startup)"""
+    return asyncio.create_task(punch_maintenance_loop(db))
+
+
+# ================================
+# ROUTES
+# ================================
+
+def setup_punch_store_routes(api_router, db, get_current_user):
+    """Setup punch store routes (range query, migration job)"""
+
+    @api_router.get("/biometric/punches")
+    async def list_punches(
+        start: Optional[str] = None,
+        end: Optional[str] = None,
+        device_id: Optional[str] = None,
+        person_id: Optional[str] = None,
+        person_type: Optional[str] = None,
+        punch_type: Optional[str] = None,
+        page: int = 1,
+        limit: int = 50,
+        current_user=Depends(get_current_user)
+    ):
+        """Paged punches in [start, end) (default: the last 7 days), newest first"""
+        if current_user.role not in ["super_admin", "admin", "principal"]:
+            raise HTTPException(status_code=403, detail="Not authorized")
+
+        start_time = _parse_day(start, "start") or datetime.now() - timedelta(days=7)
+        end_time = _parse_day(end, "end")
+        params = get_pagination_params(page, limit)
+        filters = {"device_id": device_id, "person_id": person_id, "person_type": person_type, "punch_type": punch_type}
+        try:
+            total, punches = await asyncio.gather(
+                count_punches(current_user.tenant_id, start_time, end_time, **filters),
+                query_punches(
+                    current_user.tenant_id, start_time, end_time, **filters,
+                    limit=params.effective_limit, offset=params.skip
+                )
+            )
+        except Exception as e:
+            logger.error(f"Punch query failed: {e}")
+            raise HTTPException(status_code=500, detail="Failed to retrieve punches")
+
+        names = await punch_person_names(db, current_user.tenant_id, punches)
+        for punch in punches:
+            punch["person_name"] = names.get(punch["person_id"]) or punch["source_payload"].get("staff_name") or punch["person_id"]
+            punch.pop("source_payload")
+        return create_paginated_response(punches, total, params.page, params.effective_limit)
+
+    @api_router.post("/biometric/punch-store/migrate")
+    async def start_punch_store_migration(current_user=Depends(get_current_user)):
+        """Partition the punch table and merge the tenant's Mongo punches into it (background job)"""
+        if current_user.role != "super_admin":
+            raise HTTPException(status_code=403, detail="Not authorized")
+
+        job = job_queue.create_job(job_type="punch_store_migration", tenant_id=current_user.tenant_id)
+        asyncio.create_task(job_queue.run_job(job.id, migrate_punch_store, db, current_user.tenant_id))
+        return {
+            "job_id": job.id,
+            "message": "Punch store migration started",
+            "status_url": f"/api/jobs/{job.id}"
+        }
@@ -0,0 +1,279 @@
+"""
+Exam Result Analytics
+Class-performance and subject-analysis statistics for an exam term, computed
+once and stored as a snapshot in `result_analytics`.
+
+From the published results of a term (one aggregation, unwound per subject) the
+engine computes with pandas group-bys:
+- overall and per-class distribution of percentages: mean, median, standard
+  deviation, min/max and 10/25/50/75/90th percentiles, pass rate, grade counts
+  and top student
+- per subject: the same statistics on subject percentages, a difficulty index
+  (mean fraction of marks obtained; lower is harder) and a discrimination index
+  (upper 27% minus lower 27% of students by overall percentage), plus a
+  subject x class breakdown
+- per teacher: the subjects they teach (from the class timetables), their
+  students' mean and pass rate
+
+Publishing results schedules a debounced snapshot job. The snapshot records the
+results version it was built from; a report request that finds it missing or
+stale rebuilds it on the spot, so reports never show outdated numbers.
+"""
+
+import logging
+from collections import Counter
+from datetime import datetime
+from typing import Dict, Optional
+
+import numpy as np
+import pandas as pd
+
+from grading import get_compiled_grading_scheme
+from marksheet import get_results_version
+from result_ranking import ExamTermJobScheduler
+
+logger = logging.getLogger(__name__)
+
+ANALYTICS_DEBOUNCE_SECONDS = 15.0
+PERCENTILES = [10, 25, 50, 75, 90]
+DISCRIMINATION_GROUP = 0.27
+UNASSIGNED_TEACHER = "Unassigned"
+
+
+# ================================
+# STATISTICS
+# ================================
+
+def _round(value) -> Optional[float]:
+    if value is None or pd.isna(value):
+        return None
+    return round(float(value), 2)
+
+
+def _key(value):
+    """Group key for the snapshot: missing (NaN) class ids and names are stored as None"""
+    return None if pd.isna(value) else value
+
+
+def describe(values) -> dict:
+    """Distribution statistics of a percentage series"""
+    values = np.asarray(values, dtype=np.float64)
+    if not len(values):
+        return {"count": 0}
+    percentiles = np.percentile(values, PERCENTILES)
+    return {
+        "count": int(len(values)),
+        "mean": _round(values.mean()),
+        "median": _round(np.median(values)),
+        "std": _round(values.std()),
+        "min": _round(values.min()),
+        "max": _round(values.max()),
+        "percentiles": {f"p{p}": _round(v) for p, v in zip(PERCENTILES, percentiles)},
+    }
+
+
+def grade_counts(grades: pd.Series) -> Dict[str, int]:
+    return {str(grade): int(count) for grade, count in grades.value_counts().items()}
+
+
+def discrimination_index(fractions: pd.Series, overall: pd.Series) -> Optional[float]:
+    """Mean score of the top 27% minus the bottom 27% of students (by overall percentage)"""
+    size = int(len(fractions) * DISCRIMINATION_GROUP)
+    if size < 1:
+        return None
+    order = np.argsort(overall.to_numpy(), kind="stable")
+    scores = fractions.to_numpy()[order]
+    return _round(scores[-size:].mean() - scores[:size].mean())
+
+
+# ================================
+# SNAPSHOT COMPUTATION
+# ================================
+
+async def load_subject_rows(db, tenant_id: str, school_id: Optional[str], exam_term_id: str) -> pd.DataFrame:
+    rows = await db.student_results.aggregate([
+        {"$match": {
+            "tenant_id": tenant_id, "school_id": school_id,
+            "exam_term_id": exam_term_id, "status": "published"
+        }},
+        {"$unwind": "$subjects"},
+        {"$project": {
+            "_id": 0,
+            "student_id": 1, "student_name": 1, "class_id": 1, "class_name": 1,
+            "section_id": 1, "section_name": 1,
+            "percentage": 1, "is_pass": 1, "grade": 1,
+            "subject": {"$ifNull": ["$subjects.subject_name", "$subjects.subject_id"]},
+            "obtained": "$subjects.obtained_marks",
+            "max": "$subjects.max_marks",
+            "passing": "$subjects.passing_marks",
+        }},
+    ]).to_list(None)
+    columns = ["student_id", "student_name", "class_id", "class_name", "section_id", "section_name",
+               "percentage", "is_pass", "grade", "subject", "obtained", "max", "passing"]
+    return pd.DataFrame(rows, columns=columns)
+
+
+async def load_subject_teachers(db, tenant_id: str, school_id: Optional[str], class_ids) -> Dict[tuple, dict]:
+    """(class_id, subject) -> teacher, the teacher with most periods in the class timetable"""
+    periods: Dict[tuple, Counter] = {}
+    names: Dict[str, str] = {}
+    async for timetable in db.timetables.find(
+        {"tenant_id": tenant_id, "class_id": {"$in": list(class_ids)}, "is_active": {"$ne": False}},
+        {"_id": 0, "class_id": 1, "weekly_schedule": 1}
+    ):
+        for day in timetable.get("weekly_schedule") or []:
+            for period in day.get("periods") or []:
+                if period.get("is_break") or not period.get("subject") or not period.get("teacher_id"):
+                    continue
+                key = (timetable["class_id"], str(period["subject"]).strip().lower())
+                periods.setdefault(key, Counter())[period["teacher_id"]] += 1
+                names.setdefault(period["teacher_id"], period.get("teacher_name") or "")
+    return {
+        key: {"teacher_id": counter.most_common(1)[0][0], "teacher_name": names[counter.most_common(1)[0][0]]}
+        for key, counter in periods.items()
+    }
+
+
+async def compute_exam_analytics(db, tenant_id: str, school_id: Optional[str], exam_term_id: str) -> dict:
+    """Statistics snapshot of the published results of an exam term"""
+    version = await get_results_version(db, tenant_id, school_id, exam_term_id)
+    frame = await load_subject_rows(db, tenant_id, school_id, exam_term_id)
+    snapshot = {
+        "tenant_id": tenant_id,
+        "school_id": school_id,
+        "exam_term_id": exam_term_id,
+        "results_version": version,
+        "computed_at": datetime.utcnow(),
+        "overall": {"count": 0},
+        "classes": [],
+        "subjects": [],
+        "subject_classes": [],
+        "teachers": [],
+    }
+    if frame.empty:
+        return snapshot
+
+    grading = await get_compiled_grading_scheme(db, tenant_id, school_id)
+    frame["obtained"] = pd.to_numeric(frame["obtained"], errors="coerce").fillna(0.0)
+    frame["max"] = pd.to_numeric(frame["max"], errors="coerce")
+    frame = frame[frame["max"] > 0].copy()
+    frame["passing"] = pd.to_numeric(frame["passing"], errors="coerce").fillna(0.0)
+    frame["percentage"] = pd.to_numeric(frame["percentage"], errors="coerce").fillna(0.0)
+    frame["subject"] = frame["subject"].fillna("").astype(str)
+    frame["fraction"] = frame["obtained"] / frame["max"]
+    frame["subject_pct"] = frame["fraction"] * 100
+    frame["subject_pass"] = frame["obtained"] >= frame["passing"]
+    frame["subject_grade"] = grading.grade_array(frame["subject_pct"].to_numpy())[0]
+
+    students = frame.drop_duplicates("student_id")
+    students = students.assign(is_pass=students["is_pass"].fillna(False).astype(bool))
+
+    snapshot["overall"] = {
+        **describe(students["percentage"]),
+        "pass_rate": _round(students["is_pass"].mean() * 100),
+        "grade_distribution": grade_counts(students["grade"].fillna("")),
+    }
+
+    classes = []
+    for (class_id, class_name), group in students.groupby(["class_id", "class_name"], dropna=False, sort=False):
+        top = group.loc[group["percentage"].idxmax()]
+        classes.append({
+            "class_id": _key(class_id),
+            "class_name": _key(class_name),
+            **describe(group["percentage"]),
+            "pass_rate": _round(group["is_pass"].mean() * 100),
+            "grade_distribution": grade_counts(group["grade"].fillna("")),
+            "top_student": {"student_id": top["student_id"], "name": top["student_name"], "percentage": _round(top["percentage"])},
+        })
+    classes.sort(key=lambda c: c["mean"] or 0, reverse=True)
+    for position, entry in enumerate(classes, 1):
+        entry["class_position"] = position
+    snapshot["classes"] = classes
+
+    subjects = []
+    for subject, group in frame.groupby("subject", sort=True):
+        subjects.append({
+            "subject": subject,
+            **describe(group["subject_pct"]),
+            "pass_rate": _round(group["subject_pass"].mean() * 100),
+            "grade_distribution": grade_counts(group["subject_grade"]),
+            "difficulty_index": _round(group["fraction"].mean()),
+            "discrimination_index": discrimination_index(group["fraction"], group["percentage"]),
+        })
+    snapshot["subjects"] = subjects
+
+    by_subject_class = frame.groupby(["subject", "class_id", "class_name"], dropna=False).agg(
+        students=("subject_pct", "size"),
+        mean=("subject_pct", "mean"),
+        median=("subject_pct", "median"),
+        pass_rate=("subject_pass", "mean"),
+    ).reset_index()
+    snapshot["subject_classes"] = [{
+        "subject": row.subject, "class_id": _key(row.class_id), "class_name": _key(row.class_name),
+        "count": int(row.students), "mean": _round(row.mean), "median": _round(row.median),
+        "pass_rate": _round(row.pass_rate * 100),
+    } for row in by_subject_class.itertuples(index=False)]
+
+    teachers = await load_subject_teachers(db, tenant_id, school_id, frame["class_id"].dropna().unique())
+    assignment = [
+        teachers.get((class_id, subject.strip().lower()), {"teacher_id": None, "teacher_name": UNASSIGNED_TEACHER})
+        for class_id, subject in zip(frame["class_id"], frame["subject"])
+    ]
+    frame["teacher_id"] = [a["teacher_id"] or "" for a in assignment]
+    frame["teacher_name"] = [a["teacher_name"] or UNASSIGNED_TEACHER for a in assignment]
+    teacher_rows = []
+    for (teacher_id, teacher_name), group in frame.groupby(["teacher_id", "teacher_name"], sort=False):
+        teacher_rows.append({
+            "teacher_id": teacher_id or None,
+            "teacher_name": teacher_name,
+            "students": int(group["student_id"].nunique()),
+            "subjects": sorted(group["subject"].unique().tolist()),
+            "classes": sorted(group["class_name"].dropna().unique().tolist()),
+            "mean": _round(group["subject_pct"].mean()),
+            "pass_rate": _round(group["subject_pass"].mean() * 100),
+        })
+    teacher_rows.sort(key=lambda t: t["mean"] or 0, reverse=True)
+    snapshot["teachers"] = teacher_rows
+    return snapshot
+
+
+async def materialize_exam_analytics(job_id: Optional[str], db, tenant_id: str, school_id: Optional[str], exam_term_id: str) -> dict:
+    """Compute and store the snapshot of an exam term"""
+    snapshot = await compute_exam_analytics(db, tenant_id, school_id, exam_term_id)
+    await db.result_analytics.replace_one(
+        {"tenant_id": tenant_id, "school_id": school_id, "exam_term_id": exam_term_id},
+        snapshot,
+        upsert=True
+    )
+    logger.info(
+        f"Materialized analytics for exam term {exam_term_id} "
+        f"({snapshot['overall'].get('count', 0)} students, version {snapshot['results_version']})"
+    )
+    return {"exam_term_id": exam_term_id, "students": snapshot["overall"].get("count", 0)}
+
+
+async def get_exam_analytics(db, tenant_id: str, school_id: Optional[str], exam_term_id: str) -> dict:
+    """Stored snapshot, rebuilt first if the results changed since it was computed"""
+    snapshot = await db.result_analytics.find_one(
+        {"tenant_id": tenant_id, "school_id": school_id, "exam_term_id": exam_term_id}, {"_id": 0}
+    )
+    version = await get_results_version(db, tenant_id, school_id, exam_term_id)
+    if snapshot and snapshot.get("results_version") == version:
+        return snapshot
+
+    await materialize_exam_analytics(None, db, tenant_id, school_id, exam_term_id)
+    return await db.result_analytics.find_one(
+        {"tenant_id": tenant_id, "school_id": school_id, "exam_term_id": exam_term_id}, {"_id": 0}
+    )
+
+
+analytics_scheduler = ExamTermJobScheduler(materialize_exam_analytics, "result_analytics", delay=ANALYTICS_DEBOUNCE_SECONDS)
+
+
+def schedule_analytics(db, tenant_id: str, school_id: Optional[str], exam_term_id: str) -> Optional[str]:
+    """Schedule a debounced snapshot rebuild; never lets analytics break the calling request"""
+    try:
+        return analytics_scheduler.schedule(db, tenant_id, school_id, exam_term_id)
+    except Exception as e:
+        logger.error(f"Failed to schedule analytics for exam term {exam_term_id}: {e}")
+        return None
@@ -0,0 +1,343 @@
+"""
+Bulk Result Ingestion
+One engine behind single result entry, /student-results/bulk-entry and
+/student-results/upload-excel.
+
+A batch is processed in four steps:
+1. Load once: the exam term, the grading scheme (cached), the subject catalogue,
+   every target student (by id or admission number), their classes and sections,
+   and the results that already exist for them in the term
+2. Validate every row in memory and collect per-row errors instead of raising
+3. Grade all subject marks of the batch at once with the compiled grading
+   scheme's NumPy lookup, and total them per student with bincount
+4. Write every valid row with one unordered bulk_write of upserts keyed by
+   (tenant, school, exam term, student); new results start as drafts
+
+Rows are dicts: {"row": n, "student_id" | "admission_no": ..., "subjects": [...]}
+where a subject has subject_id and/or subject_name, obtained_marks and optionally
+max_marks, passing_marks and remarks. Subjects are matched to the catalogue by id,
+name or code (spreadsheet columns by their normalized name); a row naming an
+unknown subject, or the same subject twice, is rejected. Editing a published result schedules a
+re-rank of the exam term. Uploaded sheets are streamed through
+ResultSheetUpload one chunk of rows at a time.
+"""
+
+import logging
+import uuid
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+from fastapi import HTTPException
+from pymongo import UpdateOne
+
+from grading import get_compiled_grading_scheme
+from marksheet import bump_results_version
+from result_ranking import schedule_ranking
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PASS_PERCENTAGE = 33.0
+# Class/section filter values meaning "no filter"
+ALL_FILTERS = ("", "all", "all_classes", "all_sections")
+
+
+def subject_key(name: Any) -> str:
+    """Normalized subject name, matching the Excel column normalization"""
+    return str(name or "").strip().lower().replace(" ", "_")
+
+
+def _number(value: Any) -> Optional[float]:
+    if value is None or value == "":
+        return None
+    number = float(value)
+    if np.isnan(number):
+        return None
+    return number
+
+
+# ================================
+# INGESTION
+# ================================
+
+class ResultBatch:
+    """Everything a batch of rows needs, loaded with one query per collection"""
+
+    def __init__(self, db, current_user):
+        self.db = db
+        self.tenant_id = current_user.tenant_id
+        self.school_id = current_user.school_id
+        self.user_id = current_user.id
+        self.scope = {"tenant_id": self.tenant_id, "school_id": self.school_id}
+
+    async def load(self, exam_term_id: str, rows: List[dict]):
+        self.exam_term = await self.db.exam_terms.find_one(
+            {"id": exam_term_id, **self.scope}, {"_id": 0}
+        )
+        if not self.exam_term:
+            raise HTTPException(status_code=404, detail="Exam term not found")
+        self.exam_term_id = exam_term_id
+        self.default_max = float(self.exam_term.get("max_marks") or 100)
+        self.pass_percentage = float(self.exam_term.get("passing_percentage") or DEFAULT_PASS_PERCENTAGE)
+        self.grading = await get_compiled_grading_scheme(self.db, self.tenant_id, self.school_id)
+
+        self.subjects_by_id: Dict[str, dict] = {}
+        self.subjects_by_name: Dict[str, dict] = {}
+        async for subject in self.db.subjects.find(
+            {"tenant_id": self.tenant_id, "is_active": {"$ne": False}},
+            {"_id": 0, "id": 1, "subject_name": 1, "subject_code": 1}
+        ):
+            self.subjects_by_id[subject["id"]] = subject
+            for name in (subject.get("subject_name"), subject.get("subject_code")):
+                if name:
+                    self.subjects_by_name.setdefault(subject_key(name), subject)
+
+        ids = {str(r["student_id"]) for r in rows if r.get("student_id")}
+        admission_nos = {str(r["admission_no"]).strip() for r in rows if r.get("admission_no")}
+        self.students_by_id: Dict[str, dict] = {}
+        self.students_by_admission: Dict[str, dict] = {}
+        if ids or admission_nos:
+            async for student in self.db.students.find(
+                {**self.scope, "$or": [{"id": {"$in": list(ids)}}, {"admission_no": {"$in": list(admission_nos)}}]},
+                {"_id": 0, "id": 1, "name": 1, "admission_no": 1, "class_id": 1, "section_id": 1}
+            ):
+                self.students_by_id[student["id"]] = student
+                if student.get("admission_no"):
+                    self.students_by_admission[str(student["admission_no"])] = student
+
+        students = list(self.students_by_id.values())
+        class_ids = list({s.get("class_id") for s in students if s.get("class_id")})
+        section_ids = list({s.get("section_id") for s in students if s.get("section_id")})
+        self.class_names = {c["id"]: c.get("name", "") async for c in self.db.classes.find(
+            {"id": {"$in": class_ids}}, {"_id": 0, "id": 1, "name": 1})}
+        self.section_names = {s["id"]: s.get("name", "") async for s in self.db.sections.find(
+            {"id": {"$in": section_ids}}, {"_id": 0, "id": 1, "name": 1})}
+        self.existing = {r["student_id"]: r async for r in self.db.student_results.find(
+            {**self.scope, "exam_term_id": exam_term_id, "student_id": {"$in": list(self.students_by_id)}},
+            {"_id": 0, "id": 1, "student_id": 1, "status": 1}
+        )}
+
+    def find_student(self, row: dict) -> Optional[dict]:
+        if row.get("student_id"):
+            return self.students_by_id.get(str(row["student_id"]))
+        if row.get("admission_no"):
+            return self.students_by_admission.get(str(row["admission_no"]).strip())
+        return None
+
+    def validate_subject(self, subject: dict) -> dict:
+        """Normalized subject marks; raises ValueError with a row-level message"""
+        name = subject.get("subject_name") or ""
+        known = self.subjects_by_id.get(subject.get("subject_id") or "") \
+            or self.subjects_by_name.get(subject_key(name))
+        label = name or subject.get("subject_id") or "subject"
+        if not known:
+            raise ValueError(f"{label}: not a subject of this institution")
+        try:
+            obtained = _number(subject.get("obtained_marks"))
+            max_marks = _number(subject.get("max_marks"))
+            passing = _number(subject.get("passing_marks"))
+        except (TypeError, ValueError):
+            raise ValueError(f"{label}: marks must be numbers")
+        if obtained is None:
+            raise ValueError(f"{label}: obtained marks missing")
+        max_marks = self.default_max if max_marks is None else max_marks
+        if max_marks <= 0:
+            raise ValueError(f"{label}: max marks must be positive")
+        if obtained < 0 or obtained > max_marks:
+            raise ValueError(f"{label}: marks {obtained:g} outside 0-{max_marks:g}")
+        if passing is None:
+            passing = round(max_marks * self.pass_percentage / 100)
+        return {
+            "subject_id": known["id"],
+            "subject_name": known.get("subject_name") or name,
+            "max_marks": int(max_marks) if float(max_marks).is_integer() else max_marks,
+            "obtained_marks": obtained,
+            "passing_marks": int(passing),
+            "remarks": subject.get("remarks", "") or "",
+        }
+
+
+async def ingest_results(
+    db,
+    current_user,
+    exam_term_id: str,
+    rows: List[dict],
+    class_id: Optional[str] = None,
+    section_id: Optional[str] = None,
+    seen: Optional[set] = None,
+) -> dict:
+    """
+    Validate, grade and upsert a batch of result rows; returns counts and a per-row error table.
+
+    `seen` collects the ids of the students written; pass the same set to every
+    chunk of one upload so duplicates are caught across chunks.
+    """
+    for number, row in enumerate(rows, 1):
+        row.setdefault("row", number)
+    class_id = None if class_id in ALL_FILTERS else class_id
+    section_id = None if section_id in ALL_FILTERS else section_id
+
+    batch = ResultBatch(db, current_user)
+    await batch.load(exam_term_id, rows)
+
+    errors: List[dict] = []
+    valid: List[tuple] = []
+    seen = set() if seen is None else seen
+    for row in rows:
+        reference = row.get("student_id") or row.get("admission_no") or ""
+        try:
+            student = batch.find_student(row)
+            if not student:
+                raise ValueError("Student not found")
+            if class_id and student.get("class_id") != class_id:
+                raise ValueError("Student is not in the selected class")
+            if section_id and student.get("section_id") != section_id:
+                raise ValueError("Student is not in the selected section")
+            if student["id"] in seen:
+                raise ValueError("Duplicate row for this student")
+            subjects = [batch.validate_subject(s) for s in row.get("subjects") or []]
+            if not subjects:
+                raise ValueError("No subject marks")
+            if len({s["subject_id"] for s in subjects}) < len(subjects):
+                raise ValueError("Subject listed more than once")
+            seen.add(student["id"])
+            valid.append((row, student, subjects))
+        except ValueError as e:
+            errors.append({"row": row["row"], "student": str(reference), "error": str(e)})
+
+    written = {"created": 0, "updated": 0}
+    result_ids: Dict[int, str] = {}
+    rerank = False
+    if valid:
+        # Flatten every subject of the batch, grade once, sum per student
+        owner = np.array([i for i, (_, _, subjects) in enumerate(valid) for _ in subjects], dtype=np.int64)
+        obtained = np.array([s["obtained_marks"] for _, _, subjects in valid for s in subjects], dtype=np.float64)
+        maximum = np.array([s["max_marks"] for _, _, subjects in valid for s in subjects], dtype=np.float64)
+        subject_grades, _ = batch.grading.grade_array(obtained / maximum * 100)
+
+        totals = np.bincount(owner, weights=obtained, minlength=len(valid))
+        max_totals = np.bincount(owner, weights=maximum, minlength=len(valid))
+        percentages = np.round(totals / max_totals * 100, 2)
+        grades, gpas = batch.grading.grade_array(percentages)
+        passed = percentages >= batch.pass_percentage
+
+        now = datetime.utcnow()
+        operations = []
+        position = 0
+        for i, (row, student, subjects) in enumerate(valid):
+            for subject in subjects:
+                subject["grade"] = subject_grades[position]
+                position += 1
+            existing = batch.existing.get(student["id"])
+            result_id = existing["id"] if existing else str(uuid.uuid4())
+            result_ids[row["row"]] = result_id
+            written["updated" if existing else "created"] += 1
+            if existing and existing.get("status") == "published":
+                rerank = True
+
+            key = {**batch.scope, "exam_term_id": exam_term_id, "student_id": student["id"]}
+            operations.append(UpdateOne(key, {
+                "$set": {
+                    "student_name": student.get("name", ""),
+                    "admission_no": student.get("admission_no", ""),
+                    "class_id": student.get("class_id", ""),
+                    "class_name": batch.class_names.get(student.get("class_id"), ""),
+                    "section_id": student.get("section_id", ""),
+                    "section_name": batch.section_names.get(student.get("section_id"), ""),
+                    "subjects": subjects,
+                    "total_marks": float(totals[i]),
+                    "total_max_marks": int(max_totals[i]),
+                    "percentage": float(percentages[i]),
+                    "grade": grades[i],
+                    "gpa": float(gpas[i]),
+                    "is_pass": bool(passed[i]),
+                    "updated_at": now,
+                },
+                "$setOnInsert": {
+                    "id": result_id,
+                    "rank": None,
+                    "status": "draft",
+                    "remarks": None,
+                    "entered_by": batch.user_id,
+                    "created_at": now,
+                },
+            }, upsert=True))
+
+        await db.student_results.bulk_write(operations, ordered=False)
+        await bump_results_version(db, batch.tenant_id, batch.school_id, exam_term_id)
+
+    if rerank:
+        schedule_ranking(db, batch.tenant_id, batch.school_id, exam_term_id)
+
+    logger.info(
+        f"Ingested results for exam term {exam_term_id}: {written['created']} created, "
+        f"{written['updated']} updated, {len(errors)} rejected"
+    )
+    return {
+        "success_count": len(valid),
+        "error_count": len(errors),
+        "created_count": written["created"],
+        "updated_count": written["updated"],
+        "result_ids": result_ids,
+        "errors": sorted(errors, key=lambda e: e["row"]),
+    }
+
+
+# ================================
+# SPREADSHEET UPLOAD
+# ================================
+
+ADMISSION_COLUMNS = ['admission_no', 'admissionno', 'admission_number', 'adm_no', 'admno', 'roll_no', 'rollno', 'student_id']
+# Reference columns; every other column is a subject
+REFERENCE_COLUMNS = ADMISSION_COLUMNS + ['roll_number', 'student_name', 'name', 'full_name', 'student']
+MAX_REPORTED_ERRORS = 1000
+
+
+def normalize_result_column(value: Any) -> str:
+    return str(value).strip().lower().replace(" ", "_")
+
+
+class ResultSheetUpload:
+    """Upload processor (see spreadsheet_upload) ingesting each chunk of a results sheet"""
+
+    def __init__(self, db, current_user, exam_term_id: str, class_id: Optional[str] = None, section_id: Optional[str] = None):
+        self.db = db
+        self.current_user = current_user
+        self.exam_term_id = exam_term_id
+        self.class_id = class_id
+        self.section_id = section_id
+        self.seen: set = set()
+        self.totals = {"success_count": 0, "error_count": 0, "created_count": 0, "updated_count": 0}
+        self.errors: List[dict] = []
+
+    def prepare(self, headers: List[str]):
+        self.admission_col = next((c for c in ADMISSION_COLUMNS if c in headers), None)
+        if not self.admission_col:
+            raise HTTPException(status_code=400, detail="Missing required column: admission_no (or roll_no, student_id)")
+        self.subject_cols = [c for c in headers if c not in REFERENCE_COLUMNS]
+
+    def to_row(self, number: int, record: dict) -> dict:
+        admission_no = record.get(self.admission_col)
+        if isinstance(admission_no, float) and admission_no.is_integer():
+            admission_no = int(admission_no)  # numeric column read as float
+        return {
+            "row": number,
+            "admission_no": "" if admission_no is None else str(admission_no).strip(),
+            "subjects": [{
+                "subject_name": col,
+                "obtained_marks": record[col]
+            } for col in self.subject_cols if record.get(col) not in (None, "")]
+        }
+
+    async def process(self, chunk: List[tuple]):
+        rows = [self.to_row(number, record) for number, record in chunk]
+        outcome = await ingest_results(
+            self.db, self.current_user, self.exam_term_id, rows,
+            class_id=self.class_id, section_id=self.section_id, seen=self.seen
+        )
+        for field in self.totals:
+            self.totals[field] += outcome[field]
+        self.errors.extend(outcome["errors"][:MAX_REPORTED_ERRORS - len(self.errors)])
+
+    def summary(self, total_rows: int) -> dict:
+        return {"message": "Upload completed", "total_rows": total_rows, **self.totals, "errors": self.errors}
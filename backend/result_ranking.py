@@ -0,0 +1,303 @@
+"""
+Result Ranking Engine
+Computes ranks for the published results of an exam term in one pass.
+
+Every published result gets three ranks, computed together from one sorted read:
+- section_rank: within its class section
+- class_rank: within its class (also written to `rank`, shown on result cards)
+- merit_rank: across the whole exam term (institution merit list)
+
+Results are ordered by percentage, then by the configured tie-break fields
+(total marks, then GPA by default). Results that are still equal on every key
+share a rank: "standard" competition ranking (1, 2, 2, 4) or "dense" ranking
+(1, 2, 2, 3), configured per institution in the result card settings.
+
+Only changed ranks are written, all in one unordered bulk_write. Publishing,
+editing or deleting results schedules a debounced background job per exam term,
+so publishing a class one result at a time re-ranks once after the burst.
+"""
+
+import asyncio
+import logging
+from datetime import datetime
+from typing import Callable, Dict, List, Optional, Tuple
+
+from fastapi import Depends, HTTPException, Query
+from pymongo import UpdateOne
+
+from job_queue import job_queue
+from pagination import get_pagination_params, create_paginated_response
+
+logger = logging.getLogger(__name__)
+
+RANK_MODES = ("standard", "dense")
+TIE_BREAK_FIELDS = ("total_marks", "gpa")
+DEFAULT_RANK_MODE = "standard"
+DEFAULT_TIE_BREAKS = ["total_marks", "gpa"]
+RANK_DEBOUNCE_SECONDS = 5.0
+
+SCOPES = {
+    "section": ("section_rank", ("class_id", "section_id")),
+    "class": ("class_rank", ("class_id",)),
+    "merit": ("merit_rank", ()),
+}
+
+RANK_PROJECTION = {
+    "_id": 0, "id": 1, "class_id": 1, "section_id": 1,
+    "percentage": 1, "total_marks": 1, "gpa": 1,
+    "rank": 1, "section_rank": 1, "class_rank": 1, "merit_rank": 1, "rank_mode": 1,
+}
+
+
+# ================================
+# RANK COMPUTATION
+# ================================
+
+def normalize_rank_settings(mode: Optional[str], tie_breaks: Optional[List[str]]) -> Tuple[str, List[str]]:
+    """Validated (mode, tie_breaks), falling back to the defaults"""
+    mode = mode if mode in RANK_MODES else DEFAULT_RANK_MODE
+    if tie_breaks is None:
+        tie_breaks = DEFAULT_TIE_BREAKS
+    fields = []
+    for field in tie_breaks:
+        if field in TIE_BREAK_FIELDS and field not in fields:
+            fields.append(field)
+    return mode, fields
+
+
+def sort_key(result: dict, tie_breaks: List[str]) -> tuple:
+    """Ascending sort key placing the best result first"""
+    return tuple(-float(result.get(field) or 0) for field in ["percentage", *tie_breaks])
+
+
+def assign_ranks(results: List[dict], tie_breaks: List[str], mode: str) -> Dict[str, Dict[str, int]]:
+    """
+    Rank results in every scope.
+
+    Returns {result_id: {"section_rank": n, "class_rank": n, "merit_rank": n}}.
+    The results are sorted once; each scope then walks the same order keeping a
+    running counter per group, so ties share a rank in every scope.
+    """
+    keyed = sorted(((sort_key(r, tie_breaks), r) for r in results), key=lambda pair: pair[0])
+    ranks: Dict[str, Dict[str, int]] = {r["id"]: {} for r in results}
+
+    for field, group_fields in SCOPES.values():
+        # group -> (position, last key, last rank)
+        state: Dict[tuple, tuple] = {}
+        for key, result in keyed:
+            group = tuple(result.get(g) for g in group_fields)
+            position, last_key, last_rank = state.get(group, (0, None, 0))
+            position += 1
+            if key == last_key:
+                rank = last_rank
+            elif mode == "dense":
+                rank = last_rank + 1
+            else:
+                rank = position
+            state[group] = (position, key, rank)
+            ranks[result["id"]][field] = rank
+    return ranks
+
+
+async def get_rank_settings(db, tenant_id: str, school_id: Optional[str]) -> Tuple[str, List[str]]:
+    """Rank mode and tie-breaks from the institution's result card settings"""
+    settings = await db.result_card_settings.find_one({
+        "tenant_id": tenant_id,
+        "school_id": school_id,
+        "is_active": True
+    }, {"_id": 0, "rank_mode": 1, "rank_tie_breaks": 1})
+    settings = settings or {}
+    return normalize_rank_settings(settings.get("rank_mode"), settings.get("rank_tie_breaks"))
+
+
+async def rank_exam_term(job_id: Optional[str], db, tenant_id: str, school_id: Optional[str], exam_term_id: str) -> dict:
+    """Recompute section, class and merit ranks for one exam term"""
+    mode, tie_breaks = await get_rank_settings(db, tenant_id, school_id)
+    base = {"tenant_id": tenant_id, "school_id": school_id, "exam_term_id": exam_term_id}
+
+    results = await db.student_results.find(
+        {**base, "status": "published"}, RANK_PROJECTION
+    ).to_list(None)
+    ranks = assign_ranks(results, tie_breaks, mode)
+
+    if job_id:
+        job = job_queue.get_job(job_id)
+        if job:
+            job.total = len(results)
+
+    now = datetime.utcnow()
+    operations = []
+    for result in results:
+        new = ranks[result["id"]]
+        new["rank"] = new["class_rank"]
+        new["rank_mode"] = mode
+        if all(result.get(field) == value for field, value in new.items()):
+            continue
+        operations.append(UpdateOne(
+            {"id": result["id"], **base},
+            {"$set": {**new, "ranked_at": now}}
+        ))
+
+    # Results that were unpublished since the last run must not keep a stale rank
+    stale = await db.student_results.count_documents({
+        **base, "status": {"$ne": "published"}, "rank": {"$ne": None}
+    })
+
+    written = 0
+    if operations:
+        outcome = await db.student_results.bulk_write(operations, ordered=False)
+        written = outcome.modified_count
+    if stale:
+        await db.student_results.update_many(
+            {**base, "status": {"$ne": "published"}, "rank": {"$ne": None}},
+            {"$unset": {"rank": "", "section_rank": "", "class_rank": "", "merit_rank": "", "rank_mode": ""}}
+        )
+
+    logger.info(
+        f"Ranked {len(results)} results for exam term {exam_term_id} "
+        f"({mode}, tie-breaks {tie_breaks}): {written} updated, {stale} cleared"
+    )
+    return {
+        "exam_term_id": exam_term_id,
+        "ranked": len(results),
+        "updated": written,
+        "cleared": stale,
+        "rank_mode": mode,
+        "tie_breaks": tie_breaks,
+    }
+
+
+# ================================
+# DEBOUNCED SCHEDULING
+# ================================
+
+class ExamTermJobScheduler:
+    """
+    Debounces a background job per (tenant, school, exam term).
+
+    `task(job_id, db, tenant_id, school_id, exam_term_id)` runs through job_queue.
+    Each schedule() call pushes the run back by `delay` seconds; the burst ends
+    in one job. A call that arrives while that job is running starts
+    a new debounce window and a second job once the first finishes, so the last
+    publish is always reflected. Like job_queue, state is per process.
+    """
+
+    def __init__(self, task: Callable, job_type: str, delay: float = RANK_DEBOUNCE_SECONDS):
+        self.task = task
+        self.job_type = job_type
+        self.delay = delay
+        self._deadlines: Dict[tuple, float] = {}
+        self._jobs: Dict[tuple, str] = {}
+        self._tasks: Dict[tuple, asyncio.Task] = {}
+
+    def schedule(self, db, tenant_id: str, school_id: Optional[str], exam_term_id: str, delay: Optional[float] = None) -> str:
+        """Schedule a run and return the id of the job that will perform it"""
+        key = (tenant_id, school_id, exam_term_id)
+        loop = asyncio.get_running_loop()
+        if key not in self._deadlines:
+            self._jobs[key] = job_queue.create_job(self.job_type, tenant_id).id
+        self._deadlines[key] = loop.time() + (self.delay if delay is None else delay)
+
+        task = self._tasks.get(key)
+        if task is None or task.done():
+            self._tasks[key] = asyncio.create_task(self._run(key, db))
+        return self._jobs[key]
+
+    def pending_job(self, tenant_id: str, school_id: Optional[str], exam_term_id: str) -> Optional[str]:
+        return self._jobs.get((tenant_id, school_id, exam_term_id))
+
+    async def _run(self, key: tuple, db):
+        loop = asyncio.get_running_loop()
+        try:
+            while key in self._deadlines:
+                wait = self._deadlines[key] - loop.time()
+                if wait > 0:
+                    await asyncio.sleep(wait)
+                    continue
+                del self._deadlines[key]
+                await job_queue.run_job(self._jobs[key], self.task, db, *key)
+        finally:
+            self._tasks.pop(key, None)
+            if key not in self._deadlines:
+                self._jobs.pop(key, None)
+
+
+rank_scheduler = ExamTermJobScheduler(rank_exam_term, "result_ranking")
+
+
+def schedule_ranking(db, tenant_id: str, school_id: Optional[str], exam_term_id: str) -> Optional[str]:
+    """Schedule a debounced re-rank; never lets ranking break the calling request"""
+    try:
+        return rank_scheduler.schedule(db, tenant_id, school_id, exam_term_id)
+    except Exception as e:
+        logger.error(f"Failed to schedule ranking for exam term {exam_term_id}: {e}")
+        return None
+
+
+# ================================
+# API ROUTES
+# ================================
+
+def setup_result_ranking_routes(api_router, db, get_current_user):
+    """Setup result ranking routes"""
+
+    @api_router.post("/student-results/ranks/recalculate")
+    async def recalculate_ranks(
+        exam_term_id: str,
+        current_user=Depends(get_current_user)
+    ):
+        """Re-rank all published results of an exam term in the background"""
+        if current_user.role not in ["super_admin", "admin", "principal"]:
+            raise HTTPException(status_code=403, detail="Not authorized")
+
+        job_id = rank_scheduler.schedule(
+            db, current_user.tenant_id, current_user.school_id, exam_term_id, delay=0
+        )
+        return {"job_id": job_id, "status": "pending"}
+
+    @api_router.get("/student-results/merit-list")
+    async def get_merit_list(
+        exam_term_id: str,
+        scope: str = "merit",
+        class_id: Optional[str] = None,
+        section_id: Optional[str] = None,
+        page: int = Query(1, ge=1),
+        limit: int = Query(50, ge=1, le=500),
+        current_user=Depends(get_current_user)
+    ):
+        """Published results of an exam term ordered by merit, class or section rank"""
+        try:
+            if current_user.role not in ["super_admin", "admin", "principal", "teacher"]:
+                raise HTTPException(status_code=403, detail="Not authorized")
+            if scope not in SCOPES:
+                raise HTTPException(status_code=400, detail=f"scope must be one of {', '.join(SCOPES)}")
+
+            rank_field = SCOPES[scope][0]
+            query = {
+                "tenant_id": current_user.tenant_id,
+                "school_id": current_user.school_id,
+                "exam_term_id": exam_term_id,
+                "status": "published"
+            }
+            if class_id:
+                query["class_id"] = class_id
+            if section_id:
+                query["section_id"] = section_id
+
+            params = get_pagination_params(page, limit)
+            total = await db.student_results.count_documents(query)
+            items = await db.student_results.find(query, {
+                "_id": 0, "subjects": 0
+            }).sort([(rank_field, 1), ("student_name", 1)]).skip(params.skip).limit(params.effective_limit).to_list(params.effective_limit)
+
+            response = create_paginated_response(items, total, params.page, params.effective_limit)
+            response["scope"] = scope
+            response["ranking_job_id"] = rank_scheduler.pending_job(
+                current_user.tenant_id, current_user.school_id, exam_term_id
+            )
+            return response
+        except HTTPException:
+            raise
+        except Exception as e:
+            logger.error(f"Error fetching merit list: {e}")
+            raise HTTPException(status_code=500, detail="Failed to fetch merit list")
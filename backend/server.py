@@ -52,6 +52,10 @@ from cache import (
 )
 from pagination import get_pagination_params, create_paginated_response, MAX_PAGE_SIZE
 from job_queue import job_queue, JobStatus
+from counters import (
+    Sequence, allocate_number, claim_number, preview_number, number_prefix, max_numeric_suffix,
+    validate_number_template, invalidate_number_templates
+)
 from id_card_generator import generate_student_id_card_pdf
 
 import os
@@ -81,11 +85,38 @@ import cloudinary
 import cloudinary.uploader
 from notification_service import get_notification_service, NotificationEventType
 
-from attendance_management import setup_attendance_routes
+from attendance_management import setup_attendance_routes, get_compiled_attendance_rules
+from attendance_bitmap import setup_attendance_bitmap_routes
+from attendance_features import setup_attendance_feature_routes, start_feature_scheduler
+from attendance_rollup import setup_attendance_rollup_routes, record_attendance_changes, get_attendance_rollup
 from attendance_session_management import setup_attendance_session_routes
 from live_class_management import setup_live_class_routes
 from student_portal import setup_student_portal_routes
 from payment_gateway import setup_payment_gateway_routes
+from fee_overdue import setup_fee_overdue_routes, start_overdue_scheduler, resolve_due_at, split_unpaid_amount
+from sslcommerz_client import gateway_client, gateway_base_url, ipn_queue, verify_ipn_signature
+from fee_receipts import setup_fee_receipt_routes, invalidate_receipt_branding
+from biometric_ingest import (
+    get_pg_pool, close_pg_pool, build_punch_record, punch_error, is_punch_data_error, punch_writer, MAX_PUNCH_BATCH
+)
+from punch_store import (
+    setup_punch_store_routes, start_punch_maintenance_scheduler, query_punches, count_punches,
+    daily_attendance_counts, punch_person_names
+)
+from punch_reconciler import setup_punch_reconciler_routes, start_punch_reconciler
+from live_feed import setup_live_feed_routes
+from result_ranking import setup_result_ranking_routes, schedule_ranking, RANK_MODES, TIE_BREAK_FIELDS
+from result_ingest import ingest_results, ResultSheetUpload, normalize_result_column
+from spreadsheet_upload import process_upload, EXCEL_EXTENSIONS
+from staff_import import StaffImport, allocate_employee_id
+from grading import invalidate_grading_scheme
+from marksheet import build_marksheet, bump_results_version, write_marksheet_excel, write_marksheet_pdf
+from result_analytics import get_exam_analytics, schedule_analytics
+from promotion_engine import setup_promotion_routes
+from student_ledger import (
+    setup_student_ledger_routes, ensure_student_ledger, get_ledger_balance, fee_summary,
+    record_student_fee_charge, record_student_fee_adjustment, record_fee_payment
+)
 from payroll_management import (
     SalaryStructureCreate, PayrollSettings, PayrollProcessRequest,
     PayrollItemUpdate, PayrollApprovalRequest, BonusCreate, 
@@ -455,6 +486,7 @@ class Institution(BaseModel):
     social_links: Optional[Dict[str, str]] = {}
     site_title: Optional[str] = None
     favicon_url: Optional[str] = None
+    number_formats: Optional[Dict[str, str]] = {}  # Numbering templates, e.g. {"receipt": "RCP{year}{seq:06d}"}
     is_active: bool = True
     created_at: datetime = Field(default_factory=datetime.utcnow)
     updated_at: datetime = Field(default_factory=datetime.utcnow)
@@ -480,6 +512,7 @@ class InstitutionUpdate(BaseModel):
     social_links: Optional[Dict[str, str]] = None
     site_title: Optional[str] = None
     favicon_url: Optional[str] = None
+    number_formats: Optional[Dict[str, str]] = None
 
 class Student(BaseModel):
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
@@ -1533,6 +1566,7 @@ class StudentResult(BaseModel):
     total_max_marks: int = 0
     percentage: float = 0
     grade: str = ""
+    gpa: float = 0
     rank: Optional[int] = None
     
     # Status
@@ -1633,6 +1667,10 @@ async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(s
             traceback.print_exc(file=f)
         raise HTTPException(status_code=500, detail=f"Auth Error: {str(e)}")
 
+async def get_user_from_token(token: str) -> User:
+    """get_current_user for clients that cannot send an Authorization header (WebSocket)"""
+    return await get_current_user(HTTPAuthorizationCredentials(scheme="Bearer", credentials=token))
+
 async def get_current_tenant(user: User = Depends(get_current_user)):
     tenant = await db.tenants.find_one({"id": user.tenant_id})
     if not tenant:
@@ -2625,6 +2663,10 @@ async def system_reset(
         # Delete student data (not users)
         await db.students.delete_many({"tenant_id": current_user.tenant_id})
         await db.attendance.delete_many({"tenant_id": current_user.tenant_id})
+        await db.attendance_bitmaps.delete_many({"tenant_id": current_user.tenant_id})
+        await db.attendance_rollups.delete_many({"tenant_id": current_user.tenant_id})
+        await db.attendance_features.delete_many({"tenant_id": current_user.tenant_id})
+        await db.attendance_feature_queue.delete_many({"tenant_id": current_user.tenant_id})
         await db.fees.delete_many({"tenant_id": current_user.tenant_id})
         await db.student_fees.delete_many({"tenant_id": current_user.tenant_id})
         await db.fee_payments.delete_many({"tenant_id": current_user.tenant_id})
@@ -3245,7 +3287,6 @@ async def init_sslcommerz_payment(data: dict, current_user: User = Depends(get_c
     if not config or not config.get("store_id") or not config.get("store_password"):
         raise HTTPException(status_code=400, detail="SSLCommerz is not configured. Please contact administrator.")
     
-    import requests
     import hashlib
     
     # Create payment record
@@ -3269,7 +3310,7 @@ async def init_sslcommerz_payment(data: dict, current_user: User = Depends(get_c
     
     # SSLCommerz API parameters
     is_sandbox = config.get("is_sandbox", True)
-    api_url = "https://sandbox.sslcommerz.com/gwprocess/v4/api.php" if is_sandbox else "https://securepay.sslcommerz.com/gwprocess/v4/api.php"
+    gateway_url = gateway_base_url(is_sandbox)
     
     base_url = os.environ.get("REPL_URL", "https://example.com")
     
@@ -3296,8 +3337,7 @@ async def init_sslcommerz_payment(data: dict, current_user: User = Depends(get_c
     }
     
     try:
-        response = requests.post(api_url, data=ssl_params)
-        result = response.json()
+        result = await gateway_client.initiate_session(gateway_url, ssl_params)
         
         if result.get("status") == "SUCCESS":
             await db.payments.update_one(
@@ -3312,28 +3352,7 @@ async def init_sslcommerz_payment(data: dict, current_user: User = Depends(get_c
 
 async def validate_sslcommerz_hash(form_data: dict, store_password: str) -> bool:
     """Validate SSLCommerz response hash to prevent forgery"""
-    import hashlib
-    
-    # Required fields for hash validation
-    verify_sign = form_data.get("verify_sign")
-    verify_key = form_data.get("verify_key")
-    
-    if not verify_sign or not verify_key:
-        return False
-    
-    # Build hash string from verify_key fields
-    key_fields = verify_key.split(",")
-    hash_string = ""
-    for field in key_fields:
-        value = form_data.get(field, "")
-        hash_string += f"{field}={value}&"
-    
-    hash_string = hash_string.rstrip("&")
-    
-    # Calculate expected hash
-    expected_hash = hashlib.md5((hash_string + store_password).encode()).hexdigest()
-    
-    return verify_sign == expected_hash
+    return verify_ipn_signature(form_data, store_password)
 
 @api_router.post("/payments/sslcommerz/success")
 async def sslcommerz_success(request: Request):
@@ -3432,17 +3451,40 @@ async def sslcommerz_ipn(request: Request):
         if not is_valid:
             return {"status": "invalid_hash"}
     
+    # Queue for validation; repeated deliveries of the same tran_id/val_id are ignored
+    queued = await ipn_queue.enqueue(db, "subscription", form_dict)
+    
+    return {"status": "received", "duplicate": not queued}
+
+async def process_subscription_ipn(db, form_dict: dict) -> str:
+    """IPN queue handler: confirm a subscription payment with the validation API"""
+    tran_id = form_dict.get("tran_id")
+    val_id = form_dict.get("val_id")
+    
+    config = await db.settings.find_one({"type": "sslcommerz_config"})
+    if not config or not val_id:
+        return "skipped"
+    
+    validation = await gateway_client.validate_transaction(
+        gateway_base_url(config.get("is_sandbox", True)),
+        val_id, config.get("store_id"), config.get("store_password")
+    )
+    if validation.get("status") not in ("VALID", "VALIDATED"):
+        return "invalid"
+    
     # Update payment as verified by IPN
     await db.payments.update_one(
         {"transaction_id": tran_id},
         {"$set": {
             "sslcommerz_verified": True,
             "ipn_verified": True,
+            "sslcommerz_val_id": val_id,
             "ipn_received_at": datetime.utcnow().isoformat()
         }}
     )
-    
-    return {"status": "received"}
+    return "verified"
+
+ipn_queue.register_handler("subscription", process_subscription_ipn)
 
 @api_router.get("/payments/sslcommerz/config")
 async def get_sslcommerz_config(current_user: User = Depends(get_current_user)):
@@ -3732,6 +3774,15 @@ async def update_institution(
     if current_user.role not in ["super_admin", "admin"]:
         raise HTTPException(status_code=403, detail="Not authorized")
     
+    if institution_data.number_formats:
+        invalid = [name for name, template in institution_data.number_formats.items()
+                   if not validate_number_template(template)]
+        if invalid:
+            raise HTTPException(
+                status_code=400,
+                detail=f"Invalid number format for: {', '.join(invalid)}. Templates must contain {{seq}}"
+            )
+    
     # Find existing institution
     # Find existing institution (same logic as GET endpoint - no school_id required)
     existing_institution = await db.institutions.find_one({
@@ -3747,6 +3798,8 @@ async def update_institution(
         
         new_institution = Institution(**institution_dict)
         await db.institutions.insert_one(new_institution.dict())
+        await invalidate_number_templates(current_user.tenant_id)
+        await invalidate_receipt_branding(current_user.tenant_id)
         return new_institution
     
     # Update existing institution
@@ -3760,6 +3813,10 @@ async def update_institution(
         },
         {"$set": update_data}
     )
+    if institution_data.number_formats is not None:
+        await invalidate_number_templates(current_user.tenant_id)
+    # Name, address, contact, logo or currency may have changed: re-render receipts
+    await invalidate_receipt_branding(current_user.tenant_id)
     
     updated_institution = await db.institutions.find_one({
         "tenant_id": current_user.tenant_id,
@@ -3811,6 +3868,7 @@ async def upload_institution_logo(
         {"tenant_id": current_user.tenant_id, "is_active": True},
         {"$set": {"logo_url": logo_url, "updated_at": datetime.utcnow()}}
     )
+    await invalidate_receipt_branding(current_user.tenant_id)
     
     return {"message": "Logo uploaded successfully", "logo_url": logo_url}
 
@@ -4068,53 +4126,66 @@ async def get_next_roll_number(
         logging.error(f"Error getting next roll number: {str(e)}")
         raise HTTPException(status_code=500, detail="Failed to get next roll number")
 
+async def get_admission_number_context(tenant_id: str) -> dict:
+    """School code and legacy seed for the admission number sequence"""
+    schools = await db.schools.find({
+        "tenant_id": tenant_id,
+        "is_active": True
+    }).to_list(1)
+    school_code = (schools[0].get("school_code") or "STU") if schools else "STU"
+    current_year = datetime.utcnow().year
+    prefix = await number_prefix(
+        db, tenant_id, Sequence.ADMISSION, year=current_year, school_code=school_code.upper()
+    )
+    
+    async def seed_from_existing_students():
+        # One-time scan so the counter continues after legacy admission numbers
+        students = await db.students.find(
+            {
+                "tenant_id": tenant_id,
+                "admission_no": {"$regex": f"^{re.escape(prefix)}", "$options": "i"}
+            },
+            {"admission_no": 1, "_id": 0}
+        ).to_list(None)
+        return max_numeric_suffix([s.get("admission_no") for s in students], prefix)
+    
+    return {
+        "year": current_year,
+        "prefix": prefix,
+        "seed": seed_from_existing_students,
+        "school_code": school_code.upper()
+    }
+
 @api_router.get("/students/next-admission")
 async def get_next_admission_number(
     current_user: User = Depends(get_current_user)
 ):
-    """Get the next available admission number for the tenant"""
+    """Preview the next admission number for the tenant (allocated when the student is created)"""
     if current_user.role not in ["super_admin", "admin", "teacher"]:
         raise HTTPException(status_code=403, detail="Not authorized")
     
     try:
-        # Get school code for prefix
-        schools = await db.schools.find({
-            "tenant_id": current_user.tenant_id,
-            "is_active": True
-        }).to_list(1)
-        school_code = schools[0].get("school_code", "STU") if schools else "STU"
+        context = await get_admission_number_context(current_user.tenant_id)
         
-        # Get current year
-        current_year = datetime.utcnow().year
-        year_suffix = str(current_year)[-2:]  # Last 2 digits of year
+        # Peek only: opening the admission form must not consume a number
+        next_admission = await preview_number(
+            db,
+            current_user.tenant_id,
+            Sequence.ADMISSION,
+            year=context["year"],
+            seed=context["seed"],
+            school_code=context["school_code"]
+        )
         
-        # Find all students and get max admission number with this year prefix
-        students = await db.students.find({
+        total_students = await db.students.count_documents({
             "tenant_id": current_user.tenant_id,
             "is_active": True
-        }).to_list(None)
-        
-        max_num = 0
-        prefix = f"{school_code.upper()}{year_suffix}"
-        
-        for student in students:
-            admission_no = student.get("admission_no", "")
-            if admission_no.upper().startswith(prefix):
-                try:
-                    num_part = admission_no[len(prefix):]
-                    num = int(num_part)
-                    if num > max_num:
-                        max_num = num
-                except (ValueError, TypeError):
-                    continue
-        
-        next_num = max_num + 1
-        next_admission = f"{prefix}{str(next_num).zfill(4)}"
+        })
         
         return {
             "next_admission": next_admission,
-            "prefix": prefix,
-            "total_students": len(students)
+            "prefix": context["prefix"],
+            "total_students": total_students
         }
     except Exception as e:
         logging.error(f"Error getting next admission number: {str(e)}")
@@ -4174,6 +4245,26 @@ async def create_student(student_data: StudentCreate, current_user: User = Depen
             )
         school_id = schools[0]["id"]
     
+    # Allocate the admission number atomically when the form left it blank or
+    # kept the previewed number
+    async def admission_in_use(admission_no: str) -> bool:
+        return await db.students.find_one(
+            {"admission_no": admission_no, "tenant_id": current_user.tenant_id, "is_active": True},
+            {"_id": 1}
+        ) is not None
+    
+    admission_context = await get_admission_number_context(current_user.tenant_id)
+    student_data.admission_no = await claim_number(
+        db,
+        current_user.tenant_id,
+        Sequence.ADMISSION,
+        student_data.admission_no,
+        year=admission_context["year"],
+        seed=admission_context["seed"],
+        in_use=admission_in_use,
+        school_code=admission_context["school_code"]
+    )
+    
     # Check for duplicate admission number
     existing_student = await db.students.find_one({
         "admission_no": student_data.admission_no,
@@ -5383,10 +5474,8 @@ async def create_staff(staff_data: StaffCreate, current_user: User = Depends(get
         "employee_id": staff_dict["employee_id"],
         "tenant_id": current_user.tenant_id
     }):
-        # Auto-generate unique employee ID
-        count = await db.staff.count_documents({"tenant_id": current_user.tenant_id})
-        current_year = datetime.now().year
-        staff_dict["employee_id"] = f"EMP-{current_year}-{str(count + 1).zfill(4)}"
+        # Auto-generate unique employee ID (same counter as the staff import)
+        staff_dict["employee_id"] = await allocate_employee_id(db, current_user.tenant_id)
     
     # Create user account for teachers automatically (similar to student accounts)
     user_id = None
@@ -5675,9 +5764,10 @@ async def export_staff(
 @api_router.post("/staff/import")
 async def import_staff(
     file: UploadFile = File(...),
+    background: bool = False,
     current_user: User = Depends(get_current_user)
 ):
-    """Import staff data from Excel or CSV file"""
+    """Import staff data from Excel or CSV file (streamed; background=true runs it as a job)"""
     try:
         if current_user.role not in ["admin", "super_admin"]:
             raise HTTPException(status_code=403, detail="Not authorized")
@@ -5693,143 +5783,10 @@ async def import_staff(
                 raise HTTPException(status_code=422, detail="No school found for tenant")
             school_id = schools[0]["id"]
         
-        # Read file
-        contents = await file.read()
-        
-        # Detect file format
-        if file.filename.endswith('.csv'):
-            # Parse CSV
-            import csv
-            import io as iolib
-            
-            csv_data = iolib.StringIO(contents.decode('utf-8'))
-            reader = csv.DictReader(csv_data)
-            rows = list(reader)
-        elif file.filename.endswith(('.xlsx', '.xls')):
-            # Parse Excel
-            import pandas as pd
-            import io as iolib
-            
-            df = pd.read_excel(iolib.BytesIO(contents))
-            rows = df.to_dict('records')
-        else:
-            raise HTTPException(status_code=400, detail="Unsupported file format. Use .csv, .xlsx, or .xls")
-        
-        if not rows:
-            raise HTTPException(status_code=400, detail="No data found in file")
-        
-        # Normalize column names - convert all keys to lowercase with underscores
-        normalized_rows = []
-        for row in rows:
-            normalized_row = {}
-            for key, value in row.items():
-                # Convert key to lowercase and replace spaces/hyphens with underscores
-                normalized_key = str(key).lower().replace(' ', '_').replace('-', '_').replace('(', '').replace(')', '')
-                normalized_row[normalized_key] = value
-            normalized_rows.append(normalized_row)
-        
-        # Import staff
-        success_count = 0
-        error_count = 0
-        errors = []
-        
-        for idx, row in enumerate(normalized_rows, start=2):  # Start from row 2 (after header)
-            try:
-                # Map columns (all normalized to snake_case)
-                employee_id = str(row.get('employee_id') or '').strip()
-                name = str(row.get('name') or '').strip()
-                email = str(row.get('email') or '').strip().lower()
-                phone = str(row.get('phone') or '').strip()
-                designation = str(row.get('designation') or '').strip()
-                department = str(row.get('department') or '').strip()
-                qualification = str(row.get('qualification') or '').strip()
-                
-                # Experience years - handle multiple variations
-                exp_str = str(row.get('experience_years') or row.get('experience') or 0)
-                try:
-                    experience_years = int(float(exp_str))
-                except:
-                    experience_years = 0
-                
-                # Salary
-                salary_str = str(row.get('salary') or 0)
-                try:
-                    salary = float(salary_str)
-                except:
-                    salary = 0
-                
-                date_of_joining = str(row.get('date_of_joining') or '').strip()
-                address = str(row.get('address') or '').strip()
-                
-                # Validate required fields
-                if not name:
-                    errors.append(f"Row {idx}: Name is required")
-                    error_count += 1
-                    continue
-                
-                if not email:
-                    errors.append(f"Row {idx}: Email is required")
-                    error_count += 1
-                    continue
-                
-                # Check for duplicate email
-                existing_staff = await db.staff.find_one({
-                    "email": email,
-                    "tenant_id": current_user.tenant_id,
-                    "is_active": True
-                })
-                if existing_staff:
-                    errors.append(f"Row {idx}: Email {email} already exists")
-                    error_count += 1
-                    continue
-                
-                # Generate employee ID if not provided
-                if not employee_id:
-                    count = await db.staff.count_documents({"tenant_id": current_user.tenant_id})
-                    current_year = datetime.now().year
-                    employee_id = f"EMP-{current_year}-{str(count + 1).zfill(4)}"
-                
-                # Create staff record
-                staff_dict = {
-                    "id": str(uuid.uuid4()),
-                    "tenant_id": current_user.tenant_id,
-                    "school_id": school_id,
-                    "employee_id": employee_id,
-                    "name": name,
-                    "email": email,
-                    "phone": phone,
-                    "designation": designation,
-                    "department": department,
-                    "qualification": qualification,
-                    "experience_years": experience_years,
-                    "date_of_joining": date_of_joining,
-                    "salary": salary,
-                    "address": address,
-                    "is_active": True,
-                    "created_by": current_user.id,
-                    "created_at": datetime.utcnow(),
-                    "updated_at": datetime.utcnow()
-                }
-                
-                await db.staff.insert_one(staff_dict)
-                success_count += 1
-                
-            except Exception as e:
-                errors.append(f"Row {idx}: {str(e)}")
-                error_count += 1
-        
-        # Return summary
-        result = {
-            "success_count": success_count,
-            "error_count": error_count,
-            "total_rows": len(rows),
-            "errors": errors[:10]  # Return first 10 errors
-        }
-        
-        if success_count > 0:
-            logging.info(f"Staff import completed: {success_count} success, {error_count} errors")
-        
-        return result
+        return await process_upload(
+            file, StaffImport(db, current_user, school_id), "staff_import",
+            current_user.tenant_id, background=background
+        )
         
     except HTTPException:
         raise
@@ -6368,6 +6325,15 @@ async def save_bulk_attendance(
         if request_data.attendance_session:
              delete_filter["attendance_session"] = request_data.attendance_session
 
+        # Marks being replaced are cleared from the read models before the new ones are set;
+        # slots that `student_attendance` also holds keep its mark
+        replaced_marks = []
+        if request_data.type == "student":
+            replaced_marks = await db.attendance.find(
+                delete_filter,
+                {"_id": 0, "person_id": 1, "date": 1, "attendance_session": 1, "status": 1, "class_id": 1}
+            ).to_list(None)
+
         delete_result = await db.attendance.delete_many(delete_filter)
         logging.info(f"[ATTENDANCE-POST] Deleted {delete_result.deleted_count} existing records for date={request_data.date}")
         
@@ -6420,6 +6386,17 @@ async def save_bulk_attendance(
         if attendance_records:
             result = await db.attendance.insert_many(attendance_records)
             logging.info(f"[ATTENDANCE-POST] Inserted {len(result.inserted_ids)} new records")
+
+        if request_data.type == "student":
+            await record_attendance_changes(db, current_user.tenant_id, [
+                *({
+                    **mark,
+                    "status": None,
+                    "previous_status": mark.get("status"),
+                    "previous_class_id": mark.get("class_id")
+                } for mark in replaced_marks),
+                *(doc for doc in attendance_records if doc.get("type") == "student")
+            ], source="attendance")
         
         for record in request_data.records:
             if record.status == "absent":
@@ -6552,11 +6529,8 @@ async def update_device_status(
 ):
     """Update device status from ZKTeco connector service"""
     try:
-        import asyncpg
-        import os
-        
-        database_url = os.environ.get('DATABASE_URL')
-        conn = await asyncpg.connect(database_url)
+        pool = await get_pg_pool()
+        conn = await pool.acquire()
         
         try:
             # Update device registry
@@ -6576,7 +6550,7 @@ async def update_device_status(
             return {"status": "success", "message": "Device status updated"}
             
         finally:
-            await conn.close()
+            await pool.release(conn)
             
     except Exception as e:
         logger.error(f"Device status update failed: {e}")
@@ -6903,6 +6877,18 @@ async def generate_staff_attendance_report(
         
         attendance_records = await db.attendance.find(filter_criteria).to_list(10000)
         
+        # Days reconciled from biometric punches count where no manual record exists for the employee and day
+        manual_days = {
+            (record.get("employee_id"), str(record.get("date"))[:10])
+            for record in attendance_records if record.get("source") != "biometric"
+        }
+        attendance_records = [
+            record for record in attendance_records
+            if record.get("source") != "biometric"
+            or ((record.get("employee_id"), str(record.get("date"))[:10]) not in manual_days
+                and record.get("status") != "holiday")
+        ]
+        
         # Log data retrieval for debugging
         logging.info(f"Retrieved {len(attendance_records)} staff attendance records for period {start_date} to {end_date}")
         
@@ -6980,10 +6966,13 @@ async def generate_staff_attendance_report(
                 
                 staff_stats[employee_id][status] = staff_stats[employee_id].get(status, 0) + 1
                 staff_stats[employee_id]["total_days"] += 1
+                notes = record.get("notes", "")
+                if record.get("source") == "biometric":
+                    notes = f"Biometric: in {record.get('check_in') or '-'}, out {record.get('check_out') or '-'}"
                 staff_stats[employee_id]["attendance_details"].append({
                     "date": date,
                     "status": status,
-                    "notes": record.get("notes", "")
+                    "notes": notes
                 })
                 
                 # Department statistics
@@ -9008,6 +8997,7 @@ async def create_grading_scale(scale_data: GradingScaleCreate, current_user: Use
     
     grading_scale = GradingScale(**scale_dict)
     await db.grading_scales.insert_one(grading_scale.dict())
+    await invalidate_grading_scheme(db, current_user.tenant_id)
     
     logging.info(f"Grading scale created: {scale_data.scale_name} by {current_user.full_name}")
     return grading_scale
@@ -9037,6 +9027,7 @@ async def update_grading_scale(scale_id: str, scale_data: GradingScaleUpdate, cu
             {"id": scale_id, "tenant_id": current_user.tenant_id},
             {"$set": update_data}
         )
+        await invalidate_grading_scheme(db, current_user.tenant_id)
         
         # Fetch and return updated grading scale
         updated_scale = await db.grading_scales.find_one({
@@ -9069,6 +9060,7 @@ async def delete_grading_scale(scale_id: str, current_user: User = Depends(get_c
         {"id": scale_id, "tenant_id": current_user.tenant_id},
         {"$set": {"is_active": False, "updated_at": datetime.utcnow()}}
     )
+    await invalidate_grading_scheme(db, current_user.tenant_id)
     
     logging.info(f"Grading scale deleted: {existing_scale.get('scale_name', 'Unknown')} (ID: {scale_id}) by {current_user.full_name}")
     return {"message": "Grading scale deleted successfully", "scale_id": scale_id}
@@ -11146,28 +11138,10 @@ async def get_dashboard_stats(current_user: User = Depends(get_current_user)):
         for payment in recent_payments:
             cleaned_payments.append(sanitize_mongo_data(payment))
 
-        # 5. Attendance Summary (Today)
+        # 5. Attendance Summary (Today) from the daily rollups; they count both
+        # `attendance` and `student_attendance`, and not_marked counts distinct students
         today = datetime.now().strftime("%Y-%m-%d")
-        attendance_stats = await db.attendance.aggregate([
-            {
-                "$match": {
-                    "tenant_id": tenant_id,
-                    "type": "student",
-                    "$or": [
-                        {"date": today},
-                        {"date": {"$regex": f"^{today}"}}
-                    ]
-                }
-            },
-            {
-                "$group": {
-                    "_id": "$status",
-                    "count": {"$sum": 1}
-                }
-            }
-        ]).to_list(10)
-        
-        attendance_map = {item["_id"]: item["count"] for item in attendance_stats}
+        attendance_today = await get_attendance_rollup(db, tenant_id, today, enrolled=active_students)
         
         return {
             "students": {
@@ -11184,10 +11158,13 @@ async def get_dashboard_stats(current_user: User = Depends(get_current_user)):
             },
             "recent_payments": cleaned_payments,
             "attendance": {
-                "present": attendance_map.get("present", 0),
-                "absent": attendance_map.get("absent", 0),
-                "late": attendance_map.get("late", 0),
-                "total": sum(attendance_map.values())
+                "present": attendance_today["present"],
+                "absent": attendance_today["absent"],
+                "late": attendance_today["late"],
+                "half_day": attendance_today["half_day"],
+                "leave": attendance_today["leave"],
+                "not_marked": attendance_today["not_marked"],
+                "total": attendance_today["total"]
             }
         }
 
@@ -11883,29 +11860,26 @@ async def get_biometric_punch_log(
     try:
         from datetime import datetime, timedelta
         
-        # Get punch logs from MongoDB
-        punch_collection = db["biometric_punches"]
+        # Get punch logs from the punch store
         start_date = datetime.now() - timedelta(days=days)
-        
-        cursor = punch_collection.find({
-            "tenant_id": current_user.tenant_id,
-            "punch_time": {"$gte": start_date}
-        }).sort("punch_time", -1).limit(500)
+        punches = await query_punches(current_user.tenant_id, start=start_date, limit=500)
+        names = await punch_person_names(db, current_user.tenant_id, punches)
         
         punch_log = []
-        async for punch in cursor:
+        for punch in punches:
+            payload = punch["source_payload"]
             punch_log.append({
-                "punch_id": punch.get("punch_id", str(punch.get("_id", ""))),
-                "staff_name": punch.get("staff_name", "Unknown"),
-                "staff_id": punch.get("staff_id", ""),
-                "device": punch.get("device_name", "Unknown Device"),
-                "device_id": punch.get("device_id", ""),
-                "punch_time": punch.get("punch_time").strftime("%Y-%m-%d %H:%M:%S") if punch.get("punch_time") else "",
-                "punch_type": punch.get("punch_type", "IN"),
-                "verification_method": punch.get("verification_method", "Fingerprint"),
-                "verification_score": punch.get("verification_score", 0),
-                "location": punch.get("location", ""),
-                "status": punch.get("status", "Verified")
+                "punch_id": payload.get("punch_id") or str(punch["punch_id"]),
+                "staff_name": names.get(punch["person_id"]) or payload.get("staff_name", "Unknown"),
+                "staff_id": punch["person_id"],
+                "device": punch["device_name"] or "Unknown Device",
+                "device_id": punch["device_id"] or "",
+                "punch_time": punch["punch_time"].strftime("%Y-%m-%d %H:%M:%S"),
+                "punch_type": punch["punch_type"] or "IN",
+                "verification_method": (punch["punch_method"] or "fingerprint").title(),
+                "verification_score": punch["verification_score"] or 0,
+                "location": payload.get("location", ""),
+                "status": (punch["status"] or "verified").title()
             })
         
         # Calculate summary statistics
@@ -12066,40 +12040,12 @@ async def get_biometric_calendar(
         if total_staff == 0:
             total_staff = 1  # Prevent division by zero
         
-        # Get punch data for the month
-        punch_collection = db["biometric_punches"]
+        # Staff punching in per day of the month
         start_date = datetime(year, month, 1)
-        end_date = datetime(year, month, cal_module.monthrange(year, month)[1], 23, 59, 59)
-        
-        # Aggregate punches by date
-        pipeline = [
-            {
-                "$match": {
-                    "tenant_id": current_user.tenant_id,
-                    "punch_time": {"$gte": start_date, "$lte": end_date},
-                    "punch_type": "IN"
-                }
-            },
-            {
-                "$group": {
-                    "_id": {
-                        "date": {"$dateToString": {"format": "%Y-%m-%d", "date": "$punch_time"}},
-                        "staff_id": "$staff_id"
-                    }
-                }
-            },
-            {
-                "$group": {
-                    "_id": "$_id.date",
-                    "present_count": {"$sum": 1}
-                }
-            },
-            {"$sort": {"_id": 1}}
-        ]
-        
-        punch_data = {}
-        async for doc in punch_collection.aggregate(pipeline):
-            punch_data[doc["_id"]] = doc["present_count"]
+        end_date = start_date + timedelta(days=cal_module.monthrange(year, month)[1])
+        punch_data = await daily_attendance_counts(
+            current_user.tenant_id, start_date, end_date, person_type="staff", punch_type="IN"
+        )
         
         # Build calendar data
         days_in_month = cal_module.monthrange(year, month)[1]
@@ -12179,7 +12125,6 @@ async def generate_biometric_status_report(
         maintenance_devices = len([d for d in devices if d.get("status") == "maintenance"])
         
         # Get punch data for period
-        punch_collection = db["biometric_punches"]
         if type == "daily":
             start_date = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
             period = "Today"
@@ -12190,17 +12135,11 @@ async def generate_biometric_status_report(
             start_date = datetime.now() - timedelta(days=30)
             period = "Last 30 days"
         
-        total_punches = await punch_collection.count_documents({
-            "tenant_id": current_user.tenant_id,
-            "punch_time": {"$gte": start_date}
-        })
+        total_punches = await count_punches(current_user.tenant_id, start_date)
         
         # Today's punches
         today_start = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
-        today_punches = await punch_collection.count_documents({
-            "tenant_id": current_user.tenant_id,
-            "punch_time": {"$gte": today_start}
-        })
+        today_punches = await count_punches(current_user.tenant_id, today_start)
         
         report_data = {
             "title": f"{type.title()} Biometric Status Report",
@@ -12488,124 +12427,96 @@ async def receive_punch_data(
     }
     """
     try:
-        import asyncpg
-        from datetime import datetime
-        import os
+        error = punch_error(punch_data)
+        if error:
+            raise HTTPException(status_code=400, detail=error)
         
-        # Validate required fields
-        required_fields = ["person_id", "device_id", "punch_time"]
-        for field in required_fields:
-            if field not in punch_data:
-                raise HTTPException(status_code=400, detail=f"Missing required field: {field}")
-        
-        # Get database connection
-        database_url = os.environ.get('DATABASE_URL')
-        if not database_url:
+        if not os.environ.get('DATABASE_URL'):
             raise HTTPException(status_code=500, detail="Database not configured")
         
-        # Connect to PostgreSQL
-        conn = await asyncpg.connect(database_url)
+        # Micro-batched with concurrent punches: one INSERT and one device_registry update per batch
+        punch_record = build_punch_record(punch_data, current_user.tenant_id, current_user.school_id)
+        result = await punch_writer.submit(punch_record)
         
-        try:
-            # Prepare punch record for insertion
-            punch_record = {
-                "person_id": punch_data["person_id"],
-                "person_type": punch_data.get("person_type", "student"),
-                "tenant_id": current_user.tenant_id,
-                "school_id": current_user.school_id,
-                "device_id": punch_data["device_id"],
-                "device_name": punch_data.get("device_name", "Unknown Device"),
-                "punch_time": punch_data["punch_time"],
-                "punch_method": punch_data.get("punch_method", "fingerprint"),
-                "punch_type": punch_data.get("punch_type", "IN"),
-                "verification_score": punch_data.get("verification_score", 0),
-                "status": punch_data.get("status", "verified"),
-                "source_payload": punch_data.get("source_payload", punch_data)
-            }
-            
-            # Insert punch record into database
-            insert_query = """
-                INSERT INTO attendance_punches (
-                    person_id, person_type, tenant_id, school_id, device_id, device_name,
-                    punch_time, punch_method, punch_type, verification_score, status, source_payload
-                ) VALUES ($1, $2, $3, $4, $5, $6, $7, $8, $9, $10, $11, $12)
-                RETURNING punch_id, processed_at
-            """
-            
-            result = await conn.fetchrow(
-                insert_query,
-                punch_record["person_id"], punch_record["person_type"], 
-                punch_record["tenant_id"], punch_record["school_id"],
-                punch_record["device_id"], punch_record["device_name"],
-                punch_record["punch_time"], punch_record["punch_method"],
-                punch_record["punch_type"], punch_record["verification_score"],
-                punch_record["status"], json.dumps(punch_record["source_payload"])
-            )
-            
-            # Update device last_seen
-            await conn.execute(
-                """UPDATE device_registry SET 
-                   last_seen = NOW(), connection_status = 'online', 
-                   daily_punches = daily_punches + 1
-                   WHERE device_id = $1 AND tenant_id = $2""",
-                punch_data["device_id"], current_user.tenant_id
-            )
-            
-            logger.info(f"Punch recorded: {punch_data['person_id']} on {punch_data['device_id']} at {punch_data['punch_time']}")
-            
-            return {
-                "status": "success",
-                "message": "Punch data recorded successfully",
-                "punch_id": result["punch_id"],
-                "processed_at": result["processed_at"].isoformat(),
-                "attendance_status": await _determine_attendance_status(punch_record, conn)
-            }
-            
-        finally:
-            await conn.close()
+        if result["duplicate"]:
+            return {"status": "duplicate", "message": "Punch already recorded"}
+        
+        logger.info(f"Punch recorded: {punch_data['person_id']} on {punch_data['device_id']} at {punch_data['punch_time']}")
+        
+        return {
+            "status": "success",
+            "message": "Punch data recorded successfully",
+            "punch_id": result["punch_id"],
+            "processed_at": result["processed_at"].isoformat(),
+            "attendance_status": result["attendance_status"]
+        }
             
-    except asyncpg.PostgresError as e:
-        logger.error(f"Database error in punch ingestion: {e}")
-        raise HTTPException(status_code=500, detail="Database error processing punch")
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Punch ingestion failed: {e}")
+        if is_punch_data_error(e):
+            raise HTTPException(status_code=400, detail="Punch could not be stored")
         raise HTTPException(status_code=500, detail="Failed to process punch data")
 
-async def _determine_attendance_status(punch_record: dict, conn):
-    """Determine attendance status based on punch time and history"""
-    try:
-        # Check if this is first punch of the day
-        today_start = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
-        
-        existing_punches = await conn.fetch(
-            """SELECT punch_type, punch_time FROM attendance_punches 
-               WHERE person_id = $1 AND tenant_id = $2 AND punch_time >= $3 
-               ORDER BY punch_time ASC""",
-            punch_record["person_id"], punch_record["tenant_id"], today_start
-        )
-        
-        # Determine status based on punch sequence
-        if not existing_punches:
-            # First punch of the day
-            punch_time = datetime.fromisoformat(punch_record["punch_time"].replace('Z', '+00:00'))
-            if punch_time.hour <= 9:  # Before 9 AM
-                return {"status": "present", "type": "on_time"}
-            elif punch_time.hour <= 10:  # Before 10 AM  
-                return {"status": "present", "type": "late"}
+@api_router.post("/biometric/punch/batch")
+async def receive_punch_batch(
+    batch_data: dict,
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Receive a batch of punches (ZKTeco connector spool upload).
+    Expected payload: {"punches": [<same fields as /biometric/punch>, ...]}
+    
+    Punches are stored once per (device_id, person_id, punch_time): resending a
+    batch after a lost response reports those punches as "duplicate". Results are
+    returned in request order so the sender can acknowledge each punch.
+    """
+    punches = batch_data.get("punches")
+    if not isinstance(punches, list):
+        raise HTTPException(status_code=400, detail="punches must be a list")
+    if len(punches) > MAX_PUNCH_BATCH:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_PUNCH_BATCH} punches per batch")
+    if not os.environ.get('DATABASE_URL'):
+        raise HTTPException(status_code=500, detail="Database not configured")
+    
+    try:
+        results = [None] * len(punches)
+        valid = []
+        for index, punch in enumerate(punches):
+            error = punch_error(punch)
+            if error:
+                results[index] = {"index": index, "status": "rejected", "error": error}
             else:
-                return {"status": "present", "type": "very_late"}
-        else:
-            # Subsequent punch
-            last_punch = existing_punches[-1]
-            if punch_record["punch_type"] == "OUT":
-                return {"status": "checked_out", "type": "normal"}
+                valid.append((index, build_punch_record(punch, current_user.tenant_id, current_user.school_id)))
+        
+        # A punch the database refuses for its values is rejected on its own and the rest
+        # of the batch is still stored; any other failure fails the batch so the sender retries
+        stored = await punch_writer.submit_many([record for _, record in valid], return_exceptions=True)
+        for (index, _), result in zip(valid, stored):
+            if isinstance(result, Exception):
+                if not is_punch_data_error(result):
+                    raise result
+                logger.error(f"Punch {index} of batch from tenant {current_user.tenant_id} refused: {result}")
+                results[index] = {"index": index, "status": "rejected", "error": "Punch could not be stored"}
+            elif result["duplicate"]:
+                results[index] = {"index": index, "status": "duplicate"}
             else:
-                return {"status": "checked_in", "type": "return"}
-                
+                results[index] = {
+                    "index": index,
+                    "status": "recorded",
+                    "punch_id": result["punch_id"],
+                    "attendance_status": result["attendance_status"]
+                }
+        
+        counts = {"recorded": 0, "duplicate": 0, "rejected": 0}
+        for result in results:
+            counts[result["status"]] += 1
+        logger.info(f"Punch batch from tenant {current_user.tenant_id}: {counts}")
+        return {"status": "success", **counts, "results": results}
     except Exception as e:
-        logger.error(f"Error determining attendance status: {e}")
-        return {"status": "unknown", "type": "error"}
-
+        logger.error(f"Punch batch ingestion failed: {e}")
+        raise HTTPException(status_code=500, detail="Failed to process punch batch")
 
 @api_router.get("/biometric/dashboard-stats")
 async def get_biometric_dashboard_stats(
@@ -12615,7 +12526,6 @@ async def get_biometric_dashboard_stats(
     try:
         tenant_id = current_user.tenant_id
         devices_collection = db["biometric_devices"]
-        punch_collection = db["biometric_punches"]
         
         # Get device stats
         devices = await devices_collection.find({"tenant_id": tenant_id}).to_list(1000)
@@ -12623,17 +12533,18 @@ async def get_biometric_dashboard_stats(
         online_devices = len([d for d in devices if d.get("status") == "active"])
         
         # Get today's punches
-        today = datetime.now().strftime("%Y-%m-%d")
-        today_punches = await punch_collection.count_documents({
-            "tenant_id": tenant_id,
-            "punch_time": {"$regex": f"^{today}"}
-        })
+        today_start = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+        today = today_start.strftime("%Y-%m-%d")
+        today_punches = await count_punches(tenant_id, today_start, today_start + timedelta(days=1))
+        attendance_today = await get_attendance_rollup(db, tenant_id, today)
+        attendance_today.pop("classes")
         
         return {
             "total_devices": total_devices,
             "online_devices": online_devices,
             "offline_devices": total_devices - online_devices,
-            "today_punches": today_punches
+            "today_punches": today_punches,
+            "attendance_today": attendance_today
         }
     except Exception as e:
         logger.error(f"Biometric dashboard stats failed: {e}")
@@ -12647,22 +12558,20 @@ async def get_biometric_recent_punches(
     """Get recent biometric punches for dashboard"""
     try:
         tenant_id = current_user.tenant_id
-        punch_collection = db["biometric_punches"]
-        
-        punches = await punch_collection.find(
-            {"tenant_id": tenant_id}
-        ).sort("punch_time", -1).limit(limit).to_list(limit)
+        punches = await query_punches(tenant_id, limit=limit)
+        names = await punch_person_names(db, tenant_id, punches)
         
         result = []
         for punch in punches:
+            name = names.get(punch["person_id"]) or punch["source_payload"].get("staff_name", "Unknown")
             result.append({
-                "punch_id": punch.get("punch_id"),
-                "staff_name": punch.get("staff_name") or punch.get("person_name", "Unknown"),
-                "person_name": punch.get("person_name") or punch.get("staff_name", "Unknown"),
-                "device_name": punch.get("device_name") or punch.get("device", "Unknown Device"),
-                "punch_type": punch.get("punch_type", "IN"),
-                "punch_time": punch.get("punch_time"),
-                "verification_method": punch.get("verification_method", "fingerprint")
+                "punch_id": punch["punch_id"],
+                "staff_name": name,
+                "person_name": name,
+                "device_name": punch["device_name"] or "Unknown Device",
+                "punch_type": punch["punch_type"] or "IN",
+                "punch_time": punch["punch_time"],
+                "verification_method": punch["punch_method"] or "fingerprint"
             })
         
         return {"punches": result, "count": len(result)}
@@ -12675,84 +12584,49 @@ async def get_live_attendance(
 ):
     """Get real-time attendance data from punch records"""
     try:
-        import asyncpg
-        import os
-        from datetime import datetime, date
+        from datetime import datetime, timedelta
         
-        database_url = os.environ.get('DATABASE_URL')
-        conn = await asyncpg.connect(database_url)
+        # Today's punches, as a range on punch_time so the partition index is used
+        today_start = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+        punches = await query_punches(
+            current_user.tenant_id, today_start, today_start + timedelta(days=1), limit=100
+        )
+        names = await punch_person_names(db, current_user.tenant_id, punches)
         
-        try:
-            # Get today's attendance
-            today = date.today()
-            
-            # Fetch today's punches from PostgreSQL
-            punches = await conn.fetch(
-                """SELECT person_id, person_type, device_id, device_name, 
-                          punch_time, punch_method, punch_type, verification_score, status
-                   FROM attendance_punches 
-                   WHERE tenant_id = $1 AND DATE(punch_time) = $2
-                   ORDER BY punch_time DESC
-                   LIMIT 100""",
-                current_user.tenant_id, today
-            )
-            
-            # Get staff data from MongoDB for name mapping
-            staff_dict = {}
-            try:
-                staff_members = await db.staff.find({"tenant_id": current_user.tenant_id, "is_active": True}).to_list(1000)
-                for staff in staff_members:
-                    staff_dict[staff.get("employee_id", "")] = {
-                        "name": staff.get("name", "Unknown Staff"),
-                        "designation": staff.get("designation", "Staff"),
-                        "department": staff.get("department", "Unknown")
-                    }
-            except Exception as e:
-                logger.warning(f"Could not fetch staff data from MongoDB: {e}")
-            
-            # Process attendance records into the format expected by frontend
-            attendance_records = []
-            for punch in punches:
-                person_id = punch["person_id"]
-                person_name = "Unknown"
-                
-                # Get person name based on type
-                if punch["person_type"] == "staff" and person_id in staff_dict:
-                    person_name = staff_dict[person_id]["name"]
-                elif punch["person_type"] == "student":
-                    person_name = f"Student {person_id}"  # Fallback for students
-                else:
-                    person_name = person_id
-                
-                # Format punch time
-                punch_time_str = punch["punch_time"].strftime("%Y-%m-%d %H:%M:%S")
-                
-                # Create attendance record in expected format
-                attendance_records.append({
-                    "person_name": person_name,  # Frontend expects person_name
-                    "staff_name": person_name,   # Keep for backward compatibility
-                    "time": punch["punch_time"].strftime("%H:%M:%S"),  # Just time for display
-                    "punch_time": punch_time_str,  # Full datetime for sorting
-                    "punch_type": punch["punch_type"],  # IN/OUT - Frontend expects this
-                    "device_name": punch["device_name"] or f"Device {punch['device_id']}",  # Frontend expects device_name
-                    "verification_score": punch["verification_score"] or 0,  # Frontend expects this field name
-                    "status": punch["punch_type"],  # Keep for backward compatibility
-                    "method": punch["punch_method"],
-                    "person_type": punch["person_type"],
-                    "person_id": person_id
-                })
-            
-            return {
-                "message": "Daily attendance retrieved successfully",
-                "attendance": {
-                    "latest_punches": attendance_records,
-                    "total_count": len(attendance_records),
-                    "date": today.strftime("%Y-%m-%d")
-                }
+        # Process attendance records into the format expected by frontend
+        attendance_records = []
+        for punch in punches:
+            person_id = punch["person_id"]
+            person_name = names.get(person_id)
+            if not person_name:
+                person_name = f"Student {person_id}" if punch["person_type"] == "student" else person_id
+            
+            # Format punch time
+            punch_time_str = punch["punch_time"].strftime("%Y-%m-%d %H:%M:%S")
+            
+            # Create attendance record in expected format
+            attendance_records.append({
+                "person_name": person_name,  # Frontend expects person_name
+                "staff_name": person_name,   # Keep for backward compatibility
+                "time": punch["punch_time"].strftime("%H:%M:%S"),  # Just time for display
+                "punch_time": punch_time_str,  # Full datetime for sorting
+                "punch_type": punch["punch_type"],  # IN/OUT - Frontend expects this
+                "device_name": punch["device_name"] or f"Device {punch['device_id']}",  # Frontend expects device_name
+                "verification_score": punch["verification_score"] or 0,  # Frontend expects this field name
+                "status": punch["punch_type"],  # Keep for backward compatibility
+                "method": punch["punch_method"],
+                "person_type": punch["person_type"],
+                "person_id": person_id
+            })
+        
+        return {
+            "message": "Daily attendance retrieved successfully",
+            "attendance": {
+                "latest_punches": attendance_records,
+                "total_count": len(attendance_records),
+                "date": today_start.strftime("%Y-%m-%d")
             }
-            
-        finally:
-            await conn.close()
+        }
             
     except Exception as e:
         logger.error(f"Live attendance retrieval failed: {e}")
@@ -12764,13 +12638,11 @@ async def generate_sample_data(
 ):
     """Generate sample punch data for testing biometric system without physical devices"""
     try:
-        import asyncpg
-        import os
         import random
         from datetime import datetime, date, timedelta
         
-        database_url = os.environ.get('DATABASE_URL')
-        conn = await asyncpg.connect(database_url)
+        pool = await get_pg_pool()
+        conn = await pool.acquire()
         
         try:
             # First, get existing staff from MongoDB
@@ -13036,259 +12908,57 @@ async def generate_sample_data(
             logger.error(f"Error generating sample data: {e}")
             return {"message": "Error generating sample data", "error": str(e)}
         finally:
-            await conn.close()
+            await pool.release(conn)
             
     except Exception as e:
         logger.error(f"Database connection error: {e}")
         raise HTTPException(status_code=500, detail="Failed to generate sample data")
 
+async def resolve_report_exam_term(current_user: User, exam_term_id: Optional[str], year: Optional[str]) -> str:
+    """Exam term of an academic report, defaulting to the latest one (of the academic year, if given)"""
+    if exam_term_id:
+        return exam_term_id
+    term_query = {"tenant_id": current_user.tenant_id, "school_id": current_user.school_id}
+    if year:
+        term_query["academic_year"] = year
+    latest = await db.exam_terms.find(term_query, {"_id": 0, "id": 1}).sort("created_at", -1).limit(1).to_list(1)
+    if not latest:
+        raise HTTPException(status_code=404, detail="No exam term found")
+    return latest[0]["id"]
+
 @api_router.get("/reports/academic/consolidated-marksheet")
 async def generate_consolidated_marksheet(
     format: str = "pdf",
-    year: str = "2024-25",
+    year: Optional[str] = None,
     class_filter: str = "all_classes",
+    exam_term_id: Optional[str] = None,
+    include_unpublished: bool = False,
     current_user: User = Depends(get_current_user)
 ):
-    """Generate consolidated marksheet report"""
+    """Generate consolidated marksheet report (student x subject marks of an exam term)"""
     try:
-        # Build query filters
-        query = {"tenant_id": current_user.tenant_id, "$or": [{"is_active": True}, {"is_active": {"$exists": False}}]}
-        
-        if class_filter != "all_classes":
-            query["class_id"] = class_filter
-            
-        # Fetch filtered students with academic data
-        students = await db.students.find(query).to_list(1000)
-        
-        # Convert ObjectId to string for JSON serialization
-        for student in students:
-            if "_id" in student:
-                student["_id"] = str(student["_id"])
-        
-        # Generate unique academic performance data for each student
-        import random
-        for i, student in enumerate(students):
-            # Generate unique marks for each student with some realistic variation
-            math_marks = random.randint(65, 98)
-            science_marks = random.randint(60, 95)
-            english_marks = random.randint(70, 96)
-            social_marks = random.randint(68, 92)
-            
-            total_marks = math_marks + science_marks + english_marks + social_marks
-            total_possible = 400
-            percentage = round((total_marks / total_possible) * 100, 2)
-            
-            # Assign grade based on percentage
-            if percentage >= 90:
-                overall_grade = "A+"
-            elif percentage >= 80:
-                overall_grade = "A"
-            elif percentage >= 70:
-                overall_grade = "B+"
-            elif percentage >= 60:
-                overall_grade = "B"
-            elif percentage >= 50:
-                overall_grade = "C"
-            else:
-                overall_grade = "F"
-            
-            student["academic_performance"] = {
-                "mathematics": {"marks": math_marks, "grade": "A" if math_marks >= 80 else "B+" if math_marks >= 70 else "B", "total": 100},
-                "science": {"marks": science_marks, "grade": "A" if science_marks >= 80 else "B+" if science_marks >= 70 else "B", "total": 100},
-                "english": {"marks": english_marks, "grade": "A" if english_marks >= 80 else "B+" if english_marks >= 70 else "B", "total": 100},
-                "social_studies": {"marks": social_marks, "grade": "A" if social_marks >= 80 else "B+" if social_marks >= 70 else "B", "total": 100},
-                "total_marks": total_marks,
-                "total_possible": total_possible,
-                "percentage": percentage,
-                "overall_grade": overall_grade
-            }
-        
-        # Pre-initialize all class lookup data BEFORE processing students
-        from bson import ObjectId
-        
-        # Collect all possible class references first
-        class_ids = set()
-        for student in students:
-            for field_name in ["class_id", "class", "current_class", "class_name", "grade", "standard"]:
-                class_ref = student.get(field_name)
-                if class_ref:
-                    class_ids.add(class_ref)
-        
-        # Build comprehensive class lookup cache
-        classes = {}
-        if class_ids:
-            class_ids_list = list(class_ids)
-            converted_class_ids = []
-            
-            for class_id in class_ids_list:
-                if isinstance(class_id, str):
-                    try:
-                        if len(class_id) == 24:
-                            converted_class_ids.append(ObjectId(class_id))
-                        else:
-                            converted_class_ids.append(class_id)
-                    except:
-                        converted_class_ids.append(class_id)
-                else:
-                    converted_class_ids.append(class_id)
-            
-            # Fetch all class documents
-            class_docs = await db.classes.find({"_id": {"$in": converted_class_ids}}).to_list(1000)
-            if not class_docs:
-                class_docs = await db.classes.find({"name": {"$in": class_ids_list}}).to_list(1000)
-            
-            # Build complete lookup cache
-            for cls in class_docs:
-                class_id = cls["_id"]
-                class_name = cls.get("name", cls.get("class_name", "Unknown"))
-                classes[str(class_id)] = class_name
-                classes[class_id] = class_name
-                classes[class_name] = class_name
-        
-        # Define helper function for ObjectId detection
-        def is_objectid_pattern(value_str):
-            """Check if string looks like ObjectId"""
-            if not isinstance(value_str, str):
-                return False
-            value_str = value_str.strip()
-            return (
-                (len(value_str) == 24 and all(c in '0123456789abcdefABCDEF' for c in value_str)) or
-                'ObjectId' in value_str or
-                ('-' in value_str and len(value_str) > 20) or
-                (len(value_str) > 15 and any(c in '0123456789abcdefABCDEF' for c in value_str[:10]))
-            )
-        
-        # Define deterministic class resolver function
-        def resolve_student_class(student, class_lookup_cache):
-            """Deterministic class resolver with strict priority order"""
-            
-            # Priority 1: Direct class name fields (immediate return)
-            for direct_field in ["class_name", "current_class"]:
-                direct_value = student.get(direct_field)
-                if direct_value and isinstance(direct_value, (str, int)):
-                    direct_str = str(direct_value).strip()
-                    # Normalize common variants
-                    if direct_str in ["XI", "11th"]: return "11"
-                    if direct_str in ["XII", "12th"]: return "12"
-                    if direct_str in ["HSS", "HSC"]: return direct_str
-                    if len(direct_str) < 10 and not is_objectid_pattern(direct_str):
-                        return direct_str
-            
-            # Priority 2: Database lookup via class_id/class
-            for lookup_field in ["class_id", "class", "grade", "standard"]:
-                class_ref = student.get(lookup_field)
-                if class_ref:
-                    # Try cache lookup
-                    resolved = class_lookup_cache.get(str(class_ref)) or class_lookup_cache.get(class_ref)
-                    if resolved:
-                        return resolved
-            
-            # Priority 3: Alternative field scanning
-            for alt_field in ["section", "level", "year", "current_grade"]:
-                alt_value = student.get(alt_field)
-                if alt_value and isinstance(alt_value, str) and len(alt_value) < 10:
-                    if not is_objectid_pattern(alt_value):
-                        return alt_value
-            
-            # Priority 4: Pattern recognition in any field
-            all_values = [str(v) for v in student.values() if v and isinstance(v, (str, int))]
-            for value in all_values:
-                value_str = str(value).strip()
-                if value_str in ["1", "2", "3", "4", "5", "6", "7", "8", "9", "10", "11", "12", "KG", "LKG", "UKG", "Nursery", "HSS", "HSC"]:
-                    return value_str
-            
-            return "Unknown"
-        
-        # First pass: Apply deterministic resolver to all students
-        for student in students:
-            student["class_name"] = resolve_student_class(student, classes)
-        
-        # Second pass: Fix any remaining "Unknown" entries with enhanced fallback
-        unknown_students = [s for s in students if s.get("class_name") == "Unknown"]
-        
-        if unknown_students:
-            # For students still showing "Unknown", try additional strategies
-            for student in unknown_students:
-                # Strategy 1: Check if other students with same name have class info
-                student_name = student.get("name", "").strip()
-                if student_name:
-                    same_name_students = [s for s in students if s.get("name", "").strip() == student_name and s.get("class_name") != "Unknown"]
-                    if same_name_students:
-                        # Use class from another student with same name
-                        student["class_name"] = same_name_students[0]["class_name"]
-                        continue
-                
-                # Strategy 2: Pattern matching on admission number or student ID
-                admission_no = str(student.get("admission_no", "")).strip()
-                if admission_no and len(admission_no) >= 2:
-                    # Look for class hints in admission number
-                    if admission_no.startswith("11") or "11" in admission_no[:4]:
-                        student["class_name"] = "11"
-                        continue
-                    elif admission_no.startswith("12") or "12" in admission_no[:4]:
-                        student["class_name"] = "12"
-                        continue
-                    elif admission_no.startswith("10") or "10" in admission_no[:4]:
-                        student["class_name"] = "10"
-                        continue
-                
-                # Strategy 3: Infer from student position/context (use nearby students' classes)
-                student_idx = students.index(student)
-                if student_idx > 0:
-                    prev_class = students[student_idx - 1].get("class_name")
-                    if prev_class and prev_class != "Unknown":
-                        student["class_name"] = prev_class
-                        continue
-                elif student_idx < len(students) - 1:
-                    next_class = students[student_idx + 1].get("class_name") 
-                    if next_class and next_class != "Unknown":
-                        student["class_name"] = next_class
-                        continue
-                
-                # Final fallback: Use most common class in dataset
-                class_counts = {}
-                for s in students:
-                    cls = s.get("class_name")
-                    if cls and cls != "Unknown":
-                        class_counts[cls] = class_counts.get(cls, 0) + 1
-                
-                if class_counts:
-                    most_common_class = max(class_counts.keys(), key=lambda k: class_counts[k])
-                    student["class_name"] = most_common_class
-        
-        # Find top performer properly
-        top_performer_student = max(students, key=lambda s: s.get("academic_performance", {}).get("percentage", 0)) if students else None
-        top_performer_info = None
-        if top_performer_student:
-            perf = top_performer_student.get("academic_performance", {})
-            top_performer_info = f"{top_performer_student.get('name', 'Unknown')} ({perf.get('percentage', 0)}% - {perf.get('overall_grade', 'N/A')})"
+        exam_term_id = await resolve_report_exam_term(current_user, exam_term_id, year)
+        class_id = class_filter if class_filter and class_filter != "all_classes" else None
+        sheet = await build_marksheet(
+            db, current_user.tenant_id, current_user.school_id, exam_term_id,
+            class_id=class_id, include_unpublished=include_unpublished
+        )
         
-        # Generate report data
-        report_data = {
-            "title": f"Consolidated Marksheet - Academic Year {year}",
-            "generated_date": datetime.now(timezone.utc).strftime("%Y-%m-%d %H:%M:%S"),
-            "filters": {
-                "academic_year": year,
-                "class": class_filter
-            },
-            "summary": {
-                "total_students": len(students),
-                "average_percentage": round(sum(s.get("academic_performance", {}).get("percentage", 0) for s in students) / len(students), 2) if students else 0,
-                "top_performer": top_performer_info,
-                "class_strength": len(students)
-            },
-            "students": students
-        }
+        title = f"Consolidated Marksheet - {sheet['exam_term_name'] or 'Exam'} {sheet['academic_year']}".strip()
+        slug = (sheet["academic_year"] or "exam").replace("-", "_")
+        filename = f"consolidated_marksheet_{slug}_{exam_term_id[:8]}"
         
         if format.lower() == "json":
             return {
                 "message": "Consolidated marksheet generated successfully",
-                "data": report_data,
+                "data": {"title": title, **sheet},
                 "format": "json"
             }
-        elif format.lower() == "excel":
-            filename = f"consolidated_marksheet_{year.replace('-', '_')}"
-            file_path = await generate_academic_excel_report("consolidated_marksheet", report_data, current_user, filename)
+        
+        temp_dir = tempfile.gettempdir()
+        if format.lower() == "excel":
+            file_path = os.path.join(temp_dir, f"{filename}_{uuid.uuid4().hex[:8]}.xlsx")
+            await asyncio.to_thread(write_marksheet_excel, sheet, title, file_path)
             return FileResponse(
                 path=file_path,
                 filename=f"{filename}.xlsx",
@@ -13296,100 +12966,118 @@ async def generate_consolidated_marksheet(
                 background=BackgroundTask(cleanup_temp_file, file_path)
             )
         else:  # PDF
-            filename = f"consolidated_marksheet_{year.replace('-', '_')}"
-            file_path = await generate_academic_pdf_report("consolidated_marksheet", report_data, current_user, filename)
+            branding = await get_school_branding_for_reports(current_user.tenant_id)
+            file_path = os.path.join(temp_dir, f"{filename}_{uuid.uuid4().hex[:8]}.pdf")
+            await asyncio.to_thread(write_marksheet_pdf, sheet, title, branding.get("school_name") or "", file_path)
             return FileResponse(
                 path=file_path,
                 filename=f"{filename}.pdf",
                 media_type="application/pdf",
                 background=BackgroundTask(cleanup_temp_file, file_path)
             )
-            
+    
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Consolidated marksheet generation failed: {e}")
         raise HTTPException(status_code=500, detail="Failed to generate consolidated marksheet")
 
+async def send_academic_report(report_type: str, report_data: dict, format: str, filename: str, current_user: User, message: str):
+    """Return an academic report as JSON, Excel or PDF"""
+    if format.lower() == "json":
+        return {"message": message, "data": report_data, "format": "json"}
+    elif format.lower() == "excel":
+        file_path = await generate_academic_excel_report(report_type, report_data, current_user, filename)
+        return FileResponse(
+            path=file_path,
+            filename=f"{filename}.xlsx",
+            media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+            background=BackgroundTask(cleanup_temp_file, file_path)
+        )
+    else:  # PDF
+        file_path = await generate_academic_pdf_report(report_type, report_data, current_user, filename)
+        return FileResponse(
+            path=file_path,
+            filename=f"{filename}.pdf",
+            media_type="application/pdf",
+            background=BackgroundTask(cleanup_temp_file, file_path)
+        )
+
 @api_router.get("/reports/academic/subject-wise-analysis")
 async def generate_subject_wise_analysis(
     format: str = "excel",
-    year: str = "2024-25",
+    year: Optional[str] = None,
     subject_filter: str = "all_subjects",
+    exam_term_id: Optional[str] = None,
     current_user: User = Depends(get_current_user)
 ):
-    """Generate subject-wise performance analysis report"""
+    """Generate subject-wise performance analysis report (served from the exam's analytics snapshot)"""
     try:
-        # Fetch students data
-        students = await db.students.find({"tenant_id": current_user.tenant_id, "is_active": True}).to_list(1000)
+        exam_term_id = await resolve_report_exam_term(current_user, exam_term_id, year)
+        analytics = await get_exam_analytics(db, current_user.tenant_id, current_user.school_id, exam_term_id)
+        exam_term = await db.exam_terms.find_one({"id": exam_term_id, "tenant_id": current_user.tenant_id}, {"_id": 0, "name": 1, "academic_year": 1}) or {}
         
-        # Convert ObjectId to string for JSON serialization
-        for student in students:
-            if "_id" in student:
-                student["_id"] = str(student["_id"])
-        
-        # Mock subject analysis data
-        subjects = ["Mathematics", "Science", "English", "Social Studies", "Computer Science"]
-        subject_analysis = {}
-        
-        for subject in subjects:
-            if subject_filter == "all_subjects" or subject_filter.lower() == subject.lower():
-                subject_analysis[subject] = {
-                    "total_students": len(students),
-                    "average_marks": 82.5,
-                    "highest_marks": 98,
-                    "lowest_marks": 45,
-                    "pass_percentage": 92.5,
-                    "grade_distribution": {
-                        "A+": 15,
-                        "A": 25,
-                        "B+": 30,
-                        "B": 20,
-                        "C": 8,
-                        "F": 2
-                    }
-                }
+        subjects = analytics["subjects"]
+        subject_classes = analytics["subject_classes"]
+        if subject_filter != "all_subjects":
+            subjects = [s for s in subjects if s["subject"].lower() == subject_filter.lower()]
+            subject_classes = [s for s in subject_classes if s["subject"].lower() == subject_filter.lower()]
         
-        # Generate report data
+        overall = analytics["overall"]
         report_data = {
-            "title": f"Subject-wise Analysis Report - Academic Year {year}",
+            "title": f"Subject-wise Analysis Report - {exam_term.get('name', 'Exam')} {exam_term.get('academic_year', '')}".strip(),
             "generated_date": datetime.now(timezone.utc).strftime("%Y-%m-%d %H:%M:%S"),
             "filters": {
-                "academic_year": year,
+                "exam_term": exam_term.get("name", exam_term_id),
+                "academic_year": exam_term.get("academic_year", year or ""),
                 "subject_filter": subject_filter
             },
             "summary": {
-                "total_subjects_analyzed": len(subject_analysis),
-                "overall_average": 82.5,
-                "overall_pass_rate": 92.5
+                "total_subjects_analyzed": len(subjects),
+                "students": overall.get("count", 0),
+                "overall_average": overall.get("mean"),
+                "overall_pass_rate": overall.get("pass_rate"),
+                "hardest_subject": min(subjects, key=lambda s: s["difficulty_index"])["subject"] if subjects else None
             },
-            "subject_analysis": subject_analysis,
-            "students": students[:50]  # Limit for performance
+            "subject_analysis": {s["subject"]: s for s in subjects},
+            "subject_classes": subject_classes,
+            "teachers": analytics["teachers"],
+            "computed_at": analytics["computed_at"],
+            "tables": [
+                {
+                    "title": "Subject statistics",
+                    "headers": ["Subject", "Students", "Mean %", "Median %", "Std", "P25", "P75", "Pass %", "Difficulty", "Discrimination"],
+                    "rows": [[
+                        s["subject"], s["count"], s["mean"], s["median"], s["std"],
+                        s["percentiles"]["p25"], s["percentiles"]["p75"], s["pass_rate"],
+                        s["difficulty_index"], "-" if s["discrimination_index"] is None else s["discrimination_index"]
+                    ] for s in subjects]
+                },
+                {
+                    "title": "Subject by class",
+                    "headers": ["Subject", "Class", "Students", "Mean %", "Median %", "Pass %"],
+                    "rows": [[
+                        s["subject"], s["class_name"] or "-", s["count"], s["mean"], s["median"], s["pass_rate"]
+                    ] for s in subject_classes]
+                },
+                {
+                    "title": "Teacher-wise breakdown",
+                    "headers": ["Teacher", "Subjects", "Classes", "Students", "Mean %", "Pass %"],
+                    "rows": [[
+                        t["teacher_name"], ", ".join(t["subjects"]), ", ".join(t["classes"]),
+                        t["students"], t["mean"], t["pass_rate"]
+                    ] for t in analytics["teachers"]]
+                }
+            ]
         }
         
-        if format.lower() == "json":
-            return {
-                "message": "Subject-wise analysis generated successfully",
-                "data": report_data,
-                "format": "json"
-            }
-        elif format.lower() == "excel":
-            filename = f"subject_wise_analysis_{year.replace('-', '_')}"
-            file_path = await generate_academic_excel_report("subject_wise_analysis", report_data, current_user, filename)
-            return FileResponse(
-                path=file_path,
-                filename=f"{filename}.xlsx",
-                media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-                background=BackgroundTask(cleanup_temp_file, file_path)
-            )
-        else:  # PDF
-            filename = f"subject_wise_analysis_{year.replace('-', '_')}"
-            file_path = await generate_academic_pdf_report("subject_wise_analysis", report_data, current_user, filename)
-            return FileResponse(
-                path=file_path,
-                filename=f"{filename}.pdf",
-                media_type="application/pdf",
-                background=BackgroundTask(cleanup_temp_file, file_path)
-            )
-            
+        filename = f"subject_wise_analysis_{(exam_term.get('academic_year') or 'exam').replace('-', '_')}"
+        return await send_academic_report(
+            "subject_wise_analysis", report_data, format, filename, current_user,
+            "Subject-wise analysis generated successfully"
+        )
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Subject-wise analysis generation failed: {e}")
         raise HTTPException(status_code=500, detail="Failed to generate subject-wise analysis")
@@ -13397,94 +13085,78 @@ async def generate_subject_wise_analysis(
 @api_router.get("/reports/academic/class-performance")
 async def generate_class_performance(
     format: str = "pdf",
-    year: str = "2024-25",
+    year: Optional[str] = None,
     class_filter: str = "all_classes",
+    exam_term_id: Optional[str] = None,
     current_user: User = Depends(get_current_user)
 ):
-    """Generate class performance summary report"""
+    """Generate class performance summary report (served from the exam's analytics snapshot)"""
     try:
-        # Fetch students data grouped by class
-        all_students = await db.students.find({"tenant_id": current_user.tenant_id, "is_active": True}).to_list(1000)
-        
-        # Convert ObjectId to string for JSON serialization
-        for student in all_students:
-            if "_id" in student:
-                student["_id"] = str(student["_id"])
+        exam_term_id = await resolve_report_exam_term(current_user, exam_term_id, year)
+        analytics = await get_exam_analytics(db, current_user.tenant_id, current_user.school_id, exam_term_id)
+        exam_term = await db.exam_terms.find_one({"id": exam_term_id, "tenant_id": current_user.tenant_id}, {"_id": 0, "name": 1, "academic_year": 1}) or {}
         
-        # Group students by class
-        class_data = {}
-        for student in all_students:
-            class_name = student.get("class", "Unknown")
-            if class_name not in class_data:
-                class_data[class_name] = []
-            class_data[class_name].append(student)
-        
-        # Generate class performance analysis
-        class_performance = {}
-        for class_name, students in class_data.items():
-            if class_filter == "all_classes" or class_filter == class_name:
-                class_performance[class_name] = {
-                    "total_students": len(students),
-                    "average_attendance": 92.5,
-                    "average_marks": 78.2,
-                    "top_student": {
-                        "name": f"{students[0].get('first_name', '')} {students[0].get('last_name', '')}",
-                        "roll_number": students[0].get('roll_number', ''),
-                        "class": students[0].get('class', '')
-                    } if students else None,
-                    "class_rank": 1,
-                    "performance_trend": "Improving",
-                    "subject_averages": {
-                        "mathematics": 80.5,
-                        "science": 76.8,
-                        "english": 82.1,
-                        "social_studies": 73.4
-                    }
-                }
+        classes = analytics["classes"]
+        if class_filter != "all_classes":
+            classes = [c for c in classes if class_filter in (c["class_id"], c["class_name"])]
+        class_ids = {c["class_id"] for c in classes}
+        subject_classes = [s for s in analytics["subject_classes"] if s["class_id"] in class_ids]
         
-        # Generate report data
+        overall = analytics["overall"]
         report_data = {
-            "title": f"Class Performance Report - Academic Year {year}",
+            "title": f"Class Performance Report - {exam_term.get('name', 'Exam')} {exam_term.get('academic_year', '')}".strip(),
             "generated_date": datetime.now(timezone.utc).strftime("%Y-%m-%d %H:%M:%S"),
             "filters": {
-                "academic_year": year,
+                "exam_term": exam_term.get("name", exam_term_id),
+                "academic_year": exam_term.get("academic_year", year or ""),
                 "class_filter": class_filter
             },
             "summary": {
-                "total_classes": len(class_performance),
-                "total_students": sum(cp["total_students"] for cp in class_performance.values()),
-                "overall_average": 78.2,
-                "best_performing_class": max(class_performance.keys(), key=lambda k: class_performance[k]["average_marks"]) if class_performance else None
+                "total_classes": len(classes),
+                "total_students": sum(c["count"] for c in classes),
+                "overall_average": overall.get("mean"),
+                "overall_pass_rate": overall.get("pass_rate"),
+                "best_performing_class": classes[0]["class_name"] if classes else None
             },
-            "class_performance": class_performance,
-            "students": all_students[:50]  # Limit for performance
+            "class_performance": {c["class_name"] or c["class_id"]: c for c in classes},
+            "subject_classes": subject_classes,
+            "overall": overall,
+            "computed_at": analytics["computed_at"],
+            "tables": [
+                {
+                    "title": "Class statistics",
+                    "headers": ["Pos", "Class", "Students", "Mean %", "Median %", "Std", "P10", "P90", "Pass %", "Top student"],
+                    "rows": [[
+                        c["class_position"], c["class_name"] or "-", c["count"], c["mean"], c["median"], c["std"],
+                        c["percentiles"]["p10"], c["percentiles"]["p90"], c["pass_rate"],
+                        f"{c['top_student']['name']} ({c['top_student']['percentage']}%)"
+                    ] for c in classes]
+                },
+                {
+                    "title": "Grade distribution",
+                    "headers": ["Class", "Grades"],
+                    "rows": [[
+                        c["class_name"] or "-",
+                        ", ".join(f"{grade}: {count}" for grade, count in c["grade_distribution"].items())
+                    ] for c in classes]
+                },
+                {
+                    "title": "Subject averages by class",
+                    "headers": ["Class", "Subject", "Students", "Mean %", "Pass %"],
+                    "rows": [[
+                        s["class_name"] or "-", s["subject"], s["count"], s["mean"], s["pass_rate"]
+                    ] for s in subject_classes]
+                }
+            ]
         }
         
-        if format.lower() == "json":
-            return {
-                "message": "Class performance report generated successfully",
-                "data": report_data,
-                "format": "json"
-            }
-        elif format.lower() == "excel":
-            filename = f"class_performance_{year.replace('-', '_')}"
-            file_path = await generate_academic_excel_report("class_performance", report_data, current_user, filename)
-            return FileResponse(
-                path=file_path,
-                filename=f"{filename}.xlsx",
-                media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-                background=BackgroundTask(cleanup_temp_file, file_path)
-            )
-        else:  # PDF
-            filename = f"class_performance_{year.replace('-', '_')}"
-            file_path = await generate_academic_pdf_report("class_performance", report_data, current_user, filename)
-            return FileResponse(
-                path=file_path,
-                filename=f"{filename}.pdf",
-                media_type="application/pdf",
-                background=BackgroundTask(cleanup_temp_file, file_path)
-            )
-            
+        filename = f"class_performance_{(exam_term.get('academic_year') or 'exam').replace('-', '_')}"
+        return await send_academic_report(
+            "class_performance", report_data, format, filename, current_user,
+            "Class performance report generated successfully"
+        )
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Class performance report generation failed: {e}")
         raise HTTPException(status_code=500, detail="Failed to generate class performance report")
@@ -14543,6 +14215,7 @@ async def generate_academic_excel_report(report_type: str, report_data: dict, cu
         import tempfile
         import os
         from openpyxl import Workbook
+        from openpyxl.styles import Font
         from openpyxl.utils import get_column_letter
         
         # Create temporary file
@@ -14572,38 +14245,26 @@ async def generate_academic_excel_report(report_type: str, report_data: dict, cu
             row = format_excel_summary_box(worksheet, row, report_data["summary"], primary_color, secondary_color)
             row += 1
         
+        # Analytics tables ({"title", "headers", "rows"})
+        for table in report_data.get("tables", []):
+            worksheet.cell(row=row, column=1, value=table["title"]).font = Font(bold=True, size=12)
+            row += 1
+            row = format_excel_data_table(worksheet, row, table["headers"], table["rows"], primary_color)
+            row += 1
+        
         # Professional student data table
         if report_data.get("students"):
-            # Determine headers and data based on report type
-            if report_type == "consolidated_marksheet":
-                headers = ["Name", "Class", "Roll No", "Math", "Science", "English", "Social", "Total", "Percentage", "Grade"]
-                data_rows = []
-                for student in report_data["students"][:200]:  # Show more with better formatting
-                    perf = student.get("academic_performance", {})
-                    data_rows.append([
-                        student.get("name", ""),
-                        student.get("class_name", ""),
-                        student.get("roll_no", ""),
-                        perf.get("mathematics", {}).get("marks", "-"),
-                        perf.get("science", {}).get("marks", "-"),
-                        perf.get("english", {}).get("marks", "-"),
-                        perf.get("social_studies", {}).get("marks", "-"),
-                        perf.get("total_marks", "-"),
-                        f"{perf.get('percentage', 0):.2f}%",
-                        perf.get("overall_grade", "-")
-                    ])
-            else:
-                headers = ["Name", "Class", "Section", "Roll No", "Contact", "Status"]
-                data_rows = []
-                for student in report_data["students"][:200]:
-                    data_rows.append([
-                        student.get("name", ""),
-                        student.get("class_name", ""),
-                        student.get("section_name", "-"),
-                        student.get("roll_no", ""),
-                        student.get("contact_number", "-"),
-                        student.get("status", "Active")
-                    ])
+            headers = ["Name", "Class", "Section", "Roll No", "Contact", "Status"]
+            data_rows = []
+            for student in report_data["students"][:200]:
+                data_rows.append([
+                    student.get("name", ""),
+                    student.get("class_name", ""),
+                    student.get("section_name", "-"),
+                    student.get("roll_no", ""),
+                    student.get("contact_number", "-"),
+                    student.get("status", "Active")
+                ])
             
             # Format professional table
             row = format_excel_data_table(worksheet, row, headers, data_rows, primary_color)
@@ -14703,45 +14364,33 @@ async def generate_academic_pdf_report(report_type: str, report_data: dict, curr
                 story.append(summary_table)
                 story.append(Spacer(1, 20))
         
+        # Analytics tables ({"title", "headers", "rows"})
+        for table in report_data.get("tables", []):
+            story.append(Paragraph(table["title"].upper(), template['styles']['SectionHeading']))
+            story.append(Spacer(1, 8))
+            col_width = doc.width / len(table["headers"])
+            story.append(create_data_table(table["headers"], table["rows"], template, [col_width] * len(table["headers"]), repeat_header=True))
+            story.append(Spacer(1, 15))
+        
         # Students data section with professional table
         if report_data.get("students"):
             story.append(Paragraph("STUDENT DATA", template['styles']['SectionHeading']))
             story.append(Spacer(1, 8))
             
-            if report_type == "consolidated_marksheet":
-                # Academic performance table
-                headers = ["Student", "Class", "Adm. No", "Math", "Science", "English", "Percentage", "Grade"]
-                data_rows = []
-                
-                for student in report_data["students"][:50]:  # Show more students with better formatting
-                    perf = student.get("academic_performance", {})
-                    data_rows.append([
-                        student.get("name", "")[:20],  # Truncate long names
-                        student.get("class_name", ""),
-                        student.get("admission_no", ""),
-                        str(perf.get("mathematics", {}).get("marks", "-")),
-                        str(perf.get("science", {}).get("marks", "-")),
-                        str(perf.get("english", {}).get("marks", "-")),
-                        f"{perf.get('percentage', 0):.1f}%",
-                        perf.get("overall_grade", "-")
-                    ])
-                
-                col_widths = [1.3*inch, 0.6*inch, 0.7*inch, 0.5*inch, 0.5*inch, 0.5*inch, 0.7*inch, 0.5*inch]
-            else:
-                # Standard student list table
-                headers = ["Student Name", "Class", "Section", "Roll Number", "Status"]
-                data_rows = []
-                
-                for student in report_data["students"][:100]:  # Show more students
-                    data_rows.append([
-                        student.get("name", "")[:25],
-                        student.get("class_name", ""),
-                        student.get("section_name", "-"),
-                        student.get("roll_no", ""),
-                        student.get("status", "Active")
-                    ])
-                
-                col_widths = [2.2*inch, 0.9*inch, 0.9*inch, 1*inch, 1*inch]
+            # Standard student list table
+            headers = ["Student Name", "Class", "Section", "Roll Number", "Status"]
+            data_rows = []
+            
+            for student in report_data["students"][:100]:  # Show more students
+                data_rows.append([
+                    student.get("name", "")[:25],
+                    student.get("class_name", ""),
+                    student.get("section_name", "-"),
+                    student.get("roll_no", ""),
+                    student.get("status", "Active")
+                ])
+            
+            col_widths = [2.2*inch, 0.9*inch, 0.9*inch, 1*inch, 1*inch]
             
             # Create professional data table
             student_table = create_data_table(headers, data_rows, template, col_widths, repeat_header=True)
@@ -16805,11 +16454,19 @@ async def create_course_certificate(
         if not student:
             raise HTTPException(status_code=404, detail="Student not found")
         
-        # Generate certificate number
-        cert_count = await db.course_certificates.count_documents({
-            "tenant_id": current_user.tenant_id
-        })
-        cert_number = f"CC{datetime.now().year}{cert_count + 1:04d}"
+        # Generate certificate number (seeded from the legacy count on first use)
+        async def seed_from_certificate_count():
+            return await db.course_certificates.count_documents({
+                "tenant_id": current_user.tenant_id
+            })
+        
+        cert_number = await allocate_number(
+            db,
+            current_user.tenant_id,
+            Sequence.COURSE_CERTIFICATE,
+            year=datetime.now().year,
+            seed=seed_from_certificate_count
+        )
         
         cc = CourseCertificate(
             tenant_id=current_user.tenant_id,
@@ -17245,11 +16902,19 @@ async def create_bonafide_certificate(
         if not student:
             raise HTTPException(status_code=404, detail="Student not found")
         
-        # Generate certificate number
-        cert_count = await db.bonafide_certificates.count_documents({
-            "tenant_id": current_user.tenant_id
-        })
-        cert_number = f"BF{datetime.now().year}{cert_count + 1:04d}"
+        # Generate certificate number (seeded from the legacy count on first use)
+        async def seed_from_certificate_count():
+            return await db.bonafide_certificates.count_documents({
+                "tenant_id": current_user.tenant_id
+            })
+        
+        cert_number = await allocate_number(
+            db,
+            current_user.tenant_id,
+            Sequence.BONAFIDE_CERTIFICATE,
+            year=datetime.now().year,
+            seed=seed_from_certificate_count
+        )
         
         bc = BonafideCertificate(
             tenant_id=current_user.tenant_id,
@@ -18518,7 +18183,7 @@ async def create_payment(
             raise HTTPException(status_code=404, detail="Student not found")
         
         # Generate receipt number
-        receipt_no = f"RCP{datetime.utcnow().strftime('%Y%m%d')}{uuid.uuid4().hex[:6].upper()}"
+        receipt_no = await allocate_number(db, current_user.tenant_id, Sequence.RECEIPT)
         
         # Create payment record with explicit payment_date
         payment = Payment(
@@ -18540,6 +18205,7 @@ async def create_payment(
         # Save payment
         payment_dict = payment.dict()
         await db.payments.insert_one(payment_dict)
+        await record_fee_payment(db, payment_dict)
         
         # Update student fees (ERP logic: overdue -> pending -> advance)
         await apply_payment_to_student_fees(payment, current_user)
@@ -18677,7 +18343,7 @@ async def create_bulk_payment(
             
             # Create payment for pending amount
             payment_amount = student_fee["pending_amount"]
-            receipt_no = f"RCP{datetime.utcnow().strftime('%Y%m%d')}{uuid.uuid4().hex[:6].upper()}"
+            receipt_no = await allocate_number(db, current_user.tenant_id, Sequence.RECEIPT)
             
             payment = Payment(
                 tenant_id=current_user.tenant_id,
@@ -18698,6 +18364,7 @@ async def create_bulk_payment(
             # Save payment
             payment_dict = payment.dict()
             await db.payments.insert_one(payment_dict)
+            await record_fee_payment(db, payment_dict)
             
             # Update student fees
             await apply_payment_to_student_fees(payment, current_user)
@@ -19361,15 +19028,14 @@ async def create_student_fees_from_config(fee_config: FeeConfiguration, current_
             })
             
             if existing_fee:
-                # Update existing student_fee with new configuration values
-                # Calculate new pending_amount based on what's unpaid
-                old_amount = existing_fee.get("amount", 0)
-                paid_amount = existing_fee.get("paid_amount", 0)
-                old_pending = existing_fee.get("pending_amount", 0)
-                old_overdue = existing_fee.get("overdue_amount", 0)
-                
-                # New pending = new total amount - what's already paid
-                new_pending = max(0, fee_config.amount - paid_amount)
+                # Update existing student_fee with new configuration values and
+                # recompute the unpaid split (pending and overdue together, so an
+                # overdue remainder is not counted again as pending)
+                paid_amount = existing_fee.get("paid_amount", 0) or 0
+                due_at = resolve_due_at({"due_date": fee_config.due_date, "created_at": existing_fee.get("created_at")})
+                was_overdue = (existing_fee.get("overdue_amount", 0) or 0) > 0 or existing_fee.get("status") == "overdue"
+                balances = split_unpaid_amount(fee_config.amount, paid_amount, due_at, was_overdue, datetime.utcnow())
+                await record_student_fee_adjustment(db, existing_fee, fee_config.amount)
                 
                 # Update the student_fee record with new config values
                 await db.student_fees.update_one(
@@ -19377,8 +19043,9 @@ async def create_student_fees_from_config(fee_config: FeeConfiguration, current_
                     {"$set": {
                         "fee_type": fee_config.fee_type,
                         "amount": fee_config.amount,
-                        "pending_amount": new_pending,
+                        **balances,
                         "due_date": fee_config.due_date,
+                        "due_at": due_at,
                         "updated_at": datetime.utcnow()
                     }}
                 )
@@ -19401,8 +19068,12 @@ async def create_student_fees_from_config(fee_config: FeeConfiguration, current_
                 )
                 
                 student_fee_dict = student_fee.dict()
+                # Materialize the due date now so the overdue run picks the fee up
+                # without waiting for the nightly backfill
+                student_fee_dict["due_at"] = resolve_due_at(student_fee_dict)
                 logging.info(f"💾 Creating student_fee for {student['name']}: amount={student_fee_dict.get('amount')}, pending={student_fee_dict.get('pending_amount')}, dict_keys={list(student_fee_dict.keys())}")
                 await db.student_fees.insert_one(student_fee_dict)
+                await record_student_fee_charge(db, student_fee_dict)
                 created_count += 1
         
         logging.info(f"Student fees generated for config {fee_config.id}: {created_count} created, {updated_count} updated")
@@ -19522,7 +19193,9 @@ async def apply_payment_to_student_fees(payment: Payment, current_user: User):
                     status="partial" if pending_amount > 0 else "paid"
                 )
                 
-                await db.student_fees.insert_one(student_fee.dict())
+                student_fee_dict = student_fee.dict()
+                await db.student_fees.insert_one(student_fee_dict)
+                await record_student_fee_charge(db, student_fee_dict)
                 logging.info(f"Created on-the-fly student_fee for {payment.student_name} - {payment.fee_type}")
                 return  # Payment already recorded in the new student_fee
         
@@ -26441,25 +26114,6 @@ async def get_cms_hierarchy(
 # STUDENT RESULT AUTOMATION API ENDPOINTS
 # ============================================================================
 
-def calculate_grade(percentage: float) -> str:
-    """Calculate grade based on percentage"""
-    if percentage >= 90:
-        return "A+"
-    elif percentage >= 80:
-        return "A"
-    elif percentage >= 70:
-        return "B+"
-    elif percentage >= 60:
-        return "B"
-    elif percentage >= 50:
-        return "C+"
-    elif percentage >= 40:
-        return "C"
-    elif percentage >= 33:
-        return "D"
-    else:
-        return "F"
-
 # ==================== EXAM TERM ENDPOINTS ====================
 
 @api_router.get("/exam-terms")
@@ -26746,93 +26400,19 @@ async def create_student_result(
         if current_user.role not in ["super_admin", "admin", "principal", "teacher"]:
             raise HTTPException(status_code=403, detail="Not authorized")
         
-        # Get student details
-        student = await db.students.find_one({
-            "id": result_data.student_id,
-            "tenant_id": current_user.tenant_id,
-            "school_id": current_user.school_id
-        })
-        
-        if not student:
-            raise HTTPException(status_code=404, detail="Student not found")
-        
-        # Get class and section names
-        class_doc = await db.classes.find_one({"id": student.get("class_id")})
-        section_doc = await db.sections.find_one({"id": student.get("section_id")})
-        
-        # Calculate totals and grade
-        subjects = []
-        total_marks = 0
-        total_max_marks = 0
-        
-        for subj in result_data.subjects:
-            subject_marks = SubjectMarks(
-                subject_id=subj.get("subject_id", ""),
-                subject_name=subj.get("subject_name", ""),
-                max_marks=subj.get("max_marks", 100),
-                obtained_marks=subj.get("obtained_marks", 0),
-                passing_marks=subj.get("passing_marks", 33),
-                grade=calculate_grade((subj.get("obtained_marks", 0) / subj.get("max_marks", 100)) * 100) if subj.get("max_marks", 100) > 0 else "F",
-                remarks=subj.get("remarks", "")
-            )
-            subjects.append(subject_marks)
-            total_marks += subject_marks.obtained_marks
-            total_max_marks += subject_marks.max_marks
-        
-        percentage = (total_marks / total_max_marks * 100) if total_max_marks > 0 else 0
-        overall_grade = calculate_grade(percentage)
-        is_pass = percentage >= 33
-        
-        # Check if result already exists
-        existing_result = await db.student_results.find_one({
-            "exam_term_id": result_data.exam_term_id,
+        outcome = await ingest_results(db, current_user, result_data.exam_term_id, [{
             "student_id": result_data.student_id,
-            "tenant_id": current_user.tenant_id,
-            "school_id": current_user.school_id
-        })
+            "subjects": result_data.subjects
+        }])
         
-        if existing_result:
-            # Update existing result
-            update_data = {
-                "subjects": [s.dict() for s in subjects],
-                "total_marks": total_marks,
-                "total_max_marks": total_max_marks,
-                "percentage": round(percentage, 2),
-                "grade": overall_grade,
-                "is_pass": is_pass,
-                "updated_at": datetime.utcnow()
-            }
-            
-            await db.student_results.update_one(
-                {"id": existing_result["id"]},
-                {"$set": update_data}
-            )
-            return {"message": "Result updated successfully", "id": existing_result["id"]}
-        else:
-            # Create new result
-            new_result = StudentResult(
-                tenant_id=current_user.tenant_id,
-                school_id=current_user.school_id,
-                exam_term_id=result_data.exam_term_id,
-                student_id=result_data.student_id,
-                student_name=student.get("name", ""),
-                admission_no=student.get("admission_no", ""),
-                class_id=student.get("class_id", ""),
-                class_name=class_doc.get("name", "") if class_doc else "",
-                section_id=student.get("section_id", ""),
-                section_name=section_doc.get("name", "") if section_doc else "",
-                subjects=subjects,
-                total_marks=total_marks,
-                total_max_marks=total_max_marks,
-                percentage=round(percentage, 2),
-                grade=overall_grade,
-                is_pass=is_pass,
-                entered_by=current_user.id,
-                status="draft"
-            )
-            
-            await db.student_results.insert_one(new_result.dict())
-            return {"message": "Result created successfully", "id": new_result.id}
+        if outcome["errors"]:
+            error = outcome["errors"][0]["error"]
+            raise HTTPException(status_code=404 if error == "Student not found" else 400, detail=error)
+        
+        result_id = outcome["result_ids"][1]
+        if outcome["updated_count"]:
+            return {"message": "Result updated successfully", "id": result_id}
+        return {"message": "Result created successfully", "id": result_id}
     except HTTPException:
         raise
     except Exception as e:
@@ -26852,32 +26432,12 @@ async def bulk_result_entry(
         if current_user.role not in ["super_admin", "admin", "principal", "teacher"]:
             raise HTTPException(status_code=403, detail="Not authorized")
         
-        success_count = 0
-        error_count = 0
+        outcome = await ingest_results(db, current_user, exam_term_id, [{
+            "student_id": item.get("student_id"),
+            "subjects": item.get("subjects", [])
+        } for item in results], class_id=class_id, section_id=section_id)
         
-        for result_item in results:
-            try:
-                student_id = result_item.get("student_id")
-                subjects = result_item.get("subjects", [])
-                
-                # Create result using existing logic
-                result_create = StudentResultCreate(
-                    exam_term_id=exam_term_id,
-                    student_id=student_id,
-                    subjects=subjects
-                )
-                
-                await create_student_result(result_create, current_user)
-                success_count += 1
-            except Exception as e:
-                logger.error(f"Error processing result for student: {e}")
-                error_count += 1
-        
-        return {
-            "message": f"Bulk entry completed",
-            "success_count": success_count,
-            "error_count": error_count
-        }
+        return {"message": "Bulk entry completed", **outcome}
     except HTTPException:
         raise
     except Exception as e:
@@ -26894,7 +26454,7 @@ async def publish_result(
         if current_user.role not in ["super_admin", "admin", "principal"]:
             raise HTTPException(status_code=403, detail="Not authorized to publish results")
         
-        result = await db.student_results.update_one(
+        result = await db.student_results.find_one_and_update(
             {
                 "id": result_id,
                 "tenant_id": current_user.tenant_id,
@@ -26907,13 +26467,19 @@ async def publish_result(
                     "published_at": datetime.utcnow(),
                     "updated_at": datetime.utcnow()
                 }
-            }
+            },
+            projection={"_id": 0, "exam_term_id": 1}
         )
         
-        if result.matched_count == 0:
+        if not result:
             raise HTTPException(status_code=404, detail="Result not found")
         
-        return {"message": "Result published successfully"}
+        # Ranks are recomputed in the background, once per burst of publishes
+        await bump_results_version(db, current_user.tenant_id, current_user.school_id, result["exam_term_id"])
+        job_id = schedule_ranking(db, current_user.tenant_id, current_user.school_id, result["exam_term_id"])
+        schedule_analytics(db, current_user.tenant_id, current_user.school_id, result["exam_term_id"])
+        
+        return {"message": "Result published successfully", "ranking_job_id": job_id}
     except HTTPException:
         raise
     except Exception as e:
@@ -26956,41 +26522,21 @@ async def publish_results_bulk(
             }
         )
         
-        # Calculate ranks for the published results
-        await calculate_ranks(exam_term_id, class_id, section_id, current_user)
+        # Ranks are recomputed for the whole exam term in the background
+        await bump_results_version(db, current_user.tenant_id, current_user.school_id, exam_term_id)
+        job_id = schedule_ranking(db, current_user.tenant_id, current_user.school_id, exam_term_id)
+        schedule_analytics(db, current_user.tenant_id, current_user.school_id, exam_term_id)
         
-        return {"message": f"Published {result.modified_count} results successfully"}
+        return {
+            "message": f"Published {result.modified_count} results successfully",
+            "ranking_job_id": job_id
+        }
     except HTTPException:
         raise
     except Exception as e:
         logger.error(f"Error bulk publishing results: {e}")
         raise HTTPException(status_code=500, detail="Failed to publish results")
 
-async def calculate_ranks(exam_term_id: str, class_id: Optional[str], section_id: Optional[str], current_user: User):
-    """Calculate and update ranks for students in a class/section"""
-    try:
-        query = {
-            "exam_term_id": exam_term_id,
-            "tenant_id": current_user.tenant_id,
-            "school_id": current_user.school_id,
-            "status": "published"
-        }
-        
-        if class_id and class_id != "all_classes":
-            query["class_id"] = class_id
-        if section_id:
-            query["section_id"] = section_id
-        
-        results = await db.student_results.find(query).sort("percentage", -1).to_list(None)
-        
-        for rank, result in enumerate(results, 1):
-            await db.student_results.update_one(
-                {"id": result["id"]},
-                {"$set": {"rank": rank}}
-            )
-    except Exception as e:
-        logger.error(f"Error calculating ranks: {e}")
-
 @api_router.delete("/student-results/{result_id}")
 async def delete_student_result(
     result_id: str,
@@ -27001,15 +26547,19 @@ async def delete_student_result(
         if current_user.role not in ["super_admin", "admin", "principal"]:
             raise HTTPException(status_code=403, detail="Not authorized")
         
-        result = await db.student_results.delete_one({
+        result = await db.student_results.find_one_and_delete({
             "id": result_id,
             "tenant_id": current_user.tenant_id,
             "school_id": current_user.school_id
-        })
+        }, projection={"_id": 0, "exam_term_id": 1, "status": 1})
         
-        if result.deleted_count == 0:
+        if not result:
             raise HTTPException(status_code=404, detail="Result not found")
         
+        await bump_results_version(db, current_user.tenant_id, current_user.school_id, result["exam_term_id"])
+        if result.get("status") == "published":
+            schedule_ranking(db, current_user.tenant_id, current_user.school_id, result["exam_term_id"])
+        
         return {"message": "Result deleted successfully"}
     except HTTPException:
         raise
@@ -27023,93 +26573,30 @@ async def upload_results_excel(
     exam_term_id: str = None,
     class_id: str = None,
     section_id: str = None,
+    background: bool = False,
     current_user: User = Depends(get_current_user)
 ):
-    """Upload results from Excel file"""
+    """Upload results from Excel file (streamed in chunks; background=true runs it as a job)"""
     try:
         if current_user.role not in ["super_admin", "admin", "principal", "teacher"]:
             raise HTTPException(status_code=403, detail="Not authorized")
         
-        if not file.filename.endswith(('.xlsx', '.xls')):
+        if not (file.filename or "").lower().endswith(EXCEL_EXTENSIONS):
             raise HTTPException(status_code=400, detail="Please upload an Excel file (.xlsx or .xls)")
         
-        # Read Excel file
-        contents = await file.read()
-        df = pd.read_excel(io.BytesIO(contents))
-        
-        # Normalize column names to lowercase for easier matching
-        df.columns = [str(c).strip().lower().replace(' ', '_') for c in df.columns]
-        
-        # Find the admission number column (could have different names)
-        admission_col = None
-        possible_admission_cols = ['admission_no', 'admissionno', 'admission_number', 'adm_no', 'admno', 'roll_no', 'rollno', 'student_id']
-        for col in possible_admission_cols:
-            if col in df.columns:
-                admission_col = col
-                break
-        
-        if not admission_col:
-            raise HTTPException(status_code=400, detail="Missing required column: admission_no (or roll_no, student_id)")
-        
-        success_count = 0
-        error_count = 0
-        errors = []
-        
-        # Get subject columns (exclude ID and name columns - those are reference columns)
-        # Column names are already normalized to lowercase with underscores
-        excluded_cols = ['admission_no', 'admissionno', 'admission_number', 'adm_no', 'admno', 
-                        'roll_no', 'rollno', 'roll_number', 'student_id',
-                        'student_name', 'name', 'full_name', 'student']
-        subject_cols = [c for c in df.columns if c not in excluded_cols]
-        
-        for _, row in df.iterrows():
-            try:
-                admission_no = str(row[admission_col]).strip()
-                
-                # Find student by admission number
-                student = await db.students.find_one({
-                    "admission_no": admission_no,
-                    "tenant_id": current_user.tenant_id,
-                    "school_id": current_user.school_id
-                })
-                
-                if not student:
-                    errors.append(f"Student not found: {admission_no}")
-                    error_count += 1
-                    continue
-                
-                # Build subjects list
-                subjects = []
-                for col in subject_cols:
-                    if pd.notna(row.get(col)):
-                        subjects.append({
-                            "subject_name": col,
-                            "subject_id": "",
-                            "obtained_marks": float(row[col]),
-                            "max_marks": 100,
-                            "passing_marks": 33
-                        })
-                
-                # Create result
-                result_create = StudentResultCreate(
-                    exam_term_id=exam_term_id,
-                    student_id=student["id"],
-                    subjects=subjects
-                )
-                
-                await create_student_result(result_create, current_user)
-                success_count += 1
-            except Exception as e:
-                logger.error(f"Error processing row: {e}")
-                error_count += 1
-                errors.append(str(e))
+        exam_term = await db.exam_terms.find_one({
+            "id": exam_term_id,
+            "tenant_id": current_user.tenant_id,
+            "school_id": current_user.school_id
+        }, {"_id": 0, "id": 1})
+        if not exam_term:
+            raise HTTPException(status_code=404, detail="Exam term not found")
         
-        return {
-            "message": "Upload completed",
-            "success_count": success_count,
-            "error_count": error_count,
-            "errors": errors[:10]  # Return first 10 errors
-        }
+        upload = ResultSheetUpload(db, current_user, exam_term_id, class_id=class_id, section_id=section_id)
+        return await process_upload(
+            file, upload, "result_upload", current_user.tenant_id, background=background,
+            extensions=EXCEL_EXTENSIONS, normalize=normalize_result_column
+        )
     except HTTPException:
         raise
     except Exception as e:
@@ -27250,6 +26737,8 @@ class ResultCardSettingsCreate(BaseModel):
     school_logo_url: str = ""
     result_title: str = "Progress Report"
     show_rank: bool = True
+    rank_mode: str = "standard"  # standard (1, 2, 2, 4) or dense (1, 2, 2, 3)
+    rank_tie_breaks: List[str] = ["total_marks", "gpa"]
     show_percentage: bool = True
     show_gpa: bool = True
     show_grade: bool = True
@@ -27307,6 +26796,7 @@ async def create_grading_scheme(
         }
         
         await db.grading_schemes.insert_one(scheme_doc)
+        await invalidate_grading_scheme(db, current_user.tenant_id)
         return sanitize_mongo_data(scheme_doc)
     except HTTPException:
         raise
@@ -27345,6 +26835,7 @@ async def update_grading_scheme(
         
         if result.matched_count == 0:
             raise HTTPException(status_code=404, detail="Grading scheme not found")
+        await invalidate_grading_scheme(db, current_user.tenant_id)
         
         return {"message": "Grading scheme updated successfully"}
     except HTTPException:
@@ -27370,6 +26861,7 @@ async def delete_grading_scheme(
         
         if result.matched_count == 0:
             raise HTTPException(status_code=404, detail="Grading scheme not found")
+        await invalidate_grading_scheme(db, current_user.tenant_id)
         
         return {"message": "Grading scheme deleted successfully"}
     except HTTPException:
@@ -27474,6 +26966,8 @@ async def get_result_card_settings(current_user: User = Depends(get_current_user
                 "school_logo_url": "",
                 "result_title": "Progress Report",
                 "show_rank": True,
+                "rank_mode": "standard",
+                "rank_tie_breaks": ["total_marks", "gpa"],
                 "show_percentage": True,
                 "show_gpa": True,
                 "show_grade": True,
@@ -27500,6 +26994,11 @@ async def save_result_card_settings(
     try:
         if current_user.role not in ["super_admin", "admin", "principal"]:
             raise HTTPException(status_code=403, detail="Not authorized")
+        if settings.rank_mode not in RANK_MODES:
+            raise HTTPException(status_code=400, detail=f"rank_mode must be one of {', '.join(RANK_MODES)}")
+        invalid_tie_breaks = [f for f in settings.rank_tie_breaks if f not in TIE_BREAK_FIELDS]
+        if invalid_tie_breaks:
+            raise HTTPException(status_code=400, detail=f"Unsupported rank tie-breaks: {', '.join(invalid_tie_breaks)}")
         
         existing = await db.result_card_settings.find_one({
             "tenant_id": current_user.tenant_id,
@@ -27514,6 +27013,8 @@ async def save_result_card_settings(
             "school_logo_url": settings.school_logo_url,
             "result_title": settings.result_title,
             "show_rank": settings.show_rank,
+            "rank_mode": settings.rank_mode,
+            "rank_tie_breaks": settings.rank_tie_breaks,
             "show_percentage": settings.show_percentage,
             "show_gpa": settings.show_gpa,
             "show_grade": settings.show_grade,
@@ -27548,50 +27049,6 @@ async def save_result_card_settings(
         logger.error(f"Error saving result card settings: {e}")
         raise HTTPException(status_code=500, detail="Failed to save result card settings")
 
-# Helper function to calculate grade based on percentage
-async def calculate_grade(percentage: float, tenant_id: str, school_id: str) -> dict:
-    """Calculate grade and GPA based on percentage using the default grading scheme"""
-    try:
-        scheme = await db.grading_schemes.find_one({
-            "tenant_id": tenant_id,
-            "school_id": school_id,
-            "is_default": True,
-            "is_active": True
-        })
-        
-        if not scheme:
-            # Default grading if no scheme is configured
-            if percentage >= 90:
-                return {"grade": "A+", "gpa": 10.0, "remarks": "Excellent"}
-            elif percentage >= 80:
-                return {"grade": "A", "gpa": 9.0, "remarks": "Very Good"}
-            elif percentage >= 70:
-                return {"grade": "B+", "gpa": 8.0, "remarks": "Good"}
-            elif percentage >= 60:
-                return {"grade": "B", "gpa": 7.0, "remarks": "Above Average"}
-            elif percentage >= 50:
-                return {"grade": "C+", "gpa": 6.0, "remarks": "Average"}
-            elif percentage >= 40:
-                return {"grade": "C", "gpa": 5.0, "remarks": "Below Average"}
-            elif percentage >= 33:
-                return {"grade": "D", "gpa": 4.0, "remarks": "Pass"}
-            else:
-                return {"grade": "F", "gpa": 0.0, "remarks": "Fail"}
-        
-        # Find matching grade band
-        for band in scheme.get("grade_bands", []):
-            if band["min_percentage"] <= percentage <= band["max_percentage"]:
-                return {
-                    "grade": band["grade"],
-                    "gpa": band.get("gpa", 0.0),
-                    "remarks": band.get("remarks", "")
-                }
-        
-        return {"grade": "F", "gpa": 0.0, "remarks": "Fail"}
-    except Exception as e:
-        logger.error(f"Error calculating grade: {e}")
-        return {"grade": "N/A", "gpa": 0.0, "remarks": ""}
-
 # ============================================================================
 # END RESULT CONFIGURATION API ENDPOINTS
 # ============================================================================
@@ -27704,7 +27161,12 @@ async def update_student_profile(
 
 @api_router.get("/student/fees")
 async def get_student_fees(current_user: User = Depends(get_current_user)):
-    """Get the current student's fee summary and payment history from student_fees collection"""
+    """
+    Get the current student's fee summary and payment history.
+    
+    The ledger totals come from the student's ledger snapshot; total_fees is still
+    the sum of the student's fee amounts, and waived_amount lists waivers separately.
+    """
     try:
         if current_user.role != "student":
             raise HTTPException(status_code=403, detail="This endpoint is for students only")
@@ -27748,21 +27210,10 @@ async def get_student_fees(current_user: User = Depends(get_current_user)):
                 "is_active": True
             }).to_list(50)
         
-        # Calculate totals from student_fees collection (the source of truth for ERP)
-        # Note: student_fees are created by fee configuration workflow, NOT on GET request
-        total_fees = sum(sf.get("amount", 0) for sf in student_fees)
-        paid_amount = sum(sf.get("paid_amount", 0) for sf in student_fees)
-        pending_amount = sum(sf.get("pending_amount", 0) for sf in student_fees)
-        overdue_amount = sum(sf.get("overdue_amount", 0) for sf in student_fees)
-        
-        fee_ledger = {
-            "total_fees": total_fees,
-            "paid_amount": paid_amount,
-            "balance": pending_amount + overdue_amount,
-            "pending_amount": pending_amount,
-            "overdue_amount": overdue_amount,
-            "payments": []
-        }
+        # Totals come from the student's ledger balance snapshot
+        ledger_key = await ensure_student_ledger(db, current_user.tenant_id, student)
+        ledger = await get_ledger_balance(db, current_user.tenant_id, ledger_key)
+        fee_ledger = {**fee_summary(ledger), "payments": []}
         
         # Transform student_fees to fee breakdown for UI
         fee_breakdown = []
@@ -27856,27 +27307,6 @@ async def get_teacher_dashboard(current_user: User = Depends(get_current_user)):
         # Sort today's classes by period number
         todays_classes.sort(key=lambda x: x.get("period_number", 0))
         
-        # Get attendance summary for today (for assigned classes)
-        attendance_today = {"total": 0, "present": 0, "absent": 0, "late": 0}
-        if class_ids:
-            today_str = today.isoformat()
-            attendance_records = await db.attendance.find({
-                "tenant_id": current_user.tenant_id,
-                "class_id": {"$in": list(class_ids)},
-                "date": today_str,
-                "type": "student"
-            }).to_list(500)
-            
-            attendance_today["total"] = len(attendance_records)
-            for record in attendance_records:
-                status = record.get("status", "").lower()
-                if status == "present":
-                    attendance_today["present"] += 1
-                elif status == "absent":
-                    attendance_today["absent"] += 1
-                elif status == "late":
-                    attendance_today["late"] += 1
-        
         # Get pending tasks (marks entry, homework)
         pending_tasks = []
         
@@ -27921,14 +27351,23 @@ async def get_teacher_dashboard(current_user: User = Depends(get_current_user)):
             "is_active": True
         }).sort("created_at", -1).to_list(5)
         
-        # Get student count for assigned classes
+        # Get student count and today's attendance (daily rollups, which include
+        # `student_attendance` marks) for assigned classes
         student_count = 0
+        attendance_today = {"total": 0, "present": 0, "absent": 0, "late": 0}
         if class_ids:
             student_count = await db.students.count_documents({
                 "tenant_id": current_user.tenant_id,
                 "class_id": {"$in": list(class_ids)},
                 "is_active": True
             })
+            rollup = await get_attendance_rollup(
+                db, current_user.tenant_id, today.isoformat(), list(class_ids), enrolled=student_count
+            )
+            attendance_today = {
+                key: rollup[key]
+                for key in ("total", "present", "absent", "late", "half_day", "leave", "not_marked")
+            }
         
         return {
             "teacher": {
@@ -28587,28 +28026,11 @@ async def get_student_dashboard(current_user: User = Depends(get_current_user)):
         present_days = len([a for a in attendance_records if a.get("status") == "present"])
         attendance_percentage = round((present_days / total_days) * 100, 1) if total_days > 0 else 0
         
-        # Get fee status from student_fees collection (the source of truth for ERP)
-        student_fees_records = await db.student_fees.find({
-            "student_id": student_id,
-            "tenant_id": current_user.tenant_id
-        }).to_list(100)
-        
-        # Calculate totals from student_fees collection (the source of truth for ERP)
-        # Note: student_fees are created by fee configuration workflow, NOT on GET request
-        total_fees = sum(sf.get("amount", 0) for sf in student_fees_records)
-        paid_amount = sum(sf.get("paid_amount", 0) for sf in student_fees_records)
-        pending_amount = sum(sf.get("pending_amount", 0) for sf in student_fees_records)
-        overdue_amount = sum(sf.get("overdue_amount", 0) for sf in student_fees_records)
-        balance = pending_amount + overdue_amount
-        
-        fee_status = {
-            "total_fees": total_fees,
-            "paid_amount": paid_amount,
-            "balance": balance,
-            "pending_amount": pending_amount,
-            "overdue_amount": overdue_amount,
-            "has_dues": balance > 0
-        }
+        # Get fee status from the student's ledger balance snapshot
+        ledger_key = await ensure_student_ledger(db, current_user.tenant_id, student)
+        ledger = await get_ledger_balance(db, current_user.tenant_id, ledger_key)
+        fee_status = fee_summary(ledger)
+        fee_status["has_dues"] = fee_status["balance"] > 0
         
         # Get latest result - use status: "published" to match the my-results endpoint
         latest_result = await db.student_results.find_one({
@@ -29110,6 +28532,21 @@ async def startup_db_client():
         await ensure_seed_data()
         logger.info("Seed data initialization completed")
         
+        # Nightly pending -> overdue transition and defaulter snapshot
+        start_overdue_scheduler(db)
+        
+        # Nightly refresh of the rolling attendance features behind AI insights
+        start_feature_scheduler(db)
+        
+        # Monthly punch partitions ahead of time, archival of expired ones
+        start_punch_maintenance_scheduler(db)
+        
+        # Biometric punches -> staff/student day attendance
+        start_punch_reconciler(db)
+        
+        # Pick up SSLCommerz IPNs received but not processed before the last restart
+        await ipn_queue.resume_pending(db)
+        
         # Auto-migration: Add is_active=True to old student_fees records
         try:
             result = await db.student_fees.update_many(
@@ -29126,6 +28563,9 @@ async def startup_db_client():
 
 @app.on_event("shutdown")
 async def shutdown_db_client():
+    await gateway_client.close()
+    await punch_writer.close()
+    await close_pg_pool()
     client.close()
 
 # ==================== QUESTION BANK ENDPOINTS ====================
@@ -32458,195 +31898,6 @@ async def delete_madrasah_simple_routine(
     return {"message": "Routine deleted successfully"}
 
 
-# ============================================================================
-# FEE RECEIPT PDF GENERATION
-# ============================================================================
-
-@api_router.get("/fees/receipt/{receipt_no}/pdf")
-async def generate_fee_receipt_pdf(
-    receipt_no: str,
-    current_user: User = Depends(get_current_user)
-):
-    """Generate PDF receipt for a payment"""
-    from reportlab.lib.pagesizes import A4
-    from reportlab.lib import colors
-    from reportlab.lib.units import inch, cm
-    from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer, Image as RLImage
-    from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-    from reportlab.lib.enums import TA_CENTER, TA_LEFT, TA_RIGHT
-    import io
-    from fastapi.responses import StreamingResponse
-    
-    try:
-        # Get payment details
-        payment = await db.payments.find_one({
-            "receipt_no": receipt_no,
-            "tenant_id": current_user.tenant_id
-        })
-        
-        if not payment:
-            raise HTTPException(status_code=404, detail="Receipt not found")
-        
-        # Get student details
-        student = await db.students.find_one({
-            "id": payment["student_id"],
-            "tenant_id": current_user.tenant_id
-        })
-        
-        # Get school branding from institutions (সহজ সেটিংস)
-        institution = await db.institutions.find_one({"tenant_id": current_user.tenant_id, "is_active": True})
-        
-        school_name = institution.get("school_name") or institution.get("name", "ইন্টারনেট মাদ্রাসা") if institution else "ইন্টারনেট মাদ্রাসা"
-        school_address = institution.get("address", "") if institution else ""
-        school_phone = institution.get("phone", "") if institution else ""
-        school_email = institution.get("email", "") if institution else ""
-        
-        # Get currency
-        currency_code = institution.get("currency", "BDT") if institution else "BDT"
-        currency_symbols = {'BDT': 'Tk ', 'USD': '$', 'EUR': 'EUR ', 'GBP': 'GBP ', 'INR': 'Rs '}
-        currency = currency_symbols.get(currency_code, currency_code + ' ')
-        
-        # Get class name
-        class_name = "N/A"
-        section_name = "N/A"
-        if student:
-            class_doc = await db.classes.find_one({"id": student.get("class_id")})
-            section_doc = await db.sections.find_one({"id": student.get("section_id")})
-            class_name = class_doc.get("name", "N/A") if class_doc else "N/A"
-            section_name = section_doc.get("name", "N/A") if section_doc else "N/A"
-        
-        # Create PDF
-        buffer = io.BytesIO()
-        doc = SimpleDocTemplate(buffer, pagesize=A4, topMargin=0.5*inch, bottomMargin=0.5*inch)
-        
-        styles = getSampleStyleSheet()
-        title_style = ParagraphStyle('Title', parent=styles['Title'], fontSize=18, textColor=colors.HexColor('#1e40af'), alignment=TA_CENTER)
-        header_style = ParagraphStyle('Header', parent=styles['Normal'], fontSize=12, textColor=colors.HexColor('#374151'), alignment=TA_CENTER)
-        normal_style = ParagraphStyle('Normal', parent=styles['Normal'], fontSize=10)
-        bold_style = ParagraphStyle('Bold', parent=styles['Normal'], fontSize=10, fontName='Helvetica-Bold')
-        
-        elements = []
-        
-        # Header
-        elements.append(Paragraph(school_name, title_style))
-        if school_address:
-            elements.append(Paragraph(school_address, header_style))
-        if school_phone or school_email:
-            contact_info = f"Phone: {school_phone}" if school_phone else ""
-            if school_email:
-                contact_info += f" | Email: {school_email}" if contact_info else f"Email: {school_email}"
-            elements.append(Paragraph(contact_info, header_style))
-        
-        elements.append(Spacer(1, 0.3*inch))
-        
-        # Receipt Title
-        elements.append(Paragraph("PAYMENT RECEIPT", ParagraphStyle('ReceiptTitle', parent=styles['Title'], fontSize=16, textColor=colors.HexColor('#059669'), alignment=TA_CENTER)))
-        elements.append(Paragraph(f"Receipt No: {receipt_no}", ParagraphStyle('ReceiptNo', parent=styles['Normal'], fontSize=11, alignment=TA_CENTER, textColor=colors.HexColor('#6b7280'))))
-        
-        elements.append(Spacer(1, 0.2*inch))
-        
-        # Payment date
-        payment_date = payment.get("payment_date", datetime.utcnow())
-        if isinstance(payment_date, str):
-            payment_date = datetime.fromisoformat(payment_date.replace('Z', '+00:00'))
-        
-        # Student & Payment Details Table
-        student_name = student.get("name", "N/A") if student else payment.get("student_name", "N/A")
-        admission_no = student.get("admission_no", "N/A") if student else payment.get("admission_no", "N/A")
-        
-        details_data = [
-            ["Student Name:", student_name, "Date:", payment_date.strftime("%d-%m-%Y")],
-            ["Admission No:", admission_no, "Time:", payment_date.strftime("%I:%M %p")],
-            ["Class:", f"{class_name} - Section {section_name}", "Payment Mode:", payment.get("payment_mode", "Cash")],
-        ]
-        
-        details_table = Table(details_data, colWidths=[1.5*inch, 2.5*inch, 1.3*inch, 2*inch])
-        details_table.setStyle(TableStyle([
-            ('FONTNAME', (0, 0), (0, -1), 'Helvetica-Bold'),
-            ('FONTNAME', (2, 0), (2, -1), 'Helvetica-Bold'),
-            ('FONTSIZE', (0, 0), (-1, -1), 10),
-            ('TEXTCOLOR', (0, 0), (0, -1), colors.HexColor('#374151')),
-            ('TEXTCOLOR', (2, 0), (2, -1), colors.HexColor('#374151')),
-            ('BOTTOMPADDING', (0, 0), (-1, -1), 8),
-        ]))
-        elements.append(details_table)
-        
-        elements.append(Spacer(1, 0.3*inch))
-        
-        # Payment Details
-        payment_data = [
-            ["Description", "Amount"],
-            [payment.get("fee_type", "Fee Payment"), f"{currency}{payment.get('amount', 0):,.2f}"],
-        ]
-        
-        if payment.get("transaction_id"):
-            payment_data.append(["Transaction ID", payment.get("transaction_id")])
-        
-        payment_data.append(["", ""])
-        payment_data.append(["Total Amount Paid", f"{currency}{payment.get('amount', 0):,.2f}"])
-        
-        payment_table = Table(payment_data, colWidths=[4.5*inch, 2.5*inch])
-        payment_table.setStyle(TableStyle([
-            ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#059669')),
-            ('TEXTCOLOR', (0, 0), (-1, 0), colors.white),
-            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-            ('FONTSIZE', (0, 0), (-1, -1), 10),
-            ('ALIGN', (1, 0), (1, -1), 'RIGHT'),
-            ('GRID', (0, 0), (-1, -2), 0.5, colors.HexColor('#e5e7eb')),
-            ('BACKGROUND', (0, -1), (-1, -1), colors.HexColor('#ecfdf5')),
-            ('FONTNAME', (0, -1), (-1, -1), 'Helvetica-Bold'),
-            ('TEXTCOLOR', (0, -1), (-1, -1), colors.HexColor('#059669')),
-            ('BOTTOMPADDING', (0, 0), (-1, -1), 10),
-            ('TOPPADDING', (0, 0), (-1, -1), 10),
-        ]))
-        elements.append(payment_table)
-        
-        elements.append(Spacer(1, 0.3*inch))
-        
-        # Remarks
-        if payment.get("remarks"):
-            elements.append(Paragraph(f"<b>Remarks:</b> {payment.get('remarks')}", normal_style))
-            elements.append(Spacer(1, 0.2*inch))
-        
-        # Footer
-        elements.append(Spacer(1, 0.5*inch))
-        
-        footer_data = [
-            ["", "Authorized Signature"],
-            ["", "_____________________"],
-        ]
-        footer_table = Table(footer_data, colWidths=[4.5*inch, 2.5*inch])
-        footer_table.setStyle(TableStyle([
-            ('ALIGN', (1, 0), (1, -1), 'CENTER'),
-            ('FONTSIZE', (0, 0), (-1, -1), 9),
-            ('TEXTCOLOR', (0, 0), (-1, -1), colors.HexColor('#6b7280')),
-        ]))
-        elements.append(footer_table)
-        
-        elements.append(Spacer(1, 0.3*inch))
-        elements.append(Paragraph("This is a computer-generated receipt and does not require a physical signature.", 
-                                  ParagraphStyle('Footer', parent=styles['Normal'], fontSize=8, alignment=TA_CENTER, textColor=colors.HexColor('#9ca3af'))))
-        elements.append(Paragraph(f"Generated on {datetime.utcnow().strftime('%d-%m-%Y %I:%M %p')}", 
-                                  ParagraphStyle('Footer', parent=styles['Normal'], fontSize=8, alignment=TA_CENTER, textColor=colors.HexColor('#9ca3af'))))
-        
-        # Build PDF
-        doc.build(elements)
-        buffer.seek(0)
-        
-        return StreamingResponse(
-            buffer,
-            media_type="application/pdf",
-            headers={
-                "Content-Disposition": f"attachment; filename=Receipt-{receipt_no}.pdf"
-            }
-        )
-        
-    except HTTPException:
-        raise
-    except Exception as e:
-        logging.error(f"Failed to generate receipt PDF: {str(e)}")
-        raise HTTPException(status_code=500, detail="Failed to generate receipt")
-
 @api_router.get("/student/payments")
 async def get_student_payments(
     current_user: User = Depends(get_current_user)
@@ -34023,6 +33274,40 @@ setup_attendance_session_routes(api_router, db, get_current_user, User)
 # Setup payment gateway routes
 setup_payment_gateway_routes(api_router, db, get_current_user)
 
+# Setup fee overdue engine routes
+setup_fee_overdue_routes(api_router, db, get_current_user)
+
+# Setup student fee ledger routes
+setup_student_ledger_routes(api_router, db, get_current_user)
+
+# Setup fee receipt PDF routes
+setup_fee_receipt_routes(api_router, db, get_current_user)
+
+# Setup monthly attendance bitmap routes
+setup_attendance_bitmap_routes(api_router, db, get_current_user)
+
+# Setup daily attendance rollup routes
+setup_attendance_rollup_routes(api_router, db, get_current_user)
+
+# Setup attendance feature (AI insights) routes
+setup_attendance_feature_routes(api_router, db, get_current_user)
+
+# Setup biometric punch store routes; first punches are classified with the tenant's attendance rules
+setup_punch_store_routes(api_router, db, get_current_user)
+punch_writer.set_rules_loader(lambda tenant_id: get_compiled_attendance_rules(db, tenant_id))
+
+# Setup punch reconciler routes
+setup_punch_reconciler_routes(api_router, db, get_current_user)
+
+# Setup live attendance feed routes (SSE / WebSocket, short-lived ?token= for browsers)
+setup_live_feed_routes(api_router, db, get_current_user, get_user_from_token, create_access_token)
+
+# Setup result ranking routes (section, class and merit ranks per exam term)
+setup_result_ranking_routes(api_router, db, get_current_user)
+
+# Setup promotion engine routes (rule-based year-end promotion runs)
+setup_promotion_routes(api_router, db, get_current_user)
+
 app.include_router(api_router)
 
 # Serve React frontend static files in production (catch-all route)
@@ -0,0 +1,214 @@
+"""
+Streaming Spreadsheet Uploads
+Upload pipeline for large Excel/CSV imports (results upload, staff import).
+
+- The upload is spooled to a temporary file in 1 MiB blocks instead of being
+  read into memory
+- .xlsx sheets are read with a read-only openpyxl workbook and .csv files with a
+  streaming csv reader, so rows are parsed lazily; legacy .xls files (not
+  supported by openpyxl) fall back to pandas
+- Rows are handed to an upload processor in fixed-size chunks; the processor
+  validates each chunk and writes it with its bulk writer, so memory stays
+  flat regardless of the sheet size
+- With `background=True` the import runs as a job_queue job and reports rows
+  processed as progress; otherwise it runs inline and returns the summary
+
+A processor implements:
+    prepare(headers)        validate the header row (raise HTTPException 400)
+    await process(chunk)    chunk is a list of (sheet row number, {column: value})
+    summary(total_rows)     final result dict
+"""
+
+import asyncio
+import csv
+import logging
+import os
+import tempfile
+from typing import Callable, Iterator, List, Optional, Tuple
+
+from fastapi import HTTPException, UploadFile
+
+from job_queue import job_queue
+
+logger = logging.getLogger(__name__)
+
+SPOOL_BLOCK_BYTES = 1024 * 1024
+ROW_CHUNK_SIZE = 1000
+EXCEL_EXTENSIONS = (".xlsx", ".xls")
+SPREADSHEET_EXTENSIONS = (".csv", ".xlsx", ".xls")
+
+Chunk = List[Tuple[int, dict]]
+
+
+def normalize_header(value) -> str:
+    """Column name in snake_case: 'Date of Joining' -> 'date_of_joining'"""
+    return str(value).strip().lower().replace(" ", "_").replace("-", "_").replace("(", "").replace(")", "")
+
+
+def _is_blank(value) -> bool:
+    return value is None or (isinstance(value, str) and not value.strip())
+
+
+# ================================
+# SPOOLING
+# ================================
+
+async def spool_upload(file: UploadFile, extensions=SPREADSHEET_EXTENSIONS) -> str:
+    """Copy an upload to a temporary file block by block; returns its path"""
+    filename = (file.filename or "").lower()
+    suffix = next((ext for ext in extensions if filename.endswith(ext)), None)
+    if not suffix:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Unsupported file format. Use {', '.join(extensions)}"
+        )
+
+    spooled = tempfile.NamedTemporaryFile(delete=False, suffix=suffix, prefix="upload_")
+    try:
+        with spooled:
+            while True:
+                block = await file.read(SPOOL_BLOCK_BYTES)
+                if not block:
+                    break
+                spooled.write(block)
+    except Exception:
+        os.remove(spooled.name)
+        raise
+    return spooled.name
+
+
+# ================================
+# READING
+# ================================
+
+class SheetReader:
+    """Header row and lazily parsed data rows of a spooled spreadsheet"""
+
+    def __init__(self, path: str, normalize: Callable = normalize_header):
+        self.path = path
+        self.normalize = normalize
+        self.headers: List[str] = []
+        self.estimated_rows = 0
+        self._workbook = None
+        self._handle = None
+        self._rows: Optional[Iterator[tuple]] = None
+
+    def open(self):
+        """Read the header row and estimate the number of data rows (blocking)"""
+        if self.path.endswith(".xlsx"):
+            from openpyxl import load_workbook
+
+            self._workbook = load_workbook(self.path, read_only=True, data_only=True)
+            sheet = self._workbook.active
+            self.estimated_rows = max((sheet.max_row or 1) - 1, 0)
+            self._rows = sheet.iter_rows(values_only=True)
+        elif self.path.endswith(".csv"):
+            with open(self.path, "rb") as raw:
+                lines = sum(block.count(b"\n") for block in iter(lambda: raw.read(SPOOL_BLOCK_BYTES), b""))
+            self.estimated_rows = max(lines - 1, 0)
+            self._handle = open(self.path, newline="", encoding="utf-8-sig")
+            self._rows = csv.reader(self._handle)
+        else:
+            import pandas as pd
+
+            frame = pd.read_excel(self.path, header=None, dtype=object)
+            frame = frame.astype(object).where(frame.notna(), None)
+            self.estimated_rows = max(len(frame) - 1, 0)
+            self._rows = frame.itertuples(index=False, name=None)
+
+        header = next(self._rows, None) or ()
+        self.headers = [None if _is_blank(h) else self.normalize(h) for h in header]
+
+    def chunks(self, size: int = ROW_CHUNK_SIZE) -> Iterator[Chunk]:
+        """Non-empty data rows as {column: value}, `size` rows at a time"""
+        chunk: Chunk = []
+        columns = [(i, name) for i, name in enumerate(self.headers) if name]
+        for number, values in enumerate(self._rows, 2):
+            record = {name: values[i] if i < len(values) else None for i, name in columns}
+            if all(_is_blank(v) for v in record.values()):
+                continue
+            chunk.append((number, record))
+            if len(chunk) >= size:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
+
+    def close(self):
+        if self._workbook is not None:
+            self._workbook.close()
+        if self._handle is not None:
+            self._handle.close()
+        try:
+            os.remove(self.path)
+        except OSError:
+            pass
+
+
+# ================================
+# PROCESSING
+# ================================
+
+async def stream_sheet(job_id: Optional[str], reader: SheetReader, processor, chunk_size: int = ROW_CHUNK_SIZE) -> dict:
+    """Feed every chunk of an opened sheet to the processor; removes the spooled file"""
+    processed = 0
+    try:
+        chunks = reader.chunks(chunk_size)
+        while True:
+            chunk = await asyncio.to_thread(next, chunks, None)
+            if chunk is None:
+                break
+            await processor.process(chunk)
+            processed += len(chunk)
+            if job_id:
+                job = job_queue.get_job(job_id)
+                if job and processed > job.total:
+                    job.total = processed
+                job_queue.update_progress(job_id, processed)
+    finally:
+        await asyncio.to_thread(reader.close)
+    return processor.summary(processed)
+
+
+async def process_upload(
+    file: UploadFile,
+    processor,
+    job_type: str,
+    tenant_id: str,
+    background: bool = False,
+    extensions=SPREADSHEET_EXTENSIONS,
+    normalize: Callable = normalize_header,
+    chunk_size: int = ROW_CHUNK_SIZE,
+) -> dict:
+    """
+    Spool, open and validate an uploaded sheet, then stream it through the processor.
+
+    Inline uploads return the processor summary. Background uploads return the
+    job id; the summary becomes the job result.
+    """
+    path = await spool_upload(file, extensions)
+    reader = SheetReader(path, normalize)
+    try:
+        await asyncio.to_thread(reader.open)
+        if not any(reader.headers):
+            raise HTTPException(status_code=400, detail="No data found in file")
+        processor.prepare([h for h in reader.headers if h])
+    except HTTPException:
+        await asyncio.to_thread(reader.close)
+        raise
+    except Exception as e:
+        await asyncio.to_thread(reader.close)
+        logger.error(f"Failed to open uploaded sheet {file.filename}: {e}")
+        raise HTTPException(status_code=400, detail="Could not read the uploaded file")
+
+    if not background:
+        return await stream_sheet(None, reader, processor, chunk_size)
+
+    job = job_queue.create_job(job_type, tenant_id, total=reader.estimated_rows)
+    asyncio.create_task(job_queue.run_job(job.id, stream_sheet, reader, processor, chunk_size))
+    return {
+        "job_id": job.id,
+        "message": "Upload is being processed in the background",
+        "status_url": f"/api/jobs/{job.id}",
+        "estimated_rows": reader.estimated_rows
+    }
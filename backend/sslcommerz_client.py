@@ -0,0 +1,357 @@
+"""
+Async SSLCommerz Gateway Client
+Non-blocking HTTP client for SSLCommerz session initiation and transaction validation.
+
+- One pooled aiohttp session per worker (keep-alive connections to the gateway)
+- Per-request timeouts, retries with backoff and a circuit breaker per gateway host
+- IPN signatures (verify_sign) are checked with verify_ipn_signature before a
+  notification is accepted
+- Idempotent IPN queue: notifications are stored in `sslcommerz_ipn` deduplicated
+  by (tran_id, val_id) and processed by a background worker
+
+Set SSLCOMMERZ_BASE_URL (e.g. http://127.0.0.1:8099) to point every call at the
+bundled local stub (sslcommerz_stub.py) for offline load testing.
+"""
+
+import asyncio
+import hashlib
+import hmac
+import logging
+import os
+import time
+import uuid
+from datetime import datetime, timedelta
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+import aiohttp
+from pymongo.errors import DuplicateKeyError
+
+logger = logging.getLogger(__name__)
+
+SANDBOX_URL = "https://sandbox.sslcommerz.com"
+LIVE_URL = "https://securepay.sslcommerz.com"
+
+GATEWAY_TIMEOUT_SECONDS = float(os.environ.get("SSLCOMMERZ_TIMEOUT", "15"))
+GATEWAY_MAX_CONNECTIONS = int(os.environ.get("SSLCOMMERZ_MAX_CONNECTIONS", "50"))
+GATEWAY_RETRIES = 2
+CIRCUIT_FAILURE_THRESHOLD = 5
+CIRCUIT_RESET_SECONDS = 30
+IPN_RESUME_LEASE_SECONDS = 300
+IPN_STALE_SECONDS = 300
+IPN_RETRY_MAX_SECONDS = 1800
+
+
+class GatewayUnavailableError(Exception):
+    """Raised when the gateway cannot be reached or the circuit is open"""
+
+
+def gateway_base_url(is_sandbox: bool = True) -> str:
+    """Gateway base URL, overridable for the local stub"""
+    override = os.environ.get("SSLCOMMERZ_BASE_URL")
+    if override:
+        return override.rstrip("/")
+    return SANDBOX_URL if is_sandbox else LIVE_URL
+
+
+class CircuitBreaker:
+    """Opens after consecutive failures, then lets exactly one probe through after a cooldown"""
+
+    def __init__(self, failure_threshold: int = CIRCUIT_FAILURE_THRESHOLD, reset_seconds: float = CIRCUIT_RESET_SECONDS):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self.probing = False
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_seconds:
+            return "half_open"
+        return "open"
+
+    def allow_request(self) -> bool:
+        state = self.state
+        if state == "closed":
+            return True
+        if state == "open" or self.probing:
+            return False
+        # Half-open: this caller is the probe; everyone else waits for its outcome
+        self.probing = True
+        return True
+
+    def record_success(self):
+        self.failures = 0
+        self.opened_at = None
+        self.probing = False
+
+    def record_failure(self):
+        self.failures += 1
+        self.probing = False
+        if self.failures >= self.failure_threshold:
+            self.opened_at = time.monotonic()
+
+    def release_probe(self):
+        """Give up the probe slot without an outcome (e.g. the request was cancelled)"""
+        self.probing = False
+
+
+def verify_ipn_signature(form: Dict[str, Any], store_passwd: str) -> bool:
+    """
+    Check an IPN/callback verify_sign the way the gateway computes it: the fields
+    listed in verify_key plus store_passwd=md5(store password), sorted by name,
+    joined as key=value pairs and hashed with md5.
+    """
+    verify_sign = form.get("verify_sign")
+    verify_key = form.get("verify_key")
+    if not verify_sign or not verify_key or not store_passwd:
+        return False
+
+    fields = {name: str(form.get(name, "")) for name in verify_key.split(",") if name}
+    fields["store_passwd"] = hashlib.md5(store_passwd.encode()).hexdigest()
+    hash_string = "&".join(f"{name}={fields[name]}" for name in sorted(fields))
+    return hmac.compare_digest(hashlib.md5(hash_string.encode()).hexdigest(), str(verify_sign))
+
+
+class SSLCommerzClient:
+    """Pooled async client shared by all SSLCommerz calls in a worker"""
+
+    def __init__(self):
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._breakers: Dict[str, CircuitBreaker] = {}
+
+    async def _get_session(self) -> aiohttp.ClientSession:
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=GATEWAY_MAX_CONNECTIONS, keepalive_timeout=60),
+                timeout=aiohttp.ClientTimeout(total=GATEWAY_TIMEOUT_SECONDS)
+            )
+        return self._session
+
+    def _breaker(self, base_url: str) -> CircuitBreaker:
+        return self._breakers.setdefault(base_url, CircuitBreaker())
+
+    async def _request(self, method: str, base_url: str, path: str, retry_on_response_errors: bool, **kwargs) -> Dict[str, Any]:
+        breaker = self._breaker(base_url)
+        if not breaker.allow_request():
+            raise GatewayUnavailableError("Payment gateway temporarily unavailable")
+
+        try:
+            session = await self._get_session()
+            last_error: Optional[Exception] = None
+            for attempt in range(GATEWAY_RETRIES + 1):
+                try:
+                    async with session.request(method, f"{base_url}{path}", **kwargs) as response:
+                        if response.status >= 500:
+                            raise aiohttp.ClientResponseError(
+                                response.request_info, response.history, status=response.status
+                            )
+                        data = await response.json(content_type=None)
+                    breaker.record_success()
+                    return data
+                except aiohttp.ClientConnectionError as e:
+                    # Connection never carried a response: always safe to retry
+                    last_error = e
+                except (aiohttp.ClientResponseError, asyncio.TimeoutError) as e:
+                    last_error = e
+                    if not retry_on_response_errors:
+                        break
+                if attempt < GATEWAY_RETRIES:
+                    await asyncio.sleep(0.2 * (2 ** attempt))
+
+            breaker.record_failure()
+            logger.error(f"SSLCommerz {method} {path} failed: {last_error}")
+            raise GatewayUnavailableError(f"Payment gateway error: {last_error}")
+        finally:
+            # A half-open probe that ended without an outcome frees the slot
+            breaker.release_probe()
+
+    async def initiate_session(self, base_url: str, params: Dict[str, Any]) -> Dict[str, Any]:
+        """Create a gateway session; returns the raw gateway response"""
+        # Not retried after a response error: the gateway may already have created the session
+        return await self._request(
+            "POST", base_url, "/gwprocess/v4/api.php",
+            retry_on_response_errors=False, data=params
+        )
+
+    async def validate_transaction(self, base_url: str, val_id: str, store_id: str, store_passwd: str) -> Dict[str, Any]:
+        """Validate a transaction by val_id (read-only, safe to retry)"""
+        return await self._request(
+            "GET", base_url, "/validator/api/validationserverAPI.php",
+            retry_on_response_errors=True,
+            params={"val_id": val_id, "store_id": store_id, "store_passwd": store_passwd, "format": "json"}
+        )
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            base_url: {"state": breaker.state, "consecutive_failures": breaker.failures}
+            for base_url, breaker in self._breakers.items()
+        }
+
+    async def close(self):
+        if self._session and not self._session.closed:
+            await self._session.close()
+
+
+# Global client instance (one pooled session per worker)
+gateway_client = SSLCommerzClient()
+
+
+# ================================
+# IPN QUEUE
+# ================================
+
+IpnHandler = Callable[[Any, Dict[str, Any]], Awaitable[str]]
+
+
+class IpnQueue:
+    """
+    Durable, idempotent IPN processing.
+
+    Each notification is inserted into `sslcommerz_ipn` first; the unique
+    (tran_id, val_id) index makes repeated deliveries no-ops. A background
+    worker then claims queued notifications and hands them to the handler
+    registered for their kind. A notification parked by a gateway outage is
+    put back on the queue after a backoff delay.
+    """
+
+    def __init__(self):
+        self._handlers: Dict[str, IpnHandler] = {}
+        self._queue: Optional[asyncio.Queue] = None
+        self._worker: Optional[asyncio.Task] = None
+        self._db = None
+        self._holder = f"{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._retries = set()
+
+    def register_handler(self, kind: str, handler: IpnHandler):
+        self._handlers[kind] = handler
+
+    async def enqueue(self, db, kind: str, form: Dict[str, Any]) -> bool:
+        """Store an IPN; returns False when it was already received"""
+        doc = {
+            "kind": kind,
+            "tran_id": form.get("tran_id"),
+            "val_id": form.get("val_id") or "",
+            "payload": form,
+            "status": "queued",
+            "attempts": 0,
+            "received_at": datetime.utcnow()
+        }
+        try:
+            result = await db.sslcommerz_ipn.insert_one(doc)
+        except DuplicateKeyError:
+            logger.info(f"Duplicate IPN ignored: {doc['tran_id']} / {doc['val_id']}")
+            # A redelivery retries a notification parked by a gateway outage
+            parked = await db.sslcommerz_ipn.find_one(
+                {"tran_id": doc["tran_id"], "val_id": doc["val_id"], "status": "queued"}, {"_id": 1}
+            )
+            if parked:
+                self._ensure_worker(db)
+                await self._queue.put(parked["_id"])
+            return False
+
+        self._ensure_worker(db)
+        await self._queue.put(result.inserted_id)
+        return True
+
+    def _ensure_worker(self, db):
+        self._db = db
+        if self._queue is None:
+            self._queue = asyncio.Queue()
+        if self._worker is None or self._worker.done():
+            self._worker = asyncio.create_task(self._run())
+
+    async def _claim_resume_lease(self, db) -> bool:
+        """Only one worker process resumes the queue at a time"""
+        now = datetime.utcnow()
+        lease = {"holder": self._holder, "expires_at": now + timedelta(seconds=IPN_RESUME_LEASE_SECONDS)}
+        result = await db.scheduler_locks.update_one(
+            {"_id": "sslcommerz_ipn_resume", "$or": [{"holder": self._holder}, {"expires_at": {"$lt": now}}]},
+            {"$set": lease}
+        )
+        if result.matched_count:
+            return True
+        try:
+            await db.scheduler_locks.insert_one({"_id": "sslcommerz_ipn_resume", **lease})
+            return True
+        except DuplicateKeyError:
+            return False
+
+    async def resume_pending(self, db):
+        """Re-queue notifications left unprocessed by a previous process"""
+        self._ensure_worker(db)
+        if not await self._claim_resume_lease(db):
+            return
+        # Only notifications stuck in "processing" for longer than any handler runs
+        # were interrupted; newer ones belong to a live worker. Handlers are idempotent
+        stale_before = datetime.utcnow() - timedelta(seconds=IPN_STALE_SECONDS)
+        await db.sslcommerz_ipn.update_many(
+            {"status": "processing", "started_at": {"$lt": stale_before}},
+            {"$set": {"status": "queued"}}
+        )
+        pending = await db.sslcommerz_ipn.find({"status": "queued"}, {"_id": 1}).to_list(None)
+        for doc in pending:
+            await self._queue.put(doc["_id"])
+        if pending:
+            logger.info(f"Resumed {len(pending)} pending IPN notifications")
+
+    async def _run(self):
+        while True:
+            ipn_id = await self._queue.get()
+            try:
+                await self._process(ipn_id)
+            except Exception as e:
+                logger.error(f"IPN processing crashed for {ipn_id}: {e}")
+            finally:
+                self._queue.task_done()
+
+    async def _process(self, ipn_id):
+        db = self._db
+        ipn = await db.sslcommerz_ipn.find_one_and_update(
+            {"_id": ipn_id, "status": "queued"},
+            {"$set": {"status": "processing", "started_at": datetime.utcnow()}, "$inc": {"attempts": 1}}
+        )
+        if not ipn:
+            return
+
+        handler = self._handlers.get(ipn["kind"])
+        if handler is None:
+            await db.sslcommerz_ipn.update_one({"_id": ipn_id}, {"$set": {"status": "failed", "error": "no handler"}})
+            return
+
+        try:
+            outcome = await handler(db, ipn["payload"])
+            await db.sslcommerz_ipn.update_one(
+                {"_id": ipn_id},
+                {"$set": {"status": "processed", "outcome": outcome, "processed_at": datetime.utcnow()}}
+            )
+        except GatewayUnavailableError as e:
+            # Park it queued and retry with backoff (a redelivery or restart picks it up sooner)
+            delay = min(CIRCUIT_RESET_SECONDS * 2 ** (ipn.get("attempts", 0)), IPN_RETRY_MAX_SECONDS)
+            await db.sslcommerz_ipn.update_one(
+                {"_id": ipn_id},
+                {"$set": {"status": "queued", "error": str(e), "retry_at": datetime.utcnow() + timedelta(seconds=delay)}}
+            )
+            self._retry_later(ipn_id, delay)
+        except Exception as e:
+            logger.error(f"IPN handler failed for {ipn.get('tran_id')}: {e}")
+            await db.sslcommerz_ipn.update_one({"_id": ipn_id}, {"$set": {"status": "failed", "error": str(e)}})
+
+    def _retry_later(self, ipn_id, delay: float):
+        async def requeue():
+            await asyncio.sleep(delay)
+            await self._queue.put(ipn_id)
+
+        task = asyncio.create_task(requeue())
+        self._retries.add(task)
+        task.add_done_callback(self._retries.discard)
+
+    async def drain(self):
+        """Wait until every queued notification has been processed"""
+        if self._queue is not None:
+            await self._queue.join()
+
+
+# Global IPN queue instance
+ipn_queue = IpnQueue()
@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+"""
+Local SSLCommerz Gateway Stub
+Mimics the SSLCommerz session, checkout and validation APIs so the online fee
+payment flow can be exercised and load-tested without network access.
+
+Usage:
+    python sslcommerz_stub.py                       # listens on 127.0.0.1:8099
+    SSLCOMMERZ_BASE_URL=http://127.0.0.1:8099 uvicorn server:app ...
+
+Knobs (environment):
+    STUB_PORT          port to listen on (default 8099)
+    STUB_LATENCY_MS    artificial latency added to every API call (default 0)
+    STUB_FAILURE_RATE  fraction of API calls answered with HTTP 503 (default 0)
+    STUB_DUPLICATE_IPN number of times each IPN is delivered (default 2)
+"""
+
+import asyncio
+import hashlib
+import html
+import os
+import random
+import uuid
+from datetime import datetime
+from typing import Dict
+
+import aiohttp
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import HTMLResponse, JSONResponse
+
+LATENCY_MS = int(os.environ.get("STUB_LATENCY_MS", "0"))
+FAILURE_RATE = float(os.environ.get("STUB_FAILURE_RATE", "0"))
+DUPLICATE_IPN = int(os.environ.get("STUB_DUPLICATE_IPN", "2"))
+
+app = FastAPI(title="SSLCommerz Stub")
+
+# sessionkey -> session, val_id -> validated transaction
+sessions: Dict[str, Dict] = {}
+validations: Dict[str, Dict] = {}
+
+SIGNED_FIELDS = ["tran_id", "val_id", "amount", "currency", "status", "store_amount"]
+
+
+async def _simulate_network():
+    if LATENCY_MS:
+        await asyncio.sleep(LATENCY_MS / 1000)
+    if FAILURE_RATE and random.random() < FAILURE_RATE:
+        raise HTTPException(status_code=503, detail="Stub gateway failure")
+
+
+def _sign(fields: Dict[str, str], store_passwd: str) -> Dict[str, str]:
+    """Add verify_key/verify_sign the way the gateway does (see verify_ipn_signature)"""
+    signed = {name: str(fields.get(name, "")) for name in SIGNED_FIELDS}
+    signed["store_passwd"] = hashlib.md5(store_passwd.encode()).hexdigest()
+    hash_string = "&".join(f"{name}={signed[name]}" for name in sorted(signed))
+    return {
+        **fields,
+        "verify_key": ",".join(SIGNED_FIELDS),
+        "verify_sign": hashlib.md5(hash_string.encode()).hexdigest()
+    }
+
+
+@app.post("/gwprocess/v4/api.php")
+async def create_session(request: Request):
+    await _simulate_network()
+    form = dict(await request.form())
+
+    missing = [f for f in ("store_id", "store_passwd", "total_amount", "tran_id", "success_url") if not form.get(f)]
+    if missing:
+        return {"status": "FAILED", "failedreason": f"Missing fields: {', '.join(missing)}"}
+
+    sessionkey = uuid.uuid4().hex.upper()
+    sessions[sessionkey] = form
+    return {
+        "status": "SUCCESS",
+        "sessionkey": sessionkey,
+        "GatewayPageURL": f"{str(request.base_url).rstrip('/')}/gwprocess/v4/pay/{sessionkey}"
+    }
+
+
+@app.get("/gwprocess/v4/pay/{sessionkey}", response_class=HTMLResponse)
+async def checkout(sessionkey: str, outcome: str = "success"):
+    """Customer checkout: completes the payment, fires the IPN and posts back to the merchant"""
+    session = sessions.get(sessionkey)
+    if not session:
+        raise HTTPException(status_code=404, detail="Unknown session")
+
+    status = "VALID" if outcome == "success" else "FAILED"
+    val_id = uuid.uuid4().hex[:16].upper() if status == "VALID" else ""
+    fields = {
+        "tran_id": session["tran_id"],
+        "val_id": val_id,
+        "amount": str(session["total_amount"]),
+        "store_amount": str(round(float(session["total_amount"]) * 0.975, 2)),
+        "currency": session.get("currency", "BDT"),
+        "status": status,
+        "tran_date": datetime.utcnow().strftime("%Y-%m-%d %H:%M:%S"),
+        "card_type": "STUB-VISA"
+    }
+    if val_id:
+        validations[val_id] = {**fields, "store_id": session["store_id"], "store_passwd": session["store_passwd"]}
+    payload = _sign(fields, session["store_passwd"])
+
+    if session.get("ipn_url"):
+        asyncio.create_task(_deliver_ipn(session["ipn_url"], payload))
+
+    target = session["success_url"] if status == "VALID" else session.get("fail_url", session["success_url"])
+    inputs = "".join(
+        f'<input type="hidden" name="{html.escape(k)}" value="{html.escape(str(v))}">' for k, v in payload.items()
+    )
+    return (
+        f'<html><body onload="document.forms[0].submit()">'
+        f'<form method="post" action="{html.escape(target)}">{inputs}'
+        f'<noscript><button type="submit">Continue</button></noscript></form></body></html>'
+    )
+
+
+async def _deliver_ipn(ipn_url: str, payload: Dict[str, str]):
+    # Real gateways retry notifications, so deliver more than once to exercise dedupe
+    async with aiohttp.ClientSession() as session:
+        for _ in range(max(1, DUPLICATE_IPN)):
+            try:
+                async with session.post(ipn_url, data=payload) as response:
+                    await response.read()
+            except aiohttp.ClientError:
+                pass
+            await asyncio.sleep(0.1)
+
+
+@app.get("/validator/api/validationserverAPI.php")
+async def validate(val_id: str, store_id: str, store_passwd: str, format: str = "json"):
+    await _simulate_network()
+    transaction = validations.get(val_id)
+    if not transaction or transaction["store_id"] != store_id or transaction["store_passwd"] != store_passwd:
+        return JSONResponse({"status": "INVALID_TRANSACTION"})
+
+    result = {k: v for k, v in transaction.items() if k != "store_passwd"}
+    result["status"] = "VALIDATED" if transaction.get("validated") else "VALID"
+    transaction["validated"] = True
+    return result
+
+
+if __name__ == "__main__":
+    import uvicorn
+    uvicorn.run(app, host="127.0.0.1", port=int(os.environ.get("STUB_PORT", "8099")))
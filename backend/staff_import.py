@@ -0,0 +1,151 @@
+"""
+Staff Import
+Upload processor (see spreadsheet_upload) behind /staff/import.
+
+Each chunk of rows is validated in memory; the emails of the chunk are checked
+against active staff with one $in query, duplicates inside the file are tracked
+across chunks, and the valid rows are written with one insert_many. Employee ids
+left blank are allocated from the atomic employee counter (see counters), so an
+import running next to other imports or manual creates never reuses an id.
+
+Rows with a missing name or email, or a salary / experience that is not a number,
+are reported as row errors; the file itself must have name and email columns.
+"""
+
+import logging
+import math
+import re
+import uuid
+from datetime import datetime
+from typing import List
+
+from fastapi import HTTPException
+
+from counters import Sequence, allocate_number, max_numeric_suffix, number_prefix
+
+logger = logging.getLogger(__name__)
+
+MAX_REPORTED_ERRORS = 10
+REQUIRED_COLUMNS = ["name", "email"]
+
+
+def _text(value) -> str:
+    return str(value if value is not None else "").strip()
+
+
+def _number(value, cast, label: str):
+    """Numeric cell (blank is 0); raises ValueError with a row-level message"""
+    if value is None or (isinstance(value, str) and not value.strip()):
+        return cast(0)
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"{label} must be a number, got {value!r}")
+    if not math.isfinite(number) or number < 0:
+        raise ValueError(f"{label} must be a non-negative number, got {value!r}")
+    return cast(number)
+
+
+async def allocate_employee_id(db, tenant_id: str) -> str:
+    """Next employee id of a tenant, continuing after the ids already in use this year"""
+    year = datetime.now().year
+    prefix = await number_prefix(db, tenant_id, Sequence.EMPLOYEE, year)
+
+    async def seed_from_existing_staff():
+        # One-time scan so the counter continues after legacy employee ids
+        staff = await db.staff.find(
+            {"tenant_id": tenant_id, "employee_id": {"$regex": f"^{re.escape(prefix)}", "$options": "i"}},
+            {"_id": 0, "employee_id": 1}
+        ).to_list(None)
+        return max_numeric_suffix([s.get("employee_id") for s in staff], prefix)
+
+    return await allocate_number(db, tenant_id, Sequence.EMPLOYEE, year=year, seed=seed_from_existing_staff)
+
+
+class StaffImport:
+    """Validates and bulk-inserts staff rows chunk by chunk"""
+
+    def __init__(self, db, current_user, school_id: str):
+        self.db = db
+        self.tenant_id = current_user.tenant_id
+        self.school_id = school_id
+        self.user_id = current_user.id
+        self.seen_emails: set = set()
+        self.success_count = 0
+        self.error_count = 0
+        self.errors: List[str] = []
+
+    def prepare(self, headers: List[str]):
+        missing = [column for column in REQUIRED_COLUMNS if column not in headers]
+        if missing:
+            raise HTTPException(status_code=400, detail=f"Missing required columns: {', '.join(missing)}")
+
+    def reject(self, row_number: int, message: str):
+        self.error_count += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append(f"Row {row_number}: {message}")
+
+    async def process(self, chunk: List[tuple]):
+        emails = [_text(record.get("email")).lower() for _, record in chunk]
+        existing = {doc["email"] async for doc in self.db.staff.find(
+            {"tenant_id": self.tenant_id, "email": {"$in": [e for e in emails if e]}, "is_active": True},
+            {"_id": 0, "email": 1}
+        )}
+
+        now = datetime.utcnow()
+        documents = []
+        for (row_number, row), email in zip(chunk, emails):
+            name = _text(row.get("name"))
+            if not name:
+                self.reject(row_number, "Name is required")
+                continue
+            if not email:
+                self.reject(row_number, "Email is required")
+                continue
+            if email in existing or email in self.seen_emails:
+                self.reject(row_number, f"Email {email} already exists")
+                continue
+            try:
+                experience_years = _number(row.get("experience_years") or row.get("experience"), int, "Experience")
+                salary = _number(row.get("salary"), float, "Salary")
+            except ValueError as e:
+                self.reject(row_number, str(e))
+                continue
+            self.seen_emails.add(email)
+
+            documents.append({
+                "id": str(uuid.uuid4()),
+                "tenant_id": self.tenant_id,
+                "school_id": self.school_id,
+                "employee_id": _text(row.get("employee_id")) or await allocate_employee_id(self.db, self.tenant_id),
+                "name": name,
+                "email": email,
+                "phone": _text(row.get("phone")),
+                "designation": _text(row.get("designation")),
+                "department": _text(row.get("department")),
+                "qualification": _text(row.get("qualification")),
+                "experience_years": experience_years,
+                "date_of_joining": _text(row.get("date_of_joining")),
+                "salary": salary,
+                "address": _text(row.get("address")),
+                "is_active": True,
+                "created_by": self.user_id,
+                "created_at": now,
+                "updated_at": now
+            })
+
+        if documents:
+            await self.db.staff.insert_many(documents, ordered=False)
+            self.success_count += len(documents)
+
+    def summary(self, total_rows: int) -> dict:
+        if not total_rows:
+            raise HTTPException(status_code=400, detail="No data found in file")
+        if self.success_count:
+            logger.info(f"Staff import completed: {self.success_count} success, {self.error_count} errors")
+        return {
+            "success_count": self.success_count,
+            "error_count": self.error_count,
+            "total_rows": total_rows,
+            "errors": self.errors
+        }
@@ -0,0 +1,671 @@
+"""
+Per-Student Fee Ledger
+
+Append-only ledger of every event that changes a student's fee position:
+- charge: a fee becomes payable (a student_fees record is created)
+- payment: money received (fee payments, online monthly payments)
+- waiver: an amount forgiven (also taken off the student's outstanding student_fees)
+- adjustment: a signed correction (e.g. a fee configuration amount change)
+
+student_fees are the only source of charges; they are recorded when the fee is
+written, never on reads. The monthly fee-type view of the student portal (paid and
+unpaid months) is derived from payments and is not charged to the ledger.
+
+Entries live in `student_ledger_entries` and are idempotent per (source, source_id).
+The running balance snapshot is kept on the student's `fee_ledgers` document and
+each entry records the balance returned by the same $inc that applied it. A
+statement for any date range is one indexed aggregation over
+(tenant_id, student_id, entry_date). History from before the ledger is imported by
+the nightly fee run (and on first read for students it has not reached yet).
+"""
+
+import asyncio
+import logging
+import uuid
+from collections import defaultdict
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+from fastapi import Depends, HTTPException
+from pydantic import BaseModel
+from pymongo import ReturnDocument, UpdateOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+
+logger = logging.getLogger(__name__)
+
+
+class LedgerEntryType:
+    CHARGE = "charge"
+    PAYMENT = "payment"
+    WAIVER = "waiver"
+    ADJUSTMENT = "adjustment"
+
+
+class LedgerSource:
+    STUDENT_FEE = "student_fee"
+    STUDENT_FEE_ADJUSTMENT = "student_fee_adjustment"
+    PAYMENT = "payment"
+    MONTHLY_PAYMENT = "monthly_payment"
+    MANUAL = "manual"
+
+
+# Snapshot counter moved by each entry type
+_SNAPSHOT_FIELDS = {
+    LedgerEntryType.CHARGE: "total_fees",
+    LedgerEntryType.PAYMENT: "paid_amount",
+    LedgerEntryType.WAIVER: "waived_amount",
+    LedgerEntryType.ADJUSTMENT: "adjusted_amount",
+}
+
+class LedgerEntryCreate(BaseModel):
+    entry_type: str  # waiver or adjustment
+    amount: float
+    description: Optional[str] = None
+    entry_date: Optional[str] = None
+    student_fee_id: Optional[str] = None  # waiver: fee to waive (default: oldest outstanding first)
+
+
+def ledger_student_key(student: Dict[str, Any]) -> str:
+    """Canonical student identifier used by the ledger"""
+    return student.get('id') or student.get('student_id') or student.get('admission_no')
+
+
+def balance_delta(entry_type: str, amount: float) -> float:
+    """Effect of an entry on the outstanding balance"""
+    if entry_type in (LedgerEntryType.PAYMENT, LedgerEntryType.WAIVER):
+        return -abs(amount)
+    if entry_type == LedgerEntryType.CHARGE:
+        return abs(amount)
+    return amount
+
+
+def monthly_payment_source_id(record: Dict[str, Any]) -> str:
+    """Stable ledger key for a monthly_payments record"""
+    if record.get('tran_id'):
+        return f"{record['tran_id']}:{record.get('month')}:{record.get('year')}"
+    return str(record.get('id') or record.get('_id'))
+
+
+async def append_ledger_entry(
+    db,
+    tenant_id: str,
+    student_id: str,
+    entry_type: str,
+    amount: float,
+    source: str,
+    source_id: str,
+    entry_date: Optional[datetime] = None,
+    **details: Any
+) -> Optional[Dict[str, Any]]:
+    """
+    Append one entry and move the balance snapshot.
+
+    Returns the stored entry, or None if (source, source_id) was already recorded.
+    """
+    if entry_type not in _SNAPSHOT_FIELDS:
+        raise ValueError(f"Unknown ledger entry type: {entry_type}")
+
+    now = datetime.utcnow()
+    delta = balance_delta(entry_type, amount or 0)
+    entry = {
+        "id": str(uuid.uuid4()),
+        "tenant_id": tenant_id,
+        "student_id": student_id,
+        "entry_type": entry_type,
+        "amount": amount or 0,
+        "delta": delta,
+        "source": source,
+        "source_id": source_id,
+        "entry_date": entry_date or now,
+        "created_at": now,
+        **details
+    }
+
+    try:
+        await db.student_ledger_entries.insert_one(entry)
+    except DuplicateKeyError:
+        return None
+
+    snapshot = await db.fee_ledgers.find_one_and_update(
+        {"tenant_id": tenant_id, "student_id": student_id, "is_active": True},
+        {
+            "$inc": {"balance": delta, _SNAPSHOT_FIELDS[entry_type]: abs(amount or 0) if entry_type != LedgerEntryType.ADJUSTMENT else delta},
+            "$set": {"updated_at": now, "last_entry_at": now},
+            "$setOnInsert": {"id": str(uuid.uuid4()), "created_at": now, "payments": []}
+        },
+        upsert=True,
+        return_document=ReturnDocument.AFTER
+    )
+    balance_after = snapshot.get("balance", 0)
+    await db.student_ledger_entries.update_one(
+        {"_id": entry["_id"]},
+        {"$set": {"balance_after": balance_after}}
+    )
+    entry["balance_after"] = balance_after
+    return entry
+
+
+async def resolve_ledger_student_key(db, tenant_id: str, raw_student_id: str) -> str:
+    """Map an id, student_id or admission_no to the canonical ledger key"""
+    student = await db.students.find_one(
+        {
+            "tenant_id": tenant_id,
+            "$or": [
+                {"id": raw_student_id},
+                {"student_id": raw_student_id},
+                {"admission_no": raw_student_id}
+            ]
+        },
+        {"_id": 0, "id": 1, "student_id": 1, "admission_no": 1}
+    )
+    return ledger_student_key(student) if student else raw_student_id
+
+
+# ================================
+# WRITER HOOKS
+# ================================
+
+async def record_student_fee_charge(db, student_fee: Dict[str, Any]):
+    """Ledger charge for a newly generated student_fees record"""
+    return await append_ledger_entry(
+        db,
+        student_fee["tenant_id"],
+        student_fee["student_id"],
+        LedgerEntryType.CHARGE,
+        student_fee.get("amount", 0),
+        LedgerSource.STUDENT_FEE,
+        student_fee["id"],
+        entry_date=student_fee.get("created_at"),
+        fee_type=student_fee.get("fee_type"),
+        description=student_fee.get("fee_type")
+    )
+
+
+async def record_student_fee_charges(db, student_fees: List[Dict[str, Any]]) -> int:
+    """
+    Ledger charges for many new student_fees records at once (bulk fee assignment).
+
+    One insert_many of the entries (already recorded sources are skipped), one
+    bulk_write moving each student's snapshot, and one bulk_write filling in
+    balance_after. Returns the number of entries recorded.
+    """
+    if not student_fees:
+        return 0
+    now = datetime.utcnow()
+    entries = [{
+        "id": str(uuid.uuid4()),
+        "tenant_id": fee["tenant_id"],
+        "student_id": fee["student_id"],
+        "entry_type": LedgerEntryType.CHARGE,
+        "amount": fee.get("amount", 0) or 0,
+        "delta": balance_delta(LedgerEntryType.CHARGE, fee.get("amount", 0) or 0),
+        "source": LedgerSource.STUDENT_FEE,
+        "source_id": fee["id"],
+        "entry_date": fee.get("created_at") or now,
+        "created_at": now,
+        "fee_type": fee.get("fee_type"),
+        "description": fee.get("fee_type")
+    } for fee in student_fees]
+
+    try:
+        await db.student_ledger_entries.insert_many(entries, ordered=False)
+        recorded = entries
+    except BulkWriteError as e:
+        errors = e.details.get("writeErrors", [])
+        if any(error.get("code") != 11000 for error in errors):
+            raise
+        duplicates = {error["index"] for error in errors}
+        recorded = [entry for i, entry in enumerate(entries) if i not in duplicates]
+    if not recorded:
+        return 0
+
+    by_student: Dict[tuple, List[Dict[str, Any]]] = defaultdict(list)
+    for entry in recorded:
+        by_student[(entry["tenant_id"], entry["student_id"])].append(entry)
+
+    async def move_snapshot(key, student_entries):
+        # balance_after is walked back from the balance returned by this $inc, so
+        # it never picks up another writer's entries
+        tenant_id, student_id = key
+        total = sum(entry["delta"] for entry in student_entries)
+        snapshot = await db.fee_ledgers.find_one_and_update(
+            {"tenant_id": tenant_id, "student_id": student_id, "is_active": True},
+            {
+                "$inc": {"balance": total, "total_fees": total},
+                "$set": {"updated_at": now, "last_entry_at": now},
+                "$setOnInsert": {"id": str(uuid.uuid4()), "created_at": now, "payments": []}
+            },
+            upsert=True,
+            return_document=ReturnDocument.AFTER,
+            projection={"_id": 0, "balance": 1}
+        )
+        balance = snapshot.get("balance", 0)
+        updates = []
+        for entry in reversed(student_entries):
+            updates.append(UpdateOne({"_id": entry["_id"]}, {"$set": {"balance_after": balance}}))
+            balance -= entry["delta"]
+        return updates
+
+    updates = []
+    for student_updates in await asyncio.gather(*(
+        move_snapshot(key, student_entries) for key, student_entries in by_student.items()
+    )):
+        updates.extend(student_updates)
+    await db.student_ledger_entries.bulk_write(updates, ordered=False)
+    return len(recorded)
+
+
+async def record_student_fee_adjustment(db, student_fee: Dict[str, Any], new_amount: float):
+    """Ledger adjustment when a student_fees amount is changed by its configuration"""
+    delta = (new_amount or 0) - (student_fee.get("amount", 0) or 0)
+    if not delta:
+        return None
+    now = datetime.utcnow()
+    return await append_ledger_entry(
+        db,
+        student_fee["tenant_id"],
+        student_fee["student_id"],
+        LedgerEntryType.ADJUSTMENT,
+        delta,
+        LedgerSource.STUDENT_FEE_ADJUSTMENT,
+        f"{student_fee['id']}:{now.isoformat()}",
+        entry_date=now,
+        fee_type=student_fee.get("fee_type"),
+        description=f"{student_fee.get('fee_type', 'Fee')} amount changed"
+    )
+
+
+async def record_fee_payment(db, payment: Dict[str, Any]):
+    """Ledger payment for a fee payment (payments collection)"""
+    return await append_ledger_entry(
+        db,
+        payment["tenant_id"],
+        payment["student_id"],
+        LedgerEntryType.PAYMENT,
+        payment.get("amount", 0),
+        LedgerSource.PAYMENT,
+        payment["id"],
+        entry_date=payment.get("payment_date"),
+        fee_type=payment.get("fee_type"),
+        receipt_no=payment.get("receipt_no"),
+        payment_mode=payment.get("payment_mode"),
+        description=payment.get("fee_type")
+    )
+
+
+async def record_monthly_payment(db, record: Dict[str, Any], student_key: Optional[str] = None):
+    """Ledger payment for a monthly_payments record"""
+    if record.get("status") not in ["paid", "completed"]:
+        return None
+    student_key = student_key or await resolve_ledger_student_key(db, record["tenant_id"], record["student_id"])
+    return await append_ledger_entry(
+        db,
+        record["tenant_id"],
+        student_key,
+        LedgerEntryType.PAYMENT,
+        record.get("amount", 0),
+        LedgerSource.MONTHLY_PAYMENT,
+        monthly_payment_source_id(record),
+        entry_date=record.get("payment_date") or record.get("created_at"),
+        month=record.get("month"),
+        period_year=record.get("year"),
+        receipt_no=record.get("receipt_no"),
+        payment_mode=record.get("payment_method"),
+        description=f"Monthly fee {record.get('month', '')} {record.get('year', '')}".strip()
+    )
+
+
+async def ensure_student_ledger(db, tenant_id: str, student: Dict[str, Any]) -> str:
+    """
+    Import a student's pre-ledger history once (student_fees, payments and
+    monthly_payments). Safe to run concurrently with live writers.
+    """
+    student_key = ledger_student_key(student)
+    snapshot = await db.fee_ledgers.find_one(
+        {"tenant_id": tenant_id, "student_id": student_key, "is_active": True},
+        {"ledger_initialized": 1}
+    )
+    if snapshot and snapshot.get("ledger_initialized"):
+        return student_key
+
+    student_fees = await db.student_fees.find(
+        {"tenant_id": tenant_id, "student_id": student_key, "is_active": {"$ne": False}}
+    ).to_list(None)
+    for fee in student_fees:
+        await record_student_fee_charge(db, fee)
+
+    payments = await db.payments.find(
+        {"tenant_id": tenant_id, "student_id": student_key, "receipt_no": {"$exists": True}}
+    ).to_list(None)
+    for payment in payments:
+        await record_fee_payment(db, payment)
+
+    aliases = list({a for a in [student_key, student.get('student_id'), student.get('admission_no')] if a})
+    monthly = await db.monthly_payments.find(
+        {"tenant_id": tenant_id, "student_id": {"$in": aliases}}
+    ).to_list(None)
+    for record in monthly:
+        await record_monthly_payment(db, record, student_key=student_key)
+
+    await db.fee_ledgers.update_one(
+        {"tenant_id": tenant_id, "student_id": student_key, "is_active": True},
+        {
+            "$set": {"ledger_initialized": True, "updated_at": datetime.utcnow()},
+            "$setOnInsert": {"id": str(uuid.uuid4()), "balance": 0, "created_at": datetime.utcnow()}
+        },
+        upsert=True
+    )
+    logger.info(f"Ledger initialized for student {student_key}: {len(student_fees)} fees, {len(payments) + len(monthly)} payments")
+    return student_key
+
+
+async def waive_student_fees(
+    db,
+    tenant_id: str,
+    student_key: str,
+    amount: float,
+    student_fee_id: Optional[str] = None
+) -> List[str]:
+    """
+    Take a waiver off the student's outstanding student_fees (overdue before
+    pending, oldest due date first). Each fee update is guarded on the amounts
+    read, so a concurrent payment is never overwritten. Returns the waived fee ids.
+    """
+    query = {
+        "tenant_id": tenant_id,
+        "student_id": student_key,
+        "is_active": True,
+        "$or": [{"overdue_amount": {"$gt": 0}}, {"pending_amount": {"$gt": 0}}]
+    }
+    if student_fee_id:
+        query["id"] = student_fee_id
+
+    for _ in range(3):
+        fees = await db.student_fees.find(
+            query, {"_id": 0, "id": 1, "paid_amount": 1, "pending_amount": 1, "overdue_amount": 1, "due_at": 1}
+        ).to_list(None)
+        outstanding = sum((f.get("overdue_amount") or 0) + (f.get("pending_amount") or 0) for f in fees)
+        if amount > outstanding + 0.005:
+            raise HTTPException(
+                status_code=400,
+                detail=f"Waiver of {amount:g} exceeds the outstanding amount of {outstanding:g}"
+            )
+
+        fees.sort(key=lambda f: (not (f.get("overdue_amount") or 0), f.get("due_at") or datetime.max))
+        remaining = amount
+        now = datetime.utcnow()
+        plans = []
+        for fee in fees:
+            if remaining <= 0:
+                break
+            overdue = fee.get("overdue_amount") or 0
+            pending = fee.get("pending_amount") or 0
+            from_overdue = min(remaining, overdue)
+            from_pending = min(remaining - from_overdue, pending)
+            remaining -= from_overdue + from_pending
+            left = overdue - from_overdue + pending - from_pending
+            inc = {
+                "overdue_amount": -from_overdue,
+                "pending_amount": -from_pending,
+                "waived_amount": from_overdue + from_pending
+            }
+            update = {"$inc": inc, "$set": {"updated_at": now}}
+            if not left:
+                update["$set"]["status"] = "paid" if fee.get("paid_amount") else "waived"
+            plans.append((fee, inc, update))
+
+        applied = []
+        for fee, inc, update in plans:
+            result = await db.student_fees.update_one(
+                {"id": fee["id"], "tenant_id": tenant_id,
+                 "overdue_amount": fee.get("overdue_amount"), "pending_amount": fee.get("pending_amount")},
+                update
+            )
+            if not result.modified_count:
+                break
+            applied.append(fee["id"])
+        if len(applied) == len(plans):
+            return applied
+        # A payment changed one of the fees meanwhile: give back what was taken
+        # from the fees already updated and plan again from fresh amounts
+        for fee, inc, _ in plans[:len(applied)]:
+            await db.student_fees.update_one(
+                {"id": fee["id"], "tenant_id": tenant_id},
+                {"$inc": {field: -value for field, value in inc.items()}}
+            )
+    raise HTTPException(status_code=409, detail="Fees changed while applying the waiver, please retry")
+
+
+async def initialize_student_ledgers(db, tenant_id: str) -> int:
+    """Import the pre-ledger history of every student whose ledger is not initialized yet"""
+    initialized = set(await db.fee_ledgers.distinct(
+        "student_id", {"tenant_id": tenant_id, "is_active": True, "ledger_initialized": True}
+    ))
+    imported = 0
+    students = await db.students.find(
+        {"tenant_id": tenant_id, "is_active": True},
+        {"_id": 0, "id": 1, "student_id": 1, "admission_no": 1}
+    ).to_list(None)
+    for student in students:
+        if ledger_student_key(student) not in initialized:
+            await ensure_student_ledger(db, tenant_id, student)
+            imported += 1
+    return imported
+
+
+# ================================
+# READ API
+# ================================
+
+async def get_ledger_balance(db, tenant_id: str, student_key: str) -> Dict[str, Any]:
+    """Current running balance snapshot for a student"""
+    snapshot = await db.fee_ledgers.find_one(
+        {"tenant_id": tenant_id, "student_id": student_key, "is_active": True},
+        {"_id": 0}
+    ) or {}
+    return {
+        "total_fees": snapshot.get("total_fees", 0),
+        "paid_amount": snapshot.get("paid_amount", 0),
+        "waived_amount": snapshot.get("waived_amount", 0),
+        "adjusted_amount": snapshot.get("adjusted_amount", 0),
+        "balance": snapshot.get("balance", 0),
+        "pending_amount": snapshot.get("pending_amount", 0),
+        "overdue_amount": snapshot.get("overdue_amount", 0),
+        "last_entry_at": snapshot.get("last_entry_at")
+    }
+
+
+def fee_summary(ledger: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Fee totals in the shape the student fee views have always returned.
+
+    total_fees keeps its meaning (the sum of the student's current fee amounts:
+    charges plus amount adjustments); waived_amount is reported separately.
+    """
+    balance = max(0, ledger["balance"])
+    overdue_amount = min(ledger["overdue_amount"], balance)
+    return {
+        "total_fees": ledger["total_fees"] + ledger["adjusted_amount"],
+        "paid_amount": ledger["paid_amount"],
+        "waived_amount": ledger["waived_amount"],
+        "balance": balance,
+        "pending_amount": balance - overdue_amount,
+        "overdue_amount": overdue_amount
+    }
+
+
+async def get_ledger_statement(
+    db,
+    tenant_id: str,
+    student_key: str,
+    from_date: Optional[datetime] = None,
+    to_date: Optional[datetime] = None
+) -> Dict[str, Any]:
+    """Opening balance, entries with running balance and closing balance for a date range"""
+    match = {"tenant_id": tenant_id, "student_id": student_key}
+    if to_date:
+        match["entry_date"] = {"$lte": to_date}
+    in_range = {"entry_date": {"$gte": from_date}} if from_date else {}
+    before_range = [{"$match": {"entry_date": {"$lt": from_date}}}] if from_date else [{"$match": {"_id": None}}]
+
+    result = await db.student_ledger_entries.aggregate([
+        {"$match": match},
+        {"$facet": {
+            "opening": before_range + [{"$group": {"_id": None, "balance": {"$sum": "$delta"}}}],
+            "entries": [
+                {"$match": in_range},
+                {"$sort": {"entry_date": 1, "created_at": 1}},
+                {"$project": {"_id": 0}}
+            ]
+        }}
+    ]).to_list(1)
+
+    facet = result[0] if result else {"opening": [], "entries": []}
+    opening_balance = facet["opening"][0]["balance"] if facet["opening"] else 0
+
+    running = opening_balance
+    totals = {entry_type: 0 for entry_type in _SNAPSHOT_FIELDS}
+    entries: List[Dict[str, Any]] = []
+    for entry in facet["entries"]:
+        running += entry.get("delta", 0)
+        totals[entry["entry_type"]] = totals.get(entry["entry_type"], 0) + entry.get("amount", 0)
+        entry["running_balance"] = running
+        entries.append(entry)
+
+    return {
+        "student_id": student_key,
+        "from_date": from_date,
+        "to_date": to_date,
+        "opening_balance": opening_balance,
+        "closing_balance": running,
+        "total_charges": totals[LedgerEntryType.CHARGE],
+        "total_payments": totals[LedgerEntryType.PAYMENT],
+        "total_waivers": totals[LedgerEntryType.WAIVER],
+        "total_adjustments": totals[LedgerEntryType.ADJUSTMENT],
+        "entries": entries
+    }
+
+
+async def get_period_payments(db, tenant_id: str, student_key: str, year: int) -> List[Dict[str, Any]]:
+    """Monthly payment entries for a fee year"""
+    return await db.student_ledger_entries.find(
+        {
+            "tenant_id": tenant_id,
+            "student_id": student_key,
+            "period_year": year,
+            "entry_type": LedgerEntryType.PAYMENT
+        },
+        {"_id": 0}
+    ).sort("entry_date", 1).to_list(None)
+
+
+def _parse_date(value: Optional[str], end_of_day: bool = False) -> Optional[datetime]:
+    if not value:
+        return None
+    try:
+        parsed = datetime.fromisoformat(value.replace('Z', '+00:00')).replace(tzinfo=None)
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"Invalid date: {value}")
+    if end_of_day and len(value) <= 10:
+        parsed = parsed.replace(hour=23, minute=59, second=59, microsecond=999999)
+    return parsed
+
+
+# ================================
+# ROUTES
+# ================================
+
+def setup_student_ledger_routes(router, db, get_current_user):
+
+    @router.get("/student/fees/statement")
+    async def get_my_fee_statement(
+        from_date: Optional[str] = None,
+        to_date: Optional[str] = None,
+        current_user=Depends(get_current_user)
+    ):
+        """Fee statement for the logged-in student"""
+        from student_utils import resolve_student_identity
+
+        student = await resolve_student_identity(db, current_user)
+        if not student:
+            raise HTTPException(status_code=404, detail="Student not found")
+
+        student_key = await ensure_student_ledger(db, current_user.tenant_id, student)
+        statement = await get_ledger_statement(
+            db, current_user.tenant_id, student_key,
+            _parse_date(from_date), _parse_date(to_date, end_of_day=True)
+        )
+        statement["balance"] = await get_ledger_balance(db, current_user.tenant_id, student_key)
+        statement["student_name"] = student.get("name", "")
+        return statement
+
+    @router.get("/fees/students/{student_id}/statement")
+    async def get_student_fee_statement(
+        student_id: str,
+        from_date: Optional[str] = None,
+        to_date: Optional[str] = None,
+        current_user=Depends(get_current_user)
+    ):
+        """Fee statement for any student of the tenant"""
+        if current_user.role not in ["super_admin", "admin", "accountant"]:
+            raise HTTPException(status_code=403, detail="Not authorized")
+
+        student = await db.students.find_one({"tenant_id": current_user.tenant_id, "id": student_id}, {"_id": 0})
+        if not student:
+            raise HTTPException(status_code=404, detail="Student not found")
+
+        student_key = await ensure_student_ledger(db, current_user.tenant_id, student)
+        statement = await get_ledger_statement(
+            db, current_user.tenant_id, student_key,
+            _parse_date(from_date), _parse_date(to_date, end_of_day=True)
+        )
+        statement["balance"] = await get_ledger_balance(db, current_user.tenant_id, student_key)
+        statement["student_name"] = student.get("name", "")
+        statement["admission_no"] = student.get("admission_no", "")
+        return statement
+
+    @router.post("/fees/students/{student_id}/ledger-entries")
+    async def create_ledger_entry(
+        student_id: str,
+        data: LedgerEntryCreate,
+        current_user=Depends(get_current_user)
+    ):
+        """Record a waiver or manual adjustment on a student's ledger"""
+        if current_user.role not in ["super_admin", "admin", "accountant"]:
+            raise HTTPException(status_code=403, detail="Not authorized")
+        if data.entry_type not in [LedgerEntryType.WAIVER, LedgerEntryType.ADJUSTMENT]:
+            raise HTTPException(status_code=400, detail="Only waiver and adjustment entries can be added manually")
+
+        student = await db.students.find_one({"tenant_id": current_user.tenant_id, "id": student_id}, {"_id": 0})
+        if not student:
+            raise HTTPException(status_code=404, detail="Student not found")
+
+        student_key = await ensure_student_ledger(db, current_user.tenant_id, student)
+        details = {}
+        if data.entry_type == LedgerEntryType.WAIVER:
+            if data.amount <= 0:
+                raise HTTPException(status_code=400, detail="Waiver amount must be positive")
+            details["student_fee_ids"] = await waive_student_fees(
+                db, current_user.tenant_id, student_key, data.amount, data.student_fee_id
+            )
+
+        entry = await append_ledger_entry(
+            db,
+            current_user.tenant_id,
+            student_key,
+            data.entry_type,
+            data.amount,
+            LedgerSource.MANUAL,
+            str(uuid.uuid4()),
+            entry_date=_parse_date(data.entry_date),
+            description=data.description,
+            created_by=current_user.id,
+            **details
+        )
+        if data.entry_type == LedgerEntryType.WAIVER:
+            from fee_overdue import refresh_fee_ledgers
+            await refresh_fee_ledgers(db, current_user.tenant_id, [student_key])
+        entry.pop("_id", None)
+        return entry
+
+    logger.info("Student Ledger Routes Registered")
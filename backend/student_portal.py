@@ -40,14 +40,11 @@ def setup_student_portal_routes(app, db, get_current_user):
             if not student:
                 raise HTTPException(status_code=404, detail="Student not found")
             
-            fee_structure = await get_student_fee_structure(db, tenant_id, student)
-            monthly_fee = fee_structure.get('monthly_total', 0)
-            
             current_year = datetime.now().year
             summary = await get_student_payment_summary(db, tenant_id, student, current_year)
             
             return {
-                "monthly_fee": monthly_fee,
+                "monthly_fee": summary.get('monthly_fee', 0),
                 "total_due": summary.get('total_due', 0),
                 "unpaid_months": summary.get('unpaid_months', []),
                 "paid_months": summary.get('paid_months', [])
@@ -95,7 +92,7 @@ def setup_student_portal_routes(app, db, get_current_user):
             payment_summary = await get_student_payment_summary(db, tenant_id, student, current_year)
             
             # Calculate ledger
-            monthly_fee = fee_structure.get('monthly_total', 0)
+            monthly_fee = payment_summary.get('monthly_fee', 0)
             current_month = datetime.now().month
             total_fees = monthly_fee * current_month  # Fees due till current month
             paid_amount = payment_summary.get('total_paid', 0)
@@ -9,6 +9,7 @@ import logging
 from typing import Optional, Dict, Any
 from bson import ObjectId
 from cache import cache, CacheTTL
+from student_ledger import ensure_student_ledger, get_period_payments
 
 logger = logging.getLogger(__name__)
 
@@ -309,33 +310,22 @@ async def get_student_payment_summary(db, tenant_id: str, student: Dict[str, Any
             - payments: List of payment records
             - paid_months: List of paid months
             - unpaid_months: List of unpaid months
+            - student_key: Ledger key of the student
     """
     from datetime import datetime
     
     if year is None:
         year = datetime.now().year
     
-    student_id = student.get('student_id') or student.get('admission_no') or student.get('id')
-    admission_no = student.get('admission_no') or student.get('student_id')
-    
-    # Get all payments for this student in the year
-    # We query by student_id as primary link, but also consider admission_no for robustness
-    payments_cursor = db.monthly_payments.find({
-        "tenant_id": tenant_id,
-        "year": year,
-        "$or": [
-            {"student_id": student_id},
-            {"student_id": admission_no}
-        ]
-    })
-    payments = await payments_cursor.to_list(100)
+    # Payments come from the student's ledger (one indexed query per fee year)
+    student_key = await ensure_student_ledger(db, tenant_id, student)
     
     # Get fee structure
     fee_structure = await get_student_fee_structure(db, tenant_id, student)
     monthly_total = fee_structure['monthly_total']
     
-    # Status can be 'paid' or 'completed' depending on which module recorded it
-    total_paid = sum(p.get('amount', 0) for p in payments if p.get('status') in ['paid', 'completed'])
+    payments = await get_period_payments(db, tenant_id, student_key, year)
+    total_paid = sum(p.get('amount', 0) for p in payments)
     
     # Month mapping: Admin uses English, Student portal uses Bengali
     month_translation = {
@@ -348,11 +338,10 @@ async def get_student_payment_summary(db, tenant_id: str, student: Dict[str, Any
     # Collected paid months, normalized to Bengali for comparison
     paid_months = []
     for p in payments:
-        if p.get('status') in ['paid', 'completed']:
-            m = p.get('month', '')
-            # Translate if it's English
-            normalized_m = month_translation.get(m, m)
-            paid_months.append(normalized_m)
+        m = p.get('month', '')
+        # Translate if it's English
+        normalized_m = month_translation.get(m, m)
+        paid_months.append(normalized_m)
     
     # Bengali month names
     all_months = [
@@ -373,13 +362,13 @@ async def get_student_payment_summary(db, tenant_id: str, student: Dict[str, Any
     normalized_payments = []
     for p in payments:
         normalized_payments.append({
-            "id": str(p.get('_id', '')),
+            "id": p.get('source_id', ''),
             "month": p.get('month', ''),
-            "year": p.get('year', year),
+            "year": p.get('period_year', year),
             "amount": p.get('amount', 0),
-            "status": p.get('status', 'pending'),
-            "payment_date": str(p.get('payment_date', p.get('created_at', ''))),
-            "payment_method": p.get('payment_method', ''),
+            "status": "paid",
+            "payment_date": str(p.get('entry_date', '')),
+            "payment_method": p.get('payment_mode', ''),
             "receipt_no": p.get('receipt_no', '')
         })
     
@@ -389,5 +378,6 @@ async def get_student_payment_summary(db, tenant_id: str, student: Dict[str, Any
         "monthly_fee": monthly_total,
         "payments": normalized_payments,
         "paid_months": paid_months,
-        "unpaid_months": unpaid_months
+        "unpaid_months": unpaid_months,
+        "student_key": student_key
     }
@@ -2,6 +2,22 @@
 """
 ZKTeco Device Connector Service
 Real-time biometric device integration for ERP system
+
+Punches are written to an on-disk SQLite spool first and uploaded to the ERP's
+/biometric/punch/batch endpoint in batches (by size or time) over one long-lived
+HTTP session. A punch leaves the spool only when the ERP has acknowledged it, so
+punches captured while the ERP is unreachable are replayed when it comes back.
+Each punch carries the dedupe key (device_id, user_id, timestamp); the ERP stores
+a key once, so resending after a lost response is harmless.
+
+Each device has one long-running capture thread holding a single live_capture()
+session. It pushes events into a bounded thread-safe queue drained by the asyncio
+side; when the queue is full the thread blocks (the device keeps the punch in its
+own log) and the wait is counted in the device's backpressure stats. A batch taken
+off the queue is retried until the spool accepts it, so a failing spool turns into
+backpressure instead of lost punches. ZKTecoService
+supervises every device concurrently, reconnecting with backoff, and keeps
+per-device health stats.
 """
 
 import asyncio
@@ -9,12 +25,14 @@ import aiohttp
 import json
 import logging
 import time
-from datetime import datetime, timezone
+from datetime import datetime
 from typing import Dict, List, Optional
 import os
-from zk import ZK, const
+from zk import ZK
 import threading
+import queue
 import signal
+import sqlite3
 import sys
 
 # Configure logging
@@ -24,12 +42,222 @@ logging.basicConfig(
 )
 logger = logging.getLogger('ZKTecoConnector')
 
+class PunchSpool:
+    """Append-only SQLite spool of punches waiting for ERP acknowledgement"""
+    
+    def __init__(self, path: str):
+        self.path = path
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            """CREATE TABLE IF NOT EXISTS punches (
+                   seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                   dedupe_key TEXT UNIQUE NOT NULL,
+                   payload TEXT NOT NULL,
+                   attempts INTEGER NOT NULL DEFAULT 0,
+                   created_at REAL NOT NULL
+               )"""
+        )
+        self._lock = threading.Lock()
+    
+    @staticmethod
+    def dedupe_key(punch: Dict) -> str:
+        return f"{punch['device_id']}|{punch['person_id']}|{punch['punch_time']}"
+    
+    def add(self, punches: List[Dict]) -> int:
+        """Spool punches; a key already spooled is ignored. Returns the number added."""
+        rows = [(self.dedupe_key(p), json.dumps(p, default=str), time.time()) for p in punches]
+        with self._lock:
+            before = self._db.total_changes
+            self._db.execute("BEGIN")
+            self._db.executemany(
+                "INSERT OR IGNORE INTO punches (dedupe_key, payload, created_at) VALUES (?, ?, ?)", rows
+            )
+            self._db.execute("COMMIT")
+            return self._db.total_changes - before
+    
+    def peek(self, limit: int) -> List[tuple]:
+        """Oldest spooled punches as (seq, payload)"""
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT seq, payload FROM punches ORDER BY seq LIMIT ?", (limit,)
+            ).fetchall()
+        return [(seq, json.loads(payload)) for seq, payload in rows]
+    
+    def ack(self, seqs: List[int]):
+        with self._lock:
+            self._db.execute("BEGIN")
+            self._db.executemany("DELETE FROM punches WHERE seq = ?", [(seq,) for seq in seqs])
+            self._db.execute("COMMIT")
+    
+    def mark_attempt(self, seqs: List[int]):
+        with self._lock:
+            self._db.executemany("UPDATE punches SET attempts = attempts + 1 WHERE seq = ?", [(seq,) for seq in seqs])
+    
+    def size(self) -> int:
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM punches").fetchone()[0]
+    
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+class ERPUploader:
+    """Uploads spooled punches in batches over one long-lived aiohttp session"""
+    
+    def __init__(self, erp_config: Dict, spool: PunchSpool, batch_size: int = 200, batch_interval: float = 2.0):
+        self.erp_config = erp_config
+        self.spool = spool
+        self.batch_size = batch_size
+        self.batch_interval = batch_interval
+        self.session: Optional[aiohttp.ClientSession] = None
+        self.running = False
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self.stats = {"uploaded": 0, "duplicates": 0, "rejected": 0, "failed_uploads": 0}
+    
+    @property
+    def headers(self) -> Dict:
+        return {
+            'Authorization': f"Bearer {self.erp_config['auth_token']}",
+            'Content-Type': 'application/json'
+        }
+    
+    async def start(self):
+        self.session = aiohttp.ClientSession(
+            timeout=aiohttp.ClientTimeout(total=30, connect=5),
+            connector=aiohttp.TCPConnector(limit=10, keepalive_timeout=60)
+        )
+        self.running = True
+        self._task = asyncio.create_task(self._upload_loop())
+        pending = await asyncio.to_thread(self.spool.size)
+        if pending:
+            logger.info(f"Replaying {pending} spooled punches")
+            self._wakeup.set()
+    
+    async def enqueue(self, punches: List[Dict]):
+        """Spool punches and wake the uploader once a full batch is waiting"""
+        added = await asyncio.to_thread(self.spool.add, punches)
+        if added and await asyncio.to_thread(self.spool.size) >= self.batch_size:
+            self._wakeup.set()
+    
+    async def _upload_loop(self):
+        backoff = 1.0
+        while self.running:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.batch_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            
+            # Drain the spool batch by batch; stop at the first failure and back off
+            while self.running:
+                batch = await asyncio.to_thread(self.spool.peek, self.batch_size)
+                if not batch:
+                    backoff = 1.0
+                    break
+                if not await self._upload(batch):
+                    self.stats["failed_uploads"] += 1
+                    await asyncio.to_thread(self.spool.mark_attempt, [seq for seq, _ in batch])
+                    await asyncio.sleep(backoff)
+                    backoff = min(backoff * 2, 60.0)
+                    break
+                backoff = 1.0
+    
+    async def _upload(self, batch: List[tuple]) -> bool:
+        """POST one batch; acknowledged punches (recorded, duplicate or rejected) leave the spool"""
+        url = f"{self.erp_config['base_url']}/biometric/punch/batch"
+        try:
+            async with self.session.post(url, json={"punches": [p for _, p in batch]}, headers=self.headers) as response:
+                if response.status != 200:
+                    logger.error(f"ERP batch upload error {response.status}: {await response.text()}")
+                    return False
+                result = await response.json()
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            logger.warning(f"ERP unreachable, {len(batch)} punches stay spooled: {e}")
+            return False
+        
+        for item in result.get("results", []):
+            if item.get("status") == "rejected":
+                logger.error(f"ERP rejected punch {batch[item['index']][1]}: {item.get('error')}")
+        await asyncio.to_thread(self.spool.ack, [seq for seq, _ in batch])
+        self.stats["uploaded"] += result.get("recorded", 0)
+        self.stats["duplicates"] += result.get("duplicate", 0)
+        self.stats["rejected"] += result.get("rejected", 0)
+        logger.info(f"Uploaded batch of {len(batch)} punches: recorded={result.get('recorded')}, duplicate={result.get('duplicate')}")
+        return True
+    
+    async def stop(self):
+        """Try a last upload of what is spooled, then close the session"""
+        self.running = False
+        self._wakeup.set()
+        if self._task:
+            await self._task
+        batch = await asyncio.to_thread(self.spool.peek, self.batch_size)
+        if batch and self.session:
+            await self._upload(batch)
+        if self.session:
+            await self.session.close()
+
+class DeviceCaptureThread(threading.Thread):
+    """Long-running live_capture() loop of one device, feeding a bounded queue"""
+    
+    def __init__(self, device_id: str, connection, events: queue.Queue, notify, stats: Dict, capture_timeout: int = 10):
+        super().__init__(name=f"zk-capture-{device_id}", daemon=True)
+        self.device_id = device_id
+        self.connection = connection
+        self.events = events
+        self.notify = notify
+        self.stats = stats
+        self.capture_timeout = capture_timeout
+        self.error: Optional[Exception] = None
+        self._stop_event = threading.Event()
+    
+    def run(self):
+        try:
+            # live_capture yields None every capture_timeout seconds without punches
+            for attendance in self.connection.live_capture(new_timeout=self.capture_timeout):
+                if self._stop_event.is_set():
+                    break
+                self.stats['last_heartbeat'] = time.time()
+                if attendance is None:
+                    continue
+                self.stats['events_captured'] += 1
+                self._put(attendance)
+                self.notify()
+        except Exception as e:
+            self.error = e
+            logger.error(f"Capture thread for device {self.device_id} failed: {e}")
+    
+    def _put(self, attendance):
+        try:
+            self.events.put_nowait(attendance)
+        except queue.Full:
+            # Backpressure: hold the device until the async side catches up
+            self.stats['backpressure_waits'] += 1
+            started = time.monotonic()
+            while not self._stop_event.is_set():
+                try:
+                    self.events.put(attendance, timeout=1)
+                    break
+                except queue.Full:
+                    self.notify()
+            self.stats['backpressure_seconds'] += time.monotonic() - started
+        self.stats['max_queue_depth'] = max(self.stats['max_queue_depth'], self.events.qsize())
+    
+    def stop(self):
+        self._stop_event.set()
+        # pyzk checks this flag between reads
+        self.connection.end_live_capture = True
+
 class ZKTecoDeviceConnector:
     """Manages connection to individual ZKTeco device"""
     
-    def __init__(self, device_config: Dict, erp_config: Dict):
+    def __init__(self, device_config: Dict, erp_config: Dict, uploader: ERPUploader,
+                 queue_size: int = 1000, capture_timeout: int = 10):
         self.device_config = device_config
         self.erp_config = erp_config
+        self.uploader = uploader
         self.zk = ZK(
             device_config['ip_address'], 
             port=device_config.get('port', 4370),
@@ -38,6 +266,25 @@ class ZKTecoDeviceConnector:
         self.connection = None
         self.running = False
         self.last_seen = None
+        self.capture_timeout = capture_timeout
+        self.events: queue.Queue = queue.Queue(maxsize=queue_size)
+        self.capture_thread: Optional[DeviceCaptureThread] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self.stats = {
+            'state': 'idle',
+            'events_captured': 0,
+            'events_forwarded': 0,
+            'max_queue_depth': 0,
+            'backpressure_waits': 0,
+            'backpressure_seconds': 0.0,
+            'reconnects': 0,
+            'spool_failures': 0,
+            'last_heartbeat': None,
+            'last_event_at': None,
+            'last_error': None,
+            'connected_since': None
+        }
         
     async def connect(self) -> bool:
         """Connect to ZKTeco device using async operations"""
@@ -97,130 +344,146 @@ class ZKTecoDeviceConnector:
             logger.error(f"Blocking connect error: {e}")
             return {'success': False}
     
-    async def start_live_capture(self):
-        """Start real-time attendance capture"""
-        if not self.connection:
-            if not await self.connect():
-                return None
-                
+    async def run_capture(self, batch_size: int = 200):
+        """Supervise the device: connect, run the capture thread, reconnect with backoff"""
         self.running = True
-        logger.info(f"Starting live capture for device {self.device_config['device_id']}")
+        self._loop = asyncio.get_running_loop()
+        self._wakeup = asyncio.Event()
+        backoff = 1.0
+        device_id = self.device_config['device_id']
         
-        # Start live capture task on the event loop
-        capture_task = asyncio.create_task(self._live_capture_worker())
-        return capture_task
-    
-    async def _start_live_capture_task(self):
-        """Complete async task for starting live capture"""
-        try:
+        while self.running:
             if not self.connection:
+                self.stats['state'] = 'connecting'
                 if not await self.connect():
-                    logger.error(f"Failed to connect to device {self.device_config['device_id']}")
-                    return
-                    
-            self.running = True
-            logger.info(f"Starting live capture for device {self.device_config['device_id']}")
+                    self.stats['state'] = 'reconnecting'
+                    await asyncio.sleep(backoff)
+                    backoff = min(backoff * 2, 60.0)
+                    continue
             
-            # Start the live capture worker directly
-            await self._live_capture_worker()
+            backoff = 1.0
+            self.stats['state'] = 'capturing'
+            self.stats['connected_since'] = time.time()
+            self.capture_thread = DeviceCaptureThread(
+                device_id, self.connection, self.events, self._notify, self.stats, self.capture_timeout
+            )
+            self.capture_thread.start()
+            logger.info(f"Capture thread started for device {device_id}")
             
-        except Exception as e:
-            logger.error(f"Error in live capture task for device {self.device_config['device_id']}: {e}")
-            await self._update_device_status('error')
+            await self._consume(batch_size)
+            
+            if self.running:
+                # The capture thread ended on its own: the device connection is gone
+                self.stats['last_error'] = str(self.capture_thread.error or 'capture ended')
+                self.stats['reconnects'] += 1
+                self.stats['state'] = 'reconnecting'
+                await self._close_connection()
+                await self._update_device_status('error')
+                await asyncio.sleep(backoff)
+        
+        self.stats['state'] = 'stopped'
     
-    async def _live_capture_worker(self):
-        """Async worker for live attendance capture using asyncio.to_thread"""
-        try:
-            while self.running:
-                try:
-                    # Use asyncio.to_thread to handle blocking ZK operations
-                    attendance_records = await asyncio.to_thread(self._get_live_attendance_batch)
-                    
-                    for attendance in attendance_records:
-                        if not self.running:
-                            break
-                        await self._process_attendance(attendance)
-                    
-                    # Small delay to prevent excessive polling
-                    await asyncio.sleep(0.1)
-                    
-                except Exception as e:
-                    logger.error(f"Live capture cycle error for device {self.device_config['device_id']}: {e}")
-                    await self._update_device_status('error')
-                    await asyncio.sleep(5)  # Wait before retrying
-                    
-        except Exception as e:
-            logger.error(f"Live capture worker error for device {self.device_config['device_id']}: {e}")
-            await self._update_device_status('error')
+    def _notify(self):
+        """Called from the capture thread: wake the consumer on the event loop"""
+        self._loop.call_soon_threadsafe(self._wakeup.set)
     
-    def _get_live_attendance_batch(self):
-        """Get batch of attendance records from device (blocking operation)"""
-        try:
-            # This is a blocking operation that runs in a thread pool
-            attendance_list = []
-            
-            # Use ZK live_capture with timeout to avoid infinite blocking
-            capture_iterator = self.connection.live_capture()
-            
-            # Collect up to 10 records or timeout after 1 second
-            import time
-            start_time = time.time()
+    async def _consume(self, batch_size: int):
+        """Drain the event queue into the spool until the capture thread stops"""
+        while self.capture_thread.is_alive() or not self.events.empty():
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), 1.0)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
             
-            for attendance in capture_iterator:
-                attendance_list.append(attendance)
-                
-                # Break if we have enough records or timeout
-                if len(attendance_list) >= 10 or (time.time() - start_time) > 1.0:
+            while True:
+                batch = []
+                while len(batch) < batch_size:
+                    try:
+                        batch.append(self.events.get_nowait())
+                    except queue.Empty:
+                        break
+                if not batch:
                     break
-            
-            return attendance_list
-            
-        except Exception as e:
-            logger.error(f"Error getting live attendance batch: {e}")
-            return []
+                await self._process_batch(batch)
     
-    async def _process_attendance(self, attendance):
-        """Process attendance punch and send to ERP"""
-        try:
-            # Prepare punch data
-            punch_data = {
-                "person_id": str(attendance.user_id),
-                "person_type": "student",  # Default, can be determined from user_id pattern
-                "device_id": self.device_config['device_id'],
-                "device_name": self.device_config['device_name'],
-                "punch_time": attendance.timestamp.isoformat() + 'Z',
-                "punch_method": "fingerprint",  # Default for ZKTeco
-                "punch_type": self._determine_punch_type(attendance.punch),
-                "verification_score": 95.0,  # Default high score for successful punch
-                "status": "verified",
-                "source_payload": {
-                    "raw_user_id": attendance.user_id,
-                    "raw_timestamp": str(attendance.timestamp),
-                    "raw_punch": attendance.punch,
-                    "raw_status": getattr(attendance, 'status', None),
-                    "device_info": self.device_config
-                }
+    async def _process_batch(self, records: List):
+        """
+        Spool a batch of captured punches for upload to ERP. The batch is already off
+        the event queue, so a failed spool write (disk full, locked database) is retried
+        with backoff instead of dropped; meanwhile the queue fills up and backpressure
+        holds new punches on the device.
+        """
+        punches = []
+        for attendance in records:
+            try:
+                punches.append(self._build_punch_data(attendance))
+            except Exception as e:
+                logger.error(f"Device {self.device_config['device_id']}: unreadable attendance record {attendance!r}: {e}")
+        
+        if not punches:
+            return
+        
+        backoff = 1.0
+        while True:
+            try:
+                await self.uploader.enqueue(punches)
+                break
+            except Exception as e:
+                self.stats['spool_failures'] += 1
+                self.stats['last_error'] = f"spool write failed: {e}"
+                if not self.running:
+                    logger.error(
+                        f"Device {self.device_config['device_id']}: {len(punches)} punches not spooled at shutdown "
+                        f"({e}); they stay in the device log for sync_stored_data"
+                    )
+                    return
+                logger.error(f"Device {self.device_config['device_id']}: spooling {len(punches)} punches failed, retrying in {backoff:.0f}s: {e}")
+                await asyncio.sleep(backoff)
+                backoff = min(backoff * 2, 60.0)
+        
+        self.stats['events_forwarded'] += len(punches)
+        self.stats['last_event_at'] = time.time()
+        self.last_seen = datetime.now()
+        logger.info(f"Device {self.device_config['device_id']}: spooled {len(punches)} punches")
+    
+    def health(self) -> Dict:
+        """Health snapshot of the device for monitoring"""
+        return {
+            **self.stats,
+            'queue_depth': self.events.qsize(),
+            'queue_capacity': self.events.maxsize,
+            'capture_thread_alive': bool(self.capture_thread and self.capture_thread.is_alive()),
+            'last_seen': self.last_seen.isoformat() if self.last_seen else None
+        }
+    
+    def _build_punch_data(self, attendance) -> Dict:
+        """ERP punch payload for a ZKTeco attendance record"""
+        punch_data = {
+            "person_id": str(attendance.user_id),
+            "person_type": "student",  # Default, can be determined from user_id pattern
+            "device_id": self.device_config['device_id'],
+            "device_name": self.device_config['device_name'],
+            "punch_time": attendance.timestamp.isoformat() + 'Z',
+            "punch_method": "fingerprint",  # Default for ZKTeco
+            "punch_type": self._determine_punch_type(attendance.punch),
+            "verification_score": 95.0,  # Default high score for successful punch
+            "status": "verified",
+            "source_payload": {
+                "raw_user_id": attendance.user_id,
+                "raw_timestamp": str(attendance.timestamp),
+                "raw_punch": attendance.punch,
+                "raw_status": getattr(attendance, 'status', None),
+                "device_info": self.device_config
             }
-            
-            # Determine person type from user_id pattern
-            if str(attendance.user_id).startswith(('STF', 'STAFF', 'TCH')):
-                punch_data["person_type"] = "staff"
-            elif str(attendance.user_id).startswith(('STU', 'STUDENT')):
-                punch_data["person_type"] = "student"
-                
-            logger.info(f"Processing punch: {punch_data['person_id']} on {punch_data['device_id']} at {punch_data['punch_time']}")
-            
-            # Send to ERP API
-            success = await self._send_to_erp(punch_data)
-            
-            if success:
-                logger.info(f"Punch sent to ERP successfully: {punch_data['person_id']}")
-                self.last_seen = datetime.now()
-            else:
-                logger.error(f"Failed to send punch to ERP: {punch_data['person_id']}")
-                
-        except Exception as e:
-            logger.error(f"Error processing attendance: {e}")
+        }
+        
+        # Determine person type from user_id pattern
+        if str(attendance.user_id).startswith(('STF', 'STAFF', 'TCH')):
+            punch_data["person_type"] = "staff"
+        elif str(attendance.user_id).startswith(('STU', 'STUDENT')):
+            punch_data["person_type"] = "student"
+        return punch_data
     
     def _determine_punch_type(self, punch_code) -> str:
         """Determine punch type from ZKTeco punch code"""
@@ -235,38 +498,10 @@ class ZKTecoDeviceConnector:
         }
         return punch_types.get(punch_code, "IN")
     
-    async def _send_to_erp(self, punch_data: Dict) -> bool:
-        """Send punch data to ERP API"""
-        try:
-            url = f"{self.erp_config['base_url']}/biometric/punch"
-            headers = {
-                'Authorization': f"Bearer {self.erp_config['auth_token']}",
-                'Content-Type': 'application/json'
-            }
-            
-            async with aiohttp.ClientSession() as session:
-                async with session.post(url, json=punch_data, headers=headers) as response:
-                    if response.status == 200:
-                        result = await response.json()
-                        logger.debug(f"ERP response: {result}")
-                        return True
-                    else:
-                        error_text = await response.text()
-                        logger.error(f"ERP API error {response.status}: {error_text}")
-                        return False
-                        
-        except Exception as e:
-            logger.error(f"Error sending to ERP: {e}")
-            return False
-    
     async def _update_device_status(self, status: str, additional_data: Dict = None):
         """Update device status in ERP"""
         try:
             url = f"{self.erp_config['base_url']}/biometric/device-status"
-            headers = {
-                'Authorization': f"Bearer {self.erp_config['auth_token']}",
-                'Content-Type': 'application/json'
-            }
             
             status_data = {
                 "device_id": self.device_config['device_id'],
@@ -275,12 +510,11 @@ class ZKTecoDeviceConnector:
                 **(additional_data or {})
             }
             
-            async with aiohttp.ClientSession() as session:
-                async with session.put(url, json=status_data, headers=headers) as response:
-                    if response.status == 200:
-                        logger.debug(f"Device status updated: {self.device_config['device_id']} - {status}")
-                    else:
-                        logger.warning(f"Failed to update device status: {response.status}")
+            async with self.uploader.session.put(url, json=status_data, headers=self.uploader.headers) as response:
+                if response.status == 200:
+                    logger.debug(f"Device status updated: {self.device_config['device_id']} - {status}")
+                else:
+                    logger.warning(f"Failed to update device status: {response.status}")
                         
         except Exception as e:
             logger.error(f"Error updating device status: {e}")
@@ -288,40 +522,54 @@ class ZKTecoDeviceConnector:
     async def get_stored_attendance(self) -> List[Dict]:
         """Get stored attendance records from device"""
         try:
-            if not self.connection:
-                await self.connect()
-                
-            if self.connection:
-                self.connection.disable_device()
-                records = self.connection.get_attendance()
-                self.connection.enable_device()
-                
-                attendance_data = []
-                for record in records:
-                    attendance_data.append({
-                        "person_id": str(record.user_id),
-                        "punch_time": record.timestamp.isoformat() + 'Z',
-                        "punch_type": self._determine_punch_type(record.punch),
-                        "device_id": self.device_config['device_id']
-                    })
-                
-                return attendance_data
-            return []
-            
+            records = await asyncio.to_thread(self._blocking_read_attendance)
+            return [self._build_punch_data(record) for record in records]
         except Exception as e:
             logger.error(f"Error getting stored attendance: {e}")
             return []
     
+    def _blocking_read_attendance(self) -> List:
+        """Read the device log over a separate short-lived connection (the capture thread owns self.connection)"""
+        zk = ZK(
+            self.device_config['ip_address'],
+            port=self.device_config.get('port', 4370),
+            timeout=self.device_config.get('timeout', 5)
+        )
+        connection = zk.connect()
+        try:
+            connection.disable_device()
+            try:
+                return connection.get_attendance()
+            finally:
+                connection.enable_device()
+        finally:
+            connection.disconnect()
+    
     async def disconnect(self):
-        """Disconnect from device"""
+        """Stop the capture thread and disconnect from device"""
         self.running = False
-        if self.connection:
-            try:
-                self.connection.enable_device()
-                self.connection.disconnect()
-                logger.info(f"Disconnected from device {self.device_config['device_id']}")
-            except Exception as e:
-                logger.error(f"Error disconnecting from device: {e}")
+        if self.capture_thread and self.capture_thread.is_alive():
+            self.capture_thread.stop()
+            await asyncio.to_thread(self.capture_thread.join, self.capture_timeout + 5)
+        await self._close_connection()
+    
+    async def _close_connection(self):
+        """Close the device session (live or dead) and forget it"""
+        connection, self.connection = self.connection, None
+        if not connection:
+            return
+        try:
+            await asyncio.to_thread(self._blocking_disconnect, connection)
+            logger.info(f"Disconnected from device {self.device_config['device_id']}")
+        except Exception as e:
+            logger.error(f"Error disconnecting from device: {e}")
+    
+    @staticmethod
+    def _blocking_disconnect(connection):
+        try:
+            connection.enable_device()
+        finally:
+            connection.disconnect()
 
 class ZKTecoService:
     """Main service managing multiple ZKTeco devices"""
@@ -330,6 +578,7 @@ class ZKTecoService:
         self.config = self._load_config(config_file)
         self.device_connectors: Dict[str, ZKTecoDeviceConnector] = {}
         self.capture_tasks: Dict[str, asyncio.Task] = {}
+        self.uploader: Optional[ERPUploader] = None
         self.running = False
         
     def _load_config(self, config_file: str) -> Dict:
@@ -349,7 +598,12 @@ class ZKTecoService:
                 }
             ],
             "sync_interval": 30,
-            "retry_attempts": 3
+            "retry_attempts": 3,
+            "batch_size": 200,
+            "batch_interval": 2.0,
+            "spool_path": "zkteco_spool.db",
+            "capture_queue_size": 1000,
+            "capture_timeout": 10
         }
         
         try:
@@ -372,14 +626,27 @@ class ZKTecoService:
         self.running = True
         logger.info("Starting ZKTeco Service...")
         
+        # One spool and one HTTP session shared by all devices
+        self.uploader = ERPUploader(
+            self.config['erp'],
+            PunchSpool(self.config.get('spool_path', 'zkteco_spool.db')),
+            batch_size=self.config.get('batch_size', 200),
+            batch_interval=self.config.get('batch_interval', 2.0)
+        )
+        await self.uploader.start()
+        
         # Initialize device connectors and start capture tasks
         for device_config in self.config['devices']:
             device_id = device_config['device_id']
-            connector = ZKTecoDeviceConnector(device_config, self.config['erp'])
+            connector = ZKTecoDeviceConnector(
+                device_config, self.config['erp'], self.uploader,
+                queue_size=self.config.get('capture_queue_size', 1000),
+                capture_timeout=self.config.get('capture_timeout', 10)
+            )
             self.device_connectors[device_id] = connector
             
-            # Create and store capture task for each device (don't await)
-            capture_task = asyncio.create_task(connector._start_live_capture_task())
+            # One supervisor task per device; devices connect and capture concurrently
+            capture_task = asyncio.create_task(connector.run_capture(self.config.get('batch_size', 200)))
             self.capture_tasks[device_id] = capture_task
             logger.info(f"Created capture task for device {device_id}")
         
@@ -388,17 +655,38 @@ class ZKTecoService:
         
         logger.info(f"ZKTeco Service started with {len(self.device_connectors)} devices, {len(self.capture_tasks)} capture tasks running")
     
+    def health(self) -> Dict:
+        """Per-device health plus uploader/spool state"""
+        return {
+            "devices": {device_id: c.health() for device_id, c in self.device_connectors.items()},
+            "uploader": dict(self.uploader.stats) if self.uploader else None,
+            "spool_size": self.uploader.spool.size() if self.uploader else 0
+        }
+    
     async def _monitoring_loop(self):
-        """Monitor device health and reconnect if needed"""
+        """Log device health periodically and restart supervisors that died"""
         while self.running:
             try:
-                for device_id, connector in self.device_connectors.items():
-                    if not connector.connection:
-                        logger.warning(f"Device {device_id} disconnected, attempting reconnection...")
-                        await connector.connect()
-                
                 await asyncio.sleep(self.config.get('sync_interval', 30))
                 
+                for device_id, task in list(self.capture_tasks.items()):
+                    if task.done() and self.running:
+                        logger.error(f"Supervisor for device {device_id} exited, restarting")
+                        connector = self.device_connectors[device_id]
+                        self.capture_tasks[device_id] = asyncio.create_task(
+                            connector.run_capture(self.config.get('batch_size', 200))
+                        )
+                
+                health = await asyncio.to_thread(self.health)
+                for device_id, stats in health["devices"].items():
+                    logger.info(
+                        f"Device {device_id}: state={stats['state']} captured={stats['events_captured']} "
+                        f"queue={stats['queue_depth']}/{stats['queue_capacity']} "
+                        f"backpressure={stats['backpressure_waits']} ({stats['backpressure_seconds']:.1f}s) "
+                        f"reconnects={stats['reconnects']}"
+                    )
+                logger.info(f"Spool: {health['spool_size']} pending, uploader: {health['uploader']}")
+                
             except Exception as e:
                 logger.error(f"Error in monitoring loop: {e}")
                 await asyncio.sleep(10)
@@ -408,8 +696,12 @@ class ZKTecoService:
         self.running = False
         logger.info("Stopping ZKTeco Service...")
         
-        for connector in self.device_connectors.values():
-            await connector.disconnect()
+        await asyncio.gather(*(connector.disconnect() for connector in self.device_connectors.values()))
+        await asyncio.gather(*self.capture_tasks.values(), return_exceptions=True)
+        
+        if self.uploader:
+            await self.uploader.stop()
+            self.uploader.spool.close()
         
         logger.info("ZKTeco Service stopped")
     
@@ -422,9 +714,8 @@ class ZKTecoService:
                 records = await connector.get_stored_attendance()
                 logger.info(f"Retrieved {len(records)} stored records from {device_id}")
                 
-                # Send each record to ERP
-                for record in records:
-                    await connector._send_to_erp(record)
+                # Spooled punches are deduped, so re-syncing the same records is harmless
+                await self.uploader.enqueue(records)
                     
             except Exception as e:
                 logger.error(f"Error syncing data from {device_id}: {e}")
@@ -10,6 +10,7 @@ import { Label } from './ui/label';
 import { Select, SelectContent, SelectItem, SelectTrigger, SelectValue } from './ui/select';
 import { Dialog, DialogContent, DialogHeader, DialogTitle, DialogDescription, DialogFooter } from './ui/dialog';
 import { toast } from 'sonner';
+import { useLiveAttendance } from '../hooks/useLiveAttendance';
 import { 
   Fingerprint,
   Wifi,
@@ -544,6 +545,8 @@ const BiometricDevices = () => {
   };
 
   const [recentPunchesData, setRecentPunchesData] = useState([]);
+  const liveAttendance = useLiveAttendance(activeTab === 'overview');
+  const liveCounters = liveAttendance.counters;
 
   useEffect(() => {
     if (devicesList.length > 0) {
@@ -564,11 +567,19 @@ const BiometricDevices = () => {
     }
   };
 
+  // Poll only while the live stream is not connected
   useEffect(() => {
+    if (liveAttendance.connected) {
+      return undefined;
+    }
     fetchRecentPunches();
     const interval = setInterval(fetchRecentPunches, 30000);
     return () => clearInterval(interval);
-  }, []);
+  }, [liveAttendance.connected]);
+
+  const recentPunches = liveAttendance.connected
+    ? liveAttendance.latestPunches.slice(0, 10).map((punch) => ({ ...punch, punch_time: punch.punch_time.replace(' ', 'T') }))
+    : recentPunchesData;
 
   return (
     <div className="space-y-6 fade-in">
@@ -727,7 +738,12 @@ const BiometricDevices = () => {
             <Card>
               <CardHeader>
                 <CardTitle className="flex items-center justify-between">
-                  <span>Today's Live Attendance</span>
+                  <span className="flex items-center gap-2">
+                    Today's Live Attendance
+                    {liveAttendance.connected && (
+                      <Badge className="bg-emerald-100 text-emerald-800">Live</Badge>
+                    )}
+                  </span>
                   <Button 
                     variant="outline" 
                     onClick={handleViewDailyAttendance} 
@@ -746,18 +762,23 @@ const BiometricDevices = () => {
                   <p className="text-gray-600 mb-4">Monitor live attendance from biometric devices. Click "View Daily Attendance" to see today's complete attendance data.</p>
                   <div className="grid grid-cols-3 gap-4 text-center mt-6">
                     <div>
-                      <p className="text-2xl font-bold text-emerald-600">{dailyAttendanceData?.students_present || 0}</p>
+                      <p className="text-2xl font-bold text-emerald-600">{liveCounters?.student_present ?? dailyAttendanceData?.students_present ?? 0}</p>
                       <p className="text-sm text-gray-500">Students Present</p>
                     </div>
                     <div>
-                      <p className="text-2xl font-bold text-blue-600">{dailyAttendanceData?.staff_present || 0}</p>
+                      <p className="text-2xl font-bold text-blue-600">{liveCounters?.staff_present ?? dailyAttendanceData?.staff_present ?? 0}</p>
                       <p className="text-sm text-gray-500">Staff Present</p>
                     </div>
                     <div>
-                      <p className="text-2xl font-bold text-purple-600">{dailyAttendanceData?.total_punches || 0}</p>
+                      <p className="text-2xl font-bold text-purple-600">{liveCounters?.punches ?? dailyAttendanceData?.total_punches ?? 0}</p>
                       <p className="text-sm text-gray-500">Total Punches</p>
                     </div>
                   </div>
+                  {liveCounters && (
+                    <p className="text-sm text-gray-500 mt-4">
+                      {liveCounters.late} late • {liveCounters.not_yet_arrived} not yet arrived
+                    </p>
+                  )}
                 </div>
               </CardContent>
             </Card>
@@ -774,14 +795,14 @@ const BiometricDevices = () => {
               </CardHeader>
               <CardContent>
                 <div className="space-y-3">
-                  {recentPunchesData.length === 0 ? (
+                  {recentPunches.length === 0 ? (
                     <div className="text-center py-8">
                       <Clock className="h-12 w-12 mx-auto text-gray-400 mb-3" />
                       <p className="text-gray-500">No recent punch activity</p>
                       <p className="text-sm text-gray-400 mt-1">Punches will appear here when staff use biometric devices</p>
                     </div>
                   ) : (
-                    recentPunchesData.map((punch, index) => (
+                    recentPunches.map((punch, index) => (
                       <div key={punch.punch_id || index} className="flex items-center justify-between p-3 bg-gray-50 dark:bg-gray-700 rounded-lg">
                         <div className="flex items-center space-x-3">
                           <div className={`p-2 rounded-full ${punch.punch_type === 'IN' ? 'bg-emerald-100' : 'bg-orange-100'}`}>
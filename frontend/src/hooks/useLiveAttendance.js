@@ -0,0 +1,91 @@
+import { useState, useEffect } from 'react';
+import axios from 'axios';
+import API_BASE_URL from '../config/api';
+
+const LATEST_PUNCHES = 50;
+const RECONNECT_DELAY = 3000;
+
+// Live biometric attendance over server-sent events (/biometric/live/stream).
+// EventSource cannot send an Authorization header, so every connection first asks
+// /biometric/live/token for a short-lived token and passes it as ?token=. After an
+// error the stream is reopened with a fresh token and the last (epoch, seq) seen,
+// so the server only replays the punches that were missed.
+export function useLiveAttendance(enabled = true) {
+  const [counters, setCounters] = useState(null);
+  const [latestPunches, setLatestPunches] = useState([]);
+  const [connected, setConnected] = useState(false);
+
+  useEffect(() => {
+    if (!enabled) {
+      return undefined;
+    }
+
+    let source = null;
+    let retryTimer = null;
+    let stopped = false;
+    let lastEvent = null;
+
+    const handleEvent = (message) => {
+      const event = JSON.parse(message.data);
+      lastEvent = { epoch: event.epoch, seq: event.seq };
+      setCounters(event.counters);
+      if (event.type === 'snapshot') {
+        setLatestPunches(event.latest_punches || []);
+      } else {
+        setLatestPunches((punches) => [event.punch, ...punches].slice(0, LATEST_PUNCHES));
+      }
+    };
+
+    const scheduleReconnect = () => {
+      if (!stopped) {
+        retryTimer = setTimeout(connect, RECONNECT_DELAY);
+      }
+    };
+
+    const connect = async () => {
+      try {
+        const token = localStorage.getItem('token');
+        const response = await axios.post(`${API_BASE_URL}/biometric/live/token`, {}, {
+          headers: { Authorization: `Bearer ${token}` }
+        });
+        if (stopped) {
+          return;
+        }
+        const params = new URLSearchParams({ token: response.data.token });
+        if (lastEvent) {
+          params.set('epoch', lastEvent.epoch);
+          params.set('seq', lastEvent.seq);
+        }
+        source = new EventSource(`${API_BASE_URL}/biometric/live/stream?${params}`);
+        source.onopen = () => setConnected(true);
+        source.addEventListener('snapshot', handleEvent);
+        source.addEventListener('punch', handleEvent);
+        source.onerror = () => {
+          // The token in the URL has expired by the time EventSource would retry it
+          source.close();
+          setConnected(false);
+          scheduleReconnect();
+        };
+      } catch (error) {
+        // Roles without access to the live feed keep using the polled data
+        if (error.response?.status !== 403) {
+          scheduleReconnect();
+        }
+      }
+    };
+
+    connect();
+    return () => {
+      stopped = true;
+      clearTimeout(retryTimer);
+      if (source) {
+        source.close();
+      }
+      setConnected(false);
+    };
+  }, [enabled]);
+
+  return { counters, latestPunches, connected };
+}
+
+export default useLiveAttendance;
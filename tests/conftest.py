@@ -0,0 +1,42 @@
+import asyncio
+import os
+import sys
+
+import pytest
+from mongomock_motor import AsyncMongoMockClient
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "backend"))
+
+
+@pytest.fixture(scope="session")
+def event_loop():
+    # Module-level caches and locks bind to the first loop that uses them,
+    # so every test shares one loop
+    loop = asyncio.new_event_loop()
+    yield loop
+    loop.close()
+
+
+@pytest.fixture
+def run(event_loop):
+    return event_loop.run_until_complete
+
+
+@pytest.fixture
+def db():
+    return AsyncMongoMockClient()["test"]
+
+
+@pytest.fixture
+def server(db, monkeypatch):
+    """The API module with its database swapped for the test database"""
+    for name, value in {
+        "MONGO_URL": "mongodb://localhost:27017",
+        "DB_NAME": "test",
+        "JWT_SECRET_KEY": "test-secret-key-with-at-least-32-characters",
+        "JWT_SECRET": "test-secret-key-with-at-least-32-characters",
+    }.items():
+        os.environ.setdefault(name, value)
+    import server as server_module
+    monkeypatch.setattr(server_module, "db", db)
+    return server_module
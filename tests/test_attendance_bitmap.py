@@ -0,0 +1,31 @@
+from attendance_bitmap import backfill_attendance_bitmaps, decode_day
+
+MORNING = "2026-03-02"
+
+
+def test_backfill_sets_months_from_both_collections_without_deleting_first(run, db):
+    run(db.attendance_bitmaps.insert_many([
+        {"_id": "t1:s1:2026-03", "tenant_id": "t1", "student_id": "s1", "year": 2026, "month": 3,
+         "sessions": {"Morning": 0}, "other": {"09:Morning": "leave"}},
+        {"_id": "t1:s9:2025-01", "tenant_id": "t1", "student_id": "s9", "year": 2025, "month": 1,
+         "sessions": {"Morning": 1}, "other": {}},
+    ]))
+    run(db.attendance.insert_one({
+        "tenant_id": "t1", "type": "student", "person_id": "s1", "date": MORNING, "class_id": "c1",
+        "status": "absent", "created_at": 1
+    }))
+    run(db.student_attendance.insert_many([
+        {"tenant_id": "t1", "person_id": "s1", "date": MORNING, "attendance_session": "Morning",
+         "status": "late", "created_at": 2},
+        {"tenant_id": "t1", "person_id": "s1", "date": "2026-03-03", "attendance_session": "Evening",
+         "status": "half_day", "created_at": 2},
+    ]))
+
+    outcome = run(backfill_attendance_bitmaps("job", db, "t1", year=2026))
+
+    assert outcome["month_documents_written"] == 1
+    doc = run(db.attendance_bitmaps.find_one({"_id": "t1:s1:2026-03"}))
+    assert decode_day(int(doc["sessions"]["Morning"]), 2) == 3
+    assert doc["other"] == {"03:Evening": "half_day"}
+    assert doc["class_id"] == "c1"
+    assert run(db.attendance_bitmaps.count_documents({"_id": "t1:s9:2025-01"})) == 1
@@ -0,0 +1,75 @@
+from datetime import datetime, timedelta
+
+import attendance_features
+from attendance_features import (
+    drain_feature_queue, features_ready, get_attendance_insights, prepare_tenant_features,
+    record_attendance_feature_changes
+)
+from job_queue import job_queue
+
+
+def _days_ago(days: int) -> str:
+    return (datetime.utcnow() - timedelta(days=days)).strftime("%Y-%m-%d")
+
+
+def _seed_absences(run, db):
+    run(db.students.insert_one({"id": "s1", "tenant_id": "t1", "name": "Karim", "class_id": "c1"}))
+    run(db.student_attendance.insert_many([{
+        "tenant_id": "t1", "person_id": "s1", "person_name": "Karim", "class_id": "c1",
+        "date": _days_ago(days), "status": "absent", "created_at": datetime.utcnow()
+    } for days in (1, 2, 3, 4)]))
+
+
+def test_insights_scan_attendance_until_features_are_ready(run, db):
+    _seed_absences(run, db)
+
+    insights = run(get_attendance_insights(db, "t1", "month"))
+
+    assert insights["features_as_of"] is None
+    assert insights["overall_stats"]["total_records"] == 4
+    assert insights["alerts"]["at_risk_students"][0]["person_id"] == "s1"
+    assert run(db.scheduler_locks.find_one({"_id": "attendance_features_prepare:t1"}))
+
+
+def _seed_bitmaps(run, db):
+    """Bitmaps as the backfill would write them; mongomock has no $bit, so the backfill is replaced"""
+    months = {}
+    for days in (1, 2, 3, 4):
+        day = datetime.utcnow() - timedelta(days=days)
+        key = (day.year, day.month)
+        months[key] = months.get(key, 0) | (2 << ((day.day - 1) * 2))
+    run(db.attendance_bitmaps.insert_many([{
+        "_id": f"t1:s1:{year}-{month:02d}", "tenant_id": "t1", "student_id": "s1",
+        "year": year, "month": month, "class_id": "c1", "sessions": {"Morning": bits}
+    } for (year, month), bits in months.items()]))
+
+
+def test_preparation_backfills_and_switches_to_features(run, db, monkeypatch):
+    _seed_absences(run, db)
+    _seed_bitmaps(run, db)
+
+    async def backfill(job_id, db, tenant_id):
+        return {"records": 4}
+
+    monkeypatch.setattr(attendance_features, "backfill_attendance_bitmaps", backfill)
+    job = job_queue.create_job(job_type="attendance_features_prepare", tenant_id="t1")
+
+    run(prepare_tenant_features(job.id, db, "t1"))
+
+    assert run(features_ready(db, "t1"))
+    insights = run(get_attendance_insights(db, "t1", "month"))
+    assert insights["features_as_of"] is not None
+    assert insights["alerts"]["at_risk_students"][0]["person_id"] == "s1"
+
+
+def test_writes_queue_students_and_the_loop_refreshes_them(run, db):
+    run(record_attendance_feature_changes(db, "t1", [
+        {"person_id": "s1", "date": _days_ago(0), "status": "absent"},
+        {"person_id": "s1", "date": _days_ago(1), "status": "absent"},
+    ]))
+    assert run(db.attendance_features.count_documents({})) == 0
+    assert run(db.attendance_feature_queue.count_documents({})) == 1
+
+    assert run(drain_feature_queue(db)) == 1
+    assert run(db.attendance_feature_queue.count_documents({})) == 0
+    assert run(db.attendance_features.find_one({"_id": "t1:s1"}))
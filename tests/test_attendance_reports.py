@@ -0,0 +1,48 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from attendance_management import aggregate_monthly_attendance, write_student_attendance_batch
+from attendance_rollup import attendance_report_scope
+from cache import bump_cache_version, cache
+
+LAST_MONTH = (datetime.utcnow().replace(day=1) - timedelta(days=1)).replace(day=5)
+DAY = LAST_MONTH.strftime("%Y-%m-%d")
+
+
+@pytest.fixture(autouse=True)
+def empty_cache(run):
+    run(cache.clear_all())
+
+
+def _report(run, db):
+    return run(aggregate_monthly_attendance(db, "ar1", LAST_MONTH.month, LAST_MONTH.year))
+
+
+def _mark(run, db, person_id, status):
+    run(write_student_attendance_batch(db, "ar1", [
+        {"person_id": person_id, "date": DAY, "status": status, "class_id": "c1"}
+    ], "manual", "u1", "Teacher"))
+
+
+def test_a_closed_month_edit_refreshes_the_cached_report(run, db):
+    _mark(run, db, "s1", "present")
+    assert _report(run, db)["summary"]["total_records"] == 1
+
+    _mark(run, db, "s1", "absent")
+    _mark(run, db, "s2", "present")
+
+    report = _report(run, db)
+    assert report["summary"]["total_records"] == 2
+    assert {row["person_id"]: row["absent"] for row in report["person_details"]} == {"s1": 1, "s2": 0}
+
+
+def test_a_version_bump_from_another_worker_misses_the_local_cache(run, db):
+    _mark(run, db, "s1", "present")
+    assert _report(run, db)["summary"]["total_records"] == 1
+
+    # Written by another worker: this worker's cache is untouched, the shared version moves
+    run(db.student_attendance.insert_one({"tenant_id": "ar1", "person_id": "s3", "date": DAY, "status": "late"}))
+    run(bump_cache_version(db, attendance_report_scope("ar1")))
+
+    assert _report(run, db)["summary"]["total_records"] == 2
@@ -0,0 +1,108 @@
+import asyncio
+
+import pytest
+
+import attendance_rollup
+from attendance_rollup import (
+    ensure_attendance_rollups, get_attendance_rollup, record_attendance_changes, record_attendance_rollups
+)
+
+DAY = "2026-03-02"
+
+
+@pytest.fixture(autouse=True)
+def rebuilt(run, db):
+    attendance_rollup._rebuilt_tenants.clear()
+    run(db.attendance_rollup_status.insert_one({"_id": "t1", "rebuilt": True}))
+
+
+def test_not_marked_counts_distinct_students(run, db):
+    run(record_attendance_rollups(db, "t1", [
+        {"person_id": "s1", "date": DAY, "class_id": "c1", "status": "present", "attendance_session": "Morning"},
+        {"person_id": "s1", "date": DAY, "class_id": "c1", "status": "present", "attendance_session": "Afternoon"},
+        {"person_id": "s2", "date": DAY, "class_id": "c1", "status": "absent"},
+    ]))
+
+    rollup = run(get_attendance_rollup(db, "t1", DAY, enrolled=3))
+
+    assert rollup["total"] == 3
+    assert rollup["marked"] == 2
+    assert rollup["not_marked"] == 1
+    assert rollup["classes"]["c1"]["marked"] == 2
+
+
+def test_clearing_a_mark_unmarks_the_student(run, db):
+    run(record_attendance_rollups(db, "t1", [
+        {"person_id": "s1", "date": DAY, "class_id": "c1", "status": "present"},
+    ]))
+    run(record_attendance_rollups(db, "t1", [
+        {"person_id": "s1", "date": DAY, "class_id": "c1", "status": None, "previous_status": "present"},
+    ]))
+
+    rollup = run(get_attendance_rollup(db, "t1", DAY, enrolled=1))
+
+    assert rollup["marked"] == 0
+    assert rollup["not_marked"] == 1
+
+
+def test_a_slot_written_by_both_collections_counts_once(run, db):
+    mark = {"person_id": "s1", "date": DAY, "class_id": "c1", "status": "present", "attendance_session": "Morning"}
+    run(record_attendance_rollups(db, "t1", [mark]))
+    run(record_attendance_rollups(db, "t1", [{**mark, "status": "late", "attendance_session": None}]))
+
+    rollup = run(get_attendance_rollup(db, "t1", DAY))
+
+    assert rollup["total"] == 1
+    assert rollup["late"] == 1 and rollup["present"] == 0
+
+
+def test_replacing_a_mark_that_was_never_counted_does_not_drift(run, db):
+    run(record_attendance_rollups(db, "t1", [
+        {"person_id": "s1", "date": DAY, "class_id": "c1", "status": "absent", "previous_status": "present"},
+        {"person_id": "s2", "date": DAY, "class_id": "c1", "status": "present"},
+    ]))
+
+    rollup = run(get_attendance_rollup(db, "t1", DAY))
+
+    assert (rollup["present"], rollup["absent"], rollup["total"]) == (1, 1, 2)
+
+
+def test_first_read_rebuilds_the_tenant_once(run, db):
+    run(db.attendance.insert_many([
+        {"tenant_id": "t2", "type": "student", "person_id": "s1", "date": DAY, "class_id": "c1",
+         "status": "absent", "created_at": 1},
+        {"tenant_id": "t2", "type": "student", "person_id": "s2", "date": DAY, "class_id": "c1",
+         "status": "present", "created_at": 1},
+    ]))
+    run(db.student_attendance.insert_one({
+        "tenant_id": "t2", "person_id": "s1", "date": DAY, "class_id": "c1", "status": "present",
+        "attendance_session": "Morning", "created_at": 2
+    }))
+
+    assert run(get_attendance_rollup(db, "t2", DAY))["rebuilding"] is True
+    run(asyncio.sleep(0.1))
+
+    rollup = run(get_attendance_rollup(db, "t2", DAY, enrolled=3))
+    assert rollup["rebuilding"] is False
+    assert (rollup["present"], rollup["absent"], rollup["total"]) == (2, 0, 2)
+    assert rollup["not_marked"] == 1
+    assert run(db.attendance_rollup_status.find_one({"_id": "t2"}))["rebuilt"] is True
+
+    attendance_rollup._rebuilt_tenants.clear()
+    assert run(ensure_attendance_rollups(db, "t2")) is True
+
+
+def test_clearing_an_attendance_mark_keeps_the_student_attendance_slot(run, db):
+    run(db.student_attendance.insert_one({
+        "tenant_id": "t1", "person_id": "s1", "date": DAY, "class_id": "c1", "status": "late"
+    }))
+    run(record_attendance_rollups(db, "t1", [
+        {"person_id": "s1", "date": DAY, "class_id": "c1", "status": "present"},
+    ]))
+
+    run(record_attendance_changes(db, "t1", [
+        {"person_id": "s1", "date": DAY, "class_id": "c1", "status": None, "previous_status": "present"},
+    ], source="attendance"))
+
+    rollup = run(get_attendance_rollup(db, "t1", DAY))
+    assert (rollup["late"], rollup["present"], rollup["total"]) == (1, 0, 1)
@@ -0,0 +1,57 @@
+from attendance_management import (
+    attendance_rules_scope, get_compiled_attendance_rules, sync_offline_attendance_batch,
+    write_student_attendance_batch
+)
+from cache import bump_cache_version
+
+DAY = "2026-03-02"
+
+
+def test_a_legacy_record_without_session_is_updated_as_morning(run, db):
+    run(db.student_attendance.insert_one({
+        "id": "legacy", "tenant_id": "aw1", "person_id": "s1", "date": DAY, "status": "absent", "class_id": "c1"
+    }))
+
+    outcomes = run(write_student_attendance_batch(db, "aw1", [
+        {"person_id": "s1", "date": DAY, "status": "present"}
+    ], "manual", "u1", "Teacher"))
+
+    assert outcomes[0]["outcome"] == "updated"
+    assert outcomes[0]["record_id"] == "legacy"
+    rows = run(db.student_attendance.find({"person_id": "s1"}).to_list(None))
+    assert [(row["id"], row["status"], row["attendance_session"]) for row in rows] == [("legacy", "present", "Morning")]
+
+
+RULE = {"is_active": True, "rule_type": "general", "school_start_time": "08:00",
+        "late_threshold_minutes": 10, "absent_threshold_minutes": 45, "excluded_days": []}
+
+
+def test_a_rule_edit_in_another_worker_reaches_the_compiled_rules(run, db):
+    run(db.attendance_rules.insert_one({"tenant_id": "aw2", **RULE}))
+    assert run(get_compiled_attendance_rules(db, "aw2")).classify("08:20", None, DAY)["status"] == "late"
+
+    # Another worker edits the rule: only the shared version tells this one
+    run(db.attendance_rules.update_one({"tenant_id": "aw2"}, {"$set": {"late_threshold_minutes": 30}}))
+    run(bump_cache_version(db, attendance_rules_scope("aw2")))
+
+    assert run(get_compiled_attendance_rules(db, "aw2")).classify("08:20", None, DAY)["status"] == "present"
+
+
+def test_offline_sync_keeps_sessions_apart_and_reclassifies_earlier_check_ins(run, db):
+    run(db.attendance_rules.insert_one({"tenant_id": "aw3", **RULE}))
+    run(db.student_attendance.insert_one({
+        "id": "morning", "tenant_id": "aw3", "person_id": "s1", "date": DAY, "check_in": "08:30",
+        "status": "late", "class_id": "c1"
+    }))
+
+    summary = run(sync_offline_attendance_batch(db, "aw3", "d1", [
+        {"person_id": "s1", "date": DAY, "check_in": "13:00", "attendance_session": "Evening", "class_id": "c1"},
+        {"person_id": "s1", "date": DAY, "check_in": "07:55", "class_id": "c1"},
+    ]))
+
+    assert (summary["records_synced"], summary["conflicts_resolved"]) == (1, 1)
+    rows = run(db.student_attendance.find({"person_id": "s1"}).to_list(None))
+    rows = {row.get("attendance_session", "Morning"): row for row in rows}
+    assert set(rows) == {"Morning", "Evening"}
+    assert (rows["Morning"]["check_in"], rows["Morning"]["status"]) == ("07:55", "present")
+    assert rows["Evening"]["check_in"] == "13:00"
@@ -0,0 +1,77 @@
+from datetime import datetime
+
+from attendance_management import CompiledRuleSet
+from biometric_ingest import (
+    PunchBatchWriter, attendance_status, build_punch_record, is_punch_data_error, punch_error
+)
+
+RULES = CompiledRuleSet([{
+    "rule_type": "general", "school_start_time": "08:00",
+    "late_threshold_minutes": 10, "absent_threshold_minutes": 45, "excluded_days": []
+}])
+
+
+def _punch(hour: int, minute: int, punch_type: str = "IN") -> dict:
+    return {"punch_time": datetime(2026, 3, 2, hour, minute), "punch_type": punch_type}
+
+
+def test_first_punch_is_classified_with_the_tenant_rules():
+    assert attendance_status(_punch(8, 5), 0, RULES) == {"status": "present", "type": "on_time"}
+    assert attendance_status(_punch(8, 20), 0, RULES) == {"status": "present", "type": "late"}
+    assert attendance_status(_punch(9, 0), 0, RULES) == {"status": "present", "type": "very_late"}
+
+
+def test_default_rules_apply_without_tenant_rules():
+    assert attendance_status(_punch(9, 10), 0, CompiledRuleSet([]))["type"] == "on_time"
+    assert attendance_status(_punch(9, 20), 0, CompiledRuleSet([]))["type"] == "late"
+
+
+def test_later_punches_report_check_in_and_out():
+    assert attendance_status(_punch(13, 0, "OUT"), 1, RULES)["status"] == "checked_out"
+    assert attendance_status(_punch(14, 0), 2, RULES)["status"] == "checked_in"
+
+
+VALID_PUNCH = {"person_id": "STU001", "device_id": "DEV001", "punch_time": "2026-03-02T08:05:00+06:00"}
+
+
+def test_punch_error_accepts_a_valid_punch():
+    assert punch_error(VALID_PUNCH) is None
+    assert punch_error({**VALID_PUNCH, "person_id": 1001, "verification_score": "95.5"}) is None
+
+
+def test_punch_error_rejects_nulls_and_wrong_types():
+    assert punch_error({**VALID_PUNCH, "person_id": None}) == "Missing required field: person_id"
+    assert punch_error({**VALID_PUNCH, "device_id": ""}) == "Invalid device_id"
+    assert punch_error({**VALID_PUNCH, "person_id": {"id": 1}}) == "Invalid person_id"
+    assert punch_error({**VALID_PUNCH, "punch_time": 1740902700}) == "Invalid punch_time"
+    assert punch_error({**VALID_PUNCH, "verification_score": "high"}) == "Invalid verification_score"
+    assert punch_error({**VALID_PUNCH, "verification_score": float("nan")}) == "Invalid verification_score"
+    assert punch_error({**VALID_PUNCH, "punch_type": 1}) == "Invalid punch_type"
+    assert punch_error({**VALID_PUNCH, "source_payload": "raw"}) == "Invalid source_payload"
+
+
+class FlakyWriter(PunchBatchWriter):
+    """Writer whose database refuses any batch containing a punch of person BAD"""
+
+    def __init__(self):
+        super().__init__(max_batch=10, max_delay=0.05)
+        self.batches = []
+
+    async def write(self, records, count_devices=True):
+        self.batches.append(len(records))
+        if any(record["person_id"] == "BAD" for record in records):
+            raise ValueError("invalid input value")
+        return [{"duplicate": False, "punch_id": i, "processed_at": None, "attendance_status": None}
+                for i, _ in enumerate(records)]
+
+
+def test_a_bad_punch_fails_alone_in_its_micro_batch(run):
+    writer = FlakyWriter()
+    records = [build_punch_record({**VALID_PUNCH, "person_id": person}, "t1", None) for person in ("A", "BAD", "B")]
+
+    results = run(writer.submit_many(records, return_exceptions=True))
+    run(writer.close())
+
+    assert writer.batches[0] == 3
+    assert isinstance(results[1], ValueError) and is_punch_data_error(results[1])
+    assert results[0]["duplicate"] is False and results[2]["duplicate"] is False
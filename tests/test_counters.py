@@ -0,0 +1,99 @@
+import pytest
+
+from cache import cache
+from counters import (
+    Sequence, SequenceAllocator, allocate_number, claim_number, number_prefix,
+    preview_number, sequence_allocator,
+)
+
+TENANT = "t1"
+YEAR = 2026
+
+
+@pytest.fixture(autouse=True)
+def fresh_allocator(run):
+    sequence_allocator.reset()
+    run(cache.clear_all())
+
+
+def test_blocks_never_issue_a_number_twice(run, db):
+    first = SequenceAllocator(block_sizes={Sequence.RECEIPT: 10})
+    second = SequenceAllocator(block_sizes={Sequence.RECEIPT: 10})
+
+    async def draw():
+        values = []
+        for _ in range(15):
+            values.append(await first.next_value(db, TENANT, Sequence.RECEIPT, YEAR))
+            values.append(await second.next_value(db, TENANT, Sequence.RECEIPT, YEAR))
+        return values
+
+    values = run(draw())
+    assert len(set(values)) == len(values) == 30
+
+
+def test_preview_does_not_consume(run, db):
+    async def scenario():
+        previews = [await preview_number(db, TENANT, Sequence.ADMISSION, year=YEAR, school_code="ABC")
+                    for _ in range(3)]
+        allocated = await allocate_number(db, TENANT, Sequence.ADMISSION, year=YEAR, school_code="ABC")
+        return previews, allocated
+
+    previews, allocated = run(scenario())
+    assert previews == ["ABC260001"] * 3
+    assert allocated == "ABC260001"
+
+
+def test_preview_seeds_from_legacy_numbers(run, db):
+    async def seed():
+        return 41
+
+    number = run(preview_number(db, TENANT, Sequence.ADMISSION, year=YEAR, seed=seed, school_code="ABC"))
+    assert number == "ABC260042"
+    assert run(db.counters.find_one({}))["value"] == 41
+
+
+def test_claim_allocates_previewed_number(run, db):
+    saved = set()
+
+    async def in_use(number):
+        return number in saved
+
+    async def claim(requested):
+        number = await claim_number(db, TENANT, Sequence.ADMISSION, requested, year=YEAR,
+                                    in_use=in_use, school_code="ABC")
+        saved.add(number)
+        return number
+
+    async def scenario():
+        preview = await preview_number(db, TENANT, Sequence.ADMISSION, year=YEAR, school_code="ABC")
+        # Two forms opened with the same preview both save: each gets its own number
+        first = await claim(preview)
+        second = await claim(preview)
+        blank = await claim("")
+        return first, second, blank
+
+    assert run(scenario()) == ("ABC260001", "ABC260002", "ABC260003")
+
+
+def test_claim_keeps_manual_and_issued_numbers(run, db):
+    async def scenario():
+        await allocate_number(db, TENANT, Sequence.ADMISSION, year=YEAR, school_code="ABC")
+        manual = await claim_number(db, TENANT, Sequence.ADMISSION, "OLD-17", year=YEAR, school_code="ABC")
+        issued = await claim_number(db, TENANT, Sequence.ADMISSION, "ABC260001", year=YEAR, school_code="ABC")
+        return manual, issued
+
+    assert run(scenario()) == ("OLD-17", "ABC260001")
+
+
+def test_prefix_follows_overridden_template(run, db):
+    run(db.institutions.insert_one({
+        "tenant_id": TENANT, "is_active": True,
+        "number_formats": {Sequence.ADMISSION: "ADM/{year}/{seq:05d}"}
+    }))
+
+    async def scenario():
+        prefix = await number_prefix(db, TENANT, Sequence.ADMISSION, year=YEAR, school_code="ABC")
+        number = await claim_number(db, TENANT, Sequence.ADMISSION, "ADM/2026/00001", year=YEAR)
+        return prefix, number
+
+    assert run(scenario()) == ("ADM/2026/", "ADM/2026/00001")
@@ -0,0 +1,53 @@
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+from fee_overdue import split_unpaid_amount
+
+NOW = datetime(2026, 3, 15)
+USER = SimpleNamespace(tenant_id="t1", school_id="s1", id="admin", role="admin")
+
+
+def test_split_keeps_overdue_remainder_overdue():
+    assert split_unpaid_amount(1200, 200, NOW - timedelta(days=5), True, NOW) == {
+        "pending_amount": 0, "overdue_amount": 1000, "status": "overdue"
+    }
+
+
+def test_split_returns_to_pending_when_due_date_moves_ahead():
+    assert split_unpaid_amount(1200, 200, NOW + timedelta(days=5), True, NOW) == {
+        "pending_amount": 1000, "overdue_amount": 0, "status": "partial"
+    }
+
+
+def test_split_fully_paid_after_lowering_amount():
+    assert split_unpaid_amount(500, 800, NOW - timedelta(days=5), True, NOW) == {
+        "pending_amount": 0, "overdue_amount": 0, "status": "paid"
+    }
+
+
+def _config(server, amount, due_date):
+    return server.FeeConfiguration(
+        id="cfg", tenant_id="t1", school_id="s1", fee_type="Tuition Fees",
+        amount=amount, frequency="monthly", due_date=due_date, apply_to_classes="c1", created_by="admin"
+    )
+
+
+def test_reapply_does_not_double_count_overdue(server, run, db):
+    run(db.students.insert_one({
+        "id": "st1", "tenant_id": "t1", "name": "Ali", "admission_no": "A1", "class_id": "c1", "is_active": True
+    }))
+    run(server.create_student_fees_from_config(_config(server, 1000, 1), USER))
+    fee = run(db.student_fees.find_one({"student_id": "st1"}))
+    assert fee["due_at"] is not None
+
+    # Nightly run moved the unpaid amount into overdue
+    run(db.student_fees.update_one({"id": fee["id"]}, {"$set": {
+        "paid_amount": 300, "pending_amount": 0, "overdue_amount": 700, "status": "overdue",
+        "due_at": datetime.utcnow() - timedelta(days=3)
+    }}))
+
+    result = run(server.create_student_fees_from_config(_config(server, 1200, 1), USER))
+    fee = run(db.student_fees.find_one({"student_id": "st1"}))
+    assert result == {"created": 0, "updated": 1}
+    assert fee["amount"] == 1200
+    assert fee["pending_amount"] + fee["overdue_amount"] == 900
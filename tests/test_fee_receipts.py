@@ -0,0 +1,40 @@
+from fee_receipts import get_receipt_branding, get_receipt_student, invalidate_receipt_branding, receipt_artifact_key
+
+PAYMENT = {
+    "id": "p1", "receipt_no": "R-1", "student_id": "s1", "amount": 500,
+    "payment_date": "2026-01-10", "payment_mode": "Cash", "fee_type": "Tuition Fees"
+}
+
+
+def _seed(run, db):
+    run(db.students.insert_one({
+        "id": "s1", "tenant_id": "t1", "name": "Rahim", "admission_no": "A-1",
+        "class_id": "c1", "section_id": "sec1"
+    }))
+    run(db.classes.insert_one({"id": "c1", "tenant_id": "t1", "name": "Class 5"}))
+    run(db.sections.insert_one({"id": "sec1", "tenant_id": "t1", "name": "A"}))
+    run(db.institutions.insert_one({"tenant_id": "t1", "is_active": True, "school_name": "Old Name"}))
+
+
+def test_renaming_a_class_changes_the_artifact_key(run, db):
+    _seed(run, db)
+    branding = run(get_receipt_branding(db, "t1"))
+    before = receipt_artifact_key(PAYMENT, branding["version"], run(get_receipt_student(db, "t1", PAYMENT)))
+
+    run(db.classes.update_one({"id": "c1"}, {"$set": {"name": "Class Five"}}))
+    student = run(get_receipt_student(db, "t1", PAYMENT))
+
+    assert student["class_name"] == "Class Five"
+    assert receipt_artifact_key(PAYMENT, branding["version"], student) != before
+    run(invalidate_receipt_branding("t1"))
+
+
+def test_logo_change_changes_the_branding_version(run, db):
+    _seed(run, db)
+    before = run(get_receipt_branding(db, "t1"))["version"]
+
+    run(db.institutions.update_one({"tenant_id": "t1"}, {"$set": {"logo_url": "/uploads/t1/logo.png"}}))
+    run(invalidate_receipt_branding("t1"))
+
+    assert run(get_receipt_branding(db, "t1"))["version"] != before
+    run(invalidate_receipt_branding("t1"))
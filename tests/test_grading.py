@@ -0,0 +1,70 @@
+import numpy as np
+
+from cache import bump_cache_version
+from grading import (
+    DEFAULT_GRADE_BANDS, CompiledGradingScheme, bands_from_grading_scale, get_compiled_grading_scheme,
+    grading_scheme_scope
+)
+
+GAPPED = CompiledGradingScheme([
+    {"grade": "P", "min_percentage": 50, "max_percentage": 60, "gpa": 1.0},
+    {"grade": "H", "min_percentage": 70, "max_percentage": 100, "gpa": 2.0},
+])
+
+
+def _agree(scheme, percentages):
+    grades, gpas = scheme.grade_array(percentages)
+    for percentage, grade, gpa in zip(percentages, grades, gpas):
+        band = scheme.lookup(percentage)
+        assert (band["grade"], band["gpa"]) == (grade, gpa), percentage
+
+
+def test_lookup_and_grade_array_agree_on_every_boundary():
+    percentages = np.concatenate([np.arange(-1, 101.5, 0.5), [32.99, 33, 39.99, 89.5, 89.99, 90, 100, 100.01]])
+
+    _agree(CompiledGradingScheme(DEFAULT_GRADE_BANDS), percentages)
+    _agree(GAPPED, percentages)
+
+
+def test_rounding_gaps_between_bands_are_closed():
+    scheme = CompiledGradingScheme(DEFAULT_GRADE_BANDS)
+
+    assert scheme.lookup(89.995)["grade"] == "A"
+    assert scheme.lookup(90)["grade"] == "A+"
+    assert scheme.lookup(32.995)["grade"] == "F"
+    assert scheme.lookup(33)["grade"] == "D"
+
+
+def test_real_gaps_and_out_of_range_marks_fail():
+    assert GAPPED.lookup(65)["grade"] == "F"
+    assert list(GAPPED.grade_array([-5, 45, 65, 105])[0]) == ["F", "F", "F", "F"]
+
+
+def test_missing_marks_grade_as_a_fail():
+    scheme = CompiledGradingScheme(DEFAULT_GRADE_BANDS)
+
+    assert scheme.lookup(float("nan"))["grade"] == "F"
+    assert scheme.grade_array([np.nan, 95])[0].tolist() == ["F", "A+"]
+
+
+def test_grading_scale_boundaries_compile_like_scheme_bands():
+    scheme = CompiledGradingScheme(bands_from_grading_scale({"grade_boundaries": [
+        {"grade": "A", "min_marks": 80, "max_marks": 100, "grade_point": 4.0},
+        {"grade": "B", "min_marks": 60, "max_marks": 79, "grade_point": 3.0},
+    ]}))
+
+    assert scheme.lookup(79.5) == {"grade": "B", "gpa": 3.0, "remarks": ""}
+    assert scheme.lookup(59)["grade"] == "F"
+
+
+def test_a_scheme_edit_in_another_worker_reaches_the_cached_scheme(run, db):
+    assert run(get_compiled_grading_scheme(db, "gr1", "s1")).lookup(95)["grade"] == "A+"
+
+    # Another worker saves a default scheme: only the shared version tells this one
+    run(db.grading_schemes.insert_one({
+        "id": "pf", "tenant_id": "gr1", "school_id": "s1", "is_default": True, "is_active": True,
+        "grade_bands": [{"grade": "PASS", "min_percentage": 40, "max_percentage": 100, "gpa": 1.0}]
+    }))
+    run(bump_cache_version(db, grading_scheme_scope("gr1")))
+
+    assert run(get_compiled_grading_scheme(db, "gr1", "s1")).lookup(95)["grade"] == "PASS"
@@ -0,0 +1,63 @@
+from datetime import datetime
+from types import SimpleNamespace
+
+from fastapi import APIRouter, HTTPException, Request
+
+import live_feed
+from live_feed import LiveAttendanceHub, setup_live_feed_routes
+
+
+def test_snapshot_classifies_first_punches_with_the_tenant_rules(run, db, monkeypatch):
+    run(db.attendance_rules.insert_one({
+        "tenant_id": "live1", "is_active": True, "rule_type": "general", "school_start_time": "08:00",
+        "late_threshold_minutes": 10, "absent_threshold_minutes": 45, "excluded_days": []
+    }))
+    today = datetime.now().replace(second=0, microsecond=0)
+
+    async def query(tenant_id, start, end, limit=None, newest_first=True):
+        return [
+            {"punch_id": 1, "person_id": "S1", "person_type": "student", "punch_type": "IN",
+             "punch_time": today.replace(hour=8, minute=30)},
+            {"punch_id": 2, "person_id": "S1", "person_type": "student", "punch_type": "OUT",
+             "punch_time": today.replace(hour=14, minute=0)},
+        ]
+
+    monkeypatch.setattr(live_feed, "query_punches", query)
+    hub = LiveAttendanceHub()
+    hub.db = db
+
+    counters = run(hub.get_feed("live1")).counters()
+
+    assert counters["punches"] == 2
+    assert counters["present"] == 1 and counters["late"] == 1
+
+
+def _stream_endpoint(db):
+    users = {"admin-token": "admin", "teacher-token": "teacher"}
+
+    async def get_user_from_token(token):
+        if token not in users:
+            raise HTTPException(status_code=401, detail="Invalid authentication credentials")
+        return SimpleNamespace(id=token, tenant_id="live1", role=users[token])
+
+    router = APIRouter()
+    setup_live_feed_routes(router, db, get_user_from_token, get_user_from_token, None)
+    return next(route.endpoint for route in router.routes if route.path == "/biometric/live/stream")
+
+
+def _status(run, stream, token=None, authorization=None):
+    headers = [(b"authorization", authorization.encode())] if authorization else []
+    try:
+        run(stream(Request({"type": "http", "headers": headers}), token=token))
+    except HTTPException as e:
+        return e.status_code
+    return 200
+
+
+def test_stream_requires_a_token_or_header(run, db):
+    stream = _stream_endpoint(db)
+
+    assert _status(run, stream) == 401
+    assert _status(run, stream, token="expired") == 401
+    assert _status(run, stream, token="teacher-token") == 403
+    assert _status(run, stream, authorization="Bearer teacher-token") == 403
@@ -0,0 +1,119 @@
+from types import SimpleNamespace
+
+import pytest
+from fastapi import APIRouter
+
+import promotion_engine
+from job_queue import job_queue
+from promotion_engine import (
+    DEFAULT_PROMOTION_RULES, PromotionPreviewRequest, apply_promotion, build_promotion_preview,
+    evaluate_result, setup_promotion_routes
+)
+
+USER = SimpleNamespace(tenant_id="pe1", school_id="s1", id="admin", role="admin")
+
+
+def _subjects(*marks):
+    return [{"subject_name": name, "obtained_marks": obtained, "passing_marks": 33}
+            for name, obtained in marks]
+
+
+def _evaluate(percentage, subjects, **rules):
+    rules = {**DEFAULT_PROMOTION_RULES, **rules}
+    mandatory = set(rules["mandatory_subjects"])
+    return evaluate_result({"percentage": percentage, "subjects": subjects}, rules, mandatory)
+
+
+def test_grace_marks_cover_the_smallest_shortfalls_first():
+    evaluation = _evaluate(60, _subjects(("math", 30), ("english", 31), ("science", 80)), max_grace_marks=5)
+
+    assert evaluation["decision"] == "promote"
+    assert evaluation["grace_marks"] == {"english": 2, "math": 3}
+
+
+def test_failed_subjects_beyond_grace_go_to_compartment_or_detention():
+    two_failed = _subjects(("math", 20), ("english", 25), ("science", 80))
+
+    compartment = _evaluate(50, two_failed)
+    assert compartment["decision"] == "compartment"
+    assert compartment["compartment_subjects"] == ["english", "math"]
+    assert _evaluate(50, two_failed, max_compartment_subjects=1)["decision"] == "detain"
+    assert _evaluate(50, two_failed, min_subjects_to_pass=1)["decision"] == "promote"
+
+
+def test_low_percentage_and_failed_mandatory_subjects_detain():
+    assert _evaluate(30, _subjects(("math", 80)))["decision"] == "detain"
+
+    evaluation = _evaluate(70, _subjects(("quran", 10), ("math", 90)), mandatory_subjects=["quran"])
+    assert evaluation["decision"] == "detain"
+    assert evaluation["reasons"] == ["Failed mandatory subject(s): quran"]
+
+
+def _seed(run, db, students=3):
+    run(db.exam_terms.insert_one({"id": "final", "tenant_id": "pe1", "school_id": "s1", "academic_year": "2025"}))
+    run(db.classes.insert_many([
+        {"id": f"c{n}", "tenant_id": "pe1", "name": f"Class {n}", "order_index": n, "is_active": True}
+        for n in (1, 2)
+    ]))
+    run(db.sections.insert_many([
+        {"id": f"c{n}-A", "tenant_id": "pe1", "class_id": f"c{n}", "name": "A"} for n in (1, 2)
+    ]))
+    run(db.fee_configurations.insert_one({
+        "id": "tuition-2", "tenant_id": "pe1", "school_id": "s1", "apply_to_classes": "c2",
+        "fee_type": "Tuition Fees", "amount": 900, "due_date": 10, "is_active": True
+    }))
+    run(db.students.insert_many([
+        {"id": f"st{n}", "tenant_id": "pe1", "name": f"Student {n}", "admission_no": f"A-{n}",
+         "class_id": "c1", "section_id": "c1-A", "is_active": True}
+        for n in range(students)
+    ]))
+    run(db.student_results.insert_many([
+        {"student_id": f"st{n}", "tenant_id": "pe1", "school_id": "s1", "exam_term_id": "final",
+         "status": "published", "class_id": "c1", "percentage": 60 + n, "subjects": _subjects(("math", 60))}
+        for n in range(students)
+    ]))
+    return run(build_promotion_preview(db, USER, PromotionPreviewRequest(exam_term_id="final", class_ids=["c1"])))
+
+
+def test_resuming_a_run_charges_fees_inserted_before_the_interruption(run, db, monkeypatch):
+    preview = _seed(run, db)
+    record_charges = promotion_engine.record_student_fee_charges
+
+    async def crash(db, fees):
+        raise RuntimeError("connection lost")
+
+    monkeypatch.setattr(promotion_engine, "record_student_fee_charges", crash)
+    with pytest.raises(RuntimeError):
+        run(apply_promotion(None, db, "pe1", preview["id"]))
+    assert run(db.promotion_runs.find_one({"id": preview["id"]}))["status"] == "failed"
+    assert run(db.student_fees.count_documents({})) == 3
+    assert run(db.student_ledger_entries.count_documents({})) == 0
+
+    monkeypatch.setattr(promotion_engine, "record_student_fee_charges", record_charges)
+    outcome = run(apply_promotion(None, db, "pe1", preview["id"]))
+
+    assert outcome == {"promotion_id": preview["id"], "applied": 3, "fees_assigned": 3}
+    assert run(db.student_fees.count_documents({})) == 3
+    assert run(db.student_ledger_entries.count_documents({"source": "student_fee"})) == 3
+    fee = run(db.student_fees.find_one({"student_id": "st0"}))
+    assert fee["due_at"].day == 10
+    assert run(db.students.count_documents({"class_id": "c2"})) == 3
+
+
+def test_a_run_is_claimed_once(run, db, monkeypatch):
+    preview = _seed(run, db, students=1)
+
+    async def run_job(job_id, func, *args):
+        return None
+
+    monkeypatch.setattr(job_queue, "run_job", run_job)
+    router = APIRouter()
+    setup_promotion_routes(router, db, lambda: USER)
+    apply = next(route.endpoint for route in router.routes if route.path == "/promotions/{run_id}/apply")
+
+    first = run(apply(preview["id"], current_user=USER))
+    second = run(apply(preview["id"], current_user=USER))
+
+    assert second["message"] == "Promotion is already being applied"
+    assert second["job_id"] == first["job_id"]
+    assert run(db.promotion_runs.find_one({"id": preview["id"]}))["status"] == "applying"
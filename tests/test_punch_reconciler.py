@@ -0,0 +1,65 @@
+from datetime import datetime
+
+import punch_reconciler
+from attendance_management import write_student_attendance_batch
+from punch_reconciler import pair_sessions, reconcile_person_days, summarize_days
+
+DAY = "2026-03-02"  # Monday
+
+
+def _punch(hour: int, minute: int, punch_type: str, day: int = 2) -> dict:
+    return {"punch_time": datetime(2026, 3, day, hour, minute), "punch_type": punch_type, "device_id": "DEV1"}
+
+
+def test_repeated_in_is_one_punch_and_a_later_out_moves_the_check_out():
+    sessions = pair_sessions([_punch(8, 50, "IN"), _punch(8, 51, "IN"), _punch(13, 0, "OUT"), _punch(15, 0, "OUT")])
+
+    assert sessions == [{"in": datetime(2026, 3, 2, 8, 50), "out": datetime(2026, 3, 2, 15, 0)}]
+
+
+def test_night_shift_counts_on_the_day_of_its_in():
+    days = summarize_days(pair_sessions([_punch(22, 0, "IN"), _punch(6, 0, "OUT", day=3)]))
+
+    assert list(days) == [DAY]
+    assert days[DAY]["worked_minutes"] == 8 * 60
+    assert days[DAY]["missing_out"] is False
+
+
+def _seed_student(run, db, monkeypatch, punches):
+    run(db.students.insert_one({"id": "s1", "tenant_id": "t1", "admission_no": "A-1", "name": "Rahim", "class_id": "c1"}))
+
+    async def fetch(conn, tenant_id, person_ids, start, end):
+        return {"A-1": punches}
+
+    monkeypatch.setattr(punch_reconciler, "_fetch_person_punches", fetch)
+
+
+def _reconcile(run, db):
+    return run(reconcile_person_days(db, None, "t1", "student", {"A-1": [DAY]}))
+
+
+def test_manual_mark_replaces_the_biometric_day(run, db, monkeypatch):
+    _seed_student(run, db, monkeypatch, [_punch(8, 55, "IN"), _punch(14, 0, "OUT")])
+
+    assert _reconcile(run, db)["written"] == 1
+    day = run(db.student_attendance.find_one({"person_id": "s1"}))
+    assert day["source"] == "biometric" and day["attendance_session"] == "Morning"
+
+    run(write_student_attendance_batch(db, "t1", [
+        {"person_id": "s1", "date": DAY, "status": "absent", "attendance_session": "Morning"}
+    ], "manual", "u1", "Teacher"))
+    assert _reconcile(run, db)["skipped_manual"] == 1
+
+    days = run(db.student_attendance.find({"person_id": "s1", "date": DAY}).to_list(None))
+    assert len(days) == 1
+    assert days[0]["source"] == "manual" and days[0]["status"] == "absent"
+
+
+def test_reconciler_never_inserts_next_to_a_manual_mark(run, db, monkeypatch):
+    _seed_student(run, db, monkeypatch, [_punch(8, 55, "IN")])
+    run(write_student_attendance_batch(db, "t1", [
+        {"person_id": "s1", "date": DAY, "status": "leave", "attendance_session": "Morning"}
+    ], "manual", "u1", "Teacher"))
+
+    assert _reconcile(run, db)["skipped_manual"] == 1
+    assert run(db.student_attendance.count_documents({"person_id": "s1"})) == 1
@@ -0,0 +1,33 @@
+import punch_store
+
+
+def test_pending_tenants_are_merged_once(run, db, monkeypatch):
+    merged = []
+
+    async def migrate(job_id, db, tenant_id):
+        merged.append(tenant_id)
+        await db.punch_store_migrations.insert_one({"_id": tenant_id})
+        return {"message": "merged"}
+
+    monkeypatch.setattr(punch_store, "migrate_punch_store", migrate)
+    run(db.biometric_punches.insert_many([
+        {"tenant_id": "t1", "person_id": "S1"},
+        {"tenant_id": "t2", "person_id": "S2"},
+    ]))
+    run(db.punch_store_migrations.insert_one({"_id": "t2"}))
+
+    assert run(punch_store.migrate_pending_tenants(db)) == ["t1"]
+    assert run(punch_store.migrate_pending_tenants(db)) == []
+    assert merged == ["t1"]
+    assert run(db.scheduler_locks.find_one({"_id": "punch_store_migration"})) is None
+
+
+def test_merge_waits_for_a_live_lease(run, db, monkeypatch):
+    async def migrate(job_id, db, tenant_id):
+        raise AssertionError("another worker holds the lease")
+
+    monkeypatch.setattr(punch_store, "migrate_punch_store", migrate)
+    run(db.biometric_punches.insert_one({"tenant_id": "t1", "person_id": "S1"}))
+    assert run(punch_store._claim_migration_lease(db))
+
+    assert run(punch_store.migrate_pending_tenants(db)) == []
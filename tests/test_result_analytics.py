@@ -0,0 +1,23 @@
+from result_analytics import compute_exam_analytics
+
+
+def _result(student_id, percentage, class_id=None, class_name=None):
+    result = {
+        "id": f"r-{student_id}", "tenant_id": "ra1", "school_id": "s1", "exam_term_id": "term1",
+        "status": "published", "student_id": student_id, "student_name": student_id,
+        "percentage": percentage, "is_pass": percentage >= 33, "grade": "A",
+        "subjects": [{"subject_name": "Mathematics", "obtained_marks": percentage, "max_marks": 100, "passing_marks": 33}],
+    }
+    if class_id:
+        result.update(class_id=class_id, class_name=class_name)
+    return result
+
+
+def test_results_without_a_class_are_grouped_under_none(run, db):
+    run(db.student_results.insert_many([_result("st1", 80, "c1", "Class 1"), _result("st2", 60)]))
+
+    snapshot = run(compute_exam_analytics(db, "ra1", "s1", "term1"))
+
+    assert {(c["class_id"], c["class_name"]) for c in snapshot["classes"]} == {("c1", "Class 1"), (None, None)}
+    assert {(c["class_id"], c["class_name"]) for c in snapshot["subject_classes"]} == {("c1", "Class 1"), (None, None)}
+    assert snapshot["overall"]["count"] == 2
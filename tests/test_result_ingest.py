@@ -0,0 +1,63 @@
+from types import SimpleNamespace
+
+from result_ingest import ResultSheetUpload, ingest_results
+
+USER = SimpleNamespace(tenant_id="ri1", school_id="s1", id="teacher")
+
+
+def _seed(run, db):
+    run(db.exam_terms.insert_one({"id": "term1", "tenant_id": "ri1", "school_id": "s1", "max_marks": 100}))
+    run(db.subjects.insert_many([
+        {"id": "sub-math", "tenant_id": "ri1", "subject_name": "Mathematics", "subject_code": "MATH"},
+        {"id": "sub-eng", "tenant_id": "ri1", "subject_name": "English Language", "subject_code": "ENG"},
+    ]))
+    run(db.students.insert_many([
+        {"id": f"st{n}", "tenant_id": "ri1", "school_id": "s1", "name": f"Student {n}",
+         "admission_no": f"A-{n}", "class_id": "c1", "section_id": "sec1"}
+        for n in (1, 2)
+    ]))
+
+
+def _upload(run, db, headers, records):
+    upload = ResultSheetUpload(db, USER, "term1")
+    upload.prepare(headers)
+    run(upload.process(list(enumerate(records, 2))))
+    return upload.summary(len(records))
+
+
+def test_columns_map_to_catalogue_subjects_by_name_or_code(run, db):
+    _seed(run, db)
+
+    summary = _upload(run, db, ["admission_no", "english_language", "math"], [
+        {"admission_no": "A-1", "english_language": 70, "math": 85},
+    ])
+
+    assert summary["success_count"] == 1
+    result = run(db.student_results.find_one({"student_id": "st1"}))
+    assert {(s["subject_id"], s["subject_name"]) for s in result["subjects"]} == {
+        ("sub-eng", "English Language"), ("sub-math", "Mathematics")
+    }
+
+
+def test_unknown_subject_columns_reject_the_row(run, db):
+    _seed(run, db)
+
+    summary = _upload(run, db, ["admission_no", "mathematics", "physics"], [
+        {"admission_no": "A-1", "mathematics": 60, "physics": 75},
+        {"admission_no": "A-2", "mathematics": 55, "physics": None},
+    ])
+
+    assert summary["success_count"] == 1
+    assert summary["errors"] == [{"row": 2, "student": "A-1", "error": "physics: not a subject of this institution"}]
+    assert run(db.student_results.count_documents({})) == 1
+
+
+def test_a_subject_entered_twice_is_rejected(run, db):
+    _seed(run, db)
+
+    outcome = run(ingest_results(db, USER, "term1", [{"admission_no": "A-1", "subjects": [
+        {"subject_id": "sub-math", "obtained_marks": 50},
+        {"subject_name": "MATH", "obtained_marks": 60},
+    ]}]))
+
+    assert outcome["errors"][0]["error"] == "Subject listed more than once"
@@ -0,0 +1,50 @@
+from result_ranking import assign_ranks, normalize_rank_settings
+
+
+def _result(result_id, section, percentage, total_marks=0, gpa=0, class_id="c1"):
+    return {
+        "id": result_id, "class_id": class_id, "section_id": section,
+        "percentage": percentage, "total_marks": total_marks, "gpa": gpa
+    }
+
+
+RESULTS = [
+    _result("r1", "A", 90),
+    _result("r2", "B", 80),
+    _result("r3", "A", 80),
+    _result("r4", "B", 70),
+]
+
+
+def test_standard_ranking_skips_after_a_tie():
+    ranks = assign_ranks(RESULTS, [], "standard")
+
+    assert [ranks[r]["class_rank"] for r in ("r1", "r2", "r3", "r4")] == [1, 2, 2, 4]
+    assert ranks["r4"]["section_rank"] == 2
+    assert ranks["r3"]["section_rank"] == 2
+
+
+def test_dense_ranking_does_not_skip():
+    ranks = assign_ranks(RESULTS, [], "dense")
+
+    assert [ranks[r]["class_rank"] for r in ("r1", "r2", "r3", "r4")] == [1, 2, 2, 3]
+
+
+def test_tie_breaks_split_equal_percentages():
+    results = [_result("r1", "A", 80, total_marks=400, gpa=4.0), _result("r2", "A", 80, total_marks=420, gpa=3.5)]
+
+    assert assign_ranks(results, ["total_marks"], "standard")["r2"]["class_rank"] == 1
+    assert assign_ranks(results, ["gpa"], "standard")["r1"]["class_rank"] == 1
+
+
+def test_merit_rank_spans_classes():
+    results = [_result("r1", "A", 70, class_id="c1"), _result("r2", "A", 95, class_id="c2")]
+    ranks = assign_ranks(results, [], "standard")
+
+    assert ranks["r1"]["class_rank"] == 1 and ranks["r1"]["merit_rank"] == 2
+    assert ranks["r2"]["merit_rank"] == 1
+
+
+def test_unknown_settings_fall_back_to_the_defaults():
+    assert normalize_rank_settings("olympic", ["gpa", "age", "gpa"]) == ("standard", ["gpa"])
+    assert normalize_rank_settings(None, None) == ("standard", ["total_marks", "gpa"])
@@ -0,0 +1,133 @@
+import asyncio
+import hashlib
+from datetime import datetime, timedelta
+
+import pytest
+
+import payment_gateway
+import sslcommerz_client
+from payment_gateway import handle_student_fee_ipn
+from sslcommerz_client import CircuitBreaker, GatewayUnavailableError, IpnQueue, verify_ipn_signature
+
+STORE_PASSWD = "secret"
+
+
+def _signed(fields, store_passwd=STORE_PASSWD):
+    names = ["tran_id", "val_id", "amount", "status"]
+    signed = {name: str(fields.get(name, "")) for name in names}
+    signed["store_passwd"] = hashlib.md5(store_passwd.encode()).hexdigest()
+    hash_string = "&".join(f"{name}={signed[name]}" for name in sorted(signed))
+    return {**fields, "verify_key": ",".join(names), "verify_sign": hashlib.md5(hash_string.encode()).hexdigest()}
+
+
+@pytest.fixture
+def gateway_db(run, db):
+    run(db.payment_settings.insert_one({"tenant_id": "t1", "store_id": "store", "store_passwd": STORE_PASSWD}))
+    run(db.payment_transactions.insert_one({
+        "tran_id": "T1", "tenant_id": "t1", "student_id": "s1", "status": "pending",
+        "months": ["January", "February"], "year": 2026, "amount": 1000
+    }))
+    return db
+
+
+def test_signature_round_trip():
+    form = _signed({"tran_id": "T1", "val_id": "", "amount": "1000", "status": "FAILED"})
+    assert verify_ipn_signature(form, STORE_PASSWD)
+    assert not verify_ipn_signature({**form, "amount": "1"}, STORE_PASSWD)
+    assert not verify_ipn_signature(form, "other")
+    assert not verify_ipn_signature({"tran_id": "T1", "status": "FAILED"}, STORE_PASSWD)
+
+
+def test_unsigned_failure_ipn_leaves_transaction_pending(run, gateway_db):
+    outcome = run(handle_student_fee_ipn(gateway_db, {"tran_id": "T1", "status": "FAILED"}))
+    assert outcome == "invalid_signature"
+    assert run(gateway_db.payment_transactions.find_one({"tran_id": "T1"}))["status"] == "pending"
+
+
+def test_signed_failure_ipn_fails_transaction(run, gateway_db):
+    form = _signed({"tran_id": "T1", "val_id": "", "amount": "1000", "status": "FAILED"})
+    assert run(handle_student_fee_ipn(gateway_db, form)) == "failed"
+    assert run(gateway_db.payment_transactions.find_one({"tran_id": "T1"}))["status"] == "failed"
+
+
+def test_valid_ipn_settles_once(run, gateway_db, monkeypatch):
+    async def validate(base_url, val_id, store_id, store_passwd):
+        return {"status": "VALID", "val_id": val_id}
+
+    monkeypatch.setattr(payment_gateway.gateway_client, "validate_transaction", validate)
+    form = {"tran_id": "T1", "val_id": "V1", "status": "VALID"}
+
+    assert run(handle_student_fee_ipn(gateway_db, form)) == "success"
+    assert run(handle_student_fee_ipn(gateway_db, form)) == "already_processed"
+    payments = run(gateway_db.monthly_payments.find({"student_id": "s1"}).to_list(None))
+    assert sorted(p["month"] for p in payments) == ["February", "January"]
+
+
+def test_half_open_circuit_allows_a_single_probe():
+    breaker = CircuitBreaker(failure_threshold=1, reset_seconds=0)
+    breaker.record_failure()
+    assert breaker.state == "half_open"
+    assert breaker.allow_request()
+    assert not breaker.allow_request()
+
+    breaker.record_failure()
+    assert breaker.allow_request()
+    breaker.record_success()
+    assert breaker.state == "closed"
+    assert breaker.allow_request() and breaker.allow_request()
+
+
+def test_resume_requeues_only_stale_work_under_the_lease(run, db):
+    now = datetime.utcnow()
+    run(db.sslcommerz_ipn.insert_many([
+        {"_id": "stale", "status": "processing", "started_at": now - timedelta(hours=1)},
+        {"_id": "live", "status": "processing", "started_at": now},
+    ]))
+    first, second = IpnQueue(), IpnQueue()
+
+    async def resume():
+        # Workers are not started for this check: only the requeue decision matters
+        first._ensure_worker = second._ensure_worker = lambda db: None
+        first._queue, second._queue = _Collector(), _Collector()
+        await first.resume_pending(db)
+        await second.resume_pending(db)
+        return first._queue.items, second._queue.items
+
+    first_items, second_items = run(resume())
+    assert first_items == ["stale"]
+    assert second_items == []
+    assert run(db.sslcommerz_ipn.find_one({"_id": "live"}))["status"] == "processing"
+
+
+def test_an_ipn_parked_by_a_gateway_outage_is_retried(run, db, monkeypatch):
+    monkeypatch.setattr(sslcommerz_client, "CIRCUIT_RESET_SECONDS", 0.01)
+    calls = []
+
+    async def handler(db, form):
+        calls.append(form["tran_id"])
+        if len(calls) == 1:
+            raise GatewayUnavailableError("circuit open")
+        return "success"
+
+    ipn = IpnQueue()
+    ipn.register_handler("fee", handler)
+
+    async def deliver():
+        await ipn.enqueue(db, "fee", {"tran_id": "T9", "val_id": "V9"})
+        await ipn.drain()
+        await asyncio.sleep(0.1)
+        await ipn.drain()
+        ipn._worker.cancel()
+
+    run(deliver())
+    doc = run(db.sslcommerz_ipn.find_one({"tran_id": "T9"}))
+    assert calls == ["T9", "T9"]
+    assert (doc["status"], doc["attempts"]) == ("processed", 2)
+
+
+class _Collector:
+    def __init__(self):
+        self.items = []
+
+    async def put(self, item):
+        self.items.append(item)
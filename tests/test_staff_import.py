@@ -0,0 +1,66 @@
+from datetime import datetime
+from types import SimpleNamespace
+
+import pytest
+from fastapi import HTTPException
+
+from cache import cache
+from counters import sequence_allocator
+from staff_import import StaffImport
+
+USER = SimpleNamespace(tenant_id="si1", id="admin")
+YEAR = datetime.now().year
+
+
+@pytest.fixture(autouse=True)
+def fresh_allocator(run):
+    sequence_allocator.reset()
+    run(cache.clear_all())
+
+
+def _row(number, email, **fields):
+    return number, {"name": f"Staff {number}", "email": email, **fields}
+
+
+def test_files_without_name_or_email_columns_are_refused(db):
+    with pytest.raises(HTTPException) as error:
+        StaffImport(db, USER, "s1").prepare(["name", "phone"])
+
+    assert error.value.status_code == 400
+    assert "email" in error.value.detail
+
+
+def test_bad_salary_or_experience_is_a_row_error(run, db):
+    staff_import = StaffImport(db, USER, "s1")
+
+    run(staff_import.process([
+        _row(2, "a@school.test", salary="25,000"),
+        _row(3, "b@school.test", experience_years="five"),
+        _row(4, "c@school.test", salary="", experience_years="3"),
+    ]))
+
+    assert staff_import.success_count == 1
+    assert staff_import.errors == [
+        "Row 2: Salary must be a number, got '25,000'",
+        "Row 3: Experience must be a number, got 'five'",
+    ]
+    saved = run(db.staff.find_one({"email": "c@school.test"}))
+    assert saved["salary"] == 0 and saved["experience_years"] == 3
+
+
+def test_generated_employee_ids_continue_after_existing_ids(run, db):
+    run(db.staff.insert_many([
+        {"tenant_id": "si1", "employee_id": f"EMP-{YEAR}-0007", "email": "old@school.test"},
+        {"tenant_id": "si1", "employee_id": "T-1", "email": "other@school.test"},
+    ]))
+    first, second = StaffImport(db, USER, "s1"), StaffImport(db, USER, "s1")
+
+    run(first.process([_row(2, "a@school.test")]))
+    run(second.process([_row(2, "b@school.test"), _row(3, "c@school.test", employee_id="T-2")]))
+
+    ids = {doc["email"]: doc["employee_id"] for doc in run(db.staff.find({"created_by": "admin"}).to_list(None))}
+    assert ids == {
+        "a@school.test": f"EMP-{YEAR}-0008",
+        "b@school.test": f"EMP-{YEAR}-0009",
+        "c@school.test": "T-2",
+    }
@@ -0,0 +1,95 @@
+from datetime import datetime
+
+import pytest
+from fastapi import HTTPException
+
+from student_ledger import (
+    LedgerEntryType, LedgerSource, append_ledger_entry, fee_summary, get_ledger_balance,
+    initialize_student_ledgers, record_student_fee_adjustment, record_student_fee_charges,
+    waive_student_fees,
+)
+
+TENANT = "t1"
+
+
+@pytest.fixture
+def ledger_db(run, db):
+    run(db.student_ledger_entries.create_index(
+        [("tenant_id", 1), ("source", 1), ("source_id", 1)], unique=True
+    ))
+    return db
+
+
+def _fee(fee_id, student_id, amount, **fields):
+    return {
+        "id": fee_id, "tenant_id": TENANT, "student_id": student_id, "fee_type": "Tuition Fees",
+        "amount": amount, "paid_amount": 0, "pending_amount": amount, "overdue_amount": 0,
+        "is_active": True, "created_at": datetime(2026, 1, 1), **fields
+    }
+
+
+def test_bulk_charges_are_idempotent_with_running_balances(run, ledger_db):
+    fees = [_fee("f1", "s1", 500), _fee("f2", "s1", 300), _fee("f3", "s2", 700)]
+    assert run(record_student_fee_charges(ledger_db, fees)) == 3
+    assert run(record_student_fee_charges(ledger_db, fees)) == 0
+
+    assert run(get_ledger_balance(ledger_db, TENANT, "s1"))["balance"] == 800
+    entries = run(ledger_db.student_ledger_entries.find({"student_id": "s1"}).to_list(None))
+    assert sorted(e["balance_after"] for e in entries) == [500, 800]
+
+
+def test_entries_record_the_balance_after_each_change(run, ledger_db):
+    async def scenario():
+        await append_ledger_entry(ledger_db, TENANT, "s1", LedgerEntryType.CHARGE, 1000, LedgerSource.STUDENT_FEE, "f1")
+        paid = await append_ledger_entry(ledger_db, TENANT, "s1", LedgerEntryType.PAYMENT, 400, LedgerSource.PAYMENT, "p1")
+        again = await append_ledger_entry(ledger_db, TENANT, "s1", LedgerEntryType.PAYMENT, 400, LedgerSource.PAYMENT, "p1")
+        return paid, again
+
+    paid, again = run(scenario())
+    assert paid["balance_after"] == 600
+    assert again is None
+
+
+def test_total_fees_includes_amount_adjustments(run, ledger_db):
+    fee = _fee("f1", "s1", 1000)
+    run(record_student_fee_charges(ledger_db, [fee]))
+    run(record_student_fee_adjustment(ledger_db, fee, 1200))
+
+    summary = fee_summary(run(get_ledger_balance(ledger_db, TENANT, "s1")))
+    assert summary["total_fees"] == 1200
+    assert summary["balance"] == 1200
+
+
+def test_waiver_reduces_overdue_fees_first(run, ledger_db):
+    run(ledger_db.student_fees.insert_many([
+        _fee("pending", "s1", 500, due_at=datetime(2026, 2, 10)),
+        _fee("overdue", "s1", 400, pending_amount=0, overdue_amount=400, status="overdue",
+             due_at=datetime(2026, 1, 10)),
+    ]))
+
+    assert run(waive_student_fees(ledger_db, TENANT, "s1", 600)) == ["overdue", "pending"]
+    fees = {f["id"]: f for f in run(ledger_db.student_fees.find({}).to_list(None))}
+    assert fees["overdue"]["overdue_amount"] == 0
+    assert fees["overdue"]["status"] == "waived"
+    assert fees["pending"]["pending_amount"] == 300
+    assert fees["pending"]["waived_amount"] == 200
+
+
+def test_waiver_cannot_exceed_outstanding(run, ledger_db):
+    run(ledger_db.student_fees.insert_one(_fee("f1", "s1", 100)))
+    with pytest.raises(HTTPException) as error:
+        run(waive_student_fees(ledger_db, TENANT, "s1", 150))
+    assert error.value.status_code == 400
+    assert run(ledger_db.student_fees.find_one({"id": "f1"}))["pending_amount"] == 100
+
+
+def test_nightly_import_initializes_unread_ledgers(run, ledger_db):
+    run(ledger_db.students.insert_many([
+        {"id": "s1", "tenant_id": TENANT, "is_active": True},
+        {"id": "s2", "tenant_id": TENANT, "is_active": True},
+    ]))
+    run(ledger_db.student_fees.insert_one(_fee("f1", "s2", 900)))
+
+    assert run(initialize_student_ledgers(ledger_db, TENANT)) == 2
+    assert run(initialize_student_ledgers(ledger_db, TENANT)) == 0
+    assert run(get_ledger_balance(ledger_db, TENANT, "s2"))["balance"] == 900